@@ -0,0 +1,446 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""AtlantisCmd command plug-in for compare sub-command.
+
+Compare the NetCDF output files of two Atlantis runs variable by variable,
+to check that a change to the Atlantis code or build doesn't change the results
+by more than a tolerance.
+"""
+
+import logging
+import math
+import os
+import time
+from pathlib import Path
+
+import cliff.command
+
+from atlantis_cmd import repack
+from atlantis_cmd.lazy_import import lazy_import
+
+netCDF4 = lazy_import("netCDF4")
+numpy = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+# Upper limit on the size of the blocks of time records of a variable that are
+# read from each file at once, to bound the memory use no matter how large the
+# files are
+MAX_BLOCK_BYTES = 64 * 2**20
+
+
+class Compare(cliff.command.Command):
+    """Compare the NetCDF output files of two Atlantis runs."""
+
+    def get_parser(self, prog_name):
+        parser = super().get_parser(prog_name)
+        parser.description = """
+            Compare the variables in the NetCDF files in RESULTS_A with those in
+            the files with the same names in RESULTS_B.
+            Exit with status 1 if any of them are different by more than the
+            tolerances.
+        """
+        parser.add_argument(
+            "results_a",
+            metavar="RESULTS_A",
+            type=Path,
+            help="results directory of the run to compare",
+        )
+        parser.add_argument(
+            "results_b",
+            metavar="RESULTS_B",
+            type=Path,
+            help="results directory of the reference run to compare to",
+        )
+        parser.add_argument(
+            "--files",
+            dest="globs",
+            metavar="GLOB",
+            action="append",
+            default=[],
+            help="""
+            Compare the NetCDF files whose names match the quoted glob pattern
+            GLOB.
+            May be used more than once.
+            Defaults to all of the *.nc files.
+            """,
+        )
+        parser.add_argument(
+            "--atol",
+            type=float,
+            default=0.0,
+            help="""
+            Absolute tolerance of the differences between values.
+            Defaults to 0.
+            """,
+        )
+        parser.add_argument(
+            "--rtol",
+            type=float,
+            default=0.0,
+            help="""
+            Tolerance of the differences between values relative to the values in
+            RESULTS_B.
+            Defaults to 0.
+            """,
+        )
+        parser.add_argument(
+            "--stop-after",
+            dest="stop_after",
+            metavar="N",
+            type=int,
+            default=None,
+            help="""
+            Stop comparing after N variables are found to be different by more than
+            the tolerances.
+            Defaults to comparing all of the variables.
+            """,
+        )
+        parser.add_argument(
+            "--stop-at-first-block",
+            dest="stop_at_first_block",
+            action="store_true",
+            help="""
+            Stop comparing each variable at the first block of time records in which
+            values are different by more than the tolerances.
+            The difference statistics of the variable are then those of the blocks
+            that were compared.
+            Defaults to comparing all of the values of each variable.
+            """,
+        )
+        return parser
+
+    def take_action(self, parsed_args):
+        """Execute the `atlantis compare` sub-command.
+
+        :param parsed_args: Arguments and options parsed from the command-line.
+        :type parsed_args: :class:`argparse.Namespace` instance
+        """
+        compare_results(
+            parsed_args.results_a,
+            parsed_args.results_b,
+            globs=parsed_args.globs or ["*.nc"],
+            atol=parsed_args.atol,
+            rtol=parsed_args.rtol,
+            stop_after=parsed_args.stop_after,
+            stop_at_first_block=parsed_args.stop_at_first_block,
+        )
+
+
+def compare_results(
+    results_a,
+    results_b,
+    globs=("*.nc",),
+    atol=0.0,
+    rtol=0.0,
+    stop_after=None,
+    stop_at_first_block=False,
+):
+    """Compare the variables in the NetCDF files in two results directories.
+
+    Each variable is read in blocks of time records,
+    so the memory used doesn't depend on the size of the files.
+    Values are different by more than the tolerances if
+    :kbd:`abs(a - b) > atol + rtol * abs(b)`.
+    NaN values are equal to each other.
+    Files and variables that are in only one of the results directories,
+    and variables whose dimensions are different,
+    are differences too.
+
+    :param results_a: Results directory of the run to compare.
+    :type results_a: :py:class:`pathlib.Path`
+
+    :param results_b: Results directory of the reference run to compare to.
+    :type results_b: :py:class:`pathlib.Path`
+
+    :param globs: Glob patterns of the names of the NetCDF files to compare.
+    :type globs: list
+
+    :param float atol: Absolute tolerance.
+
+    :param float rtol: Tolerance relative to the values in :kbd:`results_b`.
+
+    :param stop_after: Number of differences after which to stop comparing;
+                       :py:obj:`None` means compare everything.
+    :type stop_after: int or None
+
+    :param boolean stop_at_first_block: Stop comparing each variable at the first
+                                        block of time records that has values that
+                                        are different by more than the tolerances.
+
+    :raises: :py:exc:`SystemExit` with status 2 if the results directories
+             can't be compared,
+             or with status 1 if there are differences.
+
+    :return: Comparisons of the variables that were compared.
+    :rtype: list
+    """
+    results_a, results_b = (
+        Path(os.path.expandvars(results_dir)).expanduser()
+        for results_dir in (results_a, results_b)
+    )
+    for results_dir in (results_a, results_b):
+        if not results_dir.is_dir():
+            logger.error(f"{results_dir} is not a directory")
+            raise SystemExit(2)
+    if atol < 0 or rtol < 0:
+        logger.error(f"tolerances must not be negative: atol={atol}, rtol={rtol}")
+        raise SystemExit(2)
+    if stop_after is not None and stop_after < 1:
+        logger.error(f"--stop-after must be at least 1, not {stop_after}")
+        raise SystemExit(2)
+    names = sorted(
+        {
+            path.name
+            for glob in globs
+            for results_dir in (results_a, results_b)
+            for path in results_dir.glob(glob)
+        }
+    )
+    if not names:
+        logger.error(f"no files matching {', '.join(globs)} found to compare")
+        raise SystemExit(2)
+    start = time.perf_counter()
+    comparisons = []
+    n_differences = 0
+    for name in names:
+        path_a, path_b = results_a / name, results_b / name
+        missing = [path for path in (path_a, path_b) if not path.is_file()]
+        if missing:
+            logger.error(f"{missing[0]} not found")
+            n_differences += 1
+        else:
+            limit = None if stop_after is None else stop_after - n_differences
+            file_comparisons = _compare_files(
+                path_a, path_b, atol, rtol, limit, stop_at_first_block
+            )
+            comparisons.extend(file_comparisons)
+            n_differences += sum(
+                comparison.is_different for comparison in file_comparisons
+            )
+        if stop_after is not None and n_differences >= stop_after:
+            logger.warning(f"stopped comparing after {n_differences} difference(s)")
+            break
+    logger.info(
+        f"compared {len(comparisons)} variables in {len(names)} files "
+        f"in {time.perf_counter() - start:.3f} s"
+    )
+    if n_differences:
+        logger.error(
+            f"found {n_differences} difference(s) between {results_a} and {results_b} "
+            f"greater than atol={atol}, rtol={rtol}"
+        )
+        raise SystemExit(1)
+    return comparisons
+
+
+def _compare_files(path_a, path_b, atol, rtol, limit=None, stop_at_first_block=False):
+    """Compare the variables in two NetCDF files.
+
+    :param path_a: Path of the file to compare.
+    :type path_a: :py:class:`pathlib.Path`
+
+    :param path_b: Path of the reference file to compare to.
+    :type path_b: :py:class:`pathlib.Path`
+
+    :param float atol: Absolute tolerance.
+
+    :param float rtol: Relative tolerance.
+
+    :param limit: Number of differences after which to stop comparing.
+    :type limit: int or None
+
+    :param boolean stop_at_first_block: Stop comparing each variable at the first
+                                        block that has values that are different by
+                                        more than the tolerances.
+
+    :return: Comparisons of the variables that were compared.
+    :rtype: list
+    """
+    comparisons = []
+    with netCDF4.Dataset(path_a) as ds_a, netCDF4.Dataset(path_b) as ds_b:
+        ds_a.set_auto_maskandscale(False)
+        ds_b.set_auto_maskandscale(False)
+        time_dim = repack.find_time_dim(ds_b)
+        for var_name in sorted(ds_a.variables.keys() | ds_b.variables.keys()):
+            comparison = VariableComparison(path_a.name, var_name, atol, rtol)
+            comparisons.append(comparison)
+            if var_name not in ds_a.variables or var_name not in ds_b.variables:
+                comparison.mismatch("is in only one of the files")
+            else:
+                var_a, var_b = ds_a.variables[var_name], ds_b.variables[var_name]
+                if (var_a.dimensions, var_a.shape) != (var_b.dimensions, var_b.shape):
+                    comparison.mismatch(
+                        f"dimensions {var_a.dimensions} {var_a.shape} != "
+                        f"{var_b.dimensions} {var_b.shape}"
+                    )
+                else:
+                    _compare_variable(
+                        var_a, var_b, time_dim, comparison, stop_at_first_block
+                    )
+            comparison.report()
+            if limit is not None and comparison.is_different:
+                limit -= 1
+                if limit == 0:
+                    break
+    return comparisons
+
+
+def _compare_variable(var_a, var_b, time_dim, comparison, stop_at_first_block=False):
+    """Compare two variables with the same dimensions in blocks of time records.
+
+    :param var_a: Variable to compare.
+    :type var_a: :py:class:`netCDF4.Variable`
+
+    :param var_b: Reference variable to compare to.
+    :type var_b: :py:class:`netCDF4.Variable`
+
+    :param str time_dim: Name of the time dimension.
+
+    :param comparison: Comparison to update.
+    :type comparison: :py:class:`VariableComparison`
+
+    :param boolean stop_at_first_block: Stop at the first block that has values that
+                                        are different by more than the tolerances,
+                                        instead of comparing all of the values.
+    """
+    if time_dim not in var_b.dimensions or not all(var_b.shape):
+        comparison.update(var_a[...], var_b[...])
+        return
+    axis = var_b.dimensions.index(time_dim)
+    record_bytes = 8 * math.prod(
+        size for dim, size in zip(var_b.dimensions, var_b.shape) if dim != time_dim
+    )
+    block = max(1, MAX_BLOCK_BYTES // record_bytes)
+    for start in range(0, var_b.shape[axis], block):
+        index = [slice(None)] * len(var_b.dimensions)
+        index[axis] = slice(start, min(start + block, var_b.shape[axis]))
+        comparison.update(var_a[tuple(index)], var_b[tuple(index)])
+        if stop_at_first_block and comparison.is_different:
+            break
+
+
+class VariableComparison:
+    """Streaming comparison of a variable in two NetCDF files,
+    updated with one block of values at a time.
+
+    :param str file_name: Name of the files.
+
+    :param str var_name: Name of the variable.
+
+    :param float atol: Absolute tolerance.
+
+    :param float rtol: Tolerance relative to the reference values.
+    """
+
+    def __init__(self, file_name, var_name, atol, rtol):
+        self.file_name = file_name
+        self.var_name = var_name
+        self.atol = atol
+        self.rtol = rtol
+        self.max_abs_diff = 0.0
+        self.max_rel_diff = 0.0
+        self.n_values = 0
+        self.n_exceeding = 0
+        self.problem = None
+        self._sum_abs_diff = 0.0
+
+    @property
+    def is_different(self):
+        """Values are different by more than the tolerances,
+        or the variables don't match.
+
+        :rtype: boolean
+        """
+        return self.problem is not None or self.n_exceeding > 0
+
+    @property
+    def mean_abs_diff(self):
+        """Mean absolute difference of the values compared so far.
+
+        :rtype: float
+        """
+        return self._sum_abs_diff / self.n_values if self.n_values else 0.0
+
+    def mismatch(self, problem):
+        """Record that the variables can't be compared.
+
+        :param str problem: Description of the mismatch.
+        """
+        self.problem = problem
+
+    def update(self, a, b):
+        """Update the comparison statistics with a block of values.
+
+        :param a: Values to compare.
+        :type a: :py:class:`numpy.ndarray`
+
+        :param b: Reference values to compare to.
+        :type b: :py:class:`numpy.ndarray`
+        """
+        a, b = numpy.asarray(a), numpy.asarray(b)
+        if a.dtype.kind in "biuf" and b.dtype.kind in "biuf":
+            a, b = a.astype("f8"), b.astype("f8")
+            with numpy.errstate(invalid="ignore"):
+                abs_diff = numpy.abs(a - b)
+            # Equal infinities, and NaNs in both, are not differences;
+            # NaN in only one is an infinite difference
+            abs_diff[(a == b) | (numpy.isnan(a) & numpy.isnan(b))] = 0
+            abs_diff[numpy.isnan(abs_diff)] = numpy.inf
+            scale = numpy.abs(b)
+            scale[~numpy.isfinite(scale)] = 0
+        else:
+            # Characters and strings are either equal or not
+            abs_diff = (a != b).astype("f8")
+            scale = numpy.zeros_like(abs_diff)
+        rel_diff = numpy.divide(
+            abs_diff,
+            scale,
+            out=numpy.where(abs_diff > 0, numpy.inf, 0.0),
+            where=scale > 0,
+        )
+        self.n_exceeding += int(
+            numpy.count_nonzero(abs_diff > self.atol + self.rtol * scale)
+        )
+        if abs_diff.size:
+            self.max_abs_diff = max(self.max_abs_diff, float(abs_diff.max()))
+            self.max_rel_diff = max(self.max_rel_diff, float(rel_diff.max()))
+            self._sum_abs_diff += float(abs_diff.sum())
+            self.n_values += abs_diff.size
+
+    def report(self):
+        """Log the result of the comparison;
+        as an error if the variables are different.
+        """
+        where = f"{self.file_name}:{self.var_name}"
+        if self.problem is not None:
+            logger.error(f"{where} {self.problem}")
+            return
+        stats = (
+            f"max abs diff {self.max_abs_diff:.6g}, "
+            f"mean abs diff {self.mean_abs_diff:.6g}, "
+            f"max rel diff {self.max_rel_diff:.6g}"
+        )
+        if self.n_exceeding:
+            logger.error(
+                f"{where} {self.n_exceeding} of {self.n_values} compared values "
+                f"exceed tolerances; {stats}"
+            )
+        else:
+            logger.debug(f"{where} {stats}")
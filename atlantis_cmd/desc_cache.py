@@ -0,0 +1,305 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Cache of parsed and path-validated run descriptions.
+
+Parsed run descriptions are keyed by the SHA-256 hash of their YAML file contents.
+Validated input file paths are keyed by the hash of the unresolved path values in
+the run description,
+the current working directory,
+and the environment variables that the paths refer to,
+so the run descriptions of sweep points that only differ in their non-path values
+share one validation.
+A cached validation is only reused if all of its input files,
+and the directories of its forcing globs and directory declarations,
+still have the same device, inode, and modification time,
+and its other directories,
+like the runs directory,
+still exist.
+
+Entries are kept in memory for the lifetime of the process,
+and, optionally, in pickle files in a cache directory that is bounded in size by
+evicting the least recently used entries.
+"""
+
+import collections
+import copy
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import stat
+from pathlib import Path
+
+from atlantis_cmd import validate
+from atlantis_cmd.lazy_import import lazy_import
+
+nemo_cmd = lazy_import("nemo_cmd.prepare")
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of entries in the in-memory and on-disk caches
+DEFAULT_MAX_ENTRIES = 256
+
+# Version of the format of the cache entries;
+# entries with a different version are ignored
+CACHE_FORMAT = 2
+
+# Process-wide caches keyed by cache directory
+_caches = {}
+
+
+def default_cache_dir():
+    """Path of the on-disk run description cache directory.
+
+    :rtype: :py:class:`pathlib.Path`
+    """
+    cache_home = Path(os.environ.get("XDG_CACHE_HOME", "~/.cache")).expanduser()
+    return cache_home / "atlantis_cmd" / "run_desc"
+
+
+def get_cache(persist=False):
+    """Get the process-wide run description cache.
+
+    :param boolean persist: Use the cache that is also stored on disk in
+                            :py:func:`default_cache_dir`.
+
+    :rtype: :py:class:`RunDescCache`
+    """
+    cache_dir = default_cache_dir() if persist else None
+    if cache_dir not in _caches:
+        _caches[cache_dir] = RunDescCache(cache_dir)
+    return _caches[cache_dir]
+
+
+class RunDescCache:
+    """Cache of parsed and path-validated run descriptions.
+
+    :param cache_dir: Directory in which to store the cache entries;
+                      :py:obj:`None` means only keep them in memory.
+    :type cache_dir: :py:class:`pathlib.Path` or None
+
+    :param int max_entries: Maximum number of entries to keep in memory,
+                            and on disk.
+    """
+
+    def __init__(self, cache_dir=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, desc_file):
+        """Load a run description YAML file,
+        or get a copy of the cached parse of its contents.
+
+        :param desc_file: File path/name of the YAML run description file.
+        :type desc_file: :py:class:`pathlib.Path`
+
+        :return: Run description dictionary.
+        :rtype: dict
+        """
+        try:
+            contents = Path(desc_file).read_bytes()
+        except OSError:
+            # Let nemo_cmd report the problem
+            return nemo_cmd.prepare.load_run_desc(desc_file)
+        key = f"desc-{hashlib.sha256(contents).hexdigest()}"
+        run_desc = self._get(key)
+        if run_desc is None:
+            self.misses += 1
+            run_desc = nemo_cmd.prepare.load_run_desc(desc_file)
+            self._put(key, run_desc)
+        else:
+            self.hits += 1
+        # Callers are free to modify the run description that they get
+        return copy.deepcopy(run_desc)
+
+    def validate(self, run_desc, stat_cache=None):
+        """Validate the input file paths in a run description,
+        or get the cached resolved paths of an identical set of unresolved paths
+        whose input files have not changed.
+
+        :param dict run_desc: Run description dictionary.
+
+        :param stat_cache: Path lookup cache to use for validation.
+        :type stat_cache: :py:class:`atlantis_cmd.validate.StatCache` or None
+
+        :raises: :py:exc:`SystemExit` if any problems are found.
+
+        :return: Resolved paths keyed by run description key tuples.
+        :rtype: dict
+        """
+        errors = []
+        path_values = validate.collect_path_values(run_desc, errors)
+        if errors:
+            # Let validation report all of the problems
+            return validate.validate_run_desc(run_desc, stat_cache)
+        key = f"paths-{_paths_key(path_values)}"
+        entry = self._get(key)
+        if entry is not None and all(
+            _signature(path, scan) == signature
+            for path, scan, signature in entry["inputs"]
+        ):
+            self.hits += 1
+            return dict(entry["resolved paths"])
+        self.misses += 1
+        resolved_paths = validate.validate_run_desc(run_desc, stat_cache)
+        inputs = []
+        for keys, value in path_values.items():
+            path = _expand(validate.lookup_path(keys, value))
+            # Adding or removing files in a forcing scan directory changes the
+            # files that it declares
+            scan = keys[0] == "forcing" and keys[-1] in validate.FORCING_SCAN_KEYS
+            inputs.append((path, scan, _signature(path, scan)))
+        self._put(key, {"resolved paths": resolved_paths, "inputs": inputs})
+        return dict(resolved_paths)
+
+    def _get(self, key):
+        """Get a cache entry from memory, or from disk.
+
+        Callers count the cache hits and misses because a cache entry may turn out
+        to be out of date.
+
+        :param str key: Cache key.
+
+        :return: Cached value, or :py:obj:`None` if there isn't one.
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        if self.cache_dir is not None:
+            entry_file = self.cache_dir / f"{key}.pickle"
+            try:
+                with entry_file.open("rb") as f:
+                    cache_format, value = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+                cache_format = None
+            if cache_format == CACHE_FORMAT:
+                # Most recently used entries have the newest modification times
+                entry_file.touch()
+                self._remember(key, value)
+                return value
+        return None
+
+    def _put(self, key, value):
+        """Store a cache entry in memory, and on disk.
+
+        :param str key: Cache key.
+
+        :param value: Value to cache.
+        """
+        self._remember(key, value)
+        if self.cache_dir is None:
+            return
+        try:
+            self.cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+            entry_file = self.cache_dir / f"{key}.pickle"
+            tmp_file = entry_file.with_name(f".{entry_file.name}.{os.getpid()}.tmp")
+            with tmp_file.open("wb") as f:
+                pickle.dump((CACHE_FORMAT, value), f)
+            os.replace(tmp_file, entry_file)
+            self._evict()
+        except OSError as exc:
+            logger.warning(f"failed to write run description cache entry: {exc}")
+
+    def _remember(self, key, value):
+        """Store a cache entry in memory,
+        evicting the least recently used entry if there are too many.
+
+        :param str key: Cache key.
+
+        :param value: Value to cache.
+        """
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _evict(self):
+        """Delete the least recently used entries from the cache directory
+        if there are too many.
+        """
+        entries = []
+        for entry_file in self.cache_dir.glob("*.pickle"):
+            try:
+                entries.append((entry_file.stat().st_mtime_ns, entry_file))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+        for _, entry_file in entries[: max(0, len(entries) - self.max_entries)]:
+            entry_file.unlink(missing_ok=True)
+
+
+def _expand(path):
+    """Expand environment variables and :file:`~` in a path.
+
+    :param path: Path.
+    :type path: :py:class:`pathlib.Path` or str
+
+    :rtype: str
+    """
+    return os.path.expanduser(os.path.expandvars(os.fspath(path)))
+
+
+def _signature(path, scan=False):
+    """Identify the current version of a file by its device, inode,
+    and modification time.
+
+    The modification time of a directory changes whenever a file is created in it,
+    so directories other than forcing scan directories are only checked for
+    existence.
+
+    :param str path: Path of the file; symlinks are followed.
+
+    :param boolean scan: The path is the directory of a forcing glob or directory
+                         declaration.
+
+    :return: Signature, or :py:obj:`None` if the file doesn't exist.
+    :rtype: tuple
+    """
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    if stat.S_ISDIR(stat_result.st_mode) and not scan:
+        return ("directory",)
+    return stat_result.st_dev, stat_result.st_ino, stat_result.st_mtime_ns
+
+
+def _paths_key(path_values):
+    """Hash the unresolved paths of a run description,
+    and the context that they are resolved in.
+
+    :param dict path_values: Unresolved paths keyed by run description keys.
+
+    :return: Hexadecimal hash.
+    :rtype: str
+    """
+    values = [[keys, os.fspath(value)] for keys, value in path_values.items()]
+    text = json.dumps(values)
+    env_vars = sorted(set(re.findall(r"\$\{?(\w+)", text)) | {"HOME"})
+    context = {
+        "paths": values,
+        "cwd": os.getcwd(),
+        "env": {name: os.environ.get(name) for name in env_vars},
+    }
+    return hashlib.sha256(json.dumps(context).encode()).hexdigest()
@@ -0,0 +1,678 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""AtlantisCmd command plug-in for ensemble-stats sub-command.
+
+Calculate the mean, standard deviation, and quantiles across the members of an
+ensemble of the variables in their Atlantis output files.
+
+The members are streamed through online accumulators one block of time records
+of one variable at a time,
+so the memory used depends on the size of the blocks,
+and on the number of members only up to the number that quantiles are calculated
+exactly for.
+"""
+
+import concurrent.futures
+import itertools
+import logging
+import math
+import os
+import time
+from pathlib import Path
+
+import cliff.command
+
+from atlantis_cmd import repack
+from atlantis_cmd.lazy_import import lazy_import
+from atlantis_cmd.summarize import find_output_filename_base
+
+netCDF4 = lazy_import("netCDF4")
+numpy = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUANTILES = (0.05, 0.5, 0.95)
+
+# Upper limit on the size of the accumulators for the block of time records of a
+# variable that a worker process calculates statistics for
+MAX_BLOCK_BYTES = 64 * 2**20
+
+# Maximum number of ensemble members that quantiles are calculated exactly for;
+# the quantiles of larger ensembles are estimated with the P-squared algorithm,
+# starting from the exact order statistics of the first EXACT_QUANTILE_MEMBERS + 1
+# members
+EXACT_QUANTILE_MEMBERS = 100
+
+# Number of markers of the P-squared quantile estimator
+_P2_MARKERS = 5
+
+# Member output files opened by a worker process,
+# kept open for the lifetime of the process so that each file is opened once by
+# each worker rather than once for each block
+_datasets = {}
+
+
+class EnsembleStats(cliff.command.Command):
+    """Calculate statistics of the outputs of the members of an Atlantis ensemble."""
+
+    def get_parser(self, prog_name):
+        parser = super().get_parser(prog_name)
+        parser.description = """
+            Calculate the mean, standard deviation, and quantiles across the
+            members of the ensemble in ENSEMBLE_RESULTS_DIR of the variables in
+            their Atlantis output files.
+            The statistics are written to a NetCDF file in ENSEMBLE_RESULTS_DIR.
+        """
+        parser.add_argument(
+            "ensemble_dir",
+            metavar="ENSEMBLE_RESULTS_DIR",
+            type=Path,
+            help="""
+            results directory of the ensemble;
+            each of its sub-directories is the results directory of a member
+            """,
+        )
+        parser.add_argument(
+            "--file",
+            dest="file_name",
+            metavar="NAME",
+            default=None,
+            help="""
+            Name of the NetCDF output file of the members to calculate the
+            statistics of.
+            Defaults to the output filename base in the run description YAML file of
+            the first member, with a .nc extension.
+            """,
+        )
+        parser.add_argument(
+            "--quantile",
+            dest="quantiles",
+            metavar="Q",
+            type=float,
+            action="append",
+            default=[],
+            help=f"""
+            Quantile to calculate; between 0 and 1.
+            May be used more than once.
+            Defaults to {", ".join(str(q) for q in DEFAULT_QUANTILES)}.
+            """,
+        )
+        parser.add_argument(
+            "--max-workers",
+            dest="max_workers",
+            type=int,
+            default=4,
+            help="""
+            Maximum number of worker processes to calculate statistics with.
+            Defaults to 4.
+            """,
+        )
+        return parser
+
+    def take_action(self, parsed_args):
+        """Execute the `atlantis ensemble-stats` sub-command.
+
+        :param parsed_args: Arguments and options parsed from the command-line.
+        :type parsed_args: :class:`argparse.Namespace` instance
+        """
+        ensemble_stats(
+            parsed_args.ensemble_dir,
+            file_name=parsed_args.file_name,
+            quantiles=parsed_args.quantiles or DEFAULT_QUANTILES,
+            max_workers=parsed_args.max_workers,
+        )
+
+
+def ensemble_stats(
+    ensemble_dir, file_name=None, quantiles=DEFAULT_QUANTILES, max_workers=4
+):
+    """Calculate statistics across the members of an ensemble of the variables in
+    their output files.
+
+    Statistics are calculated for each block of time records of each variable by a
+    pool of worker processes that read the block from each member in turn,
+    and accumulate its mean and variance with Welford's online algorithm.
+    Its quantiles are calculated exactly from the members' values for ensembles of
+    up to :py:data:`EXACT_QUANTILE_MEMBERS` members,
+    and with the P-squared algorithm for larger ensembles.
+    The blocks are sized for the number of members,
+    and the number of blocks in flight is limited to twice the number of workers,
+    so memory use doesn't depend on the size of the files.
+
+    :param ensemble_dir: Results directory of the ensemble;
+                         each of its sub-directories is the results directory of
+                         a member.
+    :type ensemble_dir: :py:class:`pathlib.Path`
+
+    :param file_name: Name of the member output file;
+                      defaults to the :kbd:`output filename base` of the first
+                      member with a :file:`.nc` extension.
+    :type file_name: str or None
+
+    :param quantiles: Quantiles to calculate.
+    :type quantiles: list
+
+    :param int max_workers: Maximum number of worker processes.
+
+    :raises: :py:exc:`SystemExit` if the member output files are missing,
+             or don't have the same variables.
+
+    :return: Path of the statistics file.
+    :rtype: :py:class:`pathlib.Path`
+    """
+    ensemble_dir = Path(os.path.expandvars(ensemble_dir)).expanduser()
+    if max_workers < 1:
+        logger.error(f"--max-workers must be at least 1, not {max_workers}")
+        raise SystemExit(2)
+    bad_quantiles = [q for q in quantiles if not 0 <= q <= 1]
+    if bad_quantiles:
+        logger.error(
+            f"quantiles must be between 0 and 1: {', '.join(map(str, bad_quantiles))}"
+        )
+        raise SystemExit(2)
+    quantiles = sorted(set(quantiles))
+    member_dirs = (
+        sorted(path for path in ensemble_dir.iterdir() if path.is_dir())
+        if ensemble_dir.is_dir()
+        else []
+    )
+    if len(member_dirs) < 2:
+        logger.error(
+            f"fewer than 2 ensemble member results directories found in {ensemble_dir}"
+        )
+        raise SystemExit(2)
+    if file_name is None:
+        file_name = f"{find_output_filename_base(member_dirs[0])}.nc"
+    paths = [member_dir / file_name for member_dir in member_dirs]
+    missing = [path for path in paths if not path.is_file()]
+    for path in missing:
+        logger.error(f"{path} not found")
+    if missing:
+        raise SystemExit(2)
+    stats_path = ensemble_dir / f"{Path(file_name).stem}_ensemble_stats.nc"
+    start = time.perf_counter()
+    tasks = _check_members(paths, quantiles)
+    tmp_path = stats_path.with_name(f".{stats_path.name}.tmp")
+    try:
+        with netCDF4.Dataset(paths[0]) as template:
+            _create_stats_file(tmp_path, template, paths, quantiles, tasks)
+        with netCDF4.Dataset(tmp_path, "a") as stats:
+            _calc_stats(paths, quantiles, tasks, stats, max_workers)
+        os.replace(tmp_path, stats_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    logger.info(
+        f"calculated statistics of {len({var_name for var_name, _ in tasks})} "
+        f"variables across {len(paths)} ensemble members in "
+        f"{time.perf_counter() - start:.3f} s; written to {stats_path}"
+    )
+    return stats_path
+
+
+def _check_members(paths, quantiles):
+    """Check that the member output files have the same variables as the first one,
+    and divide the variables into blocks of time records to calculate statistics for.
+
+    :param list paths: Paths of the member output files.
+
+    :param list quantiles: Quantiles to calculate.
+
+    :raises: :py:exc:`SystemExit` if the dimensions of a variable are different
+             in a member output file.
+
+    :return: :kbd:`(variable name, index)` 2-tuples of blocks of variables.
+    :rtype: list
+    """
+    with netCDF4.Dataset(paths[0]) as first:
+        time_dim = repack.find_time_dim(first)
+        variables = {
+            name: (var.dimensions, var.shape)
+            for name, var in first.variables.items()
+            if var.dtype.kind in "biuf" and var.dimensions != (name,)
+        }
+    problems = 0
+    for path in paths[1:]:
+        with netCDF4.Dataset(path) as member:
+            for name, (dimensions, shape) in variables.items():
+                var = member.variables.get(name)
+                if var is None:
+                    logger.error(f"{name} not found in {path}")
+                    problems += 1
+                elif (var.dimensions, var.shape) != (dimensions, shape):
+                    logger.error(
+                        f"{name} dimensions in {path} are {var.dimensions} "
+                        f"{var.shape}, but they are {dimensions} {shape} in {paths[0]}"
+                    )
+                    problems += 1
+    if problems:
+        raise SystemExit(2)
+    values_per_element = _values_per_element(len(paths), len(quantiles))
+    tasks = []
+    for name, (dimensions, shape) in variables.items():
+        if time_dim not in dimensions or not all(shape):
+            tasks.append((name, (Ellipsis,)))
+            continue
+        axis = dimensions.index(time_dim)
+        record_bytes = (
+            8
+            * values_per_element
+            * math.prod(size for dim, size in zip(dimensions, shape) if dim != time_dim)
+        )
+        block = max(1, MAX_BLOCK_BYTES // record_bytes)
+        for block_start in range(0, shape[axis], block):
+            index = [slice(None)] * len(dimensions)
+            index[axis] = slice(block_start, min(block_start + block, shape[axis]))
+            tasks.append((name, tuple(index)))
+    return tasks
+
+
+def _values_per_element(n_members, n_quantiles):
+    """Number of float64 values that an :py:class:`EnsembleAccumulator` holds at
+    once for each element of a block of a variable.
+
+    :param int n_members: Number of ensemble members.
+
+    :param int n_quantiles: Number of quantiles to calculate.
+
+    :rtype: int
+    """
+    # Mean, sum of squares of differences, and the member values being accumulated
+    values = 4
+    # Member values kept for exact quantiles, and the copy that they are sorted in
+    values += 2 * min(n_members, EXACT_QUANTILE_MEMBERS + 1)
+    if n_members > EXACT_QUANTILE_MEMBERS:
+        # Heights and positions of the P-squared markers
+        values += 2 * _P2_MARKERS * n_quantiles
+    return values
+
+
+def _create_stats_file(path, template, paths, quantiles, tasks):
+    """Create the statistics file with the dimensions and coordinate variables of
+    the first member output file,
+    and mean, standard deviation, and quantiles variables for each of its numeric
+    variables.
+
+    :param path: Path of the statistics file.
+    :type path: :py:class:`pathlib.Path`
+
+    :param template: First member output file.
+    :type template: :py:class:`netCDF4.Dataset`
+
+    :param list paths: Paths of the member output files.
+
+    :param list quantiles: Quantiles to calculate.
+
+    :param list tasks: :kbd:`(variable name, index)` 2-tuples of blocks of variables.
+    """
+    template.set_auto_maskandscale(False)
+    with netCDF4.Dataset(path, "w", format="NETCDF4_CLASSIC") as stats:
+        stats.setncatts({attr: template.getncattr(attr) for attr in template.ncattrs()})
+        stats.ensemble_members = len(paths)
+        stats.ensemble_files = "\n".join(os.fspath(path) for path in paths)
+        for name, dim in template.dimensions.items():
+            stats.createDimension(name, None if dim.isunlimited() else len(dim))
+        stats.createDimension("quantile", len(quantiles))
+        quantile_var = stats.createVariable("quantile", "f8", ("quantile",))
+        quantile_var[:] = quantiles
+        for name, var in template.variables.items():
+            if var.dimensions == (name,):
+                coord = stats.createVariable(name, var.dtype, var.dimensions)
+                coord.setncatts({attr: var.getncattr(attr) for attr in var.ncattrs()})
+                coord[:] = var[:]
+        for name in dict.fromkeys(var_name for var_name, _ in tasks):
+            var = template.variables[name]
+            attrs = {attr: var.getncattr(attr) for attr in var.ncattrs()}
+            fill_value = attrs.pop("_FillValue", None)
+            # The spread of packed values is scaled but not offset,
+            # and isn't in the range of the values
+            std_attrs = {
+                attr: value
+                for attr, value in attrs.items()
+                if attr not in {"add_offset", "valid_min", "valid_max", "valid_range"}
+            }
+            for suffix, dimensions, var_attrs in (
+                ("mean", var.dimensions, attrs),
+                ("std", var.dimensions, std_attrs),
+                ("quantiles", ("quantile", *var.dimensions), attrs),
+            ):
+                stats_var = stats.createVariable(
+                    f"{name}_{suffix}",
+                    "f8",
+                    dimensions,
+                    compression="zlib" if dimensions else None,
+                    shuffle=True,
+                    fill_value=fill_value,
+                )
+                stats_var.setncatts(var_attrs)
+
+
+def _calc_stats(paths, quantiles, tasks, stats, max_workers):
+    """Calculate the statistics of the blocks of variables with a pool of worker
+    processes, and write them to the statistics file as they are completed.
+
+    :param list paths: Paths of the member output files.
+
+    :param list quantiles: Quantiles to calculate.
+
+    :param list tasks: :kbd:`(variable name, index)` 2-tuples of blocks of variables.
+
+    :param stats: Statistics file.
+    :type stats: :py:class:`netCDF4.Dataset`
+
+    :param int max_workers: Maximum number of worker processes.
+    """
+    stats.set_auto_maskandscale(False)
+    pending = iter(tasks)
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=min(max_workers, len(tasks))
+    ) as executor:
+
+        def submit(n_tasks):
+            return {
+                executor.submit(block_stats, paths, name, index, quantiles): (
+                    name,
+                    index,
+                )
+                for name, index in itertools.islice(pending, n_tasks)
+            }
+
+        futures = submit(2 * max_workers)
+        while futures:
+            done, _ = concurrent.futures.wait(
+                futures, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                name, index = futures.pop(future)
+                mean, std, quantile_values = future.result()
+                stats.variables[f"{name}_mean"][index] = mean
+                stats.variables[f"{name}_std"][index] = std
+                stats.variables[f"{name}_quantiles"][
+                    (slice(None), *index)
+                ] = quantile_values
+            futures.update(submit(len(done)))
+
+
+def block_stats(paths, var_name, index, quantiles):
+    """Calculate the mean, standard deviation, and quantiles across the ensemble
+    members of a block of a variable.
+
+    The statistics are calculated from the packed values in the member output files.
+    Elements that are fill values in any member are fill values in the statistics.
+
+    :param list paths: Paths of the member output files.
+
+    :param str var_name: Name of the variable.
+
+    :param tuple index: Index of the block.
+
+    :param list quantiles: Quantiles to calculate.
+
+    :return: Mean, sample standard deviation, and quantiles of the block;
+             the quantiles have a leading quantile dimension.
+    :rtype: 3-tuple of :py:class:`numpy.ndarray`
+    """
+    accumulator = None
+    for path in paths:
+        var = _dataset(path).variables[var_name]
+        values = numpy.asarray(var[index], dtype="f8")
+        fill = _fill_mask(var, values)
+        if accumulator is None:
+            accumulator = EnsembleAccumulator(values.shape, quantiles)
+            masked, fill_value = fill, _fill_value(var)
+        else:
+            masked |= fill
+        # Fill values would swamp the statistics of the elements;
+        # the statistics of the masked elements are replaced below
+        values[fill] = 0
+        accumulator.update(values)
+    stats = accumulator.mean, accumulator.std, accumulator.quantiles()
+    if not masked.any():
+        return stats
+    return tuple(numpy.where(masked, fill_value, stat) for stat in stats)
+
+
+def _fill_mask(var, values):
+    """Find the elements of a block of a variable that are fill or missing values.
+
+    :param var: Variable.
+    :type var: :py:class:`netCDF4.Variable`
+
+    :param values: Packed values of the block.
+    :type values: :py:class:`numpy.ndarray`
+
+    :rtype: :py:class:`numpy.ndarray` of bool
+    """
+    mask = numpy.zeros(values.shape, dtype=bool)
+    for attr in ("_FillValue", "missing_value"):
+        if attr in var.ncattrs():
+            for fill_value in numpy.atleast_1d(var.getncattr(attr)):
+                mask |= (
+                    numpy.isnan(values)
+                    if numpy.isnan(fill_value)
+                    else values == fill_value
+                )
+    return mask
+
+
+def _fill_value(var):
+    """Value to write in the statistics of masked elements of a variable;
+    its fill value, or its missing value if it doesn't have one.
+
+    :param var: Variable.
+    :type var: :py:class:`netCDF4.Variable`
+
+    :rtype: float
+    """
+    for attr in ("_FillValue", "missing_value"):
+        if attr in var.ncattrs():
+            return float(numpy.atleast_1d(var.getncattr(attr))[0])
+    return numpy.nan
+
+
+def _dataset(path):
+    """Open a member output file,
+    or return it if this process has already opened it.
+
+    :param path: Path of the member output file.
+    :type path: :py:class:`pathlib.Path`
+
+    :rtype: :py:class:`netCDF4.Dataset`
+    """
+    if path not in _datasets:
+        _datasets[path] = netCDF4.Dataset(path)
+        _datasets[path].set_auto_maskandscale(False)
+    return _datasets[path]
+
+
+class EnsembleAccumulator:
+    """Online accumulator of the mean, variance, and quantiles of arrays of values
+    from ensemble members, updated with one member's array at a time.
+
+    The mean and variance are accumulated with Welford's algorithm.
+    The arrays of up to :py:data:`EXACT_QUANTILE_MEMBERS` members are kept to
+    calculate exact quantiles;
+    when more are accumulated the quantiles are estimated with the P-squared
+    algorithm of Jain and Chlamtac (1985),
+    vectorized over the elements of the arrays.
+
+    :param tuple shape: Shape of the arrays.
+
+    :param list quantiles: Quantiles to estimate.
+    """
+
+    def __init__(self, shape, quantiles):
+        self.count = 0
+        self.mean = numpy.zeros(shape)
+        self._m2 = numpy.zeros(shape)
+        self._quantiles = list(quantiles)
+        self._members = []
+        self._estimators = None
+
+    @property
+    def std(self):
+        """Sample standard deviation of the values accumulated so far.
+
+        :rtype: :py:class:`numpy.ndarray`
+        """
+        if self.count < 2:
+            return numpy.full_like(self.mean, numpy.nan)
+        return numpy.sqrt(self._m2 / (self.count - 1))
+
+    def update(self, values):
+        """Accumulate an ensemble member's values.
+
+        :param values: Values.
+        :type values: :py:class:`numpy.ndarray`
+        """
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (values - self.mean)
+        if self._estimators is None:
+            self._members.append(values)
+            if self.count > EXACT_QUANTILE_MEMBERS:
+                initial = numpy.stack(self._members)
+                self._members = []
+                initial.sort(axis=0)
+                self._estimators = [
+                    _P2Quantile(p, initial.shape[1:]) for p in self._quantiles
+                ]
+                for estimator in self._estimators:
+                    estimator.initialize(initial)
+            return
+        for estimator in self._estimators:
+            estimator.update(values)
+
+    def quantiles(self):
+        """Quantiles of the values accumulated so far;
+        exact if no more than :py:data:`EXACT_QUANTILE_MEMBERS` arrays have been
+        accumulated,
+        and estimated otherwise.
+
+        :return: Quantiles with a leading quantile dimension.
+        :rtype: :py:class:`numpy.ndarray`
+        """
+        if self._estimators is None:
+            return numpy.quantile(
+                numpy.stack(self._members),
+                self._quantiles,
+                axis=0,
+                overwrite_input=True,
+            )
+        return numpy.stack([estimator.estimate for estimator in self._estimators])
+
+
+class _P2Quantile:
+    """P-squared estimator of a quantile,
+    vectorized over the elements of arrays of values.
+
+    The estimator keeps 5 markers for each element;
+    their heights are estimates of the minimum,
+    the :kbd:`p/2`, :kbd:`p`, and :kbd:`(1+p)/2` quantiles,
+    and the maximum.
+
+    :param float p: Quantile to estimate.
+
+    :param tuple shape: Shape of the arrays.
+    """
+
+    def __init__(self, p, shape):
+        self.p = p
+        self.heights = numpy.empty((_P2_MARKERS, *shape))
+        self._positions = numpy.empty((_P2_MARKERS, *shape))
+        self._increments = numpy.array([0, p / 2, p, (1 + p) / 2, 1])
+        self._desired = None
+
+    @property
+    def estimate(self):
+        """Estimate of the quantile.
+
+        The minimum and maximum markers are exact,
+        so they are the 0 and 1 quantiles;
+        the middle marker can't be kept at either end of the distinct marker
+        positions.
+
+        :rtype: :py:class:`numpy.ndarray`
+        """
+        if self.p == 0:
+            return self.heights[0]
+        if self.p == 1:
+            return self.heights[_P2_MARKERS - 1]
+        return self.heights[2]
+
+    def initialize(self, initial):
+        """Initialize the markers from the order statistics of the first arrays of
+        values;
+        each marker starts at the order statistic nearest to its desired position,
+        keeping the markers at distinct positions.
+
+        :param initial: At least 5 arrays of values,
+                        sorted along their leading dimension.
+        :type initial: :py:class:`numpy.ndarray`
+        """
+        n = len(initial)
+        self._desired = 1 + (n - 1) * self._increments
+        positions = numpy.rint(self._desired).astype(int)
+        for i in range(_P2_MARKERS - 2, 0, -1):
+            positions[i] = min(positions[i], positions[i + 1] - 1)
+        for i in range(1, _P2_MARKERS - 1):
+            positions[i] = max(positions[i], positions[i - 1] + 1)
+        self.heights[...] = initial[positions - 1]
+        self._positions[...] = positions.reshape(
+            (_P2_MARKERS,) + (1,) * (initial.ndim - 1)
+        )
+
+    def update(self, values):
+        """Update the markers with an array of values.
+
+        :param values: Values.
+        :type values: :py:class:`numpy.ndarray`
+        """
+        q, n = self.heights, self._positions
+        numpy.minimum(q[0], values, out=q[0])
+        numpy.maximum(q[4], values, out=q[4])
+        # Cell of each value between the markers
+        cell = (values >= q[1]).astype(int) + (values >= q[2]) + (values >= q[3])
+        for i in range(1, _P2_MARKERS):
+            n[i] += cell < i
+        self._desired += self._increments
+        for i in (1, 2, 3):
+            d = self._desired[i] - n[i]
+            step = numpy.where(
+                ((d >= 1) & (n[i + 1] - n[i] > 1))
+                | ((d <= -1) & (n[i - 1] - n[i] < -1)),
+                numpy.sign(d),
+                0,
+            )
+            if not step.any():
+                continue
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                parabolic = q[i] + step / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                neighbour_q = numpy.where(step > 0, q[i + 1], q[i - 1])
+                neighbour_n = numpy.where(step > 0, n[i + 1], n[i - 1])
+                linear = q[i] + step * (neighbour_q - q[i]) / (neighbour_n - n[i])
+            adjusted = numpy.where(
+                (q[i - 1] < parabolic) & (parabolic < q[i + 1]), parabolic, linear
+            )
+            q[i] = numpy.where(step != 0, adjusted, q[i])
+            n[i] += step
@@ -0,0 +1,377 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""AtlantisCmd command plug-in for gather sub-command.
+
+Move the run definition and results files from an Atlantis temporary run directory
+into a results directory.
+"""
+
+import concurrent.futures
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+import cliff.command
+
+from atlantis_cmd import repack
+from atlantis_cmd.summarize import summarize_biomass
+
+logger = logging.getLogger(__name__)
+
+# Size of the chunks in which files are copied between filesystems
+COPY_CHUNK_SIZE = 8 * 2**20
+
+
+class ChecksumError(Exception):
+    """Raised when the checksum of a copied file does not match that of its source."""
+
+
+class Gather(cliff.command.Command):
+    """Gather results files from an Atlantis run into a results directory."""
+
+    def get_parser(self, prog_name):
+        parser = super().get_parser(prog_name)
+        parser.description = """
+            Move results files from the current directory into RESULTS_DIR.
+
+            If RESULTS_DIR does not exist it will be created.
+        """
+        parser.add_argument(
+            "results_dir",
+            metavar="RESULTS_DIR",
+            type=Path,
+            help="directory to store results into",
+        )
+        parser.add_argument(
+            "--max-workers",
+            dest="max_workers",
+            type=int,
+            default=4,
+            help="""
+            Maximum number of files to move, or to re-pack, at the same time.
+            Defaults to 4.
+            """,
+        )
+        parser.add_argument(
+            "--repack",
+            dest="repack_globs",
+            metavar="GLOB",
+            action="append",
+            default=[],
+            help="""
+            Re-pack the NetCDF files in RESULTS_DIR that match the quoted glob
+            pattern GLOB into compressed files with chunking tuned for time series
+            access.
+            May be used more than once.
+            """,
+        )
+        parser.add_argument(
+            "--compression",
+            choices=repack.COMPRESSIONS,
+            default="zlib",
+            help="""
+            Compression method to use to re-pack NetCDF files.
+            Defaults to zlib.
+            """,
+        )
+        parser.add_argument(
+            "--compression-level",
+            dest="complevel",
+            type=int,
+            default=4,
+            help="""
+            Compression level to use to re-pack NetCDF files.
+            Defaults to 4.
+            """,
+        )
+        parser.add_argument(
+            "--time-chunk",
+            dest="time_chunk",
+            type=int,
+            default=repack.DEFAULT_TIME_CHUNK,
+            help=f"""
+            Number of time records in each chunk of the re-packed NetCDF variables.
+            Defaults to {repack.DEFAULT_TIME_CHUNK}.
+            """,
+        )
+        parser.add_argument(
+            "--summarize",
+            action="store_true",
+            help="""
+            Summarize the biomass of the functional groups in the Atlantis output
+            file in RESULTS_DIR after the results files are moved and re-packed.
+            """,
+        )
+        return parser
+
+    def take_action(self, parsed_args):
+        """Execute the `atlantis gather` sub-command.
+
+        :param parsed_args: Arguments and options parsed from the command-line.
+        :type parsed_args: :class:`argparse.Namespace` instance
+        """
+        gather(
+            parsed_args.results_dir,
+            max_workers=parsed_args.max_workers,
+            repack_globs=parsed_args.repack_globs,
+            compression=parsed_args.compression,
+            complevel=parsed_args.complevel,
+            time_chunk=parsed_args.time_chunk,
+            summarize=parsed_args.summarize,
+        )
+
+
+def gather(
+    results_dir,
+    max_workers=4,
+    run_dir=None,
+    repack_globs=(),
+    compression="zlib",
+    complevel=4,
+    time_chunk=repack.DEFAULT_TIME_CHUNK,
+    summarize=False,
+):
+    """Move the run definition and results files from a temporary run directory
+    into a results directory.
+
+    Symlinks in the temporary run directory are deleted rather than moved.
+    Files are renamed if the temporary run directory and the results directory are
+    on the same filesystem.
+    Otherwise, they are copied in chunks,
+    and the checksum of the copy is verified before the file in the temporary run
+    directory is deleted.
+    Files that already exist in the results directory are replaced.
+
+    After the files are moved,
+    the NetCDF files in the results directory that match :kbd:`repack_globs`
+    are re-packed into compressed files with chunking tuned for time series access
+    by a pool of worker processes.
+    Then, if :kbd:`summarize` is :py:obj:`True`,
+    the biomass time series of the functional groups are summarized from the
+    Atlantis output file in the results directory.
+
+    :param results_dir: Path of the directory in which to store the run results;
+                        it will be created if it does not exist.
+    :type results_dir: :py:class:`pathlib.Path`
+
+    :param int max_workers: Maximum number of files to move at the same time.
+
+    :param run_dir: Path of the temporary run directory;
+                    defaults to the current working directory.
+    :type run_dir: :py:class:`pathlib.Path` or None
+
+    :param repack_globs: Glob patterns of the NetCDF files in the results directory
+                         to re-pack.
+    :type repack_globs: list
+
+    :param str compression: Compression method to use to re-pack NetCDF files;
+                            one of :py:data:`atlantis_cmd.repack.COMPRESSIONS`.
+
+    :param int complevel: Compression level to use to re-pack NetCDF files.
+
+    :param int time_chunk: Number of time records in each chunk of the re-packed
+                           NetCDF variables.
+
+    :param boolean summarize: Summarize the biomass of the functional groups in the
+                              Atlantis output file.
+
+    :return: Number of files moved by each method.
+    :rtype: dict
+    """
+    if max_workers < 1:
+        logger.error(f"--max-workers must be at least 1, not {max_workers}")
+        raise SystemExit(2)
+    run_dir = Path.cwd() if run_dir is None else run_dir
+    results_dir = Path(os.path.expandvars(results_dir)).expanduser().resolve()
+    results_dir.mkdir(parents=True, exist_ok=True)
+    symlinks = [path for path in run_dir.iterdir() if path.is_symlink()]
+    for symlink in symlinks:
+        symlink.unlink()
+    logger.debug(f"deleted {len(symlinks)} symlinks from {run_dir}")
+    paths = sorted(run_dir.iterdir())
+    logger.info(f"Moving run definition and results files to {results_dir}...")
+    start = time.perf_counter()
+    methods = {"rename": 0, "copy": 0}
+    nbytes = 0
+    failed = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_move, path, results_dir / path.name): path
+            for path in paths
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                method, size = future.result()
+            except (OSError, ChecksumError) as exc:
+                logger.error(f"failed to move {futures[future]}: {exc}")
+                failed += 1
+                continue
+            methods[method] += 1
+            nbytes += size
+    seconds = time.perf_counter() - start
+    logger.info(
+        f"gathered {sum(methods.values())} files ({nbytes / 2**20:.1f} MiB) "
+        f"in {seconds:.3f} s "
+        f"({nbytes / 2**20 / max(seconds, 1e-9):.1f} MiB/s); "
+        f"{methods['rename']} renamed, {methods['copy']} copied"
+    )
+    repack_paths = sorted(
+        {path for glob in repack_globs for path in results_dir.glob(glob)}
+    )
+    repack_failed = repack.repack_files(
+        repack_paths,
+        compression=compression,
+        complevel=complevel,
+        time_chunk=time_chunk,
+        max_workers=max_workers,
+    )
+    summarize_failed = False
+    if summarize:
+        try:
+            summarize_biomass(results_dir)
+        except SystemExit:
+            summarize_failed = True
+    if failed:
+        logger.error(f"{failed} files were not moved and remain in {run_dir}")
+    if repack_failed:
+        logger.error(f"{len(repack_failed)} NetCDF files were not re-packed")
+    if summarize_failed:
+        logger.error(f"biomass was not summarized in {results_dir}")
+    if failed or repack_failed or summarize_failed:
+        raise SystemExit(2)
+    return methods
+
+
+def _move(src, dest):
+    """Move a file or directory by renaming it if possible,
+    or by copying it and deleting the source if not.
+
+    Each copied file, including the files in a copied directory tree,
+    is verified by its checksum before the source is deleted.
+
+    :param src: Path of the file to move.
+    :type src: :py:class:`pathlib.Path`
+
+    :param dest: Path to move the file to.
+    :type dest: :py:class:`pathlib.Path`
+
+    :return: Method used to move the file;
+             :kbd:`rename` or :kbd:`copy`,
+             and the size of the file in bytes.
+    :rtype: 2-tuple
+    """
+    size = _size(src)
+    try:
+        os.replace(src, dest)
+    except OSError as exc:
+        if exc.errno != errno.EXDEV:
+            raise
+    else:
+        logger.debug(f"renamed {src} to {dest}")
+        return "rename", size
+    if src.is_dir():
+        shutil.copytree(
+            src,
+            dest,
+            symlinks=True,
+            copy_function=lambda src_file, dest_file: _verified_copy(
+                Path(src_file), Path(dest_file)
+            ),
+            dirs_exist_ok=True,
+        )
+        shutil.rmtree(src)
+    else:
+        _verified_copy(src, dest)
+        src.unlink()
+    logger.debug(f"copied {src} to {dest}")
+    return "copy", size
+
+
+def _verified_copy(src, dest):
+    """Copy a file in chunks to a temporary file beside the destination,
+    verify the checksum of the copy,
+    and rename the copy to the destination.
+
+    :param src: Path of the file to copy.
+    :type src: :py:class:`pathlib.Path`
+
+    :param dest: Path of the copy.
+    :type dest: :py:class:`pathlib.Path`
+
+    :raises: :py:exc:`ChecksumError` if the checksums of the source file and the
+             copy don't match.
+    """
+    tmp_dest = dest.with_name(f".{dest.name}.gather-tmp")
+    src_checksum = hashlib.sha256()
+    try:
+        with src.open("rb") as src_f, tmp_dest.open("wb") as dest_f:
+            while chunk := src_f.read(COPY_CHUNK_SIZE):
+                src_checksum.update(chunk)
+                dest_f.write(chunk)
+            dest_f.flush()
+            os.fsync(dest_f.fileno())
+        dest_checksum = _sha256(tmp_dest)
+        if dest_checksum != src_checksum.hexdigest():
+            raise ChecksumError(
+                f"checksum of copy {dest_checksum} does not match "
+                f"{src_checksum.hexdigest()} of {src}"
+            )
+        shutil.copystat(src, tmp_dest)
+        os.replace(tmp_dest, dest)
+    except BaseException:
+        tmp_dest.unlink(missing_ok=True)
+        raise
+
+
+def _sha256(path):
+    """Calculate the SHA-256 checksum of a file, reading it in chunks.
+
+    :param path: Path of the file.
+    :type path: :py:class:`pathlib.Path`
+
+    :return: Hexadecimal checksum.
+    :rtype: str
+    """
+    checksum = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(COPY_CHUNK_SIZE):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def _size(path):
+    """Calculate the size of a file, or of the files in a directory tree.
+
+    :param path: Path of the file or directory.
+    :type path: :py:class:`pathlib.Path`
+
+    :return: Size in bytes.
+    :rtype: int
+    """
+    if not path.is_dir():
+        return path.stat().st_size
+    return sum(
+        (Path(dirpath) / filename).stat().st_size
+        for dirpath, _, filenames in os.walk(path)
+        for filename in filenames
+    )
@@ -0,0 +1,67 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Deferred imports of heavy dependencies.
+
+The :program:`atlantis` command is started for every sub-command,
+including the :command:`atlantis gather` at the end of every run,
+so sub-command plug-in modules defer the import of dependencies that are slow
+to import until the sub-command that needs them actually executes.
+"""
+
+import importlib
+
+
+class _LazyModule:
+    """Stand-in for a module that imports the module the first time one of its
+    attributes is accessed.
+    """
+
+    def __init__(self, name):
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, attr):
+        if self.__module is None:
+            # Importing a dotted name imports its parent packages too,
+            # and binds it as an attribute of its parent package,
+            # so it is the top-level package that stands in for the import statement
+            importlib.import_module(self.__name)
+            self.__module = importlib.import_module(self.__name.partition(".")[0])
+        return getattr(self.__module, attr)
+
+    def __repr__(self):
+        return f"<lazily imported module {self.__name!r}>"
+
+
+def lazy_import(name):
+    """Deferred equivalent of :kbd:`import name`.
+
+    Like the :kbd:`import` statement,
+    the return value stands in for the top-level package of a dotted module name,
+    so :kbd:`nemo_cmd = lazy_import("nemo_cmd.prepare")` allows
+    :kbd:`nemo_cmd.prepare.load_run_desc()` to be used.
+    The module is imported the first time that an attribute of the returned object
+    is accessed.
+
+    :param str name: Module name;
+                     may be dotted.
+
+    :return: Stand-in for the top-level package of the module.
+    """
+    return _LazyModule(name)
@@ -24,12 +24,13 @@ This module is connected to the :command:`atlantis` command via a scripts and
 entry-points configuration in :file:`pyproject.toml`.
 """
 
-import importlib.metadata
 import sys
 
 import cliff.app
 import cliff.commandmanager
 
+from atlantis_cmd.__about__ import __version__
+
 
 class AtlantisCmdApp(cliff.app.App):
     CONSOLE_MESSAGE_FORMAT = "%(name)s %(levelname)s: %(message)s"
@@ -37,7 +38,9 @@ class AtlantisCmdApp(cliff.app.App):
     def __init__(self):
         super().__init__(
             description="Atlantis Ecosystem Model Command Processor",
-            version=importlib.metadata.version("AtlantisCmd"),
+            # The package version is read from __about__.py instead of the
+            # installed package metadata because that is faster
+            version=__version__,
             command_manager=cliff.commandmanager.CommandManager(
                 "atlantis.app", convert_underscores=False
             ),
@@ -0,0 +1,352 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Manifest of the input files of a run,
+with the SHA-256 hashes of their contents.
+
+The manifest is the data counterpart of the version control revision files that
+record the state of the code that a run used.
+Hashes are stored in an SQLite database in the user's cache directory,
+keyed by the device, inode, size, and modification time of the files,
+so the contents of an input file are only read the first time that a run uses it,
+and after it changes.
+"""
+
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "input_manifest.json"
+
+HASH_ALGORITHM = "sha256"
+
+# Maximum number of input files to hash at the same time
+MAX_HASH_WORKERS = 4
+
+# Number of bytes of a memory mapped file to hash in each update
+HASH_CHUNK_BYTES = 64 * 2**20
+
+# Maximum number of hashes to keep in the cache database
+MAX_CACHED_HASHES = 100_000
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS hashes (
+        signature TEXT NOT NULL,
+        algorithm TEXT NOT NULL,
+        digest TEXT NOT NULL,
+        last_used INTEGER NOT NULL,
+        PRIMARY KEY (signature, algorithm)
+    )
+"""
+
+
+def default_cache_path():
+    """Path of the input file hash cache database.
+
+    :rtype: :py:class:`pathlib.Path`
+    """
+    cache_home = Path(os.environ.get("XDG_CACHE_HOME", "~/.cache")).expanduser()
+    return cache_home / "atlantis_cmd" / "hashes.sqlite"
+
+
+def staged_inputs(context):
+    """Input files that are staged in a temporary run directory.
+
+    :param dict context: Cookiecutter context for creation of the temporary run directory.
+
+    :return: Input file paths keyed by their names in the temporary run directory.
+    :rtype: dict
+    """
+    inputs = {
+        Path(context["run_desc_yaml"]).name: context["run_desc_yaml"],
+        Path(context["boxes"]).name: context["boxes"],
+        "init_conditions.nc": context["init_conditions"],
+        "groups.csv": context["groups"],
+        "migrations.csv": context["migrations"],
+        "fisheries.csv": context["fisheries"],
+    }
+    inputs.update((f"{key}.prm", path) for key, path in context["parameters"].items())
+    inputs.update(context["forcing"])
+    return {name: Path(path) for name, path in inputs.items()}
+
+
+def write_manifest(inputs, tmp_run_dir, cache_path=None, max_workers=MAX_HASH_WORKERS):
+    """Write the manifest of a run's input files to the temporary run directory.
+
+    Input files whose hashes are not in the cache are hashed concurrently.
+
+    :param dict inputs: Input file paths keyed by their names in the temporary
+                        run directory.
+
+    :param tmp_run_dir: Temporary run directory path.
+    :type tmp_run_dir: :py:class:`pathlib.Path`
+
+    :param cache_path: Path of the hash cache database;
+                       defaults to :py:func:`default_cache_path`.
+    :type cache_path: :py:class:`pathlib.Path` or None
+
+    :param int max_workers: Maximum number of input files to hash at the same time.
+
+    :return: Manifest file path.
+    :rtype: :py:class:`pathlib.Path`
+    """
+    cache_path = default_cache_path() if cache_path is None else cache_path
+    stats = {name: os.stat(path) for name, path in inputs.items()}
+    paths = {_signature(stats[name]): path for name, path in inputs.items()}
+    with HashCache(cache_path) as cache:
+        digests = cache.get_many(paths)
+        missing = [signature for signature in paths if signature not in digests]
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(missing)))
+        ) as executor:
+            new_digests = dict(
+                zip(missing, executor.map(hash_file, (paths[sig] for sig in missing)))
+            )
+        cache.put_many(new_digests)
+    logger.debug(
+        f"hashed {len(new_digests)} of {len(paths)} input files "
+        f"in {time.perf_counter() - start:.3f} s"
+    )
+    digests.update(new_digests)
+    manifest = {
+        "hash algorithm": HASH_ALGORITHM,
+        "files": [
+            _manifest_entry(name, path, stats[name], digests[_signature(stats[name])])
+            for name, path in inputs.items()
+        ],
+    }
+    manifest_file = tmp_run_dir / MANIFEST_FILE
+    manifest_file.write_text(json.dumps(manifest, indent=2))
+    return manifest_file
+
+
+def update_manifest(tmp_run_dir, names):
+    """Replace the manifest entries of input files that were modified after they
+    were staged in the temporary run directory with the hashes of the staged files.
+
+    The staged files are hashed directly rather than via the hash cache because
+    they are new files that no other run uses.
+
+    :param tmp_run_dir: Temporary run directory path.
+    :type tmp_run_dir: :py:class:`pathlib.Path`
+
+    :param names: Names of the modified files in the temporary run directory.
+    :type names: :py:class:`collections.abc.Iterable`
+
+    :return: Manifest file path.
+    :rtype: :py:class:`pathlib.Path`
+    """
+    manifest_file = tmp_run_dir / MANIFEST_FILE
+    manifest = json.loads(manifest_file.read_text())
+    entries = {entry["name"]: i for i, entry in enumerate(manifest["files"])}
+    for name in dict.fromkeys(names):
+        path = tmp_run_dir / name
+        entry = _manifest_entry(name, path, os.stat(path), hash_file(path))
+        if name in entries:
+            manifest["files"][entries[name]] = entry
+        else:
+            manifest["files"].append(entry)
+    manifest_file.write_text(json.dumps(manifest, indent=2))
+    return manifest_file
+
+
+def _manifest_entry(name, path, stat_result, digest):
+    """Manifest entry of an input file.
+
+    :param str name: Name of the file in the temporary run directory.
+
+    :param path: Path of the file.
+    :type path: :py:class:`pathlib.Path`
+
+    :param stat_result: :py:func:`os.stat` result of the file.
+    :type stat_result: :py:class:`os.stat_result`
+
+    :param str digest: Hexadecimal hash of the contents of the file.
+
+    :rtype: dict
+    """
+    return {
+        "name": name,
+        "path": os.fspath(path),
+        "bytes": stat_result.st_size,
+        "mtime": datetime.datetime.fromtimestamp(
+            stat_result.st_mtime, tz=datetime.UTC
+        ).isoformat(),
+        HASH_ALGORITHM: digest,
+    }
+
+
+def hash_file(path):
+    """Calculate the SHA-256 hash of the contents of a file.
+
+    The file is memory mapped and hashed in chunks so that its contents are not
+    copied into Python buffers,
+    and the interpreter lock is released while each chunk is hashed.
+
+    :param path: Path of the file.
+    :type path: :py:class:`pathlib.Path`
+
+    :return: Hexadecimal hash.
+    :rtype: str
+    """
+    digest = hashlib.new(HASH_ALGORITHM)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return digest.hexdigest()
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Files and filesystems that can't be memory mapped
+            return hashlib.file_digest(f, HASH_ALGORITHM).hexdigest()
+        with mapped:
+            if hasattr(mapped, "madvise"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mapped) as view:
+                for start in range(0, size, HASH_CHUNK_BYTES):
+                    digest.update(view[start : start + HASH_CHUNK_BYTES])
+    return digest.hexdigest()
+
+
+class HashCache:
+    """Persistent cache of file content hashes,
+    keyed by the device, inode, size, and modification time of the files.
+
+    Use it as a context manager so that its database connection is closed.
+    If the database can't be opened,
+    a warning is logged and nothing is cached.
+
+    :param cache_path: Path of the cache database.
+    :type cache_path: :py:class:`pathlib.Path`
+
+    :param int max_entries: Maximum number of hashes to keep in the database;
+                            the least recently used ones are deleted.
+    """
+
+    def __init__(self, cache_path, max_entries=MAX_CACHED_HASHES):
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self._connection = None
+
+    def __enter__(self):
+        try:
+            self.cache_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.cache_path, timeout=30)
+            with self._connection:
+                self._connection.execute(_SCHEMA)
+        except (OSError, sqlite3.Error) as exc:
+            logger.warning(f"failed to open input file hash cache: {exc}")
+            self._close()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._close()
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def get_many(self, signatures):
+        """Get the cached hashes of files.
+
+        :param signatures: File signatures from :py:func:`_signature`.
+        :type signatures: iterable
+
+        :return: Hexadecimal hashes keyed by the signatures that are in the cache.
+        :rtype: dict
+        """
+        if self._connection is None:
+            return {}
+        digests = {}
+        try:
+            with self._connection:
+                for signature in signatures:
+                    row = self._connection.execute(
+                        "SELECT digest FROM hashes "
+                        "WHERE signature = ? AND algorithm = ?",
+                        (signature, HASH_ALGORITHM),
+                    ).fetchone()
+                    if row is not None:
+                        digests[signature] = row[0]
+                self._connection.executemany(
+                    "UPDATE hashes SET last_used = ? "
+                    "WHERE signature = ? AND algorithm = ?",
+                    (
+                        (time.time_ns(), signature, HASH_ALGORITHM)
+                        for signature in digests
+                    ),
+                )
+        except sqlite3.Error as exc:
+            logger.warning(f"failed to read input file hash cache: {exc}")
+        return digests
+
+    def put_many(self, digests):
+        """Store the hashes of files in the cache,
+        deleting the least recently used hashes if there are too many.
+
+        :param dict digests: Hexadecimal hashes keyed by file signatures from
+                             :py:func:`_signature`.
+        """
+        if self._connection is None or not digests:
+            return
+        try:
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)",
+                    (
+                        (signature, HASH_ALGORITHM, digest, time.time_ns())
+                        for signature, digest in digests.items()
+                    ),
+                )
+                self._connection.execute(
+                    "DELETE FROM hashes WHERE rowid IN ("
+                    "SELECT rowid FROM hashes ORDER BY last_used DESC "
+                    "LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+        except sqlite3.Error as exc:
+            logger.warning(f"failed to write input file hash cache: {exc}")
+
+
+def _signature(stat_result):
+    """Identify the current version of a file by its device, inode, size,
+    and modification time.
+
+    The signature is a string because inode numbers can be larger than the
+    largest SQLite integer.
+
+    :param stat_result: :py:func:`os.stat` result of the file.
+    :type stat_result: :py:class:`os.stat_result`
+
+    :rtype: str
+    """
+    return (
+        f"{stat_result.st_dev}:{stat_result.st_ino}:"
+        f"{stat_result.st_size}:{stat_result.st_mtime_ns}"
+    )
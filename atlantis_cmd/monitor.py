@@ -0,0 +1,475 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""AtlantisCmd command plug-in for monitor sub-command.
+
+Report the progress, simulation rate, and estimated time to completion of
+Atlantis runs by following their :file:`stdout` logs.
+"""
+
+import datetime
+import json
+import logging
+import math
+import re
+import time
+from pathlib import Path
+
+import cliff.command
+
+from atlantis_cmd.supervise import RESOURCES_FILE
+
+logger = logging.getLogger(__name__)
+
+# Default regular expression for the simulated time markers in Atlantis stdout logs;
+# the days group captures the simulated time in days
+DEFAULT_TIME_PATTERN = (
+    r"\bTime\s*[:=]\s*(?P<days>[-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)\s*(?:day|$)"
+)
+
+# Maximum number of bytes to read from the end of a log to find the latest
+# simulated time marker when a log is first followed
+TAIL_SCAN_BYTES = 16 * 2**20
+
+# Size of the chunks in which logs are read
+READ_CHUNK_SIZE = 2**20
+
+# Conversion factors from the time units used in Atlantis parameters files to days
+_DAYS_PER_UNIT = {
+    "day": 1,
+    "days": 1,
+    "d": 1,
+    "hour": 1 / 24,
+    "hours": 1 / 24,
+    "h": 1 / 24,
+    "s": 1 / 86400,
+    "sec": 1 / 86400,
+    "seconds": 1 / 86400,
+}
+
+
+class Monitor(cliff.command.Command):
+    """Report the progress and estimated time to completion of Atlantis runs."""
+
+    def get_parser(self, prog_name):
+        parser = super().get_parser(prog_name)
+        parser.description = """
+            Follow the stdout logs in the RESULTS_DIR(s) of Atlantis runs,
+            and report the simulated time that they have reached,
+            their simulation rates in simulated days per wall clock hour,
+            and their estimated times to completion.
+        """
+        parser.add_argument(
+            "results_dirs",
+            metavar="RESULTS_DIR",
+            nargs="+",
+            type=Path,
+            help="results directory of a run",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=60,
+            help="""
+            Number of seconds between progress reports.
+            Defaults to 60.
+            """,
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Report the progress of the runs once, and exit.",
+        )
+        parser.add_argument(
+            "--time-pattern",
+            dest="time_pattern",
+            default=DEFAULT_TIME_PATTERN,
+            help="""
+            Regular expression that matches the simulated time markers in the logs;
+            its days group must capture the simulated time in days.
+            """,
+        )
+        return parser
+
+    def take_action(self, parsed_args):
+        """Execute the `atlantis monitor` sub-command.
+
+        :param parsed_args: Arguments and options parsed from the command-line.
+        :type parsed_args: :class:`argparse.Namespace` instance
+        """
+        monitor(
+            parsed_args.results_dirs,
+            interval=parsed_args.interval,
+            once=parsed_args.once,
+            time_pattern=parsed_args.time_pattern,
+        )
+
+
+def monitor(results_dirs, interval=60, once=False, time_pattern=DEFAULT_TIME_PATTERN):
+    """Follow the stdout logs of runs, and report their progress until all of them
+    have finished or failed.
+
+    :param list results_dirs: Results directories of the runs.
+
+    :param float interval: Number of seconds between progress reports.
+
+    :param boolean once: Report the progress of the runs once, and return.
+
+    :param str time_pattern: Regular expression that matches the simulated time
+                             markers in the logs.
+
+    :raises: :py:exc:`SystemExit` with exit code 1 if all of the runs have ended,
+             and any of them failed.
+    """
+    try:
+        time_re = re.compile(time_pattern)
+    except re.error as exc:
+        logger.error(f"invalid --time-pattern: {exc}")
+        raise SystemExit(2)
+    if "days" not in time_re.groupindex:
+        logger.error("--time-pattern must have a days group")
+        raise SystemExit(2)
+    runs = [RunProgress(Path(results_dir), time_re) for results_dir in results_dirs]
+    while True:
+        for run in runs:
+            run.update()
+        _report(runs)
+        if all(run.finished for run in runs):
+            failed = sum(run.failed for run in runs)
+            if failed:
+                logger.error(f"{failed} of {len(runs)} runs failed")
+                raise SystemExit(1)
+            return
+        if once:
+            return
+        time.sleep(interval)
+
+
+class LogFollower:
+    """Incremental reader of the lines that are appended to a log file.
+
+    The offset of the end of the last complete line that was read is tracked,
+    so the log is never re-read from the start.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self._partial = b""
+
+    def read_new_lines(self):
+        """Read the complete lines that have been appended to the log since the
+        last read.
+
+        If the log has been truncated it is read from the start again.
+
+        :return: New lines.
+        :rtype: list
+        """
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            return []
+        if size < self.offset:
+            self.offset, self._partial = 0, b""
+        lines = []
+        with self.path.open("rb") as f:
+            f.seek(self.offset)
+            while chunk := f.read(READ_CHUNK_SIZE):
+                self.offset += len(chunk)
+                *complete, self._partial = (self._partial + chunk).split(b"\n")
+                lines.extend(line.decode(errors="replace") for line in complete)
+        return lines
+
+    def skip_to_end(self, tail_bytes):
+        """Move the offset to the end of the log,
+        and return the complete lines in its last :kbd:`tail_bytes` bytes.
+
+        :param int tail_bytes: Number of bytes to read from the end of the log.
+
+        :return: Lines in the tail of the log.
+        :rtype: list
+        """
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            return []
+        start = max(0, size - tail_bytes)
+        with self.path.open("rb") as f:
+            f.seek(start)
+            tail = f.read(size - start)
+        *complete, self._partial = tail.split(b"\n")
+        if start > 0:
+            # The first line is probably incomplete
+            complete = complete[1:]
+        self.offset = size
+        return [line.decode(errors="replace") for line in complete]
+
+
+class RunProgress:
+    """Progress of a run from its :file:`stdout` log,
+    and from the resource usage records of its steps.
+
+    A run has finished when its log records the end of the run,
+    or when a step of its run script has failed;
+    the run script stops at the first failed step,
+    so a failed run never records its end in its log.
+    """
+
+    def __init__(self, results_dir, time_re):
+        self.results_dir = results_dir
+        self.time_re = time_re
+        self.log = LogFollower(results_dir / "stdout")
+        self.started = False
+        self.finished = False
+        self.failed = False
+        self.failed_step = None
+        self.exit_code = None
+        self.start_time = None
+        self.sim_days = None
+        self.tstop_days = None
+        self.work_dir = None
+        # Wall clock times and simulated days of the first and latest markers seen
+        # by this monitor; the first is used for the rate if the run start time is
+        # not known
+        self._first_seen = None
+        self._last_seen = None
+        self._resources_mtime = None
+
+    def update(self):
+        """Read the new lines of the log,
+        and update the progress of the run from them.
+        """
+        sim_days = self.sim_days
+        if not self.started:
+            head = self._read_head()
+            if not head:
+                return
+            self.started = True
+            self._parse_lines(head)
+            self._parse_lines(self.log.skip_to_end(TAIL_SCAN_BYTES))
+        else:
+            self._parse_lines(self.log.read_new_lines())
+        if self.sim_days != sim_days:
+            # The latest marker was written at about the time the log was last modified
+            self._last_seen = (self.log.path.stat().st_mtime, self.sim_days)
+            if self._first_seen is None:
+                self._first_seen = self._last_seen
+        if self.tstop_days is None:
+            self.tstop_days = self._read_tstop()
+        if not self.finished:
+            self._check_steps()
+
+    def _read_head(self):
+        """Read the lines at the start of the log that record the run's working
+        directory and start time.
+
+        :return: Lines at the start of the log.
+        :rtype: list
+        """
+        try:
+            with self.log.path.open("rb") as f:
+                head = f.read(64 * 2**10)
+        except FileNotFoundError:
+            return []
+        return [line.decode(errors="replace") for line in head.split(b"\n")[:-1]]
+
+    def _parse_lines(self, lines):
+        """Update the progress of the run from log lines.
+
+        :param list lines: Log lines.
+        """
+        for line in lines:
+            if line.startswith("working dir: "):
+                self.work_dir = Path(line.removeprefix("working dir: ").strip())
+            elif line.startswith("Starting run at "):
+                self.start_time = _parse_date(line.removeprefix("Starting run at "))
+            elif line.startswith("Ended run at "):
+                self.finished = True
+            elif match := self.time_re.search(line):
+                self.sim_days = float(match.group("days"))
+
+    def _check_steps(self):
+        """Check the resource usage records that the run script's steps write to the
+        results directory for a step that failed.
+
+        The records are only read when they have changed since the last check.
+        """
+        resources_file = self.results_dir / RESOURCES_FILE
+        try:
+            mtime = resources_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._resources_mtime:
+            return
+        self._resources_mtime = mtime
+        try:
+            steps = json.loads(resources_file.read_text())["steps"]
+        except (OSError, ValueError, KeyError, TypeError):
+            # The file is replaced atomically,
+            # so this is a file that the run didn't write
+            return
+        for step in steps:
+            if step.get("exit code"):
+                self.finished = self.failed = True
+                self.failed_step = step.get("step")
+                self.exit_code = step["exit code"]
+                return
+
+    def _read_tstop(self):
+        """Read the run's stop time from its :file:`run.prm` file in its working
+        directory or, after the results have been gathered, in its results directory.
+
+        :return: Stop time in days, or :py:obj:`None` if it can't be found.
+        :rtype: float
+        """
+        candidates = [self.results_dir / "run.prm"]
+        if self.work_dir is not None:
+            candidates.insert(0, self.work_dir / "run.prm")
+        for run_prm in candidates:
+            try:
+                text = run_prm.read_text(errors="replace")
+            except OSError:
+                continue
+            if tstop_days := parse_tstop(text):
+                return tstop_days
+        return None
+
+    @property
+    def rate(self):
+        """Simulation rate in simulated days per wall clock hour.
+
+        :rtype: float or None
+        """
+        if self.sim_days is None:
+            return None
+        if self.start_time is not None:
+            wall_hours = (self._last_seen[0] - self.start_time) / 3600
+            sim_days = self.sim_days
+        else:
+            wall_hours = (self._last_seen[0] - self._first_seen[0]) / 3600
+            sim_days = self._last_seen[1] - self._first_seen[1]
+        if wall_hours <= 0 or sim_days <= 0:
+            return None
+        return sim_days / wall_hours
+
+    @property
+    def eta(self):
+        """Estimated wall clock time remaining in seconds.
+
+        :rtype: float or None
+        """
+        rate = self.rate
+        if rate is None or self.tstop_days is None:
+            return None
+        return max(0.0, (self.tstop_days - self.sim_days) / rate * 3600)
+
+
+def parse_tstop(run_prm_text):
+    """Parse the stop time from the contents of an Atlantis :file:`run.prm` file.
+
+    :param str run_prm_text: Contents of a :file:`run.prm` file.
+
+    :return: Stop time in days, or :py:obj:`None` if it can't be found.
+    :rtype: float
+    """
+    match = re.search(
+        r"^\s*tstop\s+([-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)\s*(\w+)?",
+        run_prm_text,
+        re.MULTILINE,
+    )
+    if match is None:
+        return None
+    unit = (match.group(2) or "day").lower()
+    return float(match.group(1)) * _DAYS_PER_UNIT.get(unit, 1)
+
+
+def _parse_date(text):
+    """Parse a date/time in the default format of the :command:`date` command,
+    like :kbd:`Wed Aug 18 15:34:16 PDT 2021`, as local time.
+
+    :param str text: Date/time.
+
+    :return: Seconds since the epoch, or :py:obj:`None` if it can't be parsed.
+    :rtype: float
+    """
+    fields = text.split()
+    if len(fields) == 6:
+        # Drop the time zone abbreviation that strptime() can't reliably parse
+        del fields[4]
+    try:
+        return datetime.datetime.strptime(
+            " ".join(fields), "%a %b %d %H:%M:%S %Y"
+        ).timestamp()
+    except ValueError:
+        return None
+
+
+def _format_duration(seconds):
+    """Format a duration as days, hours, and minutes.
+
+    :param float seconds: Duration.
+
+    :rtype: str
+    """
+    minutes = math.ceil(seconds / 60)
+    days, minutes = divmod(minutes, 24 * 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{days}d{hours:02d}h{minutes:02d}m" if days else f"{hours}h{minutes:02d}m"
+
+
+def _report(runs):
+    """Log the progress of runs,
+    slowest first so that stragglers stand out.
+
+    :param list runs: Progress of the runs.
+    """
+
+    def sort_key(run):
+        return (
+            run.finished,
+            not run.failed,
+            -(run.eta if run.eta is not None else math.inf),
+        )
+
+    for run in sorted(runs, key=sort_key):
+        if not run.started:
+            logger.info(f"{run.results_dir}: not started")
+            continue
+        if run.failed:
+            progress = "" if run.sim_days is None else f" at day {run.sim_days:.1f}"
+            logger.error(
+                f"{run.results_dir}: failed{progress}; "
+                f"{run.failed_step} step exited with code {run.exit_code}"
+            )
+            continue
+        if run.finished:
+            logger.info(f"{run.results_dir}: finished")
+            continue
+        if run.sim_days is None:
+            logger.info(f"{run.results_dir}: started; no simulated time reported yet")
+            continue
+        progress = f"day {run.sim_days:.1f}"
+        if run.tstop_days is not None:
+            progress = (
+                f"{progress} of {run.tstop_days:g} "
+                f"({100 * run.sim_days / run.tstop_days:.1f}%)"
+            )
+        rate = "rate unknown" if run.rate is None else f"{run.rate:.2f} sim days/hour"
+        eta = "ETA unknown" if run.eta is None else f"ETA {_format_duration(run.eta)}"
+        logger.info(f"{run.results_dir}: {progress}, {rate}, {eta}")
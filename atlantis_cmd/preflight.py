@@ -0,0 +1,416 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Preflight checks of the NetCDF initial conditions and forcing files of a run.
+
+The headers of the files are read by a pool of worker processes,
+because the NetCDF library is not thread-safe.
+Only the headers,
+and the 1-dimensional time coordinate variables,
+are read,
+so the checks take seconds no matter how large the files are.
+"""
+
+import concurrent.futures
+import logging
+import math
+import os
+import re
+
+from atlantis_cmd import monitor
+from atlantis_cmd.lazy_import import lazy_import
+
+netCDF4 = lazy_import("netCDF4")
+numpy = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+# Leading bytes of NetCDF classic, 64-bit offset, 64-bit data,
+# and NetCDF-4 (HDF5) files
+NETCDF_SIGNATURES = (b"CDF\x01", b"CDF\x02", b"CDF\x05", b"\x89HDF\r\n\x1a\n")
+
+# Sizes in bytes of the external data types of NetCDF classic format files,
+# keyed by their type codes
+_CLASSIC_TYPE_SIZES = {
+    1: 1,
+    2: 1,
+    3: 2,
+    4: 4,
+    5: 4,
+    6: 8,
+    7: 1,
+    8: 2,
+    9: 4,
+    10: 8,
+    11: 8,
+}
+
+# Number of records in a NetCDF classic format file that is still being written
+_STREAMING_NUMRECS = {0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF}
+
+# Name of the time dimension and coordinate variable of Atlantis NetCDF files
+TIME_NAME = "t"
+
+# Dimensions whose sizes must be the same in the initial conditions and forcing files
+SHARED_DIMENSIONS = ("b", "z")
+
+# Maximum number of file headers to read at the same time
+MAX_PREFLIGHT_WORKERS = 8
+
+# Headers of the files that have been read,
+# keyed by their paths and the device, inode, size, and modification time of the files,
+# so that the members of an ensemble that share input files only read them once
+_headers = {}
+
+_DAYS_PER_TIME_UNIT = {
+    "second": 1 / 86400,
+    "minute": 1 / 1440,
+    "hour": 1 / 24,
+    "day": 1,
+}
+
+
+def check_input_files(
+    init_conditions, forcing, run_params=None, max_workers=MAX_PREFLIGHT_WORKERS
+):
+    """Check that the initial conditions file, and the NetCDF forcing files,
+    of a run are readable, complete, and consistent with each other.
+
+    All of the problems are logged as errors before :py:exc:`SystemExit` is raised.
+    Forcing files whose time coordinates cover less time than the run are only
+    warned about,
+    because Atlantis can re-use forcing records.
+
+    :param init_conditions: Path of the initial conditions file.
+    :type init_conditions: :py:class:`pathlib.Path`
+
+    :param dict forcing: Forcing file paths keyed by their names in the temporary
+                         run directory;
+                         files that are not NetCDF files are skipped.
+
+    :param run_params: Path of the run parameters file to read the run duration
+                       from for the time coverage checks.
+    :type run_params: :py:class:`pathlib.Path` or None
+
+    :param int max_workers: Maximum number of file headers to read at the same time.
+
+    :raises: :py:exc:`SystemExit` if any problems are found.
+
+    :return: Number of NetCDF files that were checked.
+    :rtype: int
+    """
+    paths = [os.fspath(init_conditions)]
+    paths.extend(os.fspath(path) for path in dict.fromkeys(forcing.values()))
+    errors = []
+    headers = {}
+    keys = {}
+    for path in paths:
+        try:
+            stat_result = os.stat(path)
+        except OSError as exc:
+            errors.append(f"can't read NetCDF header of {path}: {exc}")
+            continue
+        keys[path] = (
+            path,
+            stat_result.st_dev,
+            stat_result.st_ino,
+            stat_result.st_size,
+            stat_result.st_mtime_ns,
+        )
+        if keys[path] in _headers:
+            headers[path] = _headers[keys[path]]
+    unread = [path for path in keys if path not in headers]
+    if unread:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(max_workers, len(unread))
+        ) as executor:
+            futures = {executor.submit(read_header, path): path for path in unread}
+            for future in concurrent.futures.as_completed(futures):
+                path = futures[future]
+                try:
+                    headers[path] = _headers[keys[path]] = future.result()
+                except (OSError, ValueError, RuntimeError) as exc:
+                    errors.append(f"can't read NetCDF header of {path}: {exc}")
+    init_header = headers.get(paths[0])
+    if paths[0] in headers and init_header is None:
+        errors.append(f"initial conditions file {paths[0]} is not a NetCDF file")
+    tstop_days = _read_tstop(run_params)
+    for path in paths:
+        header = headers.get(path)
+        if header is None:
+            continue
+        errors.extend(_check_header(header))
+        if path != paths[0]:
+            errors.extend(_check_shared_dimensions(header, init_header))
+            warning = _check_time_coverage(header, tstop_days)
+            if warning:
+                logger.warning(warning)
+    if errors:
+        for error in errors:
+            logger.error(error)
+        logger.error(
+            f"found {len(errors)} problem(s) in NetCDF input files; "
+            f"no temporary run directory was created"
+        )
+        raise SystemExit(2)
+    checked = sum(header is not None for header in headers.values())
+    logger.debug(f"preflight checked {checked} NetCDF input files")
+    return checked
+
+
+def read_header(path):
+    """Read the header and the time coordinate of a NetCDF file.
+
+    :param str path: Path of the file.
+
+    :raises: :py:exc:`ValueError` if the file has a :file:`.nc` extension,
+             but isn't a NetCDF file.
+
+    :return: Summary of the file's header,
+             or :py:obj:`None` if it isn't a NetCDF file.
+    :rtype: dict
+    """
+    with open(path, "rb") as f:
+        signature = f.read(8)
+        if not signature.startswith(NETCDF_SIGNATURES):
+            if path.endswith(".nc"):
+                raise ValueError("not a NetCDF file")
+            return None
+        min_bytes = None
+        if signature.startswith(b"CDF"):
+            f.seek(0)
+            min_bytes = _classic_data_end(f)
+    with netCDF4.Dataset(path, "r") as ds:
+        header = {
+            "path": path,
+            "bytes": os.stat(path).st_size,
+            "data model": ds.data_model,
+            "dimensions": {name: len(dim) for name, dim in ds.dimensions.items()},
+            "min bytes": min_bytes,
+            "time": None,
+        }
+        truncated = (
+            header["min bytes"] is not None and header["bytes"] < header["min bytes"]
+        )
+        if TIME_NAME in ds.variables and not truncated:
+            time_var = ds.variables[TIME_NAME]
+            time_var.set_auto_mask(False)
+            times = numpy.asarray(time_var[:], dtype="f8").ravel()
+            header["time"] = {
+                "records": times.size,
+                "units": getattr(time_var, "units", None),
+                "first": float(times[0]) if times.size else None,
+                "last": float(times[-1]) if times.size else None,
+                "increasing": bool(numpy.all(numpy.diff(times) > 0)),
+            }
+    return header
+
+
+def _classic_data_end(f):
+    """Calculate the offset of the end of the data of a NetCDF classic format file
+    from the offsets and shapes of the variables in its header.
+
+    :param f: NetCDF classic format file, opened in binary mode at its start.
+    :type f: :py:term:`file object`
+
+    :raises: :py:exc:`ValueError` if the header is malformed.
+
+    :return: Minimum size of the file in bytes.
+    :rtype: int
+    """
+    version = f.read(4)[3]
+    # Counts are 8 bytes in 64-bit data (CDF5) files,
+    # and offsets are 8 bytes in 64-bit offset and 64-bit data files
+    count_size = 8 if version == 5 else 4
+    offset_size = 4 if version == 1 else 8
+
+    def read_uint(size):
+        data = f.read(size)
+        if len(data) != size:
+            raise ValueError("header is truncated")
+        return int.from_bytes(data, "big")
+
+    def read_name():
+        length = read_uint(count_size)
+        f.seek(length + -length % 4, os.SEEK_CUR)
+
+    def skip_attrs():
+        read_uint(4)
+        for _ in range(read_uint(count_size)):
+            read_name()
+            nc_type = read_uint(4)
+            nbytes = read_uint(count_size) * _CLASSIC_TYPE_SIZES.get(nc_type, 1)
+            f.seek(nbytes + -nbytes % 4, os.SEEK_CUR)
+
+    numrecs = read_uint(count_size)
+    read_uint(4)
+    dim_lengths = []
+    for _ in range(read_uint(count_size)):
+        read_name()
+        dim_lengths.append(read_uint(count_size))
+    skip_attrs()
+    read_uint(4)
+    variables = []
+    for _ in range(read_uint(count_size)):
+        read_name()
+        dim_ids = [read_uint(count_size) for _ in range(read_uint(count_size))]
+        skip_attrs()
+        nc_type = read_uint(4)
+        read_uint(count_size)
+        begin = read_uint(offset_size)
+        try:
+            shape = [dim_lengths[dim_id] for dim_id in dim_ids]
+            type_size = _CLASSIC_TYPE_SIZES[nc_type]
+        except (IndexError, KeyError):
+            raise ValueError("header is malformed") from None
+        # Only the first dimension can be the unlimited record dimension,
+        # whose length in the header is 0
+        is_record = bool(shape) and shape[0] == 0
+        nbytes = math.prod(shape[1:] if is_record else shape) * type_size
+        variables.append((begin, nbytes, is_record))
+    record_vars = [nbytes for _, nbytes, is_record in variables if is_record]
+    # Records are padded to 4 bytes unless there is only 1 record variable
+    record_size = (
+        record_vars[0]
+        if len(record_vars) == 1
+        else sum(nbytes + -nbytes % 4 for nbytes in record_vars)
+    )
+    ends = [f.tell()]
+    for begin, nbytes, is_record in variables:
+        if not is_record:
+            ends.append(begin + nbytes)
+        elif numrecs and numrecs not in _STREAMING_NUMRECS:
+            ends.append(begin + (numrecs - 1) * record_size + nbytes)
+    return max(ends)
+
+
+def _check_header(header):
+    """Check a NetCDF file's header for truncation and a usable time coordinate.
+
+    :param dict header: Summary of the file's header from :py:func:`read_header`.
+
+    :return: Problems that were found.
+    :rtype: list
+    """
+    path = header["path"]
+    if header["min bytes"] is not None and header["bytes"] < header["min bytes"]:
+        return [
+            f"{path} is truncated: it is {header['bytes']} bytes, "
+            f"but its variables need at least {header['min bytes']} bytes"
+        ]
+    if TIME_NAME not in header["dimensions"]:
+        return [f"{path} has no {TIME_NAME} time dimension"]
+    time = header["time"]
+    if time is None:
+        return [f"{path} has no {TIME_NAME} time coordinate variable"]
+    if time["records"] == 0:
+        return [f"{path} has no time records"]
+    if not time["increasing"]:
+        return [f"{path} time coordinate values are not increasing"]
+    return []
+
+
+def _check_shared_dimensions(header, init_header):
+    """Check that the sizes of the spatial dimensions of a forcing file are the same
+    as those of the initial conditions file.
+
+    :param dict header: Summary of the forcing file's header.
+
+    :param init_header: Summary of the initial conditions file's header.
+    :type init_header: dict or None
+
+    :return: Problems that were found.
+    :rtype: list
+    """
+    if init_header is None:
+        return []
+    problems = []
+    for name in SHARED_DIMENSIONS:
+        size = header["dimensions"].get(name)
+        init_size = init_header["dimensions"].get(name)
+        if size is not None and init_size is not None and size != init_size:
+            problems.append(
+                f"{name} dimension of {header['path']} is {size}, "
+                f"but it is {init_size} in initial conditions file {init_header['path']}"
+            )
+    return problems
+
+
+def _check_time_coverage(header, tstop_days):
+    """Check whether the time coordinate of a forcing file covers the run.
+
+    :param dict header: Summary of the forcing file's header.
+
+    :param tstop_days: Run duration in days.
+    :type tstop_days: float or None
+
+    :return: Warning message,
+             or :py:obj:`None` if the file covers the run,
+             or its coverage can't be calculated.
+    :rtype: str
+    """
+    time = header["time"]
+    if tstop_days is None or time is None or time["records"] < 2:
+        return None
+    days_per_unit = _days_per_time_unit(time["units"])
+    if days_per_unit is None:
+        return None
+    span = time["last"] - time["first"]
+    # The last record covers one time step
+    coverage_days = span * time["records"] / (time["records"] - 1) * days_per_unit
+    if coverage_days >= tstop_days:
+        return None
+    return (
+        f"{header['path']} covers {coverage_days:.1f} days, "
+        f"but the run is {tstop_days:g} days long"
+    )
+
+
+def _days_per_time_unit(units):
+    """Calculate the number of days in the unit of a CF time coordinate.
+
+    :param units: Units attribute of the time coordinate variable;
+                  e.g. :kbd:`seconds since 2007-01-01 00:00:00 -8`.
+    :type units: str or None
+
+    :return: Days per unit,
+             or :py:obj:`None` if the units aren't recognized.
+    :rtype: float
+    """
+    match = re.match(r"\s*(\w+?)s?\s+since\s", units or "")
+    if match is None:
+        return None
+    return _DAYS_PER_TIME_UNIT.get(match.group(1).lower())
+
+
+def _read_tstop(run_params):
+    """Read the run duration from the run parameters file.
+
+    :param run_params: Path of the run parameters file.
+    :type run_params: :py:class:`pathlib.Path` or None
+
+    :return: Run duration in days, or :py:obj:`None` if it can't be found.
+    :rtype: float
+    """
+    if run_params is None:
+        return None
+    try:
+        text = run_params.read_text(errors="replace")
+    except OSError:
+        return None
+    return monitor.parse_tstop(text)
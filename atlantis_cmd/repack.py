@@ -0,0 +1,239 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Re-packing of Atlantis NetCDF output files into compressed files with chunking
+tuned for time series access.
+
+Atlantis writes its output files uncompressed, with the record-oriented layout of
+the NetCDF classic format.
+Re-packing streams each variable into a deflate (:kbd:`zlib`) or :kbd:`zstd`
+compressed NetCDF-4 classic model file in blocks of time records,
+so that the memory used is bounded no matter how large the file is.
+"""
+
+import concurrent.futures
+import logging
+import os
+import time
+from pathlib import Path
+
+from atlantis_cmd.lazy_import import lazy_import
+
+netCDF4 = lazy_import("netCDF4")
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIONS = ("zlib", "zstd")
+
+# Default number of time records in each chunk of the re-packed variables
+DEFAULT_TIME_CHUNK = 256
+
+# Upper limit on the size of the blocks of time records that are read and written
+# at once, to bound the memory use of each worker process
+MAX_BLOCK_BYTES = 256 * 2**20
+
+
+def repack_files(
+    paths,
+    compression="zlib",
+    complevel=4,
+    time_chunk=DEFAULT_TIME_CHUNK,
+    max_workers=1,
+):
+    """Re-pack NetCDF files in place with a pool of worker processes.
+
+    Each file is re-packed by one worker process;
+    files that fail to re-pack are left unchanged.
+
+    :param paths: Paths of the NetCDF files to re-pack.
+    :type paths: list
+
+    :param str compression: Compression method;
+                            one of :py:data:`COMPRESSIONS`.
+
+    :param int complevel: Compression level.
+
+    :param int time_chunk: Number of time records in each chunk of the re-packed
+                           variables.
+
+    :param int max_workers: Maximum number of files to re-pack at the same time.
+
+    :return: Paths of the files that failed to re-pack.
+    :rtype: list
+    """
+    failed = []
+    if not paths:
+        return failed
+    start = time.perf_counter()
+    sizes_before = {path: path.stat().st_size for path in paths}
+    sizes_after = {}
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=min(max_workers, len(paths))
+    ) as executor:
+        futures = {
+            executor.submit(repack_file, path, compression, complevel, time_chunk): path
+            for path in paths
+        }
+        for future in concurrent.futures.as_completed(futures):
+            path = futures[future]
+            try:
+                future.result()
+            except Exception as exc:
+                logger.error(f"failed to re-pack {path}: {exc}")
+                failed.append(path)
+                continue
+            sizes_after[path] = path.stat().st_size
+            logger.debug(
+                f"re-packed {path} from {sizes_before[path] / 2**20:.1f} MiB "
+                f"to {sizes_after[path] / 2**20:.1f} MiB"
+            )
+    before = sum(sizes_before[path] for path in sizes_after)
+    after = sum(sizes_after.values())
+    logger.info(
+        f"re-packed {len(sizes_after)} NetCDF files with {compression} compression "
+        f"from {before / 2**20:.1f} MiB to {after / 2**20:.1f} MiB "
+        f"in {time.perf_counter() - start:.3f} s"
+    )
+    return sorted(failed)
+
+
+def repack_file(path, compression="zlib", complevel=4, time_chunk=DEFAULT_TIME_CHUNK):
+    """Re-pack a NetCDF file in place into a compressed NetCDF-4 classic model file
+    with chunking tuned for time series access.
+
+    The re-packed file is written beside the original file,
+    and renamed over it when it is complete.
+
+    :param path: Path of the NetCDF file to re-pack.
+    :type path: :py:class:`pathlib.Path`
+
+    :param str compression: Compression method;
+                            one of :py:data:`COMPRESSIONS`.
+
+    :param int complevel: Compression level.
+
+    :param int time_chunk: Number of time records in each chunk of the re-packed
+                           variables.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(
+            f"unknown compression: {compression}; expected one of {COMPRESSIONS}"
+        )
+    if compression == "zstd" and not netCDF4.__has_zstandard_support__:
+        raise ValueError("netCDF4 library was built without zstd support")
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.repack-tmp")
+    try:
+        with (
+            netCDF4.Dataset(path, "r") as src,
+            netCDF4.Dataset(tmp_path, "w", format="NETCDF4_CLASSIC") as dest,
+        ):
+            src.set_auto_maskandscale(False)
+            dest.setncatts({attr: src.getncattr(attr) for attr in src.ncattrs()})
+            for name, dim in src.dimensions.items():
+                dest.createDimension(name, None if dim.isunlimited() else len(dim))
+            time_dim = find_time_dim(src)
+            for var in src.variables.values():
+                _repack_variable(
+                    var, dest, time_dim, compression, complevel, time_chunk
+                )
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def find_time_dim(dataset):
+    """Find the time dimension of a NetCDF dataset.
+
+    The time dimension is the unlimited dimension,
+    or the dimension named :kbd:`t` or :kbd:`time` if there is no unlimited
+    dimension.
+
+    :param dataset: NetCDF dataset.
+    :type dataset: :py:class:`netCDF4.Dataset`
+
+    :return: Name of the time dimension,
+             or :py:obj:`None` if there isn't one.
+    :rtype: str
+    """
+    for name, dim in dataset.dimensions.items():
+        if dim.isunlimited():
+            return name
+    for name in ("t", "time"):
+        if name in dataset.dimensions:
+            return name
+    return None
+
+
+def _repack_variable(var, dest, time_dim, compression, complevel, time_chunk):
+    """Copy a variable into a compressed,
+    time series chunked variable in blocks of time records.
+
+    :param var: Variable to copy.
+    :type var: :py:class:`netCDF4.Variable`
+
+    :param dest: Re-packed dataset.
+    :type dest: :py:class:`netCDF4.Dataset`
+
+    :param str time_dim: Name of the time dimension.
+
+    :param str compression: Compression method.
+
+    :param int complevel: Compression level.
+
+    :param int time_chunk: Number of time records in each chunk.
+    """
+    attrs = {attr: var.getncattr(attr) for attr in var.ncattrs()}
+    fill_value = attrs.pop("_FillValue", None)
+    chunksizes = None
+    if var.dimensions and all(var.shape):
+        # Chunks span blocks of time records and the full extent of the other
+        # dimensions, so that time series of a box or group read few chunks
+        chunksizes = [
+            min(time_chunk, size) if dim == time_dim else size
+            for dim, size in zip(var.dimensions, var.shape)
+        ]
+    dest_var = dest.createVariable(
+        var.name,
+        var.dtype,
+        var.dimensions,
+        compression=compression if var.dimensions else None,
+        complevel=complevel,
+        shuffle=True,
+        chunksizes=chunksizes,
+        fill_value=fill_value,
+    )
+    dest_var.set_auto_maskandscale(False)
+    dest_var.setncatts(attrs)
+    if not var.dimensions:
+        dest_var.assignValue(var.getValue())
+        return
+    if time_dim not in var.dimensions or not all(var.shape):
+        dest_var[...] = var[...]
+        return
+    axis = var.dimensions.index(time_dim)
+    record_bytes = var.dtype.itemsize
+    for dim, size in zip(var.dimensions, var.shape):
+        if dim != time_dim:
+            record_bytes *= size
+    block = max(1, min(time_chunk, MAX_BLOCK_BYTES // record_bytes))
+    for start in range(0, var.shape[axis], block):
+        index = [slice(None)] * len(var.dimensions)
+        index[axis] = slice(start, min(start + block, var.shape[axis]))
+        dest_var[tuple(index)] = var[tuple(index)]
@@ -21,19 +21,74 @@
 Prepare for, execute, and gather the results of a run of the CSIRO Atlantis ecosystem model.
 """
 
+import concurrent.futures
+import functools
+import glob
 import logging
 import os
 import shlex
 import subprocess
+import threading
 from pathlib import Path
 
-import arrow
 import cliff.command
-import cookiecutter.main
-import nemo_cmd.prepare
+
+from atlantis_cmd import (
+    desc_cache,
+    manifest,
+    repack,
+    run_dir,
+    run_queue,
+    staging,
+    validate,
+    warm_start,
+)
+from atlantis_cmd.lazy_import import lazy_import
+from atlantis_cmd.preflight import check_input_files
+from atlantis_cmd.timings import Timings
+
+arrow = lazy_import("arrow")
+cookiecutter = lazy_import("cookiecutter.main")
+nemo_cmd = lazy_import("nemo_cmd.prepare")
 
 logger = logging.getLogger(__name__)
 
+# Run description keys of the input files that can have their staging method set
+# in the staging section of the run description,
+# and the cookiecutter context keys that they map to
+STAGED_INPUTS = {
+    "boxes": "boxes",
+    "initial conditions": "init_conditions",
+    "groups": "groups",
+    "migrations": "migrations",
+    "fisheries": "fisheries",
+    "parameters": "parameters",
+}
+
+# Keys of the gather section of the run description,
+# and the atlantis gather command-line options that they map to
+GATHER_OPTIONS = {
+    "repack": "--repack",
+    "compression": "--compression",
+    "compression level": "--compression-level",
+    "time chunk": "--time-chunk",
+    "max workers": "--max-workers",
+    "summarize": "--summarize",
+}
+
+# Files whose modification times change when the checked out revision,
+# or the staged changes in a repository change
+VCS_STATE_FILES = {
+    "git": (".git/HEAD", ".git/index", ".git/packed-refs"),
+    "hg": (".hg/dirstate", ".hg/branch", ".hg/store/00changelog.i"),
+}
+
+# Revision and status lines of version control repositories,
+# memoized for the lifetime of the process so that all of the members of an
+# ensemble or sweep query each repository only once
+_vcs_revisions = {}
+_vcs_revisions_lock = threading.Lock()
+
 
 class Run(cliff.command.Command):
     """Prepare, execute, and gather results from a CSIRO Atlantis ecosystem model run."""
@@ -77,6 +132,137 @@ class Run(cliff.command.Command):
             action="store_true",
             help="don't show the run directory path",
         )
+        parser.add_argument(
+            "--ensemble",
+            action="store_true",
+            help="""
+            Treat DESC_FILE as a directory of run description YAML files,
+            or a quoted glob pattern that matches them,
+            and prepare and execute all of them as members of an ensemble.
+            The results of each member are gathered in a sub-directory of
+            RESULTS_DIR that is named with the stem of its run description
+            file name.
+            The command waits for all of the ensemble members to finish.
+            """,
+        )
+        parser.add_argument(
+            "--max-concurrent",
+            dest="max_concurrent",
+            type=int,
+            default=os.cpu_count(),
+            help="""
+            Maximum number of ensemble member runs to execute at the same time;
+            the next member run is started as soon as one finishes.
+            Defaults to the number of CPUs on the machine.
+            Only used with --ensemble.
+            """,
+        )
+        parser.add_argument(
+            "--cookiecutter",
+            dest="use_cookiecutter",
+            action="store_true",
+            help="""
+            Use the legacy cookiecutter template rendering to create the
+            temporary run directory instead of the native run directory builder.
+            """,
+        )
+        parser.add_argument(
+            "--timings",
+            action="store_true",
+            help="""
+            Show the wall time of each phase of the preparation of the temporary
+            run directory, and write them, and the wall times and sizes of the
+            staged input files, to timings.json in the temporary run directory.
+            """,
+        )
+        parser.add_argument(
+            "--queue",
+            action="store_true",
+            help=f"""
+            Submit the run, or the ensemble member runs, to the local run queue
+            daemon (see `atlantis queue`) instead of launching them directly.
+            The daemon's socket is found via the {run_queue.SOCKET_ENV_VAR}
+            environment variable, or {run_queue.DEFAULT_SOCKET}.
+            """,
+        )
+        parser.add_argument(
+            "--priority",
+            type=int,
+            default=0,
+            help="""
+            Priority of the queued run(s); higher priority runs start first.
+            Defaults to 0.
+            Only used with --queue.
+            """,
+        )
+        parser.add_argument(
+            "--memory",
+            type=run_queue.parse_size,
+            default=0,
+            help="""
+            Memory that each queued run requires; e.g. 8G.
+            The queue daemon only starts a run when its memory fits within the
+            node-wide limit.
+            Only used with --queue.
+            """,
+        )
+        parser.add_argument(
+            "--warm-start-from",
+            dest="warm_start_from",
+            metavar="PREVIOUS_RESULTS_DIR",
+            type=Path,
+            help="""
+            Start the run from the final state of the run whose results are in
+            PREVIOUS_RESULTS_DIR instead of from the initial conditions file in
+            the run description.
+            With --ensemble, each member starts from the final state of the
+            results in the sub-directory of PREVIOUS_RESULTS_DIR with its name.
+            """,
+        )
+        parser.add_argument(
+            "--cache-run-desc",
+            dest="cache_run_desc",
+            action="store_true",
+            help="""
+            Keep the parsed run description(s) and their validated input file paths
+            in a cache in $XDG_CACHE_HOME/atlantis_cmd/run_desc/ (or
+            ~/.cache/atlantis_cmd/run_desc/) so that later runs from the same
+            run description files skip parsing and path resolution.
+            """,
+        )
+        parser.add_argument(
+            "--update",
+            dest="update_run_dir",
+            metavar="RUN_DIR",
+            type=Path,
+            help="""
+            Update the existing temporary run directory RUN_DIR instead of
+            creating a new one:
+            re-render its Atlantis.sh run script,
+            and re-stage only the input files that have changed since they were
+            staged in it.
+            Can't be used with --ensemble or --cookiecutter.
+            """,
+        )
+        parser.add_argument(
+            "--checksum",
+            action="store_true",
+            help="""
+            With --update, compare the contents of staged copies of input files
+            whose modification times have changed, and only re-stage them if
+            their contents differ.
+            """,
+        )
+        parser.add_argument(
+            "--preflight",
+            action="store_true",
+            help="""
+            Check that the initial conditions file and the NetCDF forcing files
+            are readable, complete, and consistent with each other before the
+            temporary run directory is created, and abort the run if they are
+            not. Only the file headers and time coordinates are read.
+            """,
+        )
         return parser
 
     def take_action(self, parsed_args):
@@ -85,21 +271,67 @@ class Run(cliff.command.Command):
         :param parsed_args: Arguments and options parsed from the command-line.
         :type parsed_args: :class:`argparse.Namespace` instance
         """
-        launched_job_msg = run(
-            parsed_args.desc_file,
-            parsed_args.results_dir,
-            no_submit=parsed_args.no_submit,
-            quiet=parsed_args.quiet,
-        )
+        if parsed_args.ensemble and parsed_args.update_run_dir is not None:
+            logger.error("--update can't be used with --ensemble")
+            raise SystemExit(2)
+        if parsed_args.ensemble:
+            launched_job_msg = run_ensemble(
+                parsed_args.desc_file,
+                parsed_args.results_dir,
+                max_concurrent=parsed_args.max_concurrent,
+                no_submit=parsed_args.no_submit,
+                quiet=parsed_args.quiet,
+                use_cookiecutter=parsed_args.use_cookiecutter,
+                timings=parsed_args.timings,
+                queue=parsed_args.queue,
+                priority=parsed_args.priority,
+                memory=parsed_args.memory,
+                warm_start_from=parsed_args.warm_start_from,
+                cache_run_desc=parsed_args.cache_run_desc,
+                preflight=parsed_args.preflight,
+            )
+        else:
+            launched_job_msg = run(
+                parsed_args.desc_file,
+                parsed_args.results_dir,
+                no_submit=parsed_args.no_submit,
+                quiet=parsed_args.quiet,
+                use_cookiecutter=parsed_args.use_cookiecutter,
+                timings=parsed_args.timings,
+                queue=parsed_args.queue,
+                priority=parsed_args.priority,
+                memory=parsed_args.memory,
+                warm_start_from=parsed_args.warm_start_from,
+                cache_run_desc=parsed_args.cache_run_desc,
+                update_run_dir=parsed_args.update_run_dir,
+                checksum=parsed_args.checksum,
+                preflight=parsed_args.preflight,
+            )
         if launched_job_msg and not parsed_args.quiet:
             logger.info(launched_job_msg)
 
 
-def run(desc_file, results_dir, no_submit=False, quiet=False):
+def run(
+    desc_file,
+    results_dir,
+    no_submit=False,
+    quiet=False,
+    use_cookiecutter=False,
+    timings=False,
+    queue=False,
+    priority=0,
+    memory=0,
+    warm_start_from=None,
+    cache_run_desc=False,
+    update_run_dir=None,
+    checksum=False,
+    preflight=False,
+):
     """Create and populate a temporary run directory, and a run script, and launch the run.
 
     The run script is stored in :file:`Atlantis.sh` in the temporary run directory.
-    That script is launched in a subprocess.
+    That script is launched in a subprocess,
+    or submitted to the local run queue daemon.
 
     :param desc_file: File path/name of the YAML run description file.
     :type desc_file: :py:class:`pathlib.Path`
@@ -116,37 +348,485 @@ def run(desc_file, results_dir, no_submit=False, quiet=False):
                           the default is to show the temporary run directory
                           path.
 
+    :param boolean use_cookiecutter: Use the legacy cookiecutter template rendering
+                                     to create the temporary run directory.
+
+    :param boolean timings: Show the wall times of the run preparation phases,
+                            and write them to :file:`timings.json` in the temporary
+                            run directory.
+
+    :param boolean queue: Submit the run script to the local run queue daemon
+                          instead of launching it.
+
+    :param int priority: Priority of the queued run.
+
+    :param int memory: Memory that the queued run requires, in bytes.
+
+    :param warm_start_from: Results directory of a previous run to take the
+                            initial conditions from the final state of.
+    :type warm_start_from: :py:class:`pathlib.Path` or None
+
+    :param boolean cache_run_desc: Also keep the parsed run description and its
+                                   validated paths in the on-disk cache.
+
+    :param update_run_dir: Existing temporary run directory to update instead of
+                           creating a new one.
+    :type update_run_dir: :py:class:`pathlib.Path` or None
+
+    :param boolean checksum: When updating a temporary run directory,
+                             compare the contents of staged copies whose
+                             modification times have changed before re-staging
+                             them.
+
+    :param boolean preflight: Check the NetCDF initial conditions and forcing files
+                              before creating the temporary run directory.
+
     :returns: Message confirming launch of the run script.
     :rtype: str
     """
-    run_desc = nemo_cmd.prepare.load_run_desc(desc_file)
-    run_id = nemo_cmd.prepare.get_run_desc_value(run_desc, ("run id",))
-    runs_dir = nemo_cmd.prepare.get_run_desc_value(
-        run_desc, ("paths", "runs directory"), resolve_path=True
-    )
-    tmp_run_dir = _calc_tmp_run_dir(runs_dir, run_id)
-    cookiecutter_context = _calc_cookiecutter_context(
-        run_desc, run_id, desc_file, tmp_run_dir, results_dir
-    )
-    # Symlinks and copied files in temporary run directory are created by
-    # cookiecutter/hooks/post_gen_project.py script
-    cookiecutter.main.cookiecutter(
-        os.fspath(Path(__file__).parent.parent / "cookiecutter"),
-        no_input=True,
-        output_dir=runs_dir,
-        extra_context=cookiecutter_context,
+    if update_run_dir is not None and use_cookiecutter:
+        logger.error("--update can't be used with --cookiecutter")
+        raise SystemExit(2)
+    run_id, tmp_run_dir = _prepare_tmp_run_dir(
+        desc_file,
+        results_dir,
+        quiet,
+        use_cookiecutter=use_cookiecutter,
+        timings=timings,
+        warm_start_from=warm_start_from,
+        cache_run_desc=cache_run_desc,
+        update_run_dir=update_run_dir,
+        checksum=checksum,
+        preflight=preflight,
     )
-    run_script_file = tmp_run_dir / "Atlantis.sh"
-    _record_vcs_revisions(run_desc, tmp_run_dir)
-    if not quiet:
-        logger.info(f"Created temporary run directory: {tmp_run_dir}")
     if no_submit:
         return
+    run_script_file = tmp_run_dir / "Atlantis.sh"
+    if queue:
+        job = run_queue.submit(run_script_file, run_id, priority, memory)
+        return f"queued {run_id} run via {run_script_file} as job {job['id']}"
     launch_cmd = f"{run_script_file}"
     subprocess.Popen(shlex.split(launch_cmd))
     return f"launched {run_id} run via {run_script_file}"
 
 
+def run_ensemble(
+    ensemble,
+    results_dir,
+    max_concurrent,
+    no_submit=False,
+    quiet=False,
+    use_cookiecutter=False,
+    timings=False,
+    queue=False,
+    priority=0,
+    memory=0,
+    warm_start_from=None,
+    cache_run_desc=False,
+    preflight=False,
+):
+    """Create and populate a temporary run directory, and a run script for each member
+    of an ensemble of runs, and execute the run scripts with at most
+    :kbd:`max_concurrent` of them running at the same time.
+
+    :param ensemble: Directory containing the run description YAML files of the
+                     ensemble members, or a glob pattern that matches them.
+    :type ensemble: :py:class:`pathlib.Path`
+
+    :param results_dir: Path of the directory in which to create the results
+                        directories of the ensemble members;
+                        it will be created if it does not exist.
+    :type results_dir: :py:class:`pathlib.Path`
+
+    :param int max_concurrent: Maximum number of member runs to execute at the same time.
+
+    :param boolean no_submit: Prepare the temporary run directories,
+                              and the run scripts to execute the Atlantis runs,
+                              but don't launch the runs.
+
+    :param boolean quiet: Don't show the run directory path messages;
+                          the default is to show the temporary run directory
+                          paths.
+
+    :param boolean use_cookiecutter: Use the legacy cookiecutter template rendering
+                                     to create the temporary run directories.
+
+    :param boolean timings: Show the wall times of the run preparation phases
+                            of each member,
+                            and write them to :file:`timings.json` in its temporary
+                            run directory.
+
+    :param boolean queue: Submit the member run scripts to the local run queue daemon
+                          instead of executing them,
+                          and return without waiting for them to finish;
+                          the daemon's concurrency limit applies instead of
+                          :kbd:`max_concurrent`.
+
+    :param int priority: Priority of the queued member runs.
+
+    :param int memory: Memory that each queued member run requires, in bytes.
+
+    :param warm_start_from: Directory containing the results directories of a
+                            previous ensemble to take the initial conditions of
+                            each member from the final state of the member with
+                            the same name.
+    :type warm_start_from: :py:class:`pathlib.Path` or None
+
+    :param boolean cache_run_desc: Also keep the parsed run descriptions and their
+                                   validated paths in the on-disk cache.
+
+    :param boolean preflight: Check the NetCDF initial conditions and forcing files
+                              of each member before creating its temporary run
+                              directory.
+
+    :raises: :py:exc:`SystemExit` with exit code 1 if any of the member runs
+             failed.
+
+    :returns: Message summarizing the outcome of the ensemble runs.
+    :rtype: str
+    """
+    if max_concurrent < 1:
+        logger.error(f"--max-concurrent must be at least 1, not {max_concurrent}")
+        raise SystemExit(2)
+    desc_files = _find_ensemble_desc_files(ensemble)
+    # Ensemble members usually share most of their input files,
+    # so they share a path lookup cache
+    stat_cache = validate.StatCache()
+    run_scripts = {}
+    for desc_file in desc_files:
+        run_id, tmp_run_dir = _prepare_tmp_run_dir(
+            desc_file,
+            results_dir / desc_file.stem,
+            quiet,
+            use_cookiecutter=use_cookiecutter,
+            timings=timings,
+            stat_cache=stat_cache,
+            warm_start_from=(
+                None if warm_start_from is None else warm_start_from / desc_file.stem
+            ),
+            cache_run_desc=cache_run_desc,
+            preflight=preflight,
+        )
+        run_scripts[desc_file.stem] = tmp_run_dir / "Atlantis.sh"
+    if no_submit:
+        return
+    if queue:
+        for member, run_script in run_scripts.items():
+            run_queue.submit(run_script, member, priority, memory)
+        return f"queued {len(run_scripts)} ensemble member runs"
+    exit_codes = _run_bounded(run_scripts, max_concurrent)
+    failed = sorted(member for member, exit_code in exit_codes.items() if exit_code)
+    for member in failed:
+        logger.error(
+            f"ensemble member {member} run failed with exit code {exit_codes[member]}"
+        )
+    msg = (
+        f"finished {len(exit_codes)} ensemble member runs "
+        f"with at most {max_concurrent} at a time; {len(failed)} failed"
+    )
+    if failed:
+        logger.error(msg)
+        raise SystemExit(1)
+    return msg
+
+
+def _find_ensemble_desc_files(ensemble):
+    """Find the run description YAML files of the members of an ensemble.
+
+    :param ensemble: Directory containing the run description YAML files of the
+                     ensemble members, or a glob pattern that matches them.
+    :type ensemble: :py:class:`pathlib.Path`
+
+    :return: Sorted run description YAML file paths.
+    :rtype: list
+    """
+    ensemble = Path(os.path.expandvars(ensemble)).expanduser()
+    if ensemble.is_dir():
+        desc_files = sorted(
+            path
+            for path in ensemble.iterdir()
+            if path.suffix in {".yaml", ".yml"} and path.is_file()
+        )
+    else:
+        desc_files = sorted(Path(path) for path in glob.glob(os.fspath(ensemble)))
+    if not desc_files:
+        logger.error(f"no run description files found for ensemble: {ensemble}")
+        raise SystemExit(2)
+    stems = [desc_file.stem for desc_file in desc_files]
+    duplicate_stems = sorted({stem for stem in stems if stems.count(stem) > 1})
+    if duplicate_stems:
+        logger.error(
+            f"ensemble run description file names must be unique so that they can "
+            f"be used as results directory names: {', '.join(duplicate_stems)}"
+        )
+        raise SystemExit(2)
+    return desc_files
+
+
+def _run_bounded(run_scripts, max_concurrent):
+    """Execute run scripts in subprocesses with at most :kbd:`max_concurrent` of them
+    running at the same time.
+
+    Each worker thread of the pool supervises one run script subprocess,
+    so the next run script is started as soon as a running one finishes.
+
+    :param dict run_scripts: Run script paths keyed by ensemble member name.
+
+    :param int max_concurrent: Maximum number of run scripts to execute at the same time.
+
+    :return: Run script exit codes keyed by ensemble member name.
+    :rtype: dict
+    """
+    exit_codes = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+        futures = {
+            executor.submit(subprocess.run, shlex.split(f"{run_script}")): member
+            for member, run_script in run_scripts.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            member = futures[future]
+            exit_codes[member] = future.result().returncode
+            logger.info(
+                f"ensemble member {member} run finished "
+                f"with exit code {exit_codes[member]}"
+            )
+    return exit_codes
+
+
+def _prepare_tmp_run_dir(
+    desc_file,
+    results_dir,
+    quiet=False,
+    run_desc=None,
+    use_cookiecutter=False,
+    timings=False,
+    stat_cache=None,
+    warm_start_from=None,
+    cache_run_desc=False,
+    update_run_dir=None,
+    checksum=False,
+    preflight=False,
+):
+    """Create and populate a temporary run directory, and a run script.
+
+    All of the input file paths in the run description are validated before
+    anything is created on disk.
+
+    :param desc_file: File path/name of the YAML run description file.
+    :type desc_file: :py:class:`pathlib.Path`
+
+    :param results_dir: Path of the directory in which to store the run results.
+    :type results_dir: :py:class:`pathlib.Path`
+
+    :param boolean quiet: Don't show the run directory path message.
+
+    :param run_desc: Run description dictionary to use instead of loading it from
+                     :kbd:`desc_file`.
+    :type run_desc: dict or None
+
+    :param boolean use_cookiecutter: Use the legacy cookiecutter template rendering
+                                     to create the temporary run directory instead
+                                     of the native run directory builder.
+
+    :param boolean timings: Show the wall times of the run preparation phases,
+                            and write them, and the wall times and sizes of the
+                            staged input files, to :file:`timings.json` in the
+                            temporary run directory.
+
+    :param stat_cache: Path lookup cache to share with the other runs in an
+                       ensemble;
+                       a new one is used if :py:obj:`None`.
+    :type stat_cache: :py:class:`atlantis_cmd.validate.StatCache` or None
+
+    :param warm_start_from: Results directory of a previous run to take the
+                            initial conditions from the final state of.
+    :type warm_start_from: :py:class:`pathlib.Path` or None
+
+    :param boolean cache_run_desc: Also keep the parsed run description and its
+                                   validated paths in the on-disk cache;
+                                   they are always cached in memory for the
+                                   lifetime of the process.
+
+    :param update_run_dir: Existing temporary run directory to re-render the run
+                           script in,
+                           and re-stage the changed input files into,
+                           instead of creating a new one.
+    :type update_run_dir: :py:class:`pathlib.Path` or None
+
+    :param boolean checksum: When updating a temporary run directory,
+                             compare the contents of staged copies whose
+                             modification times have changed before re-staging
+                             them.
+
+    :param boolean preflight: Check the NetCDF initial conditions and forcing files
+                              before creating the temporary run directory.
+
+    :return: Run identifier, and temporary run directory path.
+    :rtype: 2-tuple
+    """
+    phase_timings = Timings()
+    run_desc_cache = desc_cache.get_cache(persist=cache_run_desc)
+    with phase_timings.phase("total"):
+        if run_desc is None:
+            with phase_timings.phase("load run description"):
+                run_desc = run_desc_cache.load(desc_file)
+        with phase_timings.phase("validate run description"):
+            resolved_paths = run_desc_cache.validate(run_desc, stat_cache)
+            previous_output = _find_warm_start_output(run_desc, warm_start_from)
+        with phase_timings.phase("calculate run directory context"):
+            run_id = nemo_cmd.prepare.get_run_desc_value(run_desc, ("run id",))
+            runs_dir = resolved_paths[("paths", "runs directory")]
+            tmp_run_dir = _calc_tmp_run_dir(runs_dir, run_id)
+            cookiecutter_context = _calc_cookiecutter_context(
+                run_desc,
+                run_id,
+                desc_file,
+                tmp_run_dir,
+                results_dir,
+                resolved_paths=resolved_paths,
+            )
+            if update_run_dir is not None:
+                # The context is calculated for a new temporary run directory path
+                # so that problems found in the run description don't remove the
+                # run directory that is being updated
+                tmp_run_dir = _check_update_run_dir(update_run_dir)
+                cookiecutter_context["tmp_run_dir"] = os.fspath(tmp_run_dir)
+        if preflight:
+            with phase_timings.phase("preflight NetCDF input files"):
+                run_params = cookiecutter_context["parameters"].get("run")
+                check_input_files(
+                    Path(cookiecutter_context["init_conditions"]),
+                    cookiecutter_context["forcing"],
+                    run_params=None if run_params is None else Path(run_params),
+                )
+        if update_run_dir is not None:
+            restaged = run_dir.update_tmp_run_dir(
+                cookiecutter_context, phase_timings, checksum=checksum
+            )
+            logger.info(f"re-staged {restaged} changed input file(s) in {tmp_run_dir}")
+        elif use_cookiecutter:
+            # Symlinks and copied files in temporary run directory are created by
+            # cookiecutter/hooks/post_gen_project.py script
+            with phase_timings.phase("cookiecutter render"):
+                cookiecutter.main.cookiecutter(
+                    os.fspath(run_dir.COOKIECUTTER_DIR),
+                    no_input=True,
+                    output_dir=runs_dir,
+                    extra_context=cookiecutter_context,
+                )
+        else:
+            run_dir.build_tmp_run_dir(cookiecutter_context, phase_timings)
+        if previous_output is not None:
+            with phase_timings.phase("warm start"):
+                _warm_start(
+                    cookiecutter_context,
+                    previous_output,
+                    tmp_run_dir,
+                    remove_on_failure=update_run_dir is None,
+                )
+        with phase_timings.phase("write input manifest"):
+            inputs = manifest.staged_inputs(cookiecutter_context)
+            if previous_output is not None:
+                inputs["init_conditions.nc"] = tmp_run_dir / "init_conditions.nc"
+            manifest.write_manifest(inputs, tmp_run_dir)
+        with phase_timings.phase("record VCS revisions"):
+            _record_vcs_revisions(run_desc, tmp_run_dir)
+    if timings:
+        phase_timings.log()
+        timings_file = phase_timings.write(tmp_run_dir)
+        logger.info(f"Wrote run preparation timings to {timings_file}")
+    if not quiet:
+        logger.info(f"Created temporary run directory: {tmp_run_dir}")
+    return run_id, tmp_run_dir
+
+
+def _find_warm_start_output(run_desc, warm_start_from):
+    """Find the output file of the previous run to warm start from.
+
+    :param dict run_desc: Run description dictionary.
+
+    :param warm_start_from: Results directory of the previous run.
+    :type warm_start_from: :py:class:`pathlib.Path` or None
+
+    :raises: :py:exc:`SystemExit` if the previous run's output file doesn't exist.
+
+    :return: Path of the previous run's output file,
+             or :py:obj:`None` if the run is not warm started.
+    :rtype: :py:class:`pathlib.Path`
+    """
+    if warm_start_from is None:
+        return None
+    output_filename_base = nemo_cmd.prepare.get_run_desc_value(
+        run_desc, ("output filename base",)
+    )
+    previous_output = warm_start.find_previous_output(
+        warm_start_from, output_filename_base
+    )
+    if previous_output is None:
+        logger.error(
+            f"{output_filename_base}.nc not found in {warm_start_from} - "
+            f"please check your --warm-start-from results directory"
+        )
+        raise SystemExit(2)
+    return previous_output
+
+
+def _warm_start(
+    cookiecutter_context, previous_output, tmp_run_dir, remove_on_failure=True
+):
+    """Replace the staged initial conditions file in the temporary run directory
+    with one made from the last time record of a previous run's output file.
+
+    :param dict cookiecutter_context: Cookiecutter context of the temporary run
+                                      directory.
+
+    :param previous_output: Path of the previous run's output file.
+    :type previous_output: :py:class:`pathlib.Path`
+
+    :param tmp_run_dir: Temporary run directory path.
+    :type tmp_run_dir: :py:class:`pathlib.Path`
+
+    :param boolean remove_on_failure: Remove the temporary run directory if the
+                                      warm start fails.
+    """
+    try:
+        warm_started = warm_start.write_warm_start_init(
+            Path(cookiecutter_context["init_conditions"]),
+            previous_output,
+            tmp_run_dir / "init_conditions.nc",
+        )
+    except (OSError, ValueError) as exc:
+        logger.error(f"failed to warm start from {previous_output}: {exc}")
+        if remove_on_failure:
+            nemo_cmd.prepare.remove_run_dir(tmp_run_dir)
+        raise SystemExit(2)
+    logger.info(
+        f"warm started {len(warm_started)} initial conditions variables from the "
+        f"last time record of {previous_output}"
+    )
+
+
+def _check_update_run_dir(update_run_dir):
+    """Check that a directory to update is a temporary run directory.
+
+    :param update_run_dir: Path of the directory.
+    :type update_run_dir: :py:class:`pathlib.Path`
+
+    :raises: :py:exc:`SystemExit` if it is not a temporary run directory.
+
+    :return: Resolved temporary run directory path.
+    :rtype: :py:class:`pathlib.Path`
+    """
+    tmp_run_dir = _resolve_path(update_run_dir)
+    if not (tmp_run_dir / run_dir.RUN_SCRIPT_TEMPLATE.name).is_file():
+        logger.error(
+            f"{tmp_run_dir} is not a temporary run directory - "
+            f"please check your --update RUN_DIR"
+        )
+        raise SystemExit(2)
+    return tmp_run_dir
+
+
 def _calc_tmp_run_dir(runs_dir, run_id):
     """Compose a uniquely named temporary run directory name from the run id and a date/time stamp.
 
@@ -163,7 +843,9 @@ def _calc_tmp_run_dir(runs_dir, run_id):
     return tmp_run_dir
 
 
-def _calc_cookiecutter_context(run_desc, run_id, desc_file, tmp_run_dir, results_dir):
+def _calc_cookiecutter_context(
+    run_desc, run_id, desc_file, tmp_run_dir, results_dir, resolved_paths=None
+):
     """Calculate the cookiecutter context for creation of the temporary run directory.
 
     :param dict run_desc: Run description dictionary.
@@ -179,42 +861,55 @@ def _calc_cookiecutter_context(run_desc, run_id, desc_file, tmp_run_dir, results
     :param results_dir: Path of the directory in which to store the run results.
     :type results_dir: :py:class:`pathlib.Path`
 
+    :param resolved_paths: Input file paths that have already been resolved and
+                           checked by :py:func:`atlantis_cmd.validate.validate_run_desc`,
+                           keyed by run description key tuples.
+                           Paths that are not in it are resolved and checked here.
+    :type resolved_paths: dict or None
+
     :return: Cookiecutter context for creation of the temporary run directory.
     :rtype: dict
     """
+    resolved_paths = {} if resolved_paths is None else resolved_paths
+
+    def resolved_path(keys):
+        if keys in resolved_paths:
+            return resolved_paths[keys]
+        return nemo_cmd.prepare.get_run_desc_value(
+            run_desc, keys, resolve_path=True, run_dir=tmp_run_dir
+        )
+
     atlantis_cmd_dir = Path(__file__).parent.parent
     atlantis_cmd = f"pixi run -m {os.fspath(atlantis_cmd_dir)} atlantis"
-    atlantis_repo = nemo_cmd.prepare.get_run_desc_value(
-        run_desc, ("paths", "atlantis code"), resolve_path=True, run_dir=tmp_run_dir
-    )
+    atlantis_repo = resolved_path(("paths", "atlantis code"))
     # Build parameters and forcing dicts item-by-item instead of via dict comprehensions
     # so that we can fail fast if any of the files do not exist
     params_dict = nemo_cmd.prepare.get_run_desc_value(run_desc, ("parameters",))
     parameters = {}
     for key, path in params_dict.items():
-        parameters[key] = os.fspath(
-            nemo_cmd.prepare.get_run_desc_value(
-                run_desc, ("parameters", key), resolve_path=True, run_dir=tmp_run_dir
-            )
-        )
+        parameters[key] = os.fspath(resolved_path(("parameters", key)))
     forcing_dict = nemo_cmd.prepare.get_run_desc_value(run_desc, ("forcing",))
     forcing = {}
-    for key, path in forcing_dict.items():
-        forcing[key] = os.fspath(
-            nemo_cmd.prepare.get_run_desc_value(
-                run_desc,
-                ("forcing", key, "link to"),
-                resolve_path=True,
-                run_dir=tmp_run_dir,
-            )
-        )
+    for key, entry in forcing_dict.items():
+        sub_key = validate.forcing_sub_key(entry)
+        if sub_key == "link to":
+            forcing[key] = os.fspath(resolved_path(("forcing", key, "link to")))
+            continue
+        # glob and directory declarations are expanded to their files' names
+        keys = ("forcing", key, sub_key)
+        if keys in resolved_paths:
+            files = resolved_paths[keys]
+        else:
+            files = validate.scan_forcing(sub_key, entry[sub_key])
+        for file in files:
+            forcing[file.name] = os.fspath(file)
     atlantis_executable_name = nemo_cmd.prepare.get_run_desc_value(
         run_desc, ("paths", "atlantis executable name")
     )
     atlantis_executable = atlantis_repo.joinpath(
         "atlantis", "atlantismain", atlantis_executable_name
     )
-    if not atlantis_executable.exists():
+    if "atlantis executable" not in resolved_paths and not atlantis_executable.exists():
         logger.error(f"{atlantis_executable} not found - did you forget to build it?")
         nemo_cmd.prepare.remove_run_dir(tmp_run_dir)
         raise SystemExit(2)
@@ -226,43 +921,164 @@ def _calc_cookiecutter_context(run_desc, run_id, desc_file, tmp_run_dir, results
         "atlantis_executable": os.fspath(atlantis_executable),
         "atlantis_executable_name": atlantis_executable_name,
         "atlantis_cmd": atlantis_cmd,
-        "boxes": os.fspath(
-            nemo_cmd.prepare.get_run_desc_value(
-                run_desc, ("boxes",), resolve_path=True, run_dir=tmp_run_dir
-            )
-        ),
-        "init_conditions": os.fspath(
-            nemo_cmd.prepare.get_run_desc_value(
-                run_desc,
-                ("initial conditions",),
-                resolve_path=True,
-                run_dir=tmp_run_dir,
-            )
-        ),
-        "groups": os.fspath(
-            nemo_cmd.prepare.get_run_desc_value(
-                run_desc, ("groups",), resolve_path=True, run_dir=tmp_run_dir
-            )
-        ),
-        "migrations": os.fspath(
-            nemo_cmd.prepare.get_run_desc_value(
-                run_desc, ("migrations",), resolve_path=True, run_dir=tmp_run_dir
-            )
-        ),
-        "fisheries": os.fspath(
-            nemo_cmd.prepare.get_run_desc_value(
-                run_desc, ("fisheries",), resolve_path=True, run_dir=tmp_run_dir
-            )
-        ),
+        "boxes": os.fspath(resolved_path(("boxes",))),
+        "init_conditions": os.fspath(resolved_path(("initial conditions",))),
+        "groups": os.fspath(resolved_path(("groups",))),
+        "migrations": os.fspath(resolved_path(("migrations",))),
+        "fisheries": os.fspath(resolved_path(("fisheries",))),
         "parameters": parameters,
         "output_filename_base": nemo_cmd.prepare.get_run_desc_value(
             run_desc, ("output filename base",)
         ),
         "forcing": forcing,
+        "staging": _calc_staging_methods(run_desc, tmp_run_dir),
+        "gather_options": _calc_gather_options(run_desc, tmp_run_dir),
+        "scratch_dir": _calc_scratch_dir(run_desc, tmp_run_dir),
     }
     return cookiecutter_context
 
 
+def _calc_staging_methods(run_desc, tmp_run_dir):
+    """Calculate the methods to use to stage the input files into the temporary run directory.
+
+    The methods are set in the optional :kbd:`staging` section of the run description.
+    Its :kbd:`default` key sets the method for inputs that are not listed in it.
+
+    :param dict run_desc: Run description dictionary.
+
+    :param tmp_run_dir: Temporary run directory path.
+    :type tmp_run_dir: :py:class:`pathlib.Path`
+
+    :return: Staging methods keyed by cookiecutter context key.
+    :rtype: dict
+    """
+    staging_desc = run_desc.get("staging") or {}
+    unknown_keys = sorted(set(staging_desc) - set(STAGED_INPUTS) - {"default"})
+    if unknown_keys:
+        logger.error(
+            f"unknown staging key(s): {', '.join(unknown_keys)}; "
+            f"expected default or one of: {', '.join(STAGED_INPUTS)}"
+        )
+        nemo_cmd.prepare.remove_run_dir(tmp_run_dir)
+        raise SystemExit(2)
+    default_method = staging_desc.get("default", "auto")
+    staging_methods = {}
+    for run_desc_key, context_key in STAGED_INPUTS.items():
+        method = staging_desc.get(run_desc_key, default_method)
+        if method not in staging.STAGING_METHODS:
+            logger.error(
+                f"unknown staging method for {run_desc_key}: {method}; "
+                f"expected one of: {', '.join(staging.STAGING_METHODS)}"
+            )
+            nemo_cmd.prepare.remove_run_dir(tmp_run_dir)
+            raise SystemExit(2)
+        staging_methods[context_key] = method
+    return staging_methods
+
+
+def _calc_gather_options(run_desc, tmp_run_dir):
+    """Calculate the extra command-line options for the :command:`atlantis gather`
+    command in the run script.
+
+    The options are set in the optional :kbd:`gather` section of the run description.
+    A :kbd:`repack` value of :py:obj:`True` re-packs the output files that start
+    with the :kbd:`output filename base`.
+    A :kbd:`summarize` value of :py:obj:`True` summarizes the biomass of the
+    functional groups in the output file.
+
+    :param dict run_desc: Run description dictionary.
+
+    :param tmp_run_dir: Temporary run directory path.
+    :type tmp_run_dir: :py:class:`pathlib.Path`
+
+    :return: Command-line options,
+             each preceded by a space;
+             empty if there is no :kbd:`gather` section.
+    :rtype: str
+    """
+    gather_desc = run_desc.get("gather") or {}
+    unknown_keys = sorted(set(gather_desc) - set(GATHER_OPTIONS))
+    if unknown_keys:
+        logger.error(
+            f"unknown gather key(s): {', '.join(unknown_keys)}; "
+            f"expected one of: {', '.join(GATHER_OPTIONS)}"
+        )
+        nemo_cmd.prepare.remove_run_dir(tmp_run_dir)
+        raise SystemExit(2)
+    compression = gather_desc.get("compression", "zlib")
+    if compression not in repack.COMPRESSIONS:
+        logger.error(
+            f"unknown gather compression: {compression}; "
+            f"expected one of: {', '.join(repack.COMPRESSIONS)}"
+        )
+        nemo_cmd.prepare.remove_run_dir(tmp_run_dir)
+        raise SystemExit(2)
+    for key in ("compression level", "time chunk", "max workers"):
+        value = gather_desc.get(key, 1)
+        if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+            logger.error(f"gather {key} must be a positive integer, not {value}")
+            nemo_cmd.prepare.remove_run_dir(tmp_run_dir)
+            raise SystemExit(2)
+    summarize = gather_desc.get("summarize", False)
+    if not isinstance(summarize, bool):
+        logger.error(f"gather summarize must be True or False, not {summarize}")
+        nemo_cmd.prepare.remove_run_dir(tmp_run_dir)
+        raise SystemExit(2)
+    repack_globs = gather_desc.get("repack", False)
+    if repack_globs is True:
+        output_filename_base = nemo_cmd.prepare.get_run_desc_value(
+            run_desc, ("output filename base",)
+        )
+        repack_globs = [f"{output_filename_base}*.nc"]
+    elif repack_globs is False:
+        repack_globs = []
+    args = [arg for glob in repack_globs for arg in ("--repack", glob)]
+    for key, option in GATHER_OPTIONS.items():
+        if key not in {"repack", "summarize"} and key in gather_desc:
+            args.extend((option, str(gather_desc[key])))
+    if summarize:
+        args.append(GATHER_OPTIONS["summarize"])
+    return "".join(f" {shlex.quote(arg)}" for arg in args)
+
+
+def _calc_scratch_dir(run_desc, tmp_run_dir):
+    """Calculate the node-local scratch directory in which the run script is to
+    execute the run.
+
+    The directory is set by the optional :kbd:`scratch directory` key of the
+    :kbd:`paths` section of the run description.
+    Environment variables in it are left for the run script to expand,
+    so that variables like :envvar:`SLURM_TMPDIR` that are only set on the compute
+    node can be used.
+
+    :param dict run_desc: Run description dictionary.
+
+    :param tmp_run_dir: Temporary run directory path.
+    :type tmp_run_dir: :py:class:`pathlib.Path`
+
+    :return: Scratch directory,
+             or an empty string if the run is to execute in the temporary run
+             directory.
+    :rtype: str
+    """
+    scratch_dir = (run_desc.get("paths") or {}).get("scratch directory")
+    if not scratch_dir:
+        return ""
+    scratch_dir = os.path.expanduser(os.fspath(scratch_dir)).rstrip("/") or "/"
+    if not (scratch_dir.startswith("/") or scratch_dir.startswith("$")):
+        logger.error(
+            f"scratch directory must be an absolute path, "
+            f"or start with an environment variable, not {scratch_dir}"
+        )
+        nemo_cmd.prepare.remove_run_dir(tmp_run_dir)
+        raise SystemExit(2)
+    if '"' in scratch_dir or "`" in scratch_dir:
+        logger.error(f'scratch directory must not contain " or `: {scratch_dir}')
+        nemo_cmd.prepare.remove_run_dir(tmp_run_dir)
+        raise SystemExit(2)
+    return scratch_dir
+
+
 def _resolve_path(path):
     """Expand environment variables and :file:`~` in :kbd:`path` and resolve it to an absolute path.
 
@@ -279,6 +1095,10 @@ def _record_vcs_revisions(run_desc, tmp_run_dir):
     """Record revision and status information from version control system
     repositories in files in the temporary run directory.
 
+    The repositories are queried concurrently,
+    and their revision and status information is memoized for the lifetime of
+    the process.
+
     :param dict run_desc: Run description dictionary.
 
     :param tmp_run_dir: Path of the temporary run directory.
@@ -293,11 +1113,101 @@ def _record_vcs_revisions(run_desc, tmp_run_dir):
     vcs_tools = nemo_cmd.prepare.get_run_desc_value(
         run_desc, ("vcs revisions",), run_dir=tmp_run_dir
     )
+    repos = []
     for vcs_tool in vcs_tools:
-        repos = nemo_cmd.prepare.get_run_desc_value(
+        for repo in nemo_cmd.prepare.get_run_desc_value(
             run_desc, ("vcs revisions", vcs_tool), run_dir=tmp_run_dir
-        )
-        for repo in repos:
-            nemo_cmd.prepare.write_repo_rev_file(
-                Path(repo), tmp_run_dir, vcs_funcs[vcs_tool]
+        ):
+            repos.append((vcs_tool, Path(repo)))
+    if not repos:
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(repos)) as executor:
+        futures = [
+            executor.submit(
+                nemo_cmd.prepare.write_repo_rev_file,
+                repo,
+                tmp_run_dir,
+                functools.partial(
+                    _memoized_vcs_revision, vcs_tool, vcs_funcs[vcs_tool]
+                ),
             )
+            for vcs_tool, repo in repos
+        ]
+        for future in futures:
+            future.result()
+
+
+def _memoized_vcs_revision(vcs_tool, vcs_func, repo, run_dir):
+    """Get the revision and status information lines for a version control repository,
+    or their memoized value if the repository has been queried before,
+    and its state has not changed.
+
+    Concurrent calls for the same repository wait for the first one to query it.
+    Failed queries are not memoized.
+
+    :param str vcs_tool: Version control tool;
+                         :kbd:`git` or :kbd:`hg`.
+
+    :param vcs_func: Function that queries the repository for its revision and
+                     status information lines.
+    :type vcs_func: callable
+
+    :param repo: Path of the repository.
+    :type repo: :py:class:`pathlib.Path`
+
+    :param run_dir: Path of the temporary run directory.
+    :type run_dir: :py:class:`pathlib.Path`
+
+    :return: Revision and status information lines.
+    :rtype: list
+    """
+    key = (vcs_tool, os.fspath(repo), _vcs_state(vcs_tool, repo))
+    with _vcs_revisions_lock:
+        future = _vcs_revisions.get(key)
+        is_query_owner = future is None
+        if is_query_owner:
+            future = _vcs_revisions[key] = concurrent.futures.Future()
+    if is_query_owner:
+        try:
+            future.set_result(vcs_func(repo, run_dir))
+        except BaseException as exc:
+            with _vcs_revisions_lock:
+                del _vcs_revisions[key]
+            future.set_exception(exc)
+            raise
+    return future.result()
+
+
+def _vcs_state(vcs_tool, repo):
+    """Calculate a fingerprint of the state of a version control repository from the
+    modification times of the files that change when its checked out revision,
+    or its staged changes change.
+
+    For git repositories the file of the branch ref that :file:`HEAD` points to is
+    included.
+
+    :param str vcs_tool: Version control tool;
+                         :kbd:`git` or :kbd:`hg`.
+
+    :param repo: Path of the repository.
+    :type repo: :py:class:`pathlib.Path`
+
+    :return: Modification times in nanoseconds;
+             :py:obj:`None` for files that don't exist.
+    :rtype: tuple
+    """
+    state_files = [repo / state_file for state_file in VCS_STATE_FILES[vcs_tool]]
+    if vcs_tool == "git":
+        try:
+            head = (repo / ".git" / "HEAD").read_text().strip()
+        except OSError:
+            head = ""
+        if head.startswith("ref: "):
+            state_files.append(repo / ".git" / head.removeprefix("ref: "))
+    mtimes = []
+    for state_file in state_files:
+        try:
+            mtimes.append(state_file.stat().st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
@@ -0,0 +1,433 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Creation and population of temporary run directories.
+
+The temporary run directory is built directly from the cookiecutter context
+that is calculated by :py:func:`atlantis_cmd.run._calc_cookiecutter_context`,
+without running cookiecutter.
+The :file:`Atlantis.sh` template in the cookiecutter template directory is
+compiled once per process,
+and the input files are staged in-process.
+"""
+
+import concurrent.futures
+import contextlib
+import functools
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+from atlantis_cmd import manifest
+from atlantis_cmd.lazy_import import lazy_import
+from atlantis_cmd.staging import is_current, stage_file
+from atlantis_cmd.timings import Timings
+
+jinja2 = lazy_import("jinja2")
+
+logger = logging.getLogger(__name__)
+
+COOKIECUTTER_DIR = Path(__file__).parent.parent / "cookiecutter"
+RUN_SCRIPT_TEMPLATE = COOKIECUTTER_DIR / "{{cookiecutter.tmp_run_dir}}" / "Atlantis.sh"
+
+# Maximum number of input files to stage at the same time
+MAX_STAGING_WORKERS = 8
+
+# Number of forcing file symlinks to create in each staging task
+FORCING_SYMLINKS_PER_TASK = 256
+
+
+def build_tmp_run_dir(context, timings=None):
+    """Create a temporary run directory, render the :file:`Atlantis.sh` run script in it,
+    and populate it with the run's input files.
+
+    The temporary run directory is removed if populating it fails.
+
+    :param dict context: Cookiecutter context for creation of the temporary run directory.
+
+    :param timings: Collector for the wall times of the run script rendering and
+                    input file staging phases.
+    :type timings: :py:class:`atlantis_cmd.timings.Timings` or None
+
+    :return: Temporary run directory path.
+    :rtype: :py:class:`pathlib.Path`
+    """
+    timings = Timings() if timings is None else timings
+    tmp_run_dir = Path(context["tmp_run_dir"])
+    tmp_run_dir.mkdir()
+    try:
+        with timings.phase("render run script"):
+            write_run_script(context, tmp_run_dir)
+        with timings.phase("stage input files"):
+            populate_tmp_run_dir(context, tmp_run_dir, timings)
+    except BaseException:
+        shutil.rmtree(tmp_run_dir, ignore_errors=True)
+        raise
+    return tmp_run_dir
+
+
+def write_run_script(context, tmp_run_dir):
+    """Render the :file:`Atlantis.sh` run script in the temporary run directory.
+
+    :param dict context: Cookiecutter context for creation of the temporary run directory.
+
+    :param tmp_run_dir: Temporary run directory path.
+    :type tmp_run_dir: :py:class:`pathlib.Path`
+
+    :return: Run script path.
+    :rtype: :py:class:`pathlib.Path`
+    """
+    run_script = tmp_run_dir / RUN_SCRIPT_TEMPLATE.name
+    run_script.write_text(_run_script_template().render(cookiecutter=context))
+    shutil.copymode(RUN_SCRIPT_TEMPLATE, run_script)
+    return run_script
+
+
+@functools.cache
+def _run_script_template():
+    """Compile the :file:`Atlantis.sh` run script template.
+
+    The Jinja environment matches the one that cookiecutter uses so that the
+    rendered run scripts are identical.
+
+    :rtype: :py:class:`jinja2.Template`
+    """
+    env = jinja2.Environment(
+        undefined=jinja2.StrictUndefined, keep_trailing_newline=True
+    )
+    return env.from_string(RUN_SCRIPT_TEMPLATE.read_text())
+
+
+def update_tmp_run_dir(context, timings=None, checksum=False):
+    """Re-render the :file:`Atlantis.sh` run script in an existing temporary run
+    directory,
+    re-stage the input files that have changed since they were staged,
+    and remove the staged files and symlinks of inputs that are no longer in the
+    context.
+
+    :param dict context: Cookiecutter context for the temporary run directory.
+
+    :param timings: Collector for the wall times of the run script rendering and
+                    input file updating phases.
+    :type timings: :py:class:`atlantis_cmd.timings.Timings` or None
+
+    :param boolean checksum: Compare the contents of staged copies whose
+                             modification times differ from those of their input
+                             files before re-staging them.
+
+    :return: Number of input files that were re-staged.
+    :rtype: int
+    """
+    timings = Timings() if timings is None else timings
+    tmp_run_dir = Path(context["tmp_run_dir"])
+    staged_files = len(timings.files)
+    with timings.phase("render run script"):
+        write_run_script(context, tmp_run_dir)
+    with timings.phase("update input files"):
+        _remove_stale_inputs(context, tmp_run_dir)
+        populate_tmp_run_dir(
+            context, tmp_run_dir, timings, update=True, checksum=checksum
+        )
+    return len(timings.files) - staged_files
+
+
+def _remove_stale_inputs(context, tmp_run_dir):
+    """Remove the staged files and symlinks of inputs that are no longer in the
+    context from a temporary run directory.
+
+    The previously staged inputs are the files in the directory's input manifest,
+    and its symlinks;
+    the run script, manifest, and other files that are written in the directory
+    are left alone.
+
+    :param dict context: Cookiecutter context for the temporary run directory.
+
+    :param tmp_run_dir: Temporary run directory path.
+    :type tmp_run_dir: :py:class:`pathlib.Path`
+
+    :return: Names of the removed files and symlinks.
+    :rtype: list
+    """
+    staged = {path.name for path in tmp_run_dir.iterdir() if path.is_symlink()}
+    try:
+        manifest_files = json.loads((tmp_run_dir / manifest.MANIFEST_FILE).read_text())[
+            "files"
+        ]
+    except (OSError, ValueError, KeyError):
+        # No manifest is written if preparing the directory failed part way
+        manifest_files = []
+    staged.update(entry["name"] for entry in manifest_files)
+    current = set(manifest.staged_inputs(context))
+    current.add(context["atlantis_executable_name"])
+    stale = sorted(staged - current)
+    for name in stale:
+        (tmp_run_dir / name).unlink(missing_ok=True)
+        logger.info(
+            f"removed {name} from {tmp_run_dir} because it is no longer an input"
+        )
+    return stale
+
+
+def populate_tmp_run_dir(
+    context,
+    tmp_run_dir,
+    timings=None,
+    update=False,
+    checksum=False,
+    max_workers=MAX_STAGING_WORKERS,
+):
+    """Copy, link, and symlink the run's input files into the temporary run directory.
+
+    The input files, and batches of the forcing file symlinks,
+    are staged concurrently by a bounded pool of threads.
+
+    :param dict context: Cookiecutter context for creation of the temporary run directory.
+
+    :param tmp_run_dir: Temporary run directory path.
+    :type tmp_run_dir: :py:class:`pathlib.Path`
+
+    :param timings: Collector for the wall times and sizes of the staged input files.
+    :type timings: :py:class:`atlantis_cmd.timings.Timings` or None
+
+    :param boolean update: Only re-stage the input files and symlinks that are missing
+                           from the temporary run directory,
+                           or that have changed since they were staged.
+
+    :param boolean checksum: With :kbd:`update`,
+                             compare the contents of staged copies whose
+                             modification times differ from those of their input
+                             files before re-staging them.
+
+    :param int max_workers: Maximum number of input files to stage at the same time.
+
+    :raises: Exception of the first input file that failed to be staged,
+             after the failures of all of the input files have been logged.
+    """
+    timings = Timings() if timings is None else timings
+    staging = context["staging"]
+    shutil.copy2(context["run_desc_yaml"], tmp_run_dir)
+    _symlink(
+        context["atlantis_executable"],
+        tmp_run_dir / context["atlantis_executable_name"],
+        update=update,
+    )
+    boxes = Path(context["boxes"])
+    staged_files = [
+        (boxes, boxes.name, staging["boxes"]),
+        (
+            Path(context["init_conditions"]),
+            "init_conditions.nc",
+            staging["init_conditions"],
+        ),
+        (Path(context["groups"]), "groups.csv", staging["groups"]),
+        (Path(context["migrations"]), "migrations.csv", staging["migrations"]),
+        (Path(context["fisheries"]), "fisheries.csv", staging["fisheries"]),
+    ]
+    staged_files.extend(
+        (Path(path), f"{key}.prm", staging["parameters"])
+        for key, path in context["parameters"].items()
+    )
+    with _open_dir(tmp_run_dir) as dir_fd:
+        tasks = [
+            (
+                src,
+                functools.partial(
+                    _stage_input_file,
+                    src,
+                    tmp_run_dir / dest_name,
+                    method,
+                    timings,
+                    update,
+                    checksum,
+                ),
+            )
+            for src, dest_name, method in staged_files
+        ]
+        forcing = list(context["forcing"].items())
+        tasks.extend(
+            (
+                "forcing file symlinks",
+                functools.partial(
+                    _symlink_forcing,
+                    forcing[i : i + FORCING_SYMLINKS_PER_TASK],
+                    tmp_run_dir,
+                    dir_fd,
+                    update,
+                ),
+            )
+            for i in range(0, len(forcing), FORCING_SYMLINKS_PER_TASK)
+        )
+        _run_staging_tasks(tasks, max_workers)
+
+
+def _run_staging_tasks(tasks, max_workers):
+    """Run input file staging tasks in a bounded pool of threads.
+
+    Staging on network filesystems is bound by the latency of each file operation,
+    not by bandwidth,
+    so running the tasks concurrently makes the staging time close to that of the
+    slowest task rather than the sum of all of them.
+    All of the tasks are run,
+    and all of their failures are logged,
+    before the first failure is raised.
+
+    :param list tasks: 2-tuples of the input file, or description of the files,
+                       that a task stages, and the task callable.
+
+    :param int max_workers: Maximum number of tasks to run at the same time.
+
+    :raises: Exception of the first task, in :kbd:`tasks` order, that failed.
+    """
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(tasks)))
+    ) as executor:
+        futures = [(name, executor.submit(task)) for name, task in tasks]
+    failures = []
+    for name, future in futures:
+        exc = future.exception()
+        if exc is not None:
+            logger.error(f"failed to stage {name}: {exc}")
+            failures.append(exc)
+    if failures:
+        raise failures[0]
+
+
+def _stage_input_file(src, dest, method, timings, update=False, checksum=False):
+    """Stage an input file into the temporary run directory,
+    or, with :kbd:`update`,
+    re-stage it if the staged file is missing or not current.
+
+    :param src: Path of the input file to stage.
+    :type src: :py:class:`pathlib.Path`
+
+    :param dest: Path of the staged file in the temporary run directory.
+    :type dest: :py:class:`pathlib.Path`
+
+    :param str method: Staging method.
+
+    :param timings: Collector for the wall times and sizes of the staged input files.
+    :type timings: :py:class:`atlantis_cmd.timings.Timings`
+
+    :param boolean update: Only re-stage the file if it is missing or not current.
+
+    :param boolean checksum: With :kbd:`update`,
+                             compare the contents of a staged copy whose
+                             modification time differs from that of the input file
+                             before re-staging it.
+    """
+    if update:
+        if is_current(src, dest, method, checksum=checksum):
+            return
+        # Unlink rather than overwrite so that a hard linked input file is
+        # not written through
+        dest.unlink(missing_ok=True)
+    _stage_file(src, dest, method, timings)
+
+
+@contextlib.contextmanager
+def _open_dir(tmp_run_dir):
+    """Context manager to open a descriptor of the temporary run directory
+    that symlinks can be created relative to,
+    so that the kernel doesn't have to resolve its path for each of thousands of
+    forcing files.
+
+    :param tmp_run_dir: Temporary run directory path.
+    :type tmp_run_dir: :py:class:`pathlib.Path`
+
+    :return: Directory descriptor,
+             or :py:obj:`None` if the platform can't create symlinks relative to one.
+    :rtype: int or None
+    """
+    if os.symlink not in os.supports_dir_fd:
+        yield None
+        return
+    dir_fd = os.open(tmp_run_dir, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        yield dir_fd
+    finally:
+        os.close(dir_fd)
+
+
+def _symlink_forcing(forcing, tmp_run_dir, dir_fd=None, update=False):
+    """Create forcing file symlinks in the temporary run directory.
+
+    :param list forcing: 2-tuples of symlink names and their targets.
+
+    :param tmp_run_dir: Temporary run directory path.
+    :type tmp_run_dir: :py:class:`pathlib.Path`
+
+    :param dir_fd: Descriptor of the temporary run directory to create the symlinks
+                   relative to;
+                   :py:obj:`None` means use their full paths.
+    :type dir_fd: int or None
+
+    :param boolean update: Only replace the symlinks whose targets have changed.
+    """
+    for link_name, target in forcing:
+        link = link_name if dir_fd is not None else tmp_run_dir / link_name
+        _symlink(target, link, dir_fd=dir_fd, update=update)
+
+
+def _symlink(target, link, dir_fd=None, update=False):
+    """Create a symlink.
+
+    :param str target: Target of the symlink.
+
+    :param link: Path of the symlink;
+                 relative to :kbd:`dir_fd` if it is not :py:obj:`None`.
+    :type link: :py:class:`pathlib.Path` or str
+
+    :param dir_fd: Descriptor of the directory to create the symlink in.
+    :type dir_fd: int or None
+
+    :param boolean update: Replace an existing file or symlink at :kbd:`link`,
+                           unless it is a symlink to :kbd:`target`.
+    """
+    if update:
+        try:
+            if os.readlink(link, dir_fd=dir_fd) == os.fspath(target):
+                return
+        except OSError:
+            # Missing, or not a symlink
+            pass
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(link, dir_fd=dir_fd)
+    os.symlink(target, link, dir_fd=dir_fd)
+
+
+def _stage_file(src, dest, method, timings):
+    """Stage an input file into the temporary run directory,
+    and record how long that took.
+
+    :param src: Path of the input file to stage.
+    :type src: :py:class:`pathlib.Path`
+
+    :param dest: Path of the staged file in the temporary run directory.
+    :type dest: :py:class:`pathlib.Path`
+
+    :param str method: Staging method.
+
+    :param timings: Collector for the wall times and sizes of the staged input files.
+    :type timings: :py:class:`atlantis_cmd.timings.Timings`
+    """
+    start = time.perf_counter()
+    used = stage_file(src, dest, method)
+    timings.record_file(src, dest, used, time.perf_counter() - start)
@@ -0,0 +1,708 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""AtlantisCmd command plug-in for queue sub-command.
+
+A local run queue daemon that executes the run scripts of prepared temporary run
+directories on a shared compute node in priority order,
+within node-wide concurrency and memory limits,
+and records when each run started and ended, and its exit code.
+
+Clients like :command:`atlantis run --queue` talk to the daemon by sending JSON
+requests, one per line, over a Unix domain socket.
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import os
+import pwd
+import re
+import signal
+import socket
+import socketserver
+import struct
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import cliff.command
+
+logger = logging.getLogger(__name__)
+
+# Environment variable that sets the path of the queue daemon's socket
+SOCKET_ENV_VAR = "ATLANTIS_QUEUE_SOCKET"
+# The socket is in a directory that only root can write to,
+# so that other users can't replace it with their own
+DEFAULT_SOCKET = Path("/run/atlantis-queue/queue.sock")
+
+# Interval in seconds at which runs that were executing when the daemon was
+# restarted are checked to see whether they have finished
+LOST_JOB_POLL_INTERVAL = 30
+
+# Search path for the commands in the run scripts of jobs that are executed as
+# other users
+JOB_PATH = "/usr/local/bin:/usr/bin:/bin"
+
+# Number of finished jobs that are kept in the queue state
+MAX_FINISHED_JOBS = 1000
+
+# Binary multiples of the size suffixes accepted by memory options
+_SIZE_UNITS = {"": 1, "K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+
+
+class QueueError(Exception):
+    """Raised when the queue daemon rejects a request, or can't be reached."""
+
+
+class Queue(cliff.command.Command):
+    """Execute prepared Atlantis runs on this node within concurrency and memory limits."""
+
+    def get_parser(self, prog_name):
+        parser = super().get_parser(prog_name)
+        parser.description = """
+            Start the local run queue daemon that executes the runs that are
+            submitted to it with `atlantis run --queue` in priority order,
+            with at most MAX_CONCURRENT of them running at the same time,
+            and the sum of their requested memory limited to MAX_MEMORY.
+            Use --status to show the jobs in the queue of a running daemon instead.
+        """
+        parser.add_argument(
+            "--socket",
+            type=Path,
+            default=default_socket(),
+            help=f"""
+            Path of the daemon's Unix domain socket.
+            Defaults to the value of the {SOCKET_ENV_VAR} environment variable,
+            or {DEFAULT_SOCKET}.
+            """,
+        )
+        parser.add_argument(
+            "--state-file",
+            dest="state_file",
+            type=Path,
+            help="""
+            Path of the file in which the daemon records the queue,
+            so that queued runs survive a restart of the daemon.
+            Defaults to the socket path with a .json suffix.
+            """,
+        )
+        parser.add_argument(
+            "--max-concurrent",
+            dest="max_concurrent",
+            type=int,
+            default=os.cpu_count(),
+            help="""
+            Maximum number of runs to execute at the same time.
+            Defaults to the number of CPUs on the machine.
+            """,
+        )
+        parser.add_argument(
+            "--max-memory",
+            dest="max_memory",
+            type=parse_size,
+            help="""
+            Maximum sum of the memory requested by the runs that are executing
+            at the same time; e.g. 64G.
+            Defaults to unlimited.
+            """,
+        )
+        parser.add_argument(
+            "--status",
+            action="store_true",
+            help="Show the jobs in the queue of the running daemon, and exit.",
+        )
+        return parser
+
+    def take_action(self, parsed_args):
+        """Execute the `atlantis queue` sub-command.
+
+        :param parsed_args: Arguments and options parsed from the command-line.
+        :type parsed_args: :class:`argparse.Namespace` instance
+        """
+        if parsed_args.status:
+            show_status(parsed_args.socket)
+            return
+        serve(
+            parsed_args.socket,
+            state_file=parsed_args.state_file,
+            max_concurrent=parsed_args.max_concurrent,
+            max_memory=parsed_args.max_memory,
+        )
+
+
+def default_socket():
+    """Path of the queue daemon's socket from the environment, or the default.
+
+    :rtype: :py:class:`pathlib.Path`
+    """
+    return Path(os.environ.get(SOCKET_ENV_VAR, DEFAULT_SOCKET))
+
+
+def parse_size(text):
+    """Parse a memory size like :kbd:`512M` or :kbd:`64G` into bytes.
+
+    :param str text: Size, with an optional binary multiple suffix.
+
+    :raises: :py:exc:`ValueError` if the size can't be parsed.
+
+    :return: Size in bytes.
+    :rtype: int
+    """
+    match = re.fullmatch(
+        r"\s*(\d+(?:\.\d*)?)\s*([KMGT]?)(?:i?B)?\s*", str(text), re.IGNORECASE
+    )
+    if match is None:
+        raise ValueError(f"invalid memory size: {text}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+class RunQueue:
+    """Priority queue of run scripts that are executed within concurrency and memory
+    limits.
+
+    Jobs with higher priority are started first,
+    and jobs with the same priority are started in the order they were submitted.
+    A job that doesn't fit within the memory limit blocks the jobs behind it,
+    so that large runs are not starved by a stream of small ones.
+
+    :param state_file: Path of the file in which to record the queue.
+    :type state_file: :py:class:`pathlib.Path`
+
+    :param int max_concurrent: Maximum number of jobs to execute at the same time.
+
+    :param max_memory: Maximum sum of the memory requested by the jobs that are
+                       executing at the same time, in bytes;
+                       :py:obj:`None` means unlimited.
+    :type max_memory: int or None
+    """
+
+    def __init__(self, state_file, max_concurrent, max_memory=None):
+        self.state_file = state_file
+        self.max_concurrent = max_concurrent
+        self.max_memory = max_memory
+        self.jobs = {}
+        self._heap = []
+        self._next_id = itertools.count(1)
+        self._lock = threading.RLock()
+        self._poll_timer = None
+        self._load()
+
+    def submit(self, run_script, run_id, priority=0, memory=0, uid=None, gid=None):
+        """Add a run script to the queue, and start it if there is room.
+
+        :param str run_script: Path of the run script.
+
+        :param str run_id: Run id to show in the queue status.
+
+        :param int priority: Priority of the job; higher priority jobs start first.
+
+        :param int memory: Memory that the run requires, in bytes.
+
+        :param uid: User id to execute the run script as;
+                    :py:obj:`None` means the daemon's user.
+        :type uid: int or None
+
+        :param gid: Group id to execute the run script as;
+                    :py:obj:`None` means the daemon's group.
+        :type gid: int or None
+
+        :raises: :py:exc:`QueueError` if the job can never fit within the memory limit.
+
+        :return: Job record.
+        :rtype: dict
+        """
+        if self.max_memory is not None and memory > self.max_memory:
+            raise QueueError(
+                f"run requires {memory / 2**30:.1f} GiB of memory, "
+                f"more than the queue's {self.max_memory / 2**30:.1f} GiB limit"
+            )
+        with self._lock:
+            job = {
+                "id": next(self._next_id),
+                "run id": run_id,
+                "run script": os.fspath(run_script),
+                "priority": priority,
+                "memory": memory,
+                "uid": uid,
+                "gid": gid,
+                "state": "queued",
+                "submitted": time.time(),
+                "started": None,
+                "ended": None,
+                "pid": None,
+                "exit code": None,
+            }
+            self.jobs[job["id"]] = job
+            heapq.heappush(self._heap, (-priority, job["id"]))
+            logger.info(f"queued job {job['id']}: {run_id} via {run_script}")
+            self._schedule()
+            return dict(job)
+
+    def status(self):
+        """Records of the jobs in the queue, in the order that they were submitted.
+
+        :rtype: list
+        """
+        with self._lock:
+            return [dict(job) for job in self.jobs.values()]
+
+    def handle_request(self, request, peer_uid, peer_gid):
+        """Execute a client request.
+
+        A daemon that runs as root executes run scripts as the user that submitted
+        them;
+        otherwise, only the daemon's own user may submit runs.
+
+        :param dict request: Request with an :kbd:`op` item of :kbd:`submit` or
+                             :kbd:`status`.
+
+        :param int peer_uid: User id of the client process.
+
+        :param int peer_gid: Group id of the client process.
+
+        :return: Response with an :kbd:`ok` item,
+                 and the :kbd:`job` or :kbd:`jobs`,
+                 or an :kbd:`error` message.
+        :rtype: dict
+        """
+        try:
+            match request.get("op"):
+                case "status":
+                    return {"ok": True, "jobs": self.status()}
+                case "submit":
+                    if os.geteuid() == 0:
+                        uid, gid = peer_uid, peer_gid
+                    elif peer_uid == os.geteuid():
+                        uid = gid = None
+                    else:
+                        raise QueueError(
+                            f"queue daemon runs as uid {os.geteuid()} and only "
+                            f"accepts runs from that user, not uid {peer_uid}"
+                        )
+                    job = self.submit(
+                        request["run script"],
+                        request["run id"],
+                        priority=int(request.get("priority", 0)),
+                        memory=int(request.get("memory", 0)),
+                        uid=uid,
+                        gid=gid,
+                    )
+                    return {"ok": True, "job": job}
+                case op:
+                    raise QueueError(f"unknown request op: {op}")
+        except (QueueError, KeyError, TypeError, ValueError) as exc:
+            return {"ok": False, "error": f"{type(exc).__name__}: {exc}"}
+
+    def _schedule(self):
+        """Start queued jobs in priority order while they fit within the limits.
+
+        Lost jobs whose processes are still alive count against the limits,
+        and are checked again every :py:data:`LOST_JOB_POLL_INTERVAL` seconds
+        while there are jobs waiting for them to finish.
+        """
+        with self._lock:
+            lost = [
+                job
+                for job in self.jobs.values()
+                if job["state"] == "lost" and _pid_alive(job["pid"])
+            ]
+            running = [job for job in self.jobs.values() if job["state"] == "running"]
+            running.extend(lost)
+            memory = sum(job["memory"] for job in running)
+            while self._heap and len(running) < self.max_concurrent:
+                job = self.jobs[self._heap[0][1]]
+                if (
+                    self.max_memory is not None
+                    and memory + job["memory"] > self.max_memory
+                ):
+                    break
+                heapq.heappop(self._heap)
+                self._start(job)
+                if job["state"] == "running":
+                    running.append(job)
+                    memory += job["memory"]
+            if lost and self._heap and self._poll_timer is None:
+                self._poll_timer = threading.Timer(
+                    LOST_JOB_POLL_INTERVAL, self._poll_lost_jobs
+                )
+                self._poll_timer.daemon = True
+                self._poll_timer.start()
+            self._save()
+
+    def _poll_lost_jobs(self):
+        """Start queued jobs if lost jobs have finished since they were last checked."""
+        with self._lock:
+            self._poll_timer = None
+            self._schedule()
+
+    def _start(self, job):
+        """Launch a job's run script in a new session,
+        and start a thread that waits for it to finish.
+
+        A job that runs as another user gets that user's supplementary groups
+        and a login environment for that user,
+        not the daemon's.
+
+        :param dict job: Job record.
+        """
+        try:
+            extra_groups = env = None
+            if job["uid"] is not None:
+                extra_groups = _user_groups(job["uid"], job["gid"])
+                env = _user_env(job["uid"])
+            proc = subprocess.Popen(
+                [job["run script"]],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                start_new_session=True,
+                user=job["uid"],
+                group=job["gid"],
+                extra_groups=extra_groups,
+                env=env,
+            )
+        except OSError as exc:
+            logger.error(f"failed to start job {job['id']}: {exc}")
+            job.update(state="finished", started=time.time(), ended=time.time())
+            job["exit code"] = -1
+            return
+        job.update(state="running", started=time.time(), pid=proc.pid)
+        logger.info(f"started job {job['id']}: {job['run id']} as pid {proc.pid}")
+        threading.Thread(target=self._wait, args=(job, proc), daemon=True).start()
+
+    def _wait(self, job, proc):
+        """Wait for a job's run script to finish, record its exit code,
+        and start the next jobs.
+
+        :param dict job: Job record.
+
+        :param proc: Run script process.
+        :type proc: :py:class:`subprocess.Popen`
+        """
+        exit_code = proc.wait()
+        with self._lock:
+            job.update(state="finished", ended=time.time())
+            job["exit code"] = exit_code
+            logger.info(
+                f"job {job['id']}: {job['run id']} finished with exit code {exit_code}"
+            )
+            self._schedule()
+
+    def _load(self):
+        """Restore the queue from the state file.
+
+        Jobs that were running when the daemon stopped can't be re-attached to,
+        so they are marked as lost;
+        they still count against the limits while their processes are alive.
+        """
+        try:
+            jobs = json.loads(self.state_file.read_text())["jobs"]
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError) as exc:
+            logger.warning(
+                f"ignoring unreadable queue state file {self.state_file}: {exc}"
+            )
+            return
+        for job in jobs:
+            if job["state"] == "running":
+                job["state"] = "lost"
+            self.jobs[job["id"]] = job
+            if job["state"] == "queued":
+                heapq.heappush(self._heap, (-job["priority"], job["id"]))
+        self._next_id = itertools.count(max(self.jobs, default=0) + 1)
+
+    def _save(self):
+        """Write the queue to the state file,
+        dropping the oldest finished jobs beyond :py:data:`MAX_FINISHED_JOBS`.
+
+        The file is written beside the state file and renamed over it,
+        so it is never left partly written.
+        """
+        with self._lock:
+            done = [
+                job_id
+                for job_id, job in self.jobs.items()
+                if job["state"] in {"finished", "lost"}
+            ]
+            for job_id in done[: max(0, len(done) - MAX_FINISHED_JOBS)]:
+                del self.jobs[job_id]
+            tmp_file = self.state_file.with_name(f".{self.state_file.name}.tmp")
+            tmp_file.write_text(json.dumps({"jobs": list(self.jobs.values())}))
+            os.replace(tmp_file, self.state_file)
+
+
+def _user_groups(uid, gid):
+    """Supplementary groups of a user.
+
+    :param int uid: User id.
+
+    :param gid: Primary group id of the user;
+                :py:obj:`None` means the primary group from the password database.
+    :type gid: int or None
+
+    :return: Group ids;
+             empty if the user isn't in the password database.
+    :rtype: list
+    """
+    try:
+        user = pwd.getpwuid(uid)
+    except KeyError:
+        return []
+    return os.getgrouplist(user.pw_name, user.pw_gid if gid is None else gid)
+
+
+def _user_env(uid):
+    """Login environment of a user for the run script of a job.
+
+    :param int uid: User id.
+
+    :return: Environment variables;
+             only :envvar:`PATH` if the user isn't in the password database.
+    :rtype: dict
+    """
+    env = {"PATH": JOB_PATH}
+    try:
+        user = pwd.getpwuid(uid)
+    except KeyError:
+        return env
+    env.update(
+        HOME=user.pw_dir,
+        USER=user.pw_name,
+        LOGNAME=user.pw_name,
+        SHELL=user.pw_shell or "/bin/sh",
+    )
+    return env
+
+
+def _pid_alive(pid):
+    """Check whether a process exists.
+
+    :param pid: Process id.
+    :type pid: int or None
+
+    :rtype: boolean
+    """
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists, but belongs to another user
+        return True
+    return True
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Handler for the JSON line requests of one client connection."""
+
+    def handle(self):
+        _, peer_uid, peer_gid = struct.unpack(
+            "3i",
+            self.request.getsockopt(
+                socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+            ),
+        )
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError as exc:
+                response = {"ok": False, "error": f"invalid request: {exc}"}
+            else:
+                response = self.server.run_queue.handle_request(
+                    request, peer_uid, peer_gid
+                )
+            self.wfile.write(f"{json.dumps(response)}\n".encode())
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socket_path, state_file=None, max_concurrent=1, max_memory=None):
+    """Run the queue daemon until it is interrupted or terminated.
+
+    Runs that are executing when the daemon stops keep running,
+    and queued runs are started when the daemon is restarted.
+
+    :param socket_path: Path of the daemon's Unix domain socket.
+    :type socket_path: :py:class:`pathlib.Path`
+
+    :param state_file: Path of the file in which to record the queue;
+                       defaults to the socket path with a :file:`.json` suffix.
+    :type state_file: :py:class:`pathlib.Path` or None
+
+    :param int max_concurrent: Maximum number of runs to execute at the same time.
+
+    :param max_memory: Maximum sum of the memory requested by the runs that are
+                       executing at the same time, in bytes;
+                       :py:obj:`None` means unlimited.
+    :type max_memory: int or None
+    """
+    if max_concurrent < 1:
+        logger.error(f"--max-concurrent must be at least 1, not {max_concurrent}")
+        raise SystemExit(2)
+    socket_path = Path(socket_path)
+    state_file = socket_path.with_suffix(".json") if state_file is None else state_file
+    try:
+        socket_path.parent.mkdir(mode=0o755, parents=True, exist_ok=True)
+    except OSError as exc:
+        logger.error(
+            f"can't create queue daemon socket directory {socket_path.parent}: {exc}; "
+            f"use --socket to choose another socket path"
+        )
+        raise SystemExit(2)
+    socket_dir = socket_path.parent.stat()
+    if os.geteuid() == 0 and (socket_dir.st_uid != 0 or socket_dir.st_mode & 0o022):
+        # Another user could replace the socket of a root daemon that accepts runs
+        # from all users
+        logger.error(
+            f"queue daemon socket directory {socket_path.parent} must be owned by "
+            f"root and writable only by root"
+        )
+        raise SystemExit(2)
+    if socket_path.exists():
+        try:
+            request(socket_path, {"op": "status"})
+        except QueueError:
+            # Left behind by a daemon that didn't exit cleanly
+            socket_path.unlink()
+        else:
+            logger.error(f"queue daemon is already running on {socket_path}")
+            raise SystemExit(2)
+    run_queue = RunQueue(state_file, max_concurrent, max_memory)
+    server = _Server(os.fspath(socket_path), _RequestHandler)
+    server.run_queue = run_queue
+    # Other users can only submit runs to a daemon that can run them as themselves
+    socket_path.chmod(0o666 if os.geteuid() == 0 else 0o600)
+    signal.signal(
+        signal.SIGTERM,
+        lambda signum, frame: threading.Thread(target=server.shutdown).start(),
+    )
+    limit = "unlimited" if max_memory is None else f"{max_memory / 2**30:.1f} GiB"
+    logger.info(
+        f"queue daemon listening on {socket_path} with at most {max_concurrent} "
+        f"concurrent runs and {limit} memory"
+    )
+    run_queue._schedule()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        socket_path.unlink(missing_ok=True)
+        logger.info("queue daemon stopped")
+
+
+def request(socket_path, message):
+    """Send a request to the queue daemon, and return its response.
+
+    :param socket_path: Path of the daemon's Unix domain socket.
+    :type socket_path: :py:class:`pathlib.Path`
+
+    :param dict message: Request.
+
+    :raises: :py:exc:`QueueError` if the daemon can't be reached,
+             or it rejects the request.
+
+    :return: Response.
+    :rtype: dict
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(os.fspath(socket_path))
+            sock.sendall(f"{json.dumps(message)}\n".encode())
+            with sock.makefile("rb") as f:
+                line = f.readline()
+    except OSError as exc:
+        raise QueueError(f"can't connect to queue daemon on {socket_path}: {exc}")
+    if not line:
+        raise QueueError(f"queue daemon on {socket_path} closed the connection")
+    response = json.loads(line)
+    if not response["ok"]:
+        raise QueueError(response["error"])
+    return response
+
+
+def submit(run_script, run_id, priority=0, memory=0, socket_path=None):
+    """Submit a run script to the queue daemon.
+
+    :param run_script: Path of the run script.
+    :type run_script: :py:class:`pathlib.Path`
+
+    :param str run_id: Run id to show in the queue status.
+
+    :param int priority: Priority of the run; higher priority runs start first.
+
+    :param int memory: Memory that the run requires, in bytes.
+
+    :param socket_path: Path of the daemon's Unix domain socket;
+                        defaults to :py:func:`default_socket`.
+    :type socket_path: :py:class:`pathlib.Path` or None
+
+    :raises: :py:exc:`SystemExit` if the daemon can't be reached,
+             or it rejects the run.
+
+    :return: Job record.
+    :rtype: dict
+    """
+    socket_path = default_socket() if socket_path is None else socket_path
+    try:
+        response = request(
+            socket_path,
+            {
+                "op": "submit",
+                "run script": os.fspath(Path(run_script).resolve()),
+                "run id": run_id,
+                "priority": priority,
+                "memory": memory,
+            },
+        )
+    except QueueError as exc:
+        logger.error(f"failed to queue {run_id} run: {exc}")
+        raise SystemExit(2)
+    return response["job"]
+
+
+def show_status(socket_path):
+    """Log the jobs in the queue of the running daemon.
+
+    :param socket_path: Path of the daemon's Unix domain socket.
+    :type socket_path: :py:class:`pathlib.Path`
+    """
+    try:
+        jobs = request(socket_path, {"op": "status"})["jobs"]
+    except QueueError as exc:
+        logger.error(exc)
+        raise SystemExit(2)
+    for job in jobs:
+        line = f"job {job['id']}: {job['run id']} {job['state']}"
+        if job["state"] == "running":
+            line = f"{line} since {time.ctime(job['started'])} as pid {job['pid']}"
+        elif job["state"] == "finished":
+            line = (
+                f"{line} at {time.ctime(job['ended'])} "
+                f"with exit code {job['exit code']}"
+            )
+        logger.info(line)
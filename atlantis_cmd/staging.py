@@ -0,0 +1,242 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Staging of input files into temporary run directories.
+
+Input files can be staged by copying, hard linking, reflinking
+(copy-on-write cloning), or symlinking them,
+so that preparing a run directory on a filesystem that supports it costs
+metadata operations rather than full data copies.
+"""
+
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import stat
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+STAGING_METHODS = ("auto", "copy", "hardlink", "reflink", "symlink")
+
+# ioctl request code to clone a file on Linux filesystems that support
+# copy-on-write extents (btrfs, XFS, bcachefs, etc.); from linux/fs.h
+_FICLONE = 0x40049409
+
+# errno values that indicate that the filesystem can't link or clone the file
+_UNSUPPORTED_ERRNOS = {
+    errno.EBADF,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EPERM,
+    errno.EXDEV,
+}
+
+
+def stage_file(src, dest, method="auto"):
+    """Stage an input file into a temporary run directory.
+
+    :kbd:`reflink` and :kbd:`hardlink` fall back to copying the file if the
+    filesystem does not support them.
+
+    :kbd:`auto` uses the cheapest method that is safe,
+    in the sense that later changes to the source file can't change the staged file:
+
+    * a reflink if the filesystem supports them
+    * a hard link if the source file is read-only and on the same filesystem
+      as the temporary run directory
+    * a copy
+
+    :param src: Path of the input file to stage.
+    :type src: :py:class:`pathlib.Path`
+
+    :param dest: Path of the staged file in the temporary run directory.
+    :type dest: :py:class:`pathlib.Path`
+
+    :param str method: Staging method;
+                       one of :py:data:`STAGING_METHODS`.
+
+    :return: Staging method that was used.
+    :rtype: str
+    """
+    match method:
+        case "copy":
+            shutil.copy2(src, dest)
+            used = "copy"
+        case "hardlink":
+            used = "hardlink" if _hardlink(src, dest) else _copy(src, dest)
+        case "reflink":
+            used = "reflink" if _reflink(src, dest) else _copy(src, dest)
+        case "symlink":
+            dest.symlink_to(src)
+            used = "symlink"
+        case "auto":
+            if _reflink(src, dest):
+                used = "reflink"
+            elif _is_read_only(src) and _hardlink(src, dest):
+                used = "hardlink"
+            else:
+                used = _copy(src, dest)
+        case _:
+            raise ValueError(
+                f"unknown staging method: {method}; expected one of {STAGING_METHODS}"
+            )
+    logger.debug(f"staged {src} as {dest} by {used}")
+    return used
+
+
+def is_current(src, dest, method="auto", checksum=False):
+    """Check whether a staged file is still current with its input file,
+    so that it doesn't have to be staged again.
+
+    A staged symlink is current if it points to the input file.
+    A hard link is current if it is the same file as the input file.
+    A copy or reflink is current if its size and modification time are the same
+    as those of the input file,
+    or, if :kbd:`checksum` is :py:obj:`True`,
+    its size and contents are.
+
+    :param src: Path of the input file.
+    :type src: :py:class:`pathlib.Path`
+
+    :param dest: Path of the staged file in the temporary run directory.
+    :type dest: :py:class:`pathlib.Path`
+
+    :param str method: Staging method that the file is to be staged by;
+                       one of :py:data:`STAGING_METHODS`.
+
+    :param boolean checksum: Compare the SHA-256 hashes of the contents of the files
+                             if their sizes are the same,
+                             but their modification times differ.
+
+    :rtype: boolean
+    """
+    try:
+        dest_stat = os.lstat(dest)
+    except FileNotFoundError:
+        return False
+    if method == "symlink":
+        return stat.S_ISLNK(dest_stat.st_mode) and os.readlink(dest) == os.fspath(src)
+    if stat.S_ISLNK(dest_stat.st_mode):
+        return False
+    src_stat = os.stat(src)
+    if (src_stat.st_dev, src_stat.st_ino) == (dest_stat.st_dev, dest_stat.st_ino):
+        return True
+    if src_stat.st_size != dest_stat.st_size:
+        return False
+    if src_stat.st_mtime_ns == dest_stat.st_mtime_ns:
+        return True
+    return checksum and _sha256(src) == _sha256(dest)
+
+
+def _sha256(path):
+    """Calculate the SHA-256 hash of the contents of a file.
+
+    :param path: Path of the file.
+    :type path: :py:class:`pathlib.Path`
+
+    :rtype: str
+    """
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def _copy(src, dest):
+    """Copy a file, and its metadata.
+
+    :param src: Path of the file to copy.
+    :type src: :py:class:`pathlib.Path`
+
+    :param dest: Path of the copy.
+    :type dest: :py:class:`pathlib.Path`
+
+    :return: :kbd:`copy`
+    :rtype: str
+    """
+    shutil.copy2(src, dest)
+    return "copy"
+
+
+def _hardlink(src, dest):
+    """Try to create a hard link to a file.
+
+    :param src: Path of the file to link to.
+    :type src: :py:class:`pathlib.Path`
+
+    :param dest: Path of the link.
+    :type dest: :py:class:`pathlib.Path`
+
+    :return: :py:obj:`True` if the link was created,
+             :py:obj:`False` if the filesystem does not support it.
+    :rtype: boolean
+    """
+    try:
+        os.link(src, dest)
+    except OSError as exc:
+        if exc.errno not in _UNSUPPORTED_ERRNOS:
+            raise
+        return False
+    return True
+
+
+def _reflink(src, dest):
+    """Try to create a copy-on-write clone of a file, and copy its metadata.
+
+    :param src: Path of the file to clone.
+    :type src: :py:class:`pathlib.Path`
+
+    :param dest: Path of the clone.
+    :type dest: :py:class:`pathlib.Path`
+
+    :return: :py:obj:`True` if the clone was created,
+             :py:obj:`False` if the filesystem or operating system does not support it.
+    :rtype: boolean
+    """
+    if fcntl is None or not hasattr(fcntl, "ioctl"):
+        return False
+    with open(src, "rb") as src_f, open(dest, "xb") as dest_f:
+        try:
+            fcntl.ioctl(dest_f.fileno(), _FICLONE, src_f.fileno())
+            shutil.copystat(src, dest)
+        except BaseException as exc:
+            # Don't leave an empty or partial clone that could be mistaken for a
+            # staged file
+            os.unlink(dest)
+            if isinstance(exc, OSError) and exc.errno in _UNSUPPORTED_ERRNOS:
+                return False
+            raise
+    return True
+
+
+def _is_read_only(path):
+    """Check whether nobody has write permission on a file.
+
+    :param path: Path of the file.
+    :type path: :py:class:`pathlib.Path`
+
+    :rtype: boolean
+    """
+    return not os.stat(path).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
@@ -0,0 +1,483 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""AtlantisCmd command plug-in for summarize sub-command.
+
+Summarize the biomass of the functional groups in the output file of an Atlantis run
+as time series tables of the total biomass of each group,
+and of its biomass in each box.
+"""
+
+import csv
+import logging
+import os
+import time
+from pathlib import Path
+
+import cliff.command
+
+from atlantis_cmd.lazy_import import lazy_import
+
+netCDF4 = lazy_import("netCDF4")
+numpy = lazy_import("numpy")
+pyarrow = lazy_import("pyarrow.parquet")
+yaml = lazy_import("yaml")
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "parquet")
+
+# Upper limit on the size of the blocks of time records of a variable that are
+# read at once, to bound the memory use no matter how long the run was
+MAX_BLOCK_BYTES = 64 * 2**20
+
+# Conversion of nitrogen weight to wet weight;
+# the Redfield carbon to nitrogen weight ratio (X_CN),
+# and the wet to dry weight ratio (k_wetdry) of Atlantis models
+MG_N_TO_TONNES = 5.7 * 20 / 1e9
+
+# Dimensions and variables of Atlantis output files that the biomass is calculated
+# from: time, box, layer, and the volume and thickness of the layers
+OUTPUT_DIMS = ("t", "b", "z")
+OUTPUT_VARS = ("t", "volume", "dz")
+
+# Names of the summary files, formatted with the output filename base
+BOX_SUMMARY = "{output_filename_base}_biomass_by_box"
+TOTAL_SUMMARY = "{output_filename_base}_biomass"
+
+
+class Summarize(cliff.command.Command):
+    """Summarize the biomass of the functional groups in the output of an Atlantis run."""
+
+    def get_parser(self, prog_name):
+        parser = super().get_parser(prog_name)
+        parser.description = """
+            Summarize the biomass of each functional group in the groups.csv
+            file in RESULTS_DIR over time, in total and in each box, from the
+            Atlantis output file in RESULTS_DIR.
+            The summary tables are written to RESULTS_DIR.
+        """
+        parser.add_argument(
+            "results_dir",
+            metavar="RESULTS_DIR",
+            type=Path,
+            help="results directory of the run to summarize",
+        )
+        parser.add_argument(
+            "--format",
+            dest="file_format",
+            choices=FORMATS,
+            default="csv",
+            help="""
+            Format of the summary tables.
+            Defaults to csv.
+            parquet requires the pyarrow package.
+            """,
+        )
+        return parser
+
+    def take_action(self, parsed_args):
+        """Execute the `atlantis summarize` sub-command.
+
+        :param parsed_args: Arguments and options parsed from the command-line.
+        :type parsed_args: :class:`argparse.Namespace` instance
+        """
+        summarize_biomass(parsed_args.results_dir, file_format=parsed_args.file_format)
+
+
+def summarize_biomass(results_dir, file_format="csv", output_filename_base=None):
+    """Summarize the biomass of the functional groups in the output file of a run.
+
+    The output file is read one block of time records of one variable at a time,
+    so the memory used doesn't depend on the length of the run.
+
+    :param results_dir: Results directory of the run.
+    :type results_dir: :py:class:`pathlib.Path`
+
+    :param str file_format: Format of the summary tables;
+                            one of :py:data:`FORMATS`.
+
+    :param output_filename_base: Base name of the Atlantis output files;
+                                 read from the run description YAML file in the
+                                 results directory if it is :py:obj:`None`.
+    :type output_filename_base: str or None
+
+    :raises: :py:exc:`SystemExit` if the output or groups file can't be found,
+             the output file lacks the dimensions or variables that the biomass
+             is calculated from,
+             or the summary tables can't be written.
+
+    :return: Paths of the total and by box summary tables.
+    :rtype: 2-tuple
+    """
+    results_dir = Path(os.path.expandvars(results_dir)).expanduser()
+    if output_filename_base is None:
+        output_filename_base = find_output_filename_base(results_dir)
+    output_file = results_dir / f"{output_filename_base}.nc"
+    groups_file = results_dir / "groups.csv"
+    for path in (output_file, groups_file):
+        if not path.is_file():
+            logger.error(f"{path} not found")
+            raise SystemExit(2)
+    start = time.perf_counter()
+    writer_class = _ParquetWriter if file_format == "parquet" else _CSVWriter
+    total_path = results_dir / TOTAL_SUMMARY.format(
+        output_filename_base=output_filename_base
+    )
+    box_path = results_dir / BOX_SUMMARY.format(
+        output_filename_base=output_filename_base
+    )
+    with netCDF4.Dataset(output_file) as ds:
+        _check_output_structure(ds, output_file)
+        groups = _group_variables(_read_group_names(groups_file), ds.variables)
+        if not groups:
+            logger.error(
+                f"no variables of the groups in {groups_file} found in {output_file}"
+            )
+            raise SystemExit(2)
+        n_times = len(ds.dimensions["t"])
+        n_boxes, n_layers = len(ds.dimensions["b"]), len(ds.dimensions["z"])
+        block = max(1, MAX_BLOCK_BYTES // (n_boxes * n_layers * 8))
+        times = _read_times(ds.variables["t"])
+        try:
+            with (
+                writer_class(total_path, ("time", "group", "biomass")) as total,
+                writer_class(box_path, ("time", "group", "box", "biomass")) as by_box,
+            ):
+                for t_start in range(0, n_times, block):
+                    t_slice = slice(t_start, min(t_start + block, n_times))
+                    biomass = _block_biomass(ds, groups, t_slice)
+                    _write_block(total, by_box, groups, times[t_slice], biomass)
+        except OSError as exc:
+            logger.error(f"failed to write biomass summary: {exc}")
+            raise SystemExit(2)
+    logger.info(
+        f"summarized biomass of {len(groups)} groups in {n_boxes} boxes "
+        f"over {n_times} time records of {output_file} "
+        f"in {time.perf_counter() - start:.3f} s"
+    )
+    return total.path, by_box.path
+
+
+def find_output_filename_base(results_dir):
+    """Find the base name of the Atlantis output files in the run description
+    YAML file that was gathered into the results directory.
+
+    :param results_dir: Results directory of the run.
+    :type results_dir: :py:class:`pathlib.Path`
+
+    :raises: :py:exc:`SystemExit` if there isn't exactly one run description
+             YAML file in the results directory.
+
+    :rtype: str
+    """
+    bases = set()
+    for path in sorted(results_dir.glob("*.y*ml")):
+        try:
+            run_desc = yaml.safe_load(path.read_text())
+        except (OSError, yaml.YAMLError):
+            continue
+        if isinstance(run_desc, dict) and "output filename base" in run_desc:
+            bases.add(run_desc["output filename base"])
+    if len(bases) != 1:
+        logger.error(
+            f"can't find the output filename base in a run description YAML file "
+            f"in {results_dir}"
+        )
+        raise SystemExit(2)
+    return bases.pop()
+
+
+def _check_output_structure(ds, output_file):
+    """Check that an Atlantis output file has the dimensions and variables that
+    the biomass is calculated from.
+
+    :param ds: Atlantis output dataset.
+    :type ds: :py:class:`netCDF4.Dataset`
+
+    :param output_file: Path of the output file.
+    :type output_file: :py:class:`pathlib.Path`
+
+    :raises: :py:exc:`SystemExit` if a dimension or variable is missing.
+    """
+    missing = [f"{name} dimension" for name in OUTPUT_DIMS if name not in ds.dimensions]
+    missing.extend(
+        f"{name} variable" for name in OUTPUT_VARS if name not in ds.variables
+    )
+    if missing:
+        logger.error(f"{', '.join(missing)} not found in {output_file}")
+        raise SystemExit(2)
+
+
+def _read_group_names(groups_file):
+    """Read the names of the functional groups that are turned on from an
+    Atlantis groups file.
+
+    :param groups_file: Path of the groups file.
+    :type groups_file: :py:class:`pathlib.Path`
+
+    :return: Group names, in the order of the groups file.
+    :rtype: list
+    """
+    with groups_file.open(newline="") as f:
+        return [
+            row["Name"].strip()
+            for row in csv.DictReader(f, skipinitialspace=True)
+            if row.get("IsTurnedOn", "1").strip() != "0"
+        ]
+
+
+def _group_variables(names, variables):
+    """Find the output variables that the biomass of each group is calculated from.
+
+    Age structured vertebrate groups are summarized from the structural and reserve
+    nitrogen per individual,
+    and the numbers,
+    of their cohorts.
+    Biomass pool groups are summarized from their nitrogen concentrations;
+    per volume in the water column and sediment,
+    or per area for epibenthic groups.
+
+    :param list names: Group names.
+
+    :param dict variables: Variables of the output file.
+
+    :return: Lists of :kbd:`(kind, variable names)` 2-tuples keyed by group name;
+             groups without output variables are omitted.
+    :rtype: dict
+    """
+    groups = {}
+    for name in names:
+        cohort = 1
+        terms = []
+        while f"{name}{cohort}_Nums" in variables:
+            terms.append(
+                (
+                    "individuals",
+                    (
+                        f"{name}{cohort}_StructN",
+                        f"{name}{cohort}_ResN",
+                        f"{name}{cohort}_Nums",
+                    ),
+                )
+            )
+            cohort += 1
+        pools = [f"{name}_N"] if f"{name}_N" in variables else []
+        cohort = 1
+        while f"{name}_N{cohort}" in variables:
+            pools.append(f"{name}_N{cohort}")
+            cohort += 1
+        for pool in pools:
+            kind = "area" if variables[pool].ndim == 2 else "volume"
+            terms.append((kind, (pool,)))
+        if terms:
+            groups[name] = terms
+        else:
+            logger.debug(f"no output variables found for group {name}")
+    return groups
+
+
+def _read_times(time_var):
+    """Read the time coordinate of the output file as ISO 8601 date/times.
+
+    :param time_var: Time coordinate variable.
+    :type time_var: :py:class:`netCDF4.Variable`
+
+    :rtype: list
+    """
+    values = time_var[:]
+    units = getattr(time_var, "units", None)
+    if units is None:
+        return [str(value) for value in values]
+    calendar = getattr(time_var, "calendar", "standard")
+    return [date.isoformat() for date in netCDF4.num2date(values, units, calendar)]
+
+
+def _read(var, t_slice):
+    """Read a block of time records of a variable,
+    with missing values replaced by zeros.
+
+    :param var: Variable.
+    :type var: :py:class:`netCDF4.Variable`
+
+    :param slice t_slice: Time records to read.
+
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    return numpy.ma.filled(var[t_slice].astype("f8"), 0)
+
+
+def _block_biomass(ds, groups, t_slice):
+    """Calculate the biomass of each group in each box for a block of time records.
+
+    :param ds: Output file.
+    :type ds: :py:class:`netCDF4.Dataset`
+
+    :param dict groups: Lists of :kbd:`(kind, variable names)` 2-tuples keyed by
+                        group name.
+
+    :param slice t_slice: Time records to summarize.
+
+    :return: Biomass in tonnes wet weight,
+             with dimensions group, time, box.
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    volume = _read(ds.variables["volume"], t_slice)
+    area = None
+    biomass = numpy.zeros((len(groups), volume.shape[0], volume.shape[1]))
+    for i, terms in enumerate(groups.values()):
+        for kind, var_names in terms:
+            match kind:
+                case "individuals":
+                    struct_n, res_n, nums = (
+                        _read(ds.variables[var_name], t_slice) for var_name in var_names
+                    )
+                    biomass[i] += ((struct_n + res_n) * nums).sum(axis=2)
+                case "volume":
+                    (pool,) = var_names
+                    biomass[i] += (_read(ds.variables[pool], t_slice) * volume).sum(
+                        axis=2
+                    )
+                case "area":
+                    if area is None:
+                        area = _box_area(ds, volume, t_slice)
+                    (pool,) = var_names
+                    biomass[i] += _read(ds.variables[pool], t_slice) * area
+    return biomass * MG_N_TO_TONNES
+
+
+def _box_area(ds, volume, t_slice):
+    """Calculate the area of each box from the volume and thickness of its
+    sediment layer,
+    which is the last layer.
+
+    :param ds: Output file.
+    :type ds: :py:class:`netCDF4.Dataset`
+
+    :param volume: Volumes of the layers of the boxes.
+    :type volume: :py:class:`numpy.ndarray`
+
+    :param slice t_slice: Time records to calculate the areas for.
+
+    :return: Box areas, with dimensions time, box.
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    dz = _read(ds.variables["dz"], t_slice)[..., -1]
+    return numpy.divide(volume[..., -1], dz, out=numpy.zeros_like(dz), where=dz > 0)
+
+
+def _write_block(total, by_box, groups, times, biomass):
+    """Write the summary table rows for a block of time records.
+
+    :param total: Writer of the total biomass table.
+
+    :param by_box: Writer of the biomass by box table.
+
+    :param dict groups: Group variables keyed by group name.
+
+    :param list times: ISO 8601 date/times of the time records.
+
+    :param biomass: Biomass with dimensions group, time, box.
+    :type biomass: :py:class:`numpy.ndarray`
+    """
+    names = list(groups)
+    n_groups, n_times, n_boxes = biomass.shape
+    totals = biomass.sum(axis=2)
+    total.write_columns(
+        {
+            "time": numpy.repeat(times, n_groups),
+            "group": numpy.tile(names, n_times),
+            "biomass": totals.T.ravel(),
+        }
+    )
+    by_box.write_columns(
+        {
+            "time": numpy.repeat(times, n_groups * n_boxes),
+            "group": numpy.tile(numpy.repeat(names, n_boxes), n_times),
+            "box": numpy.tile(numpy.arange(n_boxes), n_times * n_groups),
+            "biomass": biomass.transpose(1, 0, 2).ravel(),
+        }
+    )
+
+
+class _CSVWriter:
+    """Context manager that writes a summary table to a CSV file in blocks of rows.
+
+    :param path: Path of the file without its extension.
+    :type path: :py:class:`pathlib.Path`
+
+    :param tuple columns: Column names.
+    """
+
+    def __init__(self, path, columns):
+        self.path = path.with_suffix(".csv")
+        self.columns = columns
+
+    def __enter__(self):
+        self._file = self.path.open("w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.columns)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+
+    def write_columns(self, columns):
+        """Write a block of rows.
+
+        :param dict columns: Column values keyed by column name.
+        """
+        self._writer.writerows(zip(*(columns[name].tolist() for name in self.columns)))
+
+
+class _ParquetWriter:
+    """Context manager that writes a summary table to a Parquet file,
+    with a row group for each block of rows.
+
+    :param path: Path of the file without its extension.
+    :type path: :py:class:`pathlib.Path`
+
+    :param tuple columns: Column names.
+    """
+
+    def __init__(self, path, columns):
+        self.path = path.with_suffix(".parquet")
+        self.columns = columns
+        self._writer = None
+
+    def __enter__(self):
+        try:
+            pyarrow.parquet
+        except ImportError:
+            logger.error("the pyarrow package is required to write Parquet files")
+            raise SystemExit(2)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._writer is not None:
+            self._writer.close()
+
+    def write_columns(self, columns):
+        """Write a block of rows as a row group.
+
+        :param dict columns: Column values keyed by column name.
+        """
+        table = pyarrow.table({name: columns[name] for name in self.columns})
+        if self._writer is None:
+            self._writer = pyarrow.parquet.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
@@ -0,0 +1,232 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""AtlantisCmd command plug-in for supervise sub-command.
+
+Execute a step of an Atlantis run script,
+like the Atlantis executable or the results gathering,
+and record the resources that it consumed in a JSON file in the results directory.
+"""
+
+import argparse
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import cliff.command
+
+logger = logging.getLogger(__name__)
+
+RESOURCES_FILE = "resources.json"
+
+# Units of the ru_maxrss field of resource usage;
+# kilobytes on Linux, but bytes on macOS
+_MAXRSS_UNITS = 1 if sys.platform == "darwin" else 1024
+
+# Fields of /proc/<pid>/io, and the resource record keys that they map to
+_PROC_IO_FIELDS = {
+    "rchar": "bytes read",
+    "wchar": "bytes written",
+    "read_bytes": "storage bytes read",
+    "write_bytes": "storage bytes written",
+}
+
+
+class Supervise(cliff.command.Command):
+    """Execute a run script step, and record the resources that it consumes."""
+
+    def get_parser(self, prog_name):
+        parser = super().get_parser(prog_name)
+        parser.description = """
+            Execute COMMAND, and append the wall time, user and system CPU times,
+            peak resident memory, and bytes read and written by it and its child
+            processes to RESOURCES_FILE.
+            The exit status is that of COMMAND.
+        """
+        parser.add_argument(
+            "--resources-file",
+            dest="resources_file",
+            type=Path,
+            default=Path(RESOURCES_FILE),
+            help=f"""
+            JSON file to append the resource usage record to.
+            Defaults to {RESOURCES_FILE} in the current directory.
+            """,
+        )
+        parser.add_argument(
+            "--step",
+            help="""
+            Name of the run script step to record the resource usage under.
+            Defaults to the name of the COMMAND executable.
+            """,
+        )
+        parser.add_argument(
+            "command",
+            metavar="COMMAND",
+            nargs=argparse.REMAINDER,
+            help="command to execute, and its arguments; separate them from the "
+            "options with --",
+        )
+        return parser
+
+    def take_action(self, parsed_args):
+        """Execute the `atlantis supervise` sub-command.
+
+        :param parsed_args: Arguments and options parsed from the command-line.
+        :type parsed_args: :class:`argparse.Namespace` instance
+
+        :return: Exit status of the supervised command.
+        :rtype: int
+        """
+        command = parsed_args.command
+        if command[:1] == ["--"]:
+            command = command[1:]
+        return supervise(command, parsed_args.resources_file, step=parsed_args.step)
+
+
+def supervise(command, resources_file, step=None):
+    """Execute a command, and append a record of the resources that it and its
+    child processes consumed to a JSON file.
+
+    :kbd:`SIGINT` and :kbd:`SIGTERM` are forwarded to the command,
+    so that a run script that is interrupted still records its resource usage.
+
+    :param list command: Command to execute, and its arguments.
+
+    :param resources_file: Path of the JSON file to append the record to.
+    :type resources_file: :py:class:`pathlib.Path`
+
+    :param step: Name of the step to record the resource usage under;
+                 defaults to the name of the command executable.
+    :type step: str or None
+
+    :return: Exit status of the command;
+             128 plus the signal number if it was killed by a signal.
+    :rtype: int
+    """
+    if not command:
+        logger.error("no command to supervise")
+        raise SystemExit(2)
+    step = Path(command[0]).name if step is None else step
+    start = time.time()
+    wall_start = time.perf_counter()
+    try:
+        proc = subprocess.Popen(command)
+    except OSError as exc:
+        logger.error(f"failed to execute {command[0]}: {exc}")
+        raise SystemExit(2)
+    handlers = {
+        signum: signal.signal(signum, lambda signum, frame: proc.send_signal(signum))
+        for signum in (signal.SIGINT, signal.SIGTERM)
+    }
+    try:
+        proc_io = _wait_for_exit(proc.pid)
+        _, wait_status, rusage = os.wait4(proc.pid, 0)
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    # Popen must not try to reap the process again
+    proc.returncode = exit_code = os.waitstatus_to_exitcode(wait_status)
+    record = {
+        "step": step,
+        "command": command,
+        "exit code": exit_code,
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(start)),
+        "wall seconds": time.perf_counter() - wall_start,
+        "user cpu seconds": rusage.ru_utime,
+        "system cpu seconds": rusage.ru_stime,
+        "peak rss bytes": rusage.ru_maxrss * _MAXRSS_UNITS,
+        "major page faults": rusage.ru_majflt,
+        # Block I/O counts are in 512 byte units
+        "storage bytes read": rusage.ru_inblock * 512,
+        "storage bytes written": rusage.ru_oublock * 512,
+    }
+    record.update(proc_io)
+    _append_record(resources_file, record)
+    logger.info(
+        f"{step}: {record['wall seconds']:.1f} s wall, "
+        f"{record['user cpu seconds']:.1f} s user, "
+        f"{record['system cpu seconds']:.1f} s system, "
+        f"{record['peak rss bytes'] / 2**20:.1f} MiB peak RSS; "
+        f"exit code {exit_code}"
+    )
+    return 128 - exit_code if exit_code < 0 else exit_code
+
+
+def _wait_for_exit(pid):
+    """Wait for a process to exit without reaping it,
+    and read its I/O accounting while it is still available.
+
+    The I/O accounting of a process includes that of the child processes that it
+    has waited for.
+
+    :param int pid: Process id.
+
+    :return: I/O accounting resource record items,
+             or an empty dict if they aren't available on this platform.
+    :rtype: dict
+    """
+    if not hasattr(os, "waitid"):
+        return {}
+    while True:
+        try:
+            os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+            break
+        except ChildProcessError:
+            return {}
+        except InterruptedError:
+            continue
+    try:
+        proc_io = Path(f"/proc/{pid}/io").read_text()
+    except OSError:
+        return {}
+    fields = dict(line.split(": ") for line in proc_io.splitlines() if ": " in line)
+    return {
+        key: int(fields[field])
+        for field, key in _PROC_IO_FIELDS.items()
+        if field in fields
+    }
+
+
+def _append_record(resources_file, record):
+    """Append a resource usage record to a JSON file.
+
+    The file is written beside the existing file and renamed over it,
+    so it is never left partly written.
+
+    :param resources_file: Path of the JSON file.
+    :type resources_file: :py:class:`pathlib.Path`
+
+    :param dict record: Resource usage record.
+    """
+    try:
+        resources = json.loads(resources_file.read_text())
+    except FileNotFoundError:
+        resources = {"steps": []}
+    except ValueError:
+        logger.warning(f"replacing unreadable resource usage file {resources_file}")
+        resources = {"steps": []}
+    resources["steps"].append(record)
+    tmp_file = resources_file.with_name(f".{resources_file.name}.tmp")
+    tmp_file.write_text(json.dumps(resources, indent=2))
+    os.replace(tmp_file, resources_file)
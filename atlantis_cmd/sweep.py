@@ -0,0 +1,478 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""AtlantisCmd command plug-in for sweep sub-command.
+
+Prepare, execute, and gather the results of a parameter sweep of runs
+of the CSIRO Atlantis ecosystem model.
+"""
+
+import concurrent.futures
+import copy
+import csv
+import itertools
+import logging
+import os
+import random
+import re
+from pathlib import Path
+
+import cliff.command
+
+import atlantis_cmd.run
+from atlantis_cmd import manifest
+from atlantis_cmd.lazy_import import lazy_import
+
+nemo_cmd = lazy_import("nemo_cmd.prepare")
+yaml = lazy_import("yaml")
+
+logger = logging.getLogger(__name__)
+
+
+class Sweep(cliff.command.Command):
+    """Prepare, execute, and gather results from a parameter sweep of Atlantis runs."""
+
+    def get_parser(self, prog_name):
+        parser = super().get_parser(prog_name)
+        parser.description = """
+            Prepare a temporary run directory for each point of the parameter
+            sweep described in SWEEP_FILE, using DESC_FILE as the base
+            run description,
+            then execute and gather the results of the runs.
+            The results files from each run are gathered in a sub-directory
+            of RESULTS_DIR that is named with the run id of the sweep point.
+
+            If RESULTS_DIR does not exist it will be created.
+        """
+        parser.add_argument(
+            "desc_file",
+            metavar="DESC_FILE",
+            type=Path,
+            help="base run description YAML file",
+        )
+        parser.add_argument(
+            "sweep_file",
+            metavar="SWEEP_FILE",
+            type=Path,
+            help="sweep description YAML file",
+        )
+        parser.add_argument(
+            "results_dir",
+            metavar="RESULTS_DIR",
+            type=Path,
+            help="directory to store the sweep point results directories into",
+        )
+        parser.add_argument(
+            "--no-submit",
+            dest="no_submit",
+            action="store_true",
+            help="""
+            Prepare the temporary run directories, and the bash scripts to
+            execute the Atlantis runs, but don't launch the runs.
+            """,
+        )
+        parser.add_argument(
+            "--max-workers",
+            dest="max_workers",
+            type=int,
+            default=os.cpu_count(),
+            help="""
+            Maximum number of worker processes to use to prepare the
+            temporary run directories of the sweep points.
+            Defaults to the number of CPUs on the machine.
+            """,
+        )
+        parser.add_argument(
+            "--max-concurrent",
+            dest="max_concurrent",
+            type=int,
+            default=os.cpu_count(),
+            help="""
+            Maximum number of sweep point runs to execute at the same time;
+            the next run is started as soon as one finishes.
+            Defaults to the number of CPUs on the machine.
+            """,
+        )
+        parser.add_argument(
+            "-q",
+            "--quiet",
+            action="store_true",
+            help="don't show the run directory paths",
+        )
+        return parser
+
+    def take_action(self, parsed_args):
+        """Execute the `atlantis sweep` sub-command.
+
+        :param parsed_args: Arguments and options parsed from the command-line.
+        :type parsed_args: :class:`argparse.Namespace` instance
+        """
+        sweep_msg = sweep(
+            parsed_args.desc_file,
+            parsed_args.sweep_file,
+            parsed_args.results_dir,
+            max_workers=parsed_args.max_workers,
+            max_concurrent=parsed_args.max_concurrent,
+            no_submit=parsed_args.no_submit,
+            quiet=parsed_args.quiet,
+        )
+        if sweep_msg and not parsed_args.quiet:
+            logger.info(sweep_msg)
+
+
+def sweep(
+    desc_file,
+    sweep_file,
+    results_dir,
+    max_workers,
+    max_concurrent,
+    no_submit=False,
+    quiet=False,
+):
+    """Create and populate a temporary run directory, and a run script for each point
+    of a parameter sweep, and execute the run scripts with at most
+    :kbd:`max_concurrent` of them running at the same time.
+
+    :param desc_file: File path/name of the base YAML run description file.
+    :type desc_file: :py:class:`pathlib.Path`
+
+    :param sweep_file: File path/name of the YAML sweep description file.
+    :type sweep_file: :py:class:`pathlib.Path`
+
+    :param results_dir: Path of the directory in which to create the results
+                        directories of the sweep points;
+                        it will be created if it does not exist.
+    :type results_dir: :py:class:`pathlib.Path`
+
+    :param int max_workers: Maximum number of worker processes to use to prepare
+                            the temporary run directories.
+
+    :param int max_concurrent: Maximum number of sweep point runs to execute at the same time.
+
+    :param boolean no_submit: Prepare the temporary run directories,
+                              and the run scripts to execute the Atlantis runs,
+                              but don't launch the runs.
+
+    :param boolean quiet: Don't show the run directory path messages;
+                          the default is to show the temporary run directory
+                          paths.
+
+    :raises: :py:exc:`SystemExit` with exit code 1 if any of the sweep point runs
+             failed.
+
+    :returns: Message summarizing the outcome of the sweep.
+    :rtype: str
+    """
+    run_desc = nemo_cmd.prepare.load_run_desc(desc_file)
+    run_id = nemo_cmd.prepare.get_run_desc_value(run_desc, ("run id",))
+    sweep_desc = nemo_cmd.prepare.load_run_desc(sweep_file)
+    variables = _get_sweep_variables(sweep_desc)
+    points = _calc_sweep_points(sweep_desc, variables)
+    point_ids = [f"{run_id}_{i:03d}" for i in range(len(points))]
+    results_dir = atlantis_cmd.run._resolve_path(results_dir)
+    results_dir.mkdir(parents=True, exist_ok=True)
+    _write_sweep_points_csv(results_dir / "sweep_points.csv", point_ids, points)
+    tmp_run_dirs = _prepare_sweep_points(
+        run_desc, desc_file, results_dir, variables, point_ids, points, max_workers
+    )
+    if not quiet:
+        for point_id, tmp_run_dir in tmp_run_dirs.items():
+            logger.info(f"Created {point_id} temporary run directory: {tmp_run_dir}")
+    if no_submit:
+        return
+    run_scripts = {
+        point_id: tmp_run_dir / "Atlantis.sh"
+        for point_id, tmp_run_dir in tmp_run_dirs.items()
+    }
+    exit_codes = atlantis_cmd.run._run_bounded(run_scripts, max_concurrent)
+    failed = sorted(point_id for point_id, exit_code in exit_codes.items() if exit_code)
+    for point_id in failed:
+        logger.error(
+            f"sweep point {point_id} run failed with exit code {exit_codes[point_id]}"
+        )
+    msg = (
+        f"finished {len(exit_codes)} sweep point runs "
+        f"with at most {max_concurrent} at a time; {len(failed)} failed"
+    )
+    if failed:
+        logger.error(msg)
+        raise SystemExit(1)
+    return msg
+
+
+def _get_sweep_variables(sweep_desc):
+    """Get and check the variables section of a sweep description.
+
+    Each variable must be either a run description key path,
+    or a parameter in one of the :kbd:`parameters` section :file:`.prm` files.
+
+    :param dict sweep_desc: Sweep description dictionary.
+
+    :return: Sweep variable descriptions keyed by variable name.
+    :rtype: dict
+    """
+    variables = nemo_cmd.prepare.get_run_desc_value(sweep_desc, ("variables",))
+    for name, variable in variables.items():
+        is_run_desc_key = "run description key" in variable
+        is_prm_parameter = "parameters file" in variable and "parameter" in variable
+        if is_run_desc_key == is_prm_parameter:
+            logger.error(
+                f"sweep variable {name} must have either a run description key, "
+                f"or a parameters file and parameter - please check your sweep "
+                f"description YAML file"
+            )
+            raise SystemExit(2)
+    return variables
+
+
+def _calc_sweep_points(sweep_desc, variables):
+    """Calculate the variable values for each point of a sweep.
+
+    :param dict sweep_desc: Sweep description dictionary.
+
+    :param dict variables: Sweep variable descriptions keyed by variable name.
+
+    :return: Variable values keyed by variable name for each sweep point.
+    :rtype: list
+    """
+    design = nemo_cmd.prepare.get_run_desc_value(sweep_desc, ("design",))
+    match design:
+        case "factorial":
+            for name, variable in variables.items():
+                if "values" not in variable:
+                    logger.error(
+                        f"sweep variable {name} must have a list of values "
+                        f"for a factorial design - please check your sweep "
+                        f"description YAML file"
+                    )
+                    raise SystemExit(2)
+            return [
+                dict(zip(variables, values))
+                for values in itertools.product(
+                    *(variable["values"] for variable in variables.values())
+                )
+            ]
+        case "latin hypercube":
+            samples = nemo_cmd.prepare.get_run_desc_value(sweep_desc, ("samples",))
+            rng = random.Random(sweep_desc.get("seed"))
+            return _latin_hypercube(variables, samples, rng)
+        case "list":
+            points = nemo_cmd.prepare.get_run_desc_value(sweep_desc, ("points",))
+            for point in points:
+                unknown = sorted(set(point) - set(variables))
+                if unknown:
+                    logger.error(
+                        f"unknown sweep variable(s) in points list: "
+                        f"{', '.join(unknown)} - please check your sweep "
+                        f"description YAML file"
+                    )
+                    raise SystemExit(2)
+            return points
+        case _:
+            logger.error(
+                f"unknown sweep design: {design}; expected factorial, "
+                f"latin hypercube, or list - please check your sweep "
+                f"description YAML file"
+            )
+            raise SystemExit(2)
+
+
+def _latin_hypercube(variables, samples, rng):
+    """Calculate the variable values for the points of a Latin hypercube sample.
+
+    The :kbd:`[0, 1)` range of each variable is divided into :kbd:`samples`
+    equal strata, and each stratum is sampled exactly once,
+    in an independent random order for each variable.
+    Variables with a :kbd:`range` are sampled continuously within it.
+    Variables with a list of :kbd:`values` are sampled from the list.
+
+    :param dict variables: Sweep variable descriptions keyed by variable name.
+
+    :param int samples: Number of sweep points to sample.
+
+    :param rng: Random number generator.
+    :type rng: :py:class:`random.Random`
+
+    :return: Variable values keyed by variable name for each sweep point.
+    :rtype: list
+    """
+    points = [{} for _ in range(samples)]
+    for name, variable in variables.items():
+        strata = rng.sample(range(samples), samples)
+        for point, stratum in zip(points, strata):
+            u = (stratum + rng.random()) / samples
+            if "range" in variable:
+                low, high = variable["range"]
+                point[name] = low + u * (high - low)
+            elif "values" in variable:
+                values = variable["values"]
+                point[name] = values[int(u * len(values))]
+            else:
+                logger.error(
+                    f"sweep variable {name} must have a range or a list of values "
+                    f"for a latin hypercube design - please check your sweep "
+                    f"description YAML file"
+                )
+                raise SystemExit(2)
+    return points
+
+
+def _write_sweep_points_csv(csv_file, point_ids, points):
+    """Write a CSV file that records the variable values of each sweep point.
+
+    :param csv_file: Path of the CSV file to write.
+    :type csv_file: :py:class:`pathlib.Path`
+
+    :param list point_ids: Run ids of the sweep points.
+
+    :param list points: Variable values keyed by variable name for each sweep point.
+    """
+    variable_names = list(dict.fromkeys(name for point in points for name in point))
+    with csv_file.open("wt", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["run id", *variable_names])
+        for point_id, point in zip(point_ids, points):
+            writer.writerow(
+                [point_id, *(point.get(name, "") for name in variable_names)]
+            )
+
+
+def _prepare_sweep_points(
+    run_desc, desc_file, results_dir, variables, point_ids, points, max_workers
+):
+    """Prepare the temporary run directories of the sweep points,
+    using a pool of worker processes.
+
+    :param dict run_desc: Base run description dictionary.
+
+    :param desc_file: File path/name of the base YAML run description file.
+    :type desc_file: :py:class:`pathlib.Path`
+
+    :param results_dir: Path of the directory in which to create the results
+                        directories of the sweep points.
+    :type results_dir: :py:class:`pathlib.Path`
+
+    :param dict variables: Sweep variable descriptions keyed by variable name.
+
+    :param list point_ids: Run ids of the sweep points.
+
+    :param list points: Variable values keyed by variable name for each sweep point.
+
+    :param int max_workers: Maximum number of worker processes to use.
+
+    :return: Temporary run directory paths keyed by sweep point run id.
+    :rtype: dict
+    """
+    args = [
+        (run_desc, desc_file, results_dir / point_id, variables, point_id, point)
+        for point_id, point in zip(point_ids, points)
+    ]
+    if max_workers == 1:
+        tmp_run_dirs = [_prepare_sweep_point(*point_args) for point_args in args]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+            tmp_run_dirs = list(executor.map(_prepare_sweep_point, *zip(*args)))
+    return dict(zip(point_ids, tmp_run_dirs))
+
+
+def _prepare_sweep_point(run_desc, desc_file, results_dir, variables, point_id, point):
+    """Prepare the temporary run directory of a sweep point.
+
+    Run description key variables are set in a copy of the base run description
+    before the temporary run directory is prepared.
+    Parameter variables are substituted in the :file:`.prm` files in the temporary
+    run directory after it is prepared.
+
+    :param dict run_desc: Base run description dictionary.
+
+    :param desc_file: File path/name of the base YAML run description file.
+    :type desc_file: :py:class:`pathlib.Path`
+
+    :param results_dir: Path of the directory in which to store the run results.
+    :type results_dir: :py:class:`pathlib.Path`
+
+    :param dict variables: Sweep variable descriptions keyed by variable name.
+
+    :param str point_id: Run id of the sweep point.
+
+    :param dict point: Variable values keyed by variable name for the sweep point.
+
+    :return: Temporary run directory path.
+    :rtype: :py:class:`pathlib.Path`
+    """
+    point_run_desc = copy.deepcopy(run_desc)
+    point_run_desc["run id"] = point_id
+    for name, value in point.items():
+        if "run description key" in variables[name]:
+            *keys, last_key = variables[name]["run description key"]
+            section = point_run_desc
+            for key in keys:
+                section = section.setdefault(key, {})
+            section[last_key] = value
+    _, tmp_run_dir = atlantis_cmd.run._prepare_tmp_run_dir(
+        desc_file, results_dir, quiet=True, run_desc=point_run_desc
+    )
+    modified = [desc_file.name]
+    for name, value in point.items():
+        if "parameters file" in variables[name]:
+            prm_name = f"{variables[name]['parameters file']}.prm"
+            _set_prm_value(
+                tmp_run_dir / prm_name, variables[name]["parameter"], value, tmp_run_dir
+            )
+            modified.append(prm_name)
+    # Replace the copy of the base run description with the sweep point's run description
+    with (tmp_run_dir / desc_file.name).open("wt") as f:
+        yaml.safe_dump(point_run_desc, f, sort_keys=False)
+    # The manifest was written with the hashes of the base input files
+    manifest.update_manifest(tmp_run_dir, modified)
+    with (tmp_run_dir / "sweep_point.yaml").open("wt") as f:
+        yaml.safe_dump({"run id": point_id, **point}, f, sort_keys=False)
+    return tmp_run_dir
+
+
+def _set_prm_value(prm_file, parameter, value, tmp_run_dir):
+    """Set the value of a scalar parameter in an Atlantis :file:`.prm` file.
+
+    The file is replaced rather than modified in place so that the source of
+    a linked file is not changed.
+
+    :param prm_file: Path of the :file:`.prm` file.
+    :type prm_file: :py:class:`pathlib.Path`
+
+    :param str parameter: Name of the parameter.
+
+    :param value: Value to set the parameter to.
+
+    :param tmp_run_dir: Temporary run directory path.
+    :type tmp_run_dir: :py:class:`pathlib.Path`
+    """
+    prm = prm_file.read_text()
+    prm, n_subs = re.subn(
+        rf"^(\s*{re.escape(parameter)}\s+)\S+",
+        lambda match: f"{match.group(1)}{value}",
+        prm,
+        count=1,
+        flags=re.MULTILINE,
+    )
+    if not n_subs:
+        logger.error(f"{parameter} not found in {prm_file}")
+        nemo_cmd.prepare.remove_run_dir(tmp_run_dir)
+        raise SystemExit(2)
+    new_prm_file = prm_file.with_suffix(".prm.new")
+    new_prm_file.write_text(prm)
+    os.replace(new_prm_file, prm_file)
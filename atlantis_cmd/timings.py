@@ -0,0 +1,131 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Wall time and data volume instrumentation of run preparation phases.
+
+The timings are collected by :py:class:`Timings` objects that are passed down
+through the run preparation functions,
+and written to a :file:`timings.json` file in the temporary run directory
+when :command:`atlantis run --timings` is used.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+TIMINGS_FILE = "timings.json"
+
+
+class Timings:
+    """Wall times of the phases of run preparation,
+    and wall times and sizes of the staged input files.
+    """
+
+    def __init__(self):
+        self.phases = []
+        self.files = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager to record the wall time of a run preparation phase.
+
+        Phases are recorded in the order in which they finish,
+        so nested phases are recorded before the phase that contains them.
+
+        :param str name: Phase name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append({"phase": name, "seconds": time.perf_counter() - start})
+
+    def record_file(self, src, dest, method, seconds):
+        """Record the wall time and size of a staged input file.
+
+        Only copies move the file's data;
+        links and reflinks are metadata operations,
+        so their :kbd:`bytes moved` is 0.
+
+        :param src: Path of the input file.
+        :type src: :py:class:`pathlib.Path`
+
+        :param dest: Path of the staged file in the temporary run directory.
+        :type dest: :py:class:`pathlib.Path`
+
+        :param str method: Staging method that was used.
+
+        :param float seconds: Wall time of staging the file.
+        """
+        size = os.stat(src).st_size
+        self.files.append(
+            {
+                "src": os.fspath(src),
+                "dest": os.fspath(dest),
+                "method": method,
+                "bytes": size,
+                "bytes moved": size if method == "copy" else 0,
+                "seconds": seconds,
+            }
+        )
+
+    def as_dict(self):
+        """Timings as a JSON-serializable dict.
+
+        :rtype: dict
+        """
+        return {
+            "phases": self.phases,
+            "files": self.files,
+            "total bytes moved": sum(file["bytes moved"] for file in self.files),
+        }
+
+    def write(self, tmp_run_dir):
+        """Write the timings to the :file:`timings.json` file in the temporary run directory.
+
+        :param tmp_run_dir: Temporary run directory path.
+        :type tmp_run_dir: :py:class:`pathlib.Path`
+
+        :return: Timings file path.
+        :rtype: :py:class:`pathlib.Path`
+        """
+        timings_file = tmp_run_dir / TIMINGS_FILE
+        timings_file.write_text(json.dumps(self.as_dict(), indent=2))
+        return timings_file
+
+    def log(self):
+        """Log the phase wall times,
+        and a summary of the staged input files.
+        """
+        for phase in self.phases:
+            logger.info(f"{phase['phase']}: {phase['seconds']:.3f} s")
+        if not self.files:
+            return
+        bytes_moved = sum(file["bytes moved"] for file in self.files)
+        seconds = sum(file["seconds"] for file in self.files)
+        slowest = max(self.files, key=lambda file: file["seconds"])
+        logger.info(
+            f"staged {len(self.files)} files in {seconds:.3f} s, "
+            f"moving {bytes_moved / 2**20:.1f} MiB; "
+            f"slowest was {slowest['src']} by {slowest['method']} "
+            f"in {slowest['seconds']:.3f} s"
+        )
@@ -0,0 +1,385 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Validation of the paths in run descriptions.
+
+All of the input file paths in a run description are resolved and checked in one
+pass before anything is created on disk,
+and all of the problems are reported at once.
+The path lookups are done concurrently through a :py:class:`StatCache` that can be
+shared by all of the runs in an ensemble or sweep.
+Forcing :kbd:`glob` and :kbd:`directory` declarations are expanded to their files
+with one scan of their directory.
+"""
+
+import concurrent.futures
+import fnmatch
+import glob
+import logging
+import os
+import re
+import stat
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Run description keys of input files that must exist
+INPUT_FILE_KEYS = (
+    ("paths", "runs directory"),
+    ("paths", "atlantis code"),
+    ("boxes",),
+    ("initial conditions",),
+    ("groups",),
+    ("migrations",),
+    ("fisheries",),
+)
+
+# Run description keys of values that are required but are not paths
+REQUIRED_VALUE_KEYS = (
+    ("run id",),
+    ("paths", "atlantis executable name"),
+    ("output filename base",),
+)
+
+# Sub-keys of forcing section entries that declare several files,
+# in order of precedence
+FORCING_SCAN_KEYS = ("glob", "directory")
+
+# Maximum number of concurrent path lookups
+MAX_LOOKUP_WORKERS = 16
+
+
+class StatCache:
+    """Thread-safe cache of resolved paths and their :py:func:`os.stat` results.
+
+    Paths are keyed by their environment variable and :file:`~` expanded values,
+    so the same input file is only looked up once no matter how many run
+    descriptions refer to it.
+    """
+
+    def __init__(self):
+        self._lookups = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, path):
+        """Resolve a path and stat it, or return the cached result of doing so.
+
+        :param path: Path to look up;
+                     may contain environment variables and :file:`~`.
+        :type path: :py:class:`pathlib.Path` or str
+
+        :return: Resolved path,
+                 and its stat result, or :py:obj:`None` if it does not exist.
+        :rtype: 2-tuple
+        """
+        expanded = os.path.expanduser(os.path.expandvars(os.fspath(path)))
+        with self._lock:
+            if expanded in self._lookups:
+                return self._lookups[expanded]
+        resolved = Path(expanded).resolve()
+        try:
+            stat_result = resolved.stat()
+        except OSError:
+            stat_result = None
+        with self._lock:
+            return self._lookups.setdefault(expanded, (resolved, stat_result))
+
+    def lookup_many(self, paths):
+        """Look up several paths concurrently.
+
+        :param paths: Paths to look up.
+        :type paths: iterable
+
+        :return: :py:meth:`lookup` results in the same order as :kbd:`paths`.
+        :rtype: list
+        """
+        paths = list(paths)
+        if not paths:
+            return []
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(len(paths), MAX_LOOKUP_WORKERS)
+        ) as executor:
+            return list(executor.map(self.lookup, paths))
+
+
+def validate_run_desc(run_desc, stat_cache=None):
+    """Resolve and check all of the input file paths in a run description,
+    and check that its required values are present.
+
+    All of the problems are logged as errors before :py:exc:`SystemExit` is raised.
+
+    :param dict run_desc: Run description dictionary.
+
+    :param stat_cache: Path lookup cache to use;
+                       a new one is used if :py:obj:`None`.
+    :type stat_cache: :py:class:`StatCache` or None
+
+    :raises: :py:exc:`SystemExit` if any problems are found.
+
+    :return: Resolved paths keyed by run description key tuples.
+    :rtype: dict
+    """
+    stat_cache = StatCache() if stat_cache is None else stat_cache
+    errors = []
+    path_values = collect_path_values(run_desc, errors)
+    lookups = dict(
+        zip(
+            path_values,
+            stat_cache.lookup_many(
+                lookup_path(keys, value) for keys, value in path_values.items()
+            ),
+        )
+    )
+    resolved_paths = {}
+    for keys, (resolved, stat_result) in lookups.items():
+        if stat_result is None:
+            if keys == "atlantis executable":
+                errors.append(f"{resolved} not found - did you forget to build it?")
+            else:
+                errors.append(
+                    f"{resolved} path from run description YAML file not found - "
+                    f"please check your run description YAML file"
+                )
+        elif _is_forcing_scan(keys):
+            if not stat.S_ISDIR(stat_result.st_mode):
+                errors.append(
+                    f"{resolved} forcing {keys[-1]} is not a directory - "
+                    f"please check your run description YAML file"
+                )
+                continue
+            files = scan_forcing(keys[-1], path_values[keys], resolved)
+            if not files:
+                errors.append(
+                    f"no forcing files found for {path_values[keys]} - "
+                    f"please check your run description YAML file"
+                )
+            resolved_paths[keys] = files
+        else:
+            resolved_paths[keys] = resolved
+    errors.extend(_duplicate_forcing_link_names(resolved_paths))
+    if errors:
+        for error in errors:
+            logger.error(error)
+        logger.error(
+            f"found {len(errors)} problem(s) in run description; "
+            f"no temporary run directory was created"
+        )
+        raise SystemExit(2)
+    return resolved_paths
+
+
+def collect_path_values(run_desc, errors):
+    """Collect the unresolved input file paths from a run description,
+    and check that its required values are present.
+
+    :param dict run_desc: Run description dictionary.
+
+    :param list errors: List to append missing key error messages to.
+
+    :return: Input file paths as they appear in the run description,
+             keyed by run description key tuples,
+             and the path of the Atlantis executable keyed by
+             :kbd:`atlantis executable`.
+    :rtype: dict
+    """
+    path_values = {}
+    for keys in REQUIRED_VALUE_KEYS:
+        _get_value(run_desc, keys, errors)
+    for keys in INPUT_FILE_KEYS:
+        value = _get_value(run_desc, keys, errors)
+        if value is not None:
+            path_values[keys] = value
+    for key in _get_value(run_desc, ("parameters",), errors) or {}:
+        keys = ("parameters", key)
+        value = _get_value(run_desc, keys, errors)
+        if value is not None:
+            path_values[keys] = value
+    for key, entry in (_get_value(run_desc, ("forcing",), errors) or {}).items():
+        keys = ("forcing", key, forcing_sub_key(entry))
+        value = _get_value(run_desc, keys, errors)
+        if value is None:
+            continue
+        if keys[-1] == "glob" and glob.has_magic(os.path.dirname(value)):
+            errors.append(
+                f"{value} forcing glob may only have wildcards in its file name - "
+                f"please check your run description YAML file"
+            )
+            continue
+        path_values[keys] = value
+    executable_name = _get_value(run_desc, ("paths", "atlantis executable name"))
+    if ("paths", "atlantis code") in path_values and executable_name is not None:
+        path_values["atlantis executable"] = os.path.join(
+            path_values[("paths", "atlantis code")],
+            "atlantis",
+            "atlantismain",
+            executable_name,
+        )
+    return path_values
+
+
+def forcing_sub_key(entry):
+    """Find the sub-key of a forcing section entry that declares its file(s).
+
+    :param entry: Forcing section entry.
+
+    :return: :kbd:`glob` or :kbd:`directory` if the entry has that key,
+             otherwise :kbd:`link to`.
+    :rtype: str
+    """
+    if isinstance(entry, dict):
+        for sub_key in FORCING_SCAN_KEYS:
+            if sub_key in entry:
+                return sub_key
+    return "link to"
+
+
+def lookup_path(keys, value):
+    """Calculate the path to look up to check a run description path value.
+
+    The directory of a forcing :kbd:`glob` is looked up instead of the glob pattern.
+
+    :param keys: Run description key tuple of the value.
+
+    :param value: Path value from the run description.
+    :type value: :py:class:`pathlib.Path` or str
+
+    :return: Path to look up.
+    :rtype: :py:class:`pathlib.Path` or str
+    """
+    if _is_forcing_scan(keys) and keys[-1] == "glob":
+        return _glob_dir(value)
+    return value
+
+
+def scan_forcing(sub_key, value, directory=None):
+    """Expand a forcing :kbd:`glob` or :kbd:`directory` declaration to the files
+    that it matches,
+    with one scan of its directory.
+
+    Only wildcards in the file name part of a glob are expanded.
+    As in shell globs,
+    hidden files are only matched by patterns that start with :kbd:`.`;
+    a directory declaration matches all of the files in it that aren't hidden.
+
+    :param str sub_key: :kbd:`glob` or :kbd:`directory`.
+
+    :param value: Glob pattern or directory path from the run description.
+    :type value: :py:class:`pathlib.Path` or str
+
+    :param directory: Resolved path of the directory to scan;
+                      resolved from :kbd:`value` if :py:obj:`None`.
+    :type directory: :py:class:`pathlib.Path` or None
+
+    :return: Resolved paths of the matching regular files, sorted by name.
+    :rtype: tuple
+    """
+    value = os.fspath(value)
+    if directory is None:
+        directory = value if sub_key == "directory" else _glob_dir(value)
+        directory = Path(os.path.expandvars(directory)).expanduser().resolve()
+    pattern = os.path.basename(value) if sub_key == "glob" else "*"
+    match = re.compile(fnmatch.translate(pattern)).match
+    match_hidden = pattern.startswith(".")
+    with os.scandir(directory) as entries:
+        files = [
+            Path(entry.path)
+            for entry in entries
+            if match(entry.name)
+            and (match_hidden or not entry.name.startswith("."))
+            and entry.is_file()
+        ]
+    return tuple(sorted(files))
+
+
+def _glob_dir(pattern):
+    """Get the directory part of a forcing glob pattern.
+
+    :param pattern: Glob pattern.
+    :type pattern: :py:class:`pathlib.Path` or str
+
+    :rtype: str
+    """
+    return os.path.dirname(os.fspath(pattern)) or "."
+
+
+def _is_forcing_scan(keys):
+    """Check whether run description keys are those of a forcing :kbd:`glob` or
+    :kbd:`directory` declaration.
+
+    :param keys: Run description key tuple,
+                 or :kbd:`atlantis executable`.
+
+    :rtype: boolean
+    """
+    return (
+        isinstance(keys, tuple)
+        and keys[0] == "forcing"
+        and keys[-1] in FORCING_SCAN_KEYS
+    )
+
+
+def _duplicate_forcing_link_names(resolved_paths):
+    """Find forcing symlink names that are declared more than once.
+
+    :param dict resolved_paths: Resolved paths keyed by run description key tuples.
+
+    :return: Error messages.
+    :rtype: list
+    """
+    declarations = {}
+    for keys, resolved in resolved_paths.items():
+        if not isinstance(keys, tuple) or keys[0] != "forcing":
+            continue
+        link_names = (
+            [file.name for file in resolved] if _is_forcing_scan(keys) else [keys[1]]
+        )
+        for link_name in link_names:
+            declarations.setdefault(link_name, []).append(keys[1])
+    return [
+        f"forcing file {link_name} is declared by more than one of: "
+        f"{', '.join(keys)} - please check your run description YAML file"
+        for link_name, keys in declarations.items()
+        if len(keys) > 1
+    ]
+
+
+def _get_value(run_desc, keys, errors=None):
+    """Get a value from a run description.
+
+    :param dict run_desc: Run description dictionary.
+
+    :param tuple keys: Key path of the value.
+
+    :param errors: List to append a missing key error message to.
+    :type errors: list or None
+
+    :return: Value, or :py:obj:`None` if it is missing.
+    """
+    value = run_desc
+    for key in keys:
+        try:
+            value = value[key]
+        except (KeyError, TypeError):
+            if errors is not None:
+                errors.append(
+                    f'"{": ".join(keys)}" key not found - '
+                    f"please check your run description YAML file"
+                )
+            return None
+    return value
@@ -0,0 +1,179 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Warm start initial conditions from the final state of a previous run.
+
+The run's configured initial conditions file is used as the template for the
+warm start file,
+so it has exactly the variables, dimensions, and attributes that Atlantis expects.
+The values of each variable that is also in the previous run's output file are
+replaced with those of its last time record,
+one variable at a time,
+so that only one record of one variable is in memory at once.
+"""
+
+import logging
+import os
+from pathlib import Path
+
+from atlantis_cmd import repack
+from atlantis_cmd.lazy_import import lazy_import
+
+netCDF4 = lazy_import("netCDF4")
+
+logger = logging.getLogger(__name__)
+
+
+def find_previous_output(previous_results_dir, output_filename_base):
+    """Find the output file of a previous run in its results directory.
+
+    :param previous_results_dir: Results directory of the previous run.
+    :type previous_results_dir: :py:class:`pathlib.Path`
+
+    :param str output_filename_base: Base name of the Atlantis output files.
+
+    :return: Path of the previous run's output file,
+             or :py:obj:`None` if it doesn't exist.
+    :rtype: :py:class:`pathlib.Path`
+    """
+    previous_results_dir = Path(os.path.expandvars(previous_results_dir))
+    previous_output = (
+        previous_results_dir.expanduser() / f"{output_filename_base}.nc"
+    ).resolve()
+    return previous_output if previous_output.is_file() else None
+
+
+def write_warm_start_init(init_conditions, previous_output, dest):
+    """Write an initial conditions file from the last time record of a previous
+    run's output file.
+
+    The file is written beside :kbd:`dest` and renamed over it when it is complete,
+    so a staged link to the configured initial conditions file is replaced,
+    not written through.
+
+    :param init_conditions: Path of the run's configured initial conditions file.
+    :type init_conditions: :py:class:`pathlib.Path`
+
+    :param previous_output: Path of the previous run's output file.
+    :type previous_output: :py:class:`pathlib.Path`
+
+    :param dest: Path of the warm start initial conditions file.
+    :type dest: :py:class:`pathlib.Path`
+
+    :raises: :py:exc:`ValueError` if the previous run's output file has no time
+             records.
+
+    :return: Names of the variables that were warm started.
+    :rtype: list
+    """
+    tmp_dest = dest.with_name(f".{dest.name}.warm-start-tmp")
+    warm_started = []
+    try:
+        with (
+            netCDF4.Dataset(init_conditions, "r") as init,
+            netCDF4.Dataset(previous_output, "r") as prev,
+            netCDF4.Dataset(tmp_dest, "w", format=init.data_model) as new,
+        ):
+            init.set_auto_maskandscale(False)
+            prev.set_auto_maskandscale(False)
+            prev_time_dim = repack.find_time_dim(prev)
+            if prev_time_dim is None or not len(prev.dimensions[prev_time_dim]):
+                raise ValueError(f"no time records in {previous_output}")
+            last = len(prev.dimensions[prev_time_dim]) - 1
+            init_time_dim = repack.find_time_dim(init)
+            new.setncatts({attr: init.getncattr(attr) for attr in init.ncattrs()})
+            new.warm_start_from = f"{previous_output} time record {last}"
+            for name, dim in init.dimensions.items():
+                new.createDimension(name, None if dim.isunlimited() else len(dim))
+            for var in init.variables.values():
+                src = prev.variables.get(var.name)
+                if var.name == init_time_dim or not _matches(
+                    var, init_time_dim, src, prev_time_dim
+                ):
+                    # The time coordinate stays that of the configured initial
+                    # conditions so that the run's start time is unchanged
+                    _copy_variable(var, new, var[...])
+                    continue
+                index = tuple(
+                    last if dim == prev_time_dim else slice(None)
+                    for dim in src.dimensions
+                )
+                _copy_variable(var, new, src[index].reshape(var.shape))
+                warm_started.append(var.name)
+        os.replace(tmp_dest, dest)
+    except BaseException:
+        tmp_dest.unlink(missing_ok=True)
+        raise
+    return warm_started
+
+
+def _matches(var, var_time_dim, src, src_time_dim):
+    """Check whether a previous output variable can supply the values of an initial
+    conditions variable.
+
+    :param var: Initial conditions variable.
+    :type var: :py:class:`netCDF4.Variable`
+
+    :param str var_time_dim: Name of the initial conditions time dimension.
+
+    :param src: Previous output variable of the same name,
+                or :py:obj:`None` if there isn't one.
+    :type src: :py:class:`netCDF4.Variable` or None
+
+    :param str src_time_dim: Name of the previous output time dimension.
+
+    :rtype: boolean
+    """
+    if src is None or src_time_dim not in src.dimensions:
+        return False
+    var_shape = [
+        size for dim, size in zip(var.dimensions, var.shape) if dim != var_time_dim
+    ]
+    src_shape = [
+        size for dim, size in zip(src.dimensions, src.shape) if dim != src_time_dim
+    ]
+    var_records = [
+        size for dim, size in zip(var.dimensions, var.shape) if dim == var_time_dim
+    ]
+    return var_shape == src_shape and var_records in ([], [1])
+
+
+def _copy_variable(var, dest, values):
+    """Create a variable like an initial conditions variable, and write its values.
+
+    :param var: Initial conditions variable.
+    :type var: :py:class:`netCDF4.Variable`
+
+    :param dest: Warm start initial conditions dataset.
+    :type dest: :py:class:`netCDF4.Dataset`
+
+    :param values: Values of the variable, in the shape of :kbd:`var`.
+    :type values: :py:class:`numpy.ndarray`
+    """
+    attrs = {attr: var.getncattr(attr) for attr in var.ncattrs()}
+    fill_value = attrs.pop("_FillValue", None)
+    dest_var = dest.createVariable(
+        var.name, var.dtype, var.dimensions, fill_value=fill_value
+    )
+    dest_var.set_auto_maskandscale(False)
+    dest_var.setncatts(attrs)
+    if not var.dimensions:
+        dest_var.assignValue(values)
+        return
+    # Explicit slices extend unlimited dimensions
+    dest_var[tuple(slice(0, size) for size in var.shape)] = values
@@ -0,0 +1,207 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Synthetic model configurations for the run preparation benchmarks.
+
+The configurations are shaped like the :kbd:`run_desc` fixture of the unit tests,
+but scaled up to the size of production configurations.
+The scale can be changed with environment variables so that regressions that only
+show up at larger scales can be investigated:
+
+* :envvar:`ATLANTIS_BENCHMARK_FORCING_FILES`: number of forcing files;
+  default 300
+* :envvar:`ATLANTIS_BENCHMARK_PRM_FILES`: number of :file:`.prm` parameters files;
+  default 40
+* :envvar:`ATLANTIS_BENCHMARK_INIT_GB`: size of the sparse initial conditions file
+  in GiB;
+  default 4
+* :envvar:`ATLANTIS_BENCHMARK_REPOS`: number of git repositories to record the
+  revisions of;
+  default 4
+"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+import yaml
+
+import atlantis_cmd.desc_cache
+import atlantis_cmd.run
+
+# Number of committed files in each synthetic git repository
+REPO_FILES = 200
+
+
+def _scale(name, default):
+    """Get a configuration scale from an environment variable.
+
+    :param str name: Scale name.
+
+    :param int default: Value to use if the environment variable is not set.
+
+    :rtype: int
+    """
+    return int(os.environ.get(f"ATLANTIS_BENCHMARK_{name}", default))
+
+
+@pytest.fixture(scope="session")
+def scale():
+    """Size of the synthetic model configuration.
+
+    Recorded with the benchmark results so that results at different scales are
+    not compared with each other.
+    """
+    return {
+        "forcing files": _scale("FORCING_FILES", 300),
+        "prm files": _scale("PRM_FILES", 40),
+        "init GiB": _scale("INIT_GB", 4),
+        "repos": _scale("REPOS", 4),
+    }
+
+
+def _git(repo, *args):
+    subprocess.run(
+        ["git", "-C", os.fspath(repo), *args],
+        check=True,
+        capture_output=True,
+        env={
+            **os.environ,
+            "GIT_AUTHOR_NAME": "benchmark",
+            "GIT_AUTHOR_EMAIL": "benchmark@example.com",
+            "GIT_COMMITTER_NAME": "benchmark",
+            "GIT_COMMITTER_EMAIL": "benchmark@example.com",
+        },
+    )
+
+
+@pytest.fixture(name="scaled_config", scope="session")
+def fixture_scaled_config(tmp_path_factory, scale):
+    """Build a scaled-up model configuration, and its run description YAML file.
+
+    The initial conditions file is sparse,
+    so it occupies almost no disk space despite its size.
+    It and the parameters files are read-only,
+    like those in a shared model configuration archive,
+    so that the :kbd:`auto` staging method can hard link them.
+
+    :return: Run description YAML file path, and runs directory path.
+    :rtype: 2-tuple
+    """
+    if shutil.which("git") is None:
+        pytest.skip("git is required to build the synthetic VCS repositories")
+    config_dir = tmp_path_factory.mktemp("scaled_config")
+    atlantis_code_dir = config_dir / "atlantis-trunk"
+    atlantismain_dir = atlantis_code_dir / "atlantis" / "atlantismain"
+    atlantismain_dir.mkdir(parents=True)
+    (atlantismain_dir / "atlantisMerged").write_bytes(b"")
+    runs_dir = config_dir / "runs_dir"
+    runs_dir.mkdir()
+    model_config = config_dir / "salish-sea-atlantis-model"
+    model_config.mkdir()
+    for name in (
+        "SS_xy.bgm",
+        "SS_grps.csv",
+        "SalishMigrations.csv",
+        "SalishFisheries.csv",
+    ):
+        (model_config / name).write_text("")
+    init_conditions = model_config / "SS_init.nc"
+    with init_conditions.open("wb") as f:
+        f.truncate(scale["init GiB"] * 2**30)
+    parameters = {}
+    for name in ("run", "forcing", "physics", "biology", "harvest"):
+        parameters[name] = model_config / f"SS_{name}.prm"
+    for i in range(scale["prm files"] - len(parameters)):
+        parameters[f"extra{i:03d}"] = model_config / f"SS_extra{i:03d}.prm"
+    for prm_file in parameters.values():
+        prm_file.write_text("# synthetic parameters\n" * 500)
+    for path in [init_conditions, *parameters.values()]:
+        path.chmod(0o444)
+    forcing_dir = model_config / "input"
+    forcing_dir.mkdir()
+    forcing = {}
+    for i in range(scale["forcing files"]):
+        forcing_file = forcing_dir / f"SS_forcing{i:04d}.nc"
+        forcing_file.write_bytes(b"")
+        forcing[forcing_file.name] = {"link to": os.fspath(forcing_file)}
+    repos = []
+    for i in range(scale["repos"]):
+        repo = config_dir / f"repo{i}"
+        repo.mkdir()
+        for j in range(REPO_FILES):
+            (repo / f"file{j:04d}.txt").write_text(f"{i} {j}\n")
+        _git(repo, "init", "--quiet")
+        _git(repo, "add", ".")
+        _git(repo, "commit", "--quiet", "--message", "synthetic revision")
+        repos.append(os.fspath(repo))
+    run_desc = {
+        "run id": "SS-Atlantis-benchmark",
+        "paths": {
+            "atlantis code": os.fspath(atlantis_code_dir),
+            "atlantis executable name": "atlantisMerged",
+            "runs directory": os.fspath(runs_dir),
+        },
+        "boxes": os.fspath(model_config / "SS_xy.bgm"),
+        "initial conditions": os.fspath(init_conditions),
+        "groups": os.fspath(model_config / "SS_grps.csv"),
+        "migrations": os.fspath(model_config / "SalishMigrations.csv"),
+        "fisheries": os.fspath(model_config / "SalishFisheries.csv"),
+        "parameters": {key: os.fspath(path) for key, path in parameters.items()},
+        "forcing": forcing,
+        "output filename base": "outputSalishSea",
+        "vcs revisions": {"git": repos},
+    }
+    desc_file = config_dir / "atlantis.yaml"
+    desc_file.write_text(yaml.safe_dump(run_desc, sort_keys=False))
+    return desc_file, runs_dir
+
+
+@pytest.fixture(name="runs_dir")
+def fixture_runs_dir(scaled_config):
+    """Runs directory of the scaled configuration,
+    emptied of the temporary run directories that a benchmark created.
+    """
+    _, runs_dir = scaled_config
+    yield runs_dir
+    for tmp_run_dir in runs_dir.iterdir():
+        shutil.rmtree(tmp_run_dir)
+
+
+@pytest.fixture
+def clear_caches(monkeypatch):
+    """Function that empties the process-wide run description and VCS revision
+    caches so that a benchmark round starts cold,
+    like the first run that a process prepares.
+    """
+    monkeypatch.setattr(atlantis_cmd.desc_cache, "_caches", {})
+
+    def clear():
+        atlantis_cmd.desc_cache._caches.clear()
+        atlantis_cmd.run._vcs_revisions.clear()
+
+    clear()
+    yield clear
+    clear()
+
+
+@pytest.fixture(autouse=True)
+def isolated_run_desc_cache(tmp_path, monkeypatch):
+    """Keep the on-disk run description cache out of the user's cache directory."""
+    monkeypatch.setenv("XDG_CACHE_HOME", os.fspath(tmp_path / "cache"))
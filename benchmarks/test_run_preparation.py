@@ -0,0 +1,155 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Benchmarks of the preparation of runs of scaled-up model configurations.
+
+The end to end benchmarks time :py:func:`atlantis_cmd.run.run` with
+:kbd:`no_submit=True`,
+and record the median wall time of each run preparation phase from the
+:file:`timings.json` files of their rounds in the benchmark's :kbd:`extra_info`.
+The phase benchmarks time the functions of the most expensive phases on their own
+so that a regression can be attributed to one of them.
+"""
+
+import json
+import statistics
+from pathlib import Path
+
+import pytest
+
+import atlantis_cmd.run
+from atlantis_cmd import desc_cache, run_dir
+from atlantis_cmd.timings import TIMINGS_FILE
+
+ROUNDS = 10
+
+
+def _record_phases(benchmark, runs_dir, scale):
+    """Record the scale of the configuration,
+    and the median wall times of the run preparation phases of the benchmark rounds,
+    in the benchmark's :kbd:`extra_info`.
+    """
+    phase_seconds = {}
+    for timings_file in runs_dir.glob(f"*/{TIMINGS_FILE}"):
+        for phase in json.loads(timings_file.read_text())["phases"]:
+            phase_seconds.setdefault(phase["phase"], []).append(phase["seconds"])
+    benchmark.extra_info["scale"] = scale
+    benchmark.extra_info["phase median seconds"] = {
+        phase: statistics.median(seconds) for phase, seconds in phase_seconds.items()
+    }
+
+
+class TestRun:
+    """End to end benchmarks of preparing a run without launching it."""
+
+    def test_cold(self, benchmark, scaled_config, runs_dir, scale, clear_caches):
+        """First run that a process prepares."""
+        desc_file, _ = scaled_config
+
+        def prepare():
+            atlantis_cmd.run.run(
+                desc_file,
+                desc_file.parent / "results",
+                no_submit=True,
+                quiet=True,
+                timings=True,
+            )
+
+        benchmark.pedantic(prepare, setup=clear_caches, rounds=ROUNDS)
+        _record_phases(benchmark, runs_dir, scale)
+
+    def test_warm(self, benchmark, scaled_config, runs_dir, scale, clear_caches):
+        """Later runs that a process prepares, like ensemble members and sweep points."""
+        desc_file, _ = scaled_config
+
+        def prepare():
+            atlantis_cmd.run.run(
+                desc_file,
+                desc_file.parent / "results",
+                no_submit=True,
+                quiet=True,
+                timings=True,
+            )
+
+        prepare()
+        benchmark.pedantic(prepare, rounds=ROUNDS)
+        _record_phases(benchmark, runs_dir, scale)
+
+
+class TestPhases:
+    """Benchmarks of the individual run preparation phases."""
+
+    def test_load_run_desc(self, benchmark, scaled_config, scale, clear_caches):
+        desc_file, _ = scaled_config
+
+        benchmark.extra_info["scale"] = scale
+        benchmark.pedantic(
+            lambda: desc_cache.get_cache().load(desc_file),
+            setup=clear_caches,
+            rounds=ROUNDS,
+        )
+
+    def test_validate_run_desc(self, benchmark, scaled_config, scale, clear_caches):
+        desc_file, _ = scaled_config
+        run_desc = desc_cache.get_cache().load(desc_file)
+
+        benchmark.extra_info["scale"] = scale
+        benchmark.pedantic(
+            lambda: desc_cache.get_cache().validate(run_desc),
+            setup=clear_caches,
+            rounds=ROUNDS,
+        )
+
+    @pytest.mark.parametrize("method", ["auto", "symlink"])
+    def test_build_tmp_run_dir(self, benchmark, scaled_config, runs_dir, scale, method):
+        desc_file, _ = scaled_config
+        run_desc = desc_cache.get_cache().load(desc_file)
+        run_desc["staging"] = {"default": method}
+        contexts = []
+
+        def setup():
+            tmp_run_dir = atlantis_cmd.run._calc_tmp_run_dir(
+                runs_dir, run_desc["run id"]
+            )
+            context = atlantis_cmd.run._calc_cookiecutter_context(
+                run_desc,
+                run_desc["run id"],
+                desc_file,
+                tmp_run_dir,
+                desc_file.parent / "results",
+            )
+            contexts.append(context)
+            return (context,), {}
+
+        benchmark.extra_info["scale"] = scale
+        benchmark.pedantic(run_dir.build_tmp_run_dir, setup=setup, rounds=ROUNDS)
+        assert all(Path(context["tmp_run_dir"]).is_dir() for context in contexts)
+
+    def test_record_vcs_revisions(
+        self, benchmark, scaled_config, tmp_path, scale, clear_caches
+    ):
+        desc_file, _ = scaled_config
+        run_desc = desc_cache.get_cache().load(desc_file)
+
+        benchmark.extra_info["scale"] = scale
+        benchmark.pedantic(
+            atlantis_cmd.run._record_vcs_revisions,
+            args=(run_desc, tmp_path),
+            setup=clear_caches,
+            rounds=ROUNDS,
+        )
@@ -16,38 +16,18 @@
 # SPDX-License-Identifier: Apache-2.0
 
 
-"""Post-rendering script to set up symlinks and copied files in temporary run directory
+"""Post-rendering script to set up symlinks and copied or linked files in temporary run directory
 for a run of the CSIRO Atlantis ecosystem model.
+
+This hook is only used when the legacy cookiecutter rendering of the temporary
+run directory is requested.
+The work is done by the same function that the native run directory builder uses.
 """
 
 import json
-import shutil
 from pathlib import Path
 
-shutil.copy2(Path("{{ cookiecutter.run_desc_yaml }}"), Path.cwd())
-
-Path("{{ cookiecutter.atlantis_executable_name }}").symlink_to(
-    Path("{{ cookiecutter.atlantis_executable }}")
-)
-
-shutil.copy2(Path("{{ cookiecutter.boxes }}"), Path.cwd())
-
-shutil.copy2(Path("{{ cookiecutter.init_conditions }}"), "init_conditions.nc")
-
-shutil.copy2(Path("{{ cookiecutter.groups }}"), "groups.csv")
-
-shutil.copy2(Path("{{ cookiecutter.migrations }}"), "migrations.csv")
-
-shutil.copy2(Path("{{ cookiecutter.fisheries }}"), "fisheries.csv")
-
-# Deserializing the parameters and forcing dicts from cookiecutter.json is a bit hacky,
-# especially because of the necessary single-quote to double-quote substitution.
-parameters = "{{ cookiecutter.parameters }}"
-parameters = json.loads(parameters.replace("'", '"'))
-for key, path in parameters.items():
-    shutil.copy2(Path(path), f"{key}.prm")
+from atlantis_cmd.run_dir import populate_tmp_run_dir
 
-forcing = "{{ cookiecutter.forcing }}"
-forcing = json.loads(forcing.replace("'", '"'))
-for link_name, target in forcing.items():
-    Path(link_name).symlink_to(Path(target))
+context = json.loads(r"""{{ cookiecutter | jsonify }}""")
+populate_tmp_run_dir(context, Path.cwd())
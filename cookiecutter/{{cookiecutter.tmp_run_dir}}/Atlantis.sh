@@ -8,23 +8,60 @@ RUN_DESC="{{ cookiecutter.run_desc_yaml }}"
 WORK_DIR="{{ cookiecutter.tmp_run_dir }}"
 RESULTS_DIR="{{ cookiecutter.results_dir }}"
 GATHER="{{ cookiecutter.atlantis_cmd }} gather"
+SUPERVISE="{{ cookiecutter.atlantis_cmd }} supervise --resources-file ${RESULTS_DIR}/resources.json"
 
 mkdir -p ${RESULTS_DIR}
 
 cd ${WORK_DIR}
 echo "working dir: $(pwd)" >${RESULTS_DIR}/stdout
+{%- if cookiecutter.scratch_dir %}
+
+SCRATCH_DIR=$(mktemp -d "{{ cookiecutter.scratch_dir }}/${RUN_ID}.XXXXXX")
+OUTPUT_DIR=${SCRATCH_DIR}/results
+COPIED_BACK=false
+
+copy_back() {
+  echo "Copying results back from scratch started at $(date)" >>${RESULTS_DIR}/stdout
+  if (cd ${OUTPUT_DIR} && ${SUPERVISE} --step copy-back -- ${GATHER} ${RESULTS_DIR} --debug) &>>${RESULTS_DIR}/stdout; then
+    COPIED_BACK=true
+  fi
+  echo "Copying results back from scratch ended at $(date)" >>${RESULTS_DIR}/stdout
+}
+
+remove_scratch() {
+  if ! ${COPIED_BACK}; then
+    copy_back
+  fi
+  if ${COPIED_BACK}; then
+    rm -rf ${SCRATCH_DIR}
+  else
+    echo "Kept scratch directory ${SCRATCH_DIR} because its results were not all copied back" >>${RESULTS_DIR}/stdout
+  fi
+}
+trap remove_scratch EXIT
+
+echo "Staging run directory in scratch directory ${SCRATCH_DIR} at $(date)" >>${RESULTS_DIR}/stdout
+${SUPERVISE} --step stage-scratch -- cp -a ${WORK_DIR}/. ${SCRATCH_DIR}/ &>>${RESULTS_DIR}/stdout
+mkdir ${OUTPUT_DIR}
+cd ${SCRATCH_DIR}
+{%- endif %}
 
 echo "Starting run at $(date)" >>${RESULTS_DIR}/stdout
-./{{ cookiecutter.atlantis_executable_name }} \
+${SUPERVISE} --step atlantis -- ./{{ cookiecutter.atlantis_executable_name }} \
   -i init_conditions.nc 0 -o {{ cookiecutter.output_filename_base }}.nc \
   -r run.prm -f forcing.prm -p physics.prm -b biology.prm -s groups.csv -m migrations.csv \
   -h harvest.prm -q fisheries.csv \
-  -d ${RESULTS_DIR} &>>${RESULTS_DIR}/stdout
+  -d {% if cookiecutter.scratch_dir %}${OUTPUT_DIR}{% else %}${RESULTS_DIR}{% endif %} &>>${RESULTS_DIR}/stdout
 ATLANTIS_EXIT_CODE=$?
 echo "Ended run at $(date)" >>${RESULTS_DIR}/stdout
+{%- if cookiecutter.scratch_dir %}
+
+copy_back
+cd ${WORK_DIR}
+{%- endif %}
 
 echo "Results gathering started at $(date)" >>${RESULTS_DIR}/stdout
-${GATHER} ${RESULTS_DIR} --debug &>>${RESULTS_DIR}/stdout
+${SUPERVISE} --step gather -- ${GATHER} ${RESULTS_DIR}{{ cookiecutter.gather_options }} --debug &>>${RESULTS_DIR}/stdout
 echo "Results gathering ended at $(date)" >>${RESULTS_DIR}/stdout
 
 chmod -v go+rx ${RESULTS_DIR} &>>${RESULTS_DIR}/stdout
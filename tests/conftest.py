@@ -25,9 +25,19 @@ from pathlib import Path
 import pytest
 import yaml
 
+import atlantis_cmd.desc_cache
 import atlantis_cmd.run
 
 
+@pytest.fixture(autouse=True)
+def isolated_run_desc_cache(tmp_path, monkeypatch):
+    """Keep the run description caches of tests separate,
+    and out of the user's cache directory.
+    """
+    monkeypatch.setattr(atlantis_cmd.desc_cache, "_caches", {})
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+
 @pytest.fixture(name="run_desc", scope="function")
 def fixture_run_desc(tmp_path):
     atlantis_code_dir = tmp_path / "atlantis-trunk"
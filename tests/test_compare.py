@@ -0,0 +1,342 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Unit tests for compare sub-command."""
+
+import logging
+from pathlib import Path
+from types import SimpleNamespace
+
+import netCDF4
+import numpy
+import pytest
+
+import atlantis_cmd.compare
+import atlantis_cmd.main
+
+N_TIMES, BOXES, LAYERS = 6, 3, 2
+
+
+@pytest.fixture
+def compare_cmd():
+    return atlantis_cmd.compare.Compare(atlantis_cmd.main.AtlantisCmdApp, [])
+
+
+def _write_output(path, temperature_offset=0.0, diatom_offset=0.0):
+    """Write a small Atlantis output file."""
+    shape = (N_TIMES, BOXES, LAYERS)
+    with netCDF4.Dataset(path, "w") as ds:
+        ds.createDimension("t", None)
+        ds.createDimension("b", BOXES)
+        ds.createDimension("z", LAYERS)
+        ds.createVariable("t", "f8", ("t",))[:] = numpy.arange(N_TIMES) * 86400.0
+        temperature = numpy.arange(numpy.prod(shape), dtype="f8").reshape(shape) + 1
+        ds.createVariable("Temp", "f8", ("t", "b", "z"))[:] = (
+            temperature + temperature_offset
+        )
+        ds.createVariable("Diatom_N", "f4", ("t", "b", "z"))[:] = numpy.full(
+            shape, 2.0 + diatom_offset
+        )
+        ds.createVariable("nominal_dz", "f8", ("b", "z"))[:] = numpy.ones(shape[1:])
+    return path
+
+
+@pytest.fixture(name="results_dirs")
+def fixture_results_dirs(tmp_path):
+    results_dirs = []
+    for name in ("results_a", "results_b"):
+        results_dir = tmp_path / name
+        results_dir.mkdir()
+        _write_output(results_dir / "outputSalishSea.nc")
+        results_dirs.append(results_dir)
+    return results_dirs
+
+
+class TestParser:
+    """Unit tests for `atlantis compare` sub-command command-line parser."""
+
+    def test_get_parser(self, compare_cmd):
+        parser = compare_cmd.get_parser("atlantis compare")
+        assert parser.prog == "atlantis compare"
+
+    def test_parsed_args_defaults(self, compare_cmd):
+        parser = compare_cmd.get_parser("atlantis compare")
+        parsed_args = parser.parse_args(["results/a/", "results/b/"])
+        assert parsed_args.results_a == Path("results/a/")
+        assert parsed_args.results_b == Path("results/b/")
+        assert parsed_args.globs == []
+        assert parsed_args.atol == 0.0
+        assert parsed_args.rtol == 0.0
+        assert parsed_args.stop_after is None
+        assert not parsed_args.stop_at_first_block
+
+    def test_parsed_args_options(self, compare_cmd):
+        parser = compare_cmd.get_parser("atlantis compare")
+        parsed_args = parser.parse_args(
+            [
+                "results/a/",
+                "results/b/",
+                "--files",
+                "outputSalishSea.nc",
+                "--files",
+                "*CATCH.nc",
+                "--atol",
+                "1e-9",
+                "--rtol",
+                "1e-6",
+                "--stop-after",
+                "3",
+                "--stop-at-first-block",
+            ]
+        )
+        assert parsed_args.globs == ["outputSalishSea.nc", "*CATCH.nc"]
+        assert parsed_args.atol == 1e-9
+        assert parsed_args.rtol == 1e-6
+        assert parsed_args.stop_after == 3
+        assert parsed_args.stop_at_first_block
+
+
+class TestTakeAction:
+    """Unit tests for `atlantis compare` sub-command take_action() method."""
+
+    @pytest.mark.parametrize(
+        "globs, expected",
+        (([], ["*.nc"]), (["outputSalishSea.nc"], ["outputSalishSea.nc"])),
+    )
+    def test_take_action(self, globs, expected, compare_cmd, monkeypatch):
+        compare_args = {}
+
+        def mock_compare_results(results_a, results_b, **kwargs):
+            compare_args.update(results_a=results_a, results_b=results_b, **kwargs)
+
+        monkeypatch.setattr(
+            atlantis_cmd.compare, "compare_results", mock_compare_results
+        )
+        parsed_args = SimpleNamespace(
+            results_a=Path("results_a"),
+            results_b=Path("results_b"),
+            globs=globs,
+            atol=0.0,
+            rtol=1e-6,
+            stop_after=None,
+            stop_at_first_block=False,
+        )
+
+        compare_cmd.take_action(parsed_args)
+
+        assert compare_args == {
+            "results_a": Path("results_a"),
+            "results_b": Path("results_b"),
+            "globs": expected,
+            "atol": 0.0,
+            "rtol": 1e-6,
+            "stop_after": None,
+            "stop_at_first_block": False,
+        }
+
+
+class TestCompareResults:
+    """Unit tests for compare_results() function."""
+
+    def test_identical(self, results_dirs):
+        comparisons = atlantis_cmd.compare.compare_results(*results_dirs)
+
+        assert [comparison.var_name for comparison in comparisons] == [
+            "Diatom_N",
+            "Temp",
+            "nominal_dz",
+            "t",
+        ]
+        assert not any(comparison.is_different for comparison in comparisons)
+        assert comparisons[1].n_values == N_TIMES * BOXES * LAYERS
+
+    def test_within_tolerance(self, results_dirs):
+        results_a, results_b = results_dirs
+        _write_output(results_a / "outputSalishSea.nc", temperature_offset=1e-3)
+
+        comparisons = atlantis_cmd.compare.compare_results(
+            results_a, results_b, rtol=1e-3
+        )
+
+        temp = comparisons[1]
+        assert not temp.is_different
+        assert temp.max_abs_diff == pytest.approx(1e-3)
+        assert temp.mean_abs_diff == pytest.approx(1e-3)
+        # Relative to the smallest reference value, 1
+        assert temp.max_rel_diff == pytest.approx(1e-3)
+
+    def test_regression(self, results_dirs, caplog):
+        results_a, results_b = results_dirs
+        _write_output(results_a / "outputSalishSea.nc", diatom_offset=0.5)
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit) as exc_info:
+            atlantis_cmd.compare.compare_results(results_a, results_b, rtol=0.1)
+
+        assert exc_info.value.code == 1
+        assert caplog.messages[0].startswith(
+            "outputSalishSea.nc:Diatom_N 36 of 36 compared values exceed tolerances; "
+            "max abs diff 0.5, mean abs diff 0.5, max rel diff 0.25"
+        )
+        assert caplog.messages[-1] == (
+            f"found 1 difference(s) between {results_a} and {results_b} "
+            f"greater than atol=0.0, rtol=0.1"
+        )
+
+    def test_stop_after(self, results_dirs, caplog):
+        results_a, results_b = results_dirs
+        _write_output(
+            results_a / "outputSalishSea.nc", temperature_offset=1, diatom_offset=1
+        )
+        caplog.set_level(logging.WARNING)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.compare.compare_results(results_a, results_b, stop_after=1)
+
+        assert len(caplog.messages) == 3
+        assert caplog.messages[0].startswith("outputSalishSea.nc:Diatom_N ")
+        assert caplog.messages[1] == "stopped comparing after 1 difference(s)"
+
+    @pytest.mark.parametrize(
+        "stop_at_first_block, expected_n_values",
+        ((True, 2 * BOXES * LAYERS), (False, N_TIMES * BOXES * LAYERS)),
+    )
+    def test_variable_blocks(
+        self, stop_at_first_block, expected_n_values, results_dirs, monkeypatch
+    ):
+        results_a, results_b = results_dirs
+        _write_output(results_a / "outputSalishSea.nc", temperature_offset=1)
+        # 8 bytes per value; 2 time records per block
+        monkeypatch.setattr(
+            atlantis_cmd.compare, "MAX_BLOCK_BYTES", 2 * BOXES * LAYERS * 8
+        )
+        comparisons = []
+        variable_comparison = atlantis_cmd.compare.VariableComparison
+
+        def mock_variable_comparison(*args):
+            comparisons.append(variable_comparison(*args))
+            return comparisons[-1]
+
+        monkeypatch.setattr(
+            atlantis_cmd.compare, "VariableComparison", mock_variable_comparison
+        )
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.compare.compare_results(
+                results_a, results_b, stop_at_first_block=stop_at_first_block
+            )
+
+        temp = comparisons[1]
+        assert temp.is_different
+        assert temp.n_values == expected_n_values
+        assert temp.n_exceeding == expected_n_values
+
+    def test_missing_variable(self, results_dirs, caplog):
+        results_a, results_b = results_dirs
+        with netCDF4.Dataset(results_b / "outputSalishSea.nc", "a") as ds:
+            ds.createVariable("Diatom_S", "f4", ("t", "b", "z"))
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.compare.compare_results(results_a, results_b)
+
+        assert caplog.messages[0] == (
+            "outputSalishSea.nc:Diatom_S is in only one of the files"
+        )
+
+    def test_different_time_records(self, results_dirs, caplog):
+        results_a, results_b = results_dirs
+        with netCDF4.Dataset(results_b / "outputSalishSea.nc", "a") as ds:
+            ds.variables["t"][N_TIMES] = N_TIMES * 86400.0
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.compare.compare_results(results_a, results_b)
+
+        assert caplog.messages[0] == (
+            "outputSalishSea.nc:Diatom_N dimensions ('t', 'b', 'z') (6, 3, 2) != "
+            "('t', 'b', 'z') (7, 3, 2)"
+        )
+
+    def test_missing_file(self, results_dirs, caplog):
+        results_a, results_b = results_dirs
+        _write_output(results_b / "outputSalishSeaCATCH.nc")
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit) as exc_info:
+            atlantis_cmd.compare.compare_results(results_a, results_b)
+
+        assert exc_info.value.code == 1
+        assert (
+            caplog.messages[0] == f"{results_a / 'outputSalishSeaCATCH.nc'} not found"
+        )
+
+    def test_globs(self, results_dirs):
+        results_a, results_b = results_dirs
+        _write_output(results_b / "outputSalishSeaCATCH.nc")
+
+        comparisons = atlantis_cmd.compare.compare_results(
+            results_a, results_b, globs=["outputSalishSea.nc"]
+        )
+
+        assert {comparison.file_name for comparison in comparisons} == {
+            "outputSalishSea.nc"
+        }
+
+    def test_no_files(self, results_dirs, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit) as exc_info:
+            atlantis_cmd.compare.compare_results(*results_dirs, globs=["*.txt"])
+
+        assert exc_info.value.code == 2
+        assert caplog.messages[0] == "no files matching *.txt found to compare"
+
+
+class TestVariableComparison:
+    """Unit tests for VariableComparison class."""
+
+    def test_nans(self):
+        comparison = atlantis_cmd.compare.VariableComparison("f.nc", "v", 0.0, 0.0)
+
+        comparison.update(
+            numpy.array([numpy.nan, 1.0, numpy.inf]),
+            numpy.array([numpy.nan, 1.0, numpy.inf]),
+        )
+
+        assert not comparison.is_different
+
+        comparison.update(numpy.array([numpy.nan]), numpy.array([1.0]))
+
+        assert comparison.is_different
+        assert comparison.max_abs_diff == numpy.inf
+
+    def test_zero_reference_value(self):
+        comparison = atlantis_cmd.compare.VariableComparison("f.nc", "v", 1e-3, 0.5)
+
+        comparison.update(numpy.array([1e-4, 0.0]), numpy.array([0.0, 0.0]))
+
+        assert not comparison.is_different
+        assert comparison.max_rel_diff == numpy.inf
+
+    def test_strings(self):
+        comparison = atlantis_cmd.compare.VariableComparison("f.nc", "v", 0.0, 0.0)
+
+        comparison.update(numpy.array([b"a", b"b"]), numpy.array([b"a", b"c"]))
+
+        assert comparison.n_exceeding == 1
@@ -0,0 +1,272 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Unit tests for the parsed and path-validated run description cache."""
+
+import logging
+import os
+from pathlib import Path
+
+import pytest
+
+from atlantis_cmd import desc_cache, validate
+
+
+@pytest.fixture
+def count_loads(monkeypatch):
+    loads = []
+    load_run_desc = desc_cache.nemo_cmd.prepare.load_run_desc
+
+    def mock_load_run_desc(desc_file):
+        loads.append(desc_file)
+        return load_run_desc(desc_file)
+
+    monkeypatch.setattr(
+        desc_cache.nemo_cmd.prepare, "load_run_desc", mock_load_run_desc
+    )
+    return loads
+
+
+@pytest.fixture
+def count_validations(monkeypatch):
+    validations = []
+    validate_run_desc = validate.validate_run_desc
+
+    def mock_validate_run_desc(run_desc, stat_cache=None):
+        validations.append(run_desc)
+        return validate_run_desc(run_desc, stat_cache)
+
+    monkeypatch.setattr(validate, "validate_run_desc", mock_validate_run_desc)
+    return validations
+
+
+class TestGetCache:
+    """Unit tests for get_cache() function."""
+
+    def test_memory_cache(self):
+        cache = desc_cache.get_cache()
+        assert cache.cache_dir is None
+        assert desc_cache.get_cache() is cache
+
+    def test_persistent_cache(self, tmp_path):
+        cache = desc_cache.get_cache(persist=True)
+        assert cache.cache_dir == tmp_path / "cache" / "atlantis_cmd" / "run_desc"
+        assert desc_cache.get_cache() is not cache
+
+
+class TestLoad:
+    """Unit tests for RunDescCache.load() method."""
+
+    def test_parsed_once(self, run_desc, count_loads, tmp_path):
+        cache = desc_cache.RunDescCache()
+
+        first = cache.load(tmp_path / "atlantis.yaml")
+        second = cache.load(tmp_path / "atlantis.yaml")
+
+        assert first == second == run_desc
+        assert len(count_loads) == 1
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_returns_copies(self, run_desc, tmp_path):
+        cache = desc_cache.RunDescCache()
+
+        cache.load(tmp_path / "atlantis.yaml")["parameters"]["run"] = "changed.prm"
+
+        assert cache.load(tmp_path / "atlantis.yaml") == run_desc
+
+    def test_keyed_on_contents(self, run_desc, count_loads, tmp_path):
+        cache = desc_cache.RunDescCache()
+        desc_file = tmp_path / "atlantis.yaml"
+        cache.load(desc_file)
+        desc_file.write_text(desc_file.read_text().replace("SS-Atlantis", "SS-2"))
+
+        assert cache.load(desc_file)["run id"] == "SS-2"
+        assert len(count_loads) == 2
+
+    def test_persisted(self, run_desc, count_loads, tmp_path):
+        cache_dir = tmp_path / "run_desc_cache"
+        desc_cache.RunDescCache(cache_dir).load(tmp_path / "atlantis.yaml")
+
+        run_desc_from_disk = desc_cache.RunDescCache(cache_dir).load(
+            tmp_path / "atlantis.yaml"
+        )
+
+        assert run_desc_from_disk == run_desc
+        assert len(count_loads) == 1
+        assert cache_dir.stat().st_mode & 0o777 == 0o700
+
+    def test_corrupt_entry_ignored(self, run_desc, count_loads, tmp_path):
+        cache_dir = tmp_path / "run_desc_cache"
+        desc_cache.RunDescCache(cache_dir).load(tmp_path / "atlantis.yaml")
+        for entry_file in cache_dir.glob("*.pickle"):
+            entry_file.write_bytes(b"not a pickle")
+
+        run_desc_loaded = desc_cache.RunDescCache(cache_dir).load(
+            tmp_path / "atlantis.yaml"
+        )
+
+        assert run_desc_loaded == run_desc
+        assert len(count_loads) == 2
+
+
+class TestValidate:
+    """Unit tests for RunDescCache.validate() method."""
+
+    def test_validated_once(self, run_desc, count_validations):
+        cache = desc_cache.RunDescCache()
+
+        first = cache.validate(run_desc)
+        second = cache.validate(run_desc)
+
+        assert first == second
+        assert first[("paths", "runs directory")] == Path(
+            run_desc["paths"]["runs directory"]
+        )
+        assert len(count_validations) == 1
+
+    def test_non_path_values_share_validation(self, run_desc, count_validations):
+        cache = desc_cache.RunDescCache()
+        cache.validate(run_desc)
+
+        cache.validate({**run_desc, "run id": "SS-Atlantis_001"})
+
+        assert len(count_validations) == 1
+
+    def test_changed_input_revalidated(self, run_desc, count_validations):
+        cache = desc_cache.RunDescCache()
+        cache.validate(run_desc)
+        groups = Path(run_desc["groups"])
+        stat_result = groups.stat()
+        os.utime(groups, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 10**9))
+
+        cache.validate(run_desc)
+
+        assert len(count_validations) == 2
+        assert (cache.hits, cache.misses) == (0, 2)
+
+    def test_runs_dir_change_not_revalidated(self, run_desc, count_validations):
+        cache = desc_cache.RunDescCache()
+        cache.validate(run_desc)
+        runs_dir = Path(run_desc["paths"]["runs directory"])
+        (runs_dir / "SS-Atlantis_2024-01-01T000000").mkdir()
+        stat_result = runs_dir.stat()
+        os.utime(
+            runs_dir, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 10**9)
+        )
+
+        cache.validate(run_desc)
+
+        assert len(count_validations) == 1
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_added_forcing_file_revalidated(self, run_desc, tmp_path):
+        forcing_dir = tmp_path / "forcing"
+        forcing_dir.mkdir()
+        (forcing_dir / "SS_hydro_2020.nc").write_bytes(b"")
+        run_desc["forcing"]["hydro"] = {"glob": f"{forcing_dir}/SS_hydro_*.nc"}
+        cache = desc_cache.RunDescCache()
+        cache.validate(run_desc)
+        (forcing_dir / "SS_hydro_2021.nc").write_bytes(b"")
+        stat_result = forcing_dir.stat()
+        os.utime(
+            forcing_dir, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 10**9)
+        )
+
+        resolved_paths = cache.validate(run_desc)
+
+        assert resolved_paths[("forcing", "hydro", "glob")] == (
+            forcing_dir / "SS_hydro_2020.nc",
+            forcing_dir / "SS_hydro_2021.nc",
+        )
+
+    def test_deleted_input_reported(self, run_desc, caplog):
+        cache = desc_cache.RunDescCache()
+        cache.validate(run_desc)
+        Path(run_desc["groups"]).unlink()
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            cache.validate(run_desc)
+
+        assert caplog.messages[0].startswith(f"{run_desc['groups']} path from run")
+
+    def test_env_var_change_revalidated(
+        self, run_desc, count_validations, tmp_path, monkeypatch
+    ):
+        monkeypatch.setenv("MODEL_DIR", str(tmp_path / "salish-sea-atlantis-model"))
+        run_desc = {**run_desc, "groups": "$MODEL_DIR/SS_grps.csv"}
+        cache = desc_cache.RunDescCache()
+        cache.validate(run_desc)
+        other_model_dir = tmp_path / "other-model"
+        other_model_dir.mkdir()
+        (other_model_dir / "SS_grps.csv").write_text("")
+        monkeypatch.setenv("MODEL_DIR", str(other_model_dir))
+
+        resolved_paths = cache.validate(run_desc)
+
+        assert resolved_paths[("groups",)] == other_model_dir / "SS_grps.csv"
+        assert len(count_validations) == 2
+
+    def test_missing_keys_reported(self, run_desc, caplog):
+        del run_desc["boxes"]
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            desc_cache.RunDescCache().validate(run_desc)
+
+        assert caplog.messages[0].startswith('"boxes" key not found')
+
+    def test_persisted(self, run_desc, count_validations, tmp_path):
+        cache_dir = tmp_path / "run_desc_cache"
+        desc_cache.RunDescCache(cache_dir).validate(run_desc)
+
+        desc_cache.RunDescCache(cache_dir).validate(run_desc)
+
+        assert len(count_validations) == 1
+
+
+class TestEviction:
+    """Unit tests for least recently used entry eviction."""
+
+    def test_memory(self, run_desc, count_loads, tmp_path):
+        cache = desc_cache.RunDescCache(max_entries=2)
+        desc_files = []
+        for i in range(3):
+            desc_file = tmp_path / f"desc_{i}.yaml"
+            desc_file.write_text(f"run id: run_{i}\n")
+            desc_files.append(desc_file)
+            cache.load(desc_file)
+        cache.load(desc_files[2])
+        cache.load(desc_files[0])
+
+        assert len(count_loads) == 4
+
+    def test_disk(self, tmp_path):
+        cache_dir = tmp_path / "run_desc_cache"
+        cache = desc_cache.RunDescCache(cache_dir, max_entries=2)
+        for i in range(3):
+            desc_file = tmp_path / f"desc_{i}.yaml"
+            desc_file.write_text(f"run id: run_{i}\n")
+            cache.load(desc_file)
+            # Make sure that modification times are distinct
+            entry_file = max(
+                cache_dir.glob("*.pickle"), key=lambda p: p.stat().st_mtime_ns
+            )
+            os.utime(entry_file, ns=(i * 10**9, i * 10**9))
+
+        assert len(list(cache_dir.glob("*.pickle"))) == 2
@@ -0,0 +1,363 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Unit tests for ensemble-stats sub-command."""
+
+import logging
+from pathlib import Path
+from types import SimpleNamespace
+
+import netCDF4
+import numpy
+import pytest
+
+import atlantis_cmd.ensemble_stats
+import atlantis_cmd.main
+
+N_TIMES, BOXES, LAYERS = 4, 3, 2
+
+
+@pytest.fixture
+def ensemble_stats_cmd():
+    return atlantis_cmd.ensemble_stats.EnsembleStats(
+        atlantis_cmd.main.AtlantisCmdApp, []
+    )
+
+
+def _member_values(member):
+    shape = (N_TIMES, BOXES, LAYERS)
+    return numpy.arange(numpy.prod(shape), dtype="f8").reshape(shape) * (member + 1)
+
+
+@pytest.fixture(name="ensemble_dir")
+def fixture_ensemble_dir(tmp_path):
+    """Results directory of an ensemble of 3 members with small output files."""
+    ensemble_dir = tmp_path / "my-ensemble"
+    for member in range(3):
+        member_dir = ensemble_dir / f"SS-Atlantis_{member:02d}"
+        member_dir.mkdir(parents=True)
+        (member_dir / "atlantis.yaml").write_text(
+            "run id: SS-Atlantis\noutput filename base: outputSalishSea\n"
+        )
+        with netCDF4.Dataset(member_dir / "outputSalishSea.nc", "w") as ds:
+            ds.title = "Salish Sea Atlantis output"
+            ds.createDimension("t", None)
+            ds.createDimension("b", BOXES)
+            ds.createDimension("z", LAYERS)
+            t = ds.createVariable("t", "f8", ("t",))
+            t.units = "seconds since 2007-01-01 00:00:00"
+            t[:] = numpy.arange(N_TIMES) * 86400.0
+            temp = ds.createVariable("Temp", "f8", ("t", "b", "z"))
+            temp.units = "degrees Celsius"
+            temp[:] = _member_values(member)
+            ds.createVariable("nominal_dz", "f8", ("b", "z"))[:] = numpy.full(
+                (BOXES, LAYERS), 2.0 + member
+            )
+    return ensemble_dir
+
+
+class TestParser:
+    """Unit tests for `atlantis ensemble-stats` sub-command command-line parser."""
+
+    def test_get_parser(self, ensemble_stats_cmd):
+        parser = ensemble_stats_cmd.get_parser("atlantis ensemble-stats")
+        assert parser.prog == "atlantis ensemble-stats"
+
+    def test_parsed_args_defaults(self, ensemble_stats_cmd):
+        parser = ensemble_stats_cmd.get_parser("atlantis ensemble-stats")
+        parsed_args = parser.parse_args(["results/my-ensemble/"])
+        assert parsed_args.ensemble_dir == Path("results/my-ensemble/")
+        assert parsed_args.file_name is None
+        assert parsed_args.quantiles == []
+        assert parsed_args.max_workers == 4
+
+    def test_parsed_args_options(self, ensemble_stats_cmd):
+        parser = ensemble_stats_cmd.get_parser("atlantis ensemble-stats")
+        parsed_args = parser.parse_args(
+            [
+                "results/my-ensemble/",
+                "--file",
+                "outputSalishSeaCATCH.nc",
+                "--quantile",
+                "0.1",
+                "--quantile",
+                "0.9",
+                "--max-workers",
+                "8",
+            ]
+        )
+        assert parsed_args.file_name == "outputSalishSeaCATCH.nc"
+        assert parsed_args.quantiles == [0.1, 0.9]
+        assert parsed_args.max_workers == 8
+
+
+class TestTakeAction:
+    """Unit test for `atlantis ensemble-stats` sub-command take_action() method."""
+
+    def test_take_action(self, ensemble_stats_cmd, monkeypatch):
+        stats_args = {}
+
+        def mock_ensemble_stats(ensemble_dir, **kwargs):
+            stats_args.update(ensemble_dir=ensemble_dir, **kwargs)
+
+        monkeypatch.setattr(
+            atlantis_cmd.ensemble_stats, "ensemble_stats", mock_ensemble_stats
+        )
+        parsed_args = SimpleNamespace(
+            ensemble_dir=Path("my-ensemble"),
+            file_name=None,
+            quantiles=[],
+            max_workers=2,
+        )
+
+        ensemble_stats_cmd.take_action(parsed_args)
+
+        assert stats_args == {
+            "ensemble_dir": Path("my-ensemble"),
+            "file_name": None,
+            "quantiles": (0.05, 0.5, 0.95),
+            "max_workers": 2,
+        }
+
+
+class TestEnsembleStats:
+    """Unit tests for ensemble_stats() function."""
+
+    def test_stats_file(self, ensemble_dir):
+        stats_path = atlantis_cmd.ensemble_stats.ensemble_stats(
+            ensemble_dir, max_workers=2
+        )
+
+        assert stats_path == ensemble_dir / "outputSalishSea_ensemble_stats.nc"
+        members = numpy.stack([_member_values(member) for member in range(3)])
+        with netCDF4.Dataset(stats_path) as stats:
+            assert stats.title == "Salish Sea Atlantis output"
+            assert stats.ensemble_members == 3
+            numpy.testing.assert_array_equal(
+                stats.variables["t"][:], numpy.arange(N_TIMES) * 86400.0
+            )
+            numpy.testing.assert_array_equal(
+                stats.variables["quantile"][:], [0.05, 0.5, 0.95]
+            )
+            assert stats.variables["Temp_mean"].units == "degrees Celsius"
+            numpy.testing.assert_allclose(
+                stats.variables["Temp_mean"][:], members.mean(axis=0)
+            )
+            numpy.testing.assert_allclose(
+                stats.variables["Temp_std"][:], members.std(axis=0, ddof=1)
+            )
+            numpy.testing.assert_allclose(
+                stats.variables["Temp_quantiles"][:],
+                numpy.quantile(members, [0.05, 0.5, 0.95], axis=0),
+            )
+            numpy.testing.assert_allclose(
+                stats.variables["nominal_dz_mean"][:], numpy.full((BOXES, LAYERS), 3.0)
+            )
+
+    def test_time_blocks(self, ensemble_dir, monkeypatch):
+        # 2 time records per block of 3 members with exact quantiles
+        monkeypatch.setattr(
+            atlantis_cmd.ensemble_stats,
+            "MAX_BLOCK_BYTES",
+            2 * BOXES * LAYERS * 8 * (4 + 2 * 3),
+        )
+
+        stats_path = atlantis_cmd.ensemble_stats.ensemble_stats(
+            ensemble_dir, quantiles=[0.5], max_workers=1
+        )
+
+        members = numpy.stack([_member_values(member) for member in range(3)])
+        with netCDF4.Dataset(stats_path) as stats:
+            numpy.testing.assert_allclose(
+                stats.variables["Temp_mean"][:], members.mean(axis=0)
+            )
+            numpy.testing.assert_allclose(
+                stats.variables["Temp_quantiles"][0], numpy.median(members, axis=0)
+            )
+
+    def test_fill_values(self, ensemble_dir):
+        for member, member_dir in enumerate(sorted(ensemble_dir.iterdir())):
+            with netCDF4.Dataset(member_dir / "outputSalishSea.nc", "a") as ds:
+                salt = ds.createVariable(
+                    "salt", "i2", ("t", "b", "z"), fill_value=-32767
+                )
+                salt.scale_factor = 0.01
+                salt.add_offset = 30.0
+                values = numpy.ma.masked_array(
+                    numpy.full((N_TIMES, BOXES, LAYERS), 30.0 + member)
+                )
+                # Land box in every member, and a layer missing in one member
+                values[:, 0] = numpy.ma.masked
+                if member == 1:
+                    values[:, 1, 1] = numpy.ma.masked
+                salt[:] = values
+
+        stats_path = atlantis_cmd.ensemble_stats.ensemble_stats(
+            ensemble_dir, max_workers=1
+        )
+
+        with netCDF4.Dataset(stats_path) as stats:
+            mean = stats.variables["salt_mean"][:]
+            std = stats.variables["salt_std"][:]
+            quantiles = stats.variables["salt_quantiles"][:]
+            assert "add_offset" not in stats.variables["salt_std"].ncattrs()
+        expected_mask = numpy.zeros((N_TIMES, BOXES, LAYERS), dtype=bool)
+        expected_mask[:, 0] = True
+        expected_mask[:, 1, 1] = True
+        for stat in (mean, std, quantiles[0], quantiles[-1]):
+            numpy.testing.assert_array_equal(numpy.ma.getmaskarray(stat), expected_mask)
+        numpy.testing.assert_allclose(mean[:, 2], 31.0)
+        numpy.testing.assert_allclose(std[:, 2], 1.0)
+        numpy.testing.assert_allclose(quantiles[1, :, 2], 31.0)
+
+    def test_file_name(self, ensemble_dir):
+        for member_dir in ensemble_dir.iterdir():
+            (member_dir / "atlantis.yaml").unlink()
+
+        stats_path = atlantis_cmd.ensemble_stats.ensemble_stats(
+            ensemble_dir, file_name="outputSalishSea.nc", max_workers=1
+        )
+
+        assert stats_path.exists()
+
+    def test_missing_member_file(self, ensemble_dir, caplog):
+        path = ensemble_dir / "SS-Atlantis_01" / "outputSalishSea.nc"
+        path.unlink()
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.ensemble_stats.ensemble_stats(ensemble_dir)
+
+        assert caplog.messages == [f"{path} not found"]
+
+    def test_member_shape_mismatch(self, ensemble_dir, caplog):
+        path = ensemble_dir / "SS-Atlantis_02" / "outputSalishSea.nc"
+        with netCDF4.Dataset(path, "a") as ds:
+            ds.variables["t"][N_TIMES] = N_TIMES * 86400.0
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.ensemble_stats.ensemble_stats(ensemble_dir)
+
+        assert caplog.messages[0] == (
+            f"Temp dimensions in {path} are ('t', 'b', 'z') (5, 3, 2), "
+            f"but they are ('t', 'b', 'z') (4, 3, 2) in "
+            f"{ensemble_dir / 'SS-Atlantis_00' / 'outputSalishSea.nc'}"
+        )
+        assert not list(ensemble_dir.glob("*.nc"))
+
+    def test_too_few_members(self, tmp_path, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.ensemble_stats.ensemble_stats(tmp_path)
+
+        assert caplog.messages == [
+            f"fewer than 2 ensemble member results directories found in {tmp_path}"
+        ]
+
+    def test_bad_quantile(self, ensemble_dir, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.ensemble_stats.ensemble_stats(ensemble_dir, quantiles=[95])
+
+        assert caplog.messages == ["quantiles must be between 0 and 1: 95"]
+
+
+class TestValuesPerElement:
+    """Unit tests for _values_per_element() function."""
+
+    @pytest.mark.parametrize(
+        "n_members, expected",
+        ((3, 4 + 2 * 3), (100, 4 + 2 * 100), (101, 4 + 2 * 101 + 2 * 5 * 3)),
+    )
+    def test_values_per_element(self, n_members, expected):
+        assert atlantis_cmd.ensemble_stats._values_per_element(n_members, 3) == expected
+
+    def test_bounded_by_exact_quantile_members(self):
+        values_per_element = atlantis_cmd.ensemble_stats._values_per_element
+
+        assert values_per_element(10_000, 3) == values_per_element(101, 3)
+
+
+class TestEnsembleAccumulator:
+    """Unit tests for EnsembleAccumulator class."""
+
+    def test_mean_and_std(self):
+        rng = numpy.random.default_rng(42)
+        members = rng.normal(1e6, 1.0, size=(50, 4, 3))
+        accumulator = atlantis_cmd.ensemble_stats.EnsembleAccumulator((4, 3), [0.5])
+
+        for values in members:
+            accumulator.update(values)
+
+        numpy.testing.assert_allclose(accumulator.mean, members.mean(axis=0))
+        numpy.testing.assert_allclose(
+            accumulator.std, members.std(axis=0, ddof=1), rtol=1e-9
+        )
+
+    @pytest.mark.parametrize("n_members", (5, 6, 10, 21, 50))
+    def test_exact_quantiles(self, n_members):
+        rng = numpy.random.default_rng(n_members)
+        members = rng.normal(0.0, 1.0, size=(n_members, 4, 3))
+        quantiles = [0.05, 0.25, 0.5, 0.95]
+        accumulator = atlantis_cmd.ensemble_stats.EnsembleAccumulator((4, 3), quantiles)
+
+        for values in members:
+            accumulator.update(values)
+
+        numpy.testing.assert_allclose(
+            accumulator.quantiles(), numpy.quantile(members, quantiles, axis=0)
+        )
+
+    def test_p2_quantiles(self):
+        rng = numpy.random.default_rng(42)
+        members = rng.normal(0.0, 1.0, size=(2000, 10))
+        quantiles = [0.05, 0.5, 0.95]
+        accumulator = atlantis_cmd.ensemble_stats.EnsembleAccumulator((10,), quantiles)
+
+        for values in members:
+            accumulator.update(values)
+
+        estimates = accumulator.quantiles()
+        assert estimates.shape == (3, 10)
+        numpy.testing.assert_allclose(
+            estimates, numpy.quantile(members, quantiles, axis=0), atol=0.1
+        )
+
+    def test_p2_min_and_max(self):
+        rng = numpy.random.default_rng(42)
+        members = rng.normal(0.0, 1.0, size=(500, 10))
+        accumulator = atlantis_cmd.ensemble_stats.EnsembleAccumulator((10,), [0.0, 1.0])
+
+        for values in members:
+            accumulator.update(values)
+
+        numpy.testing.assert_array_equal(
+            accumulator.quantiles(), [members.min(axis=0), members.max(axis=0)]
+        )
+
+    def test_exact_quantiles_of_few_members(self):
+        members = numpy.array([[1.0, 4.0], [3.0, 2.0], [2.0, 3.0]])
+        accumulator = atlantis_cmd.ensemble_stats.EnsembleAccumulator((2,), [0.5])
+
+        for values in members:
+            accumulator.update(values)
+
+        numpy.testing.assert_array_equal(accumulator.quantiles(), [[2.0, 3.0]])
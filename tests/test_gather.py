@@ -0,0 +1,380 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""AtlantisCmd gather sub-command plug-in unit tests."""
+
+import errno
+import logging
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import atlantis_cmd.gather
+import atlantis_cmd.main
+
+
+@pytest.fixture
+def gather_cmd():
+    return atlantis_cmd.gather.Gather(atlantis_cmd.main.AtlantisCmdApp, [])
+
+
+@pytest.fixture(name="run_dir")
+def fixture_run_dir(tmp_path):
+    run_dir = tmp_path / "tmp_run_dir"
+    run_dir.mkdir()
+    (run_dir / "atlantis.yaml").write_text("run id: SS-Atlantis\n")
+    (run_dir / "biology.prm").write_text("flag_fish 1\n")
+    (run_dir / "outputSalishSea.nc").write_bytes(os.urandom(3 * 1024))
+    forcing = tmp_path / "SS_hydro.nc"
+    forcing.write_bytes(b"")
+    (run_dir / "SS_hydro.nc").symlink_to(forcing)
+    return run_dir
+
+
+@pytest.fixture
+def mock_cross_filesystem(run_dir, monkeypatch):
+    """Make renames out of the temporary run directory fail like they do between
+    filesystems.
+    """
+    os_replace = os.replace
+
+    def mock_replace(src, dest):
+        if Path(src).parent == run_dir:
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        os_replace(src, dest)
+
+    monkeypatch.setattr(atlantis_cmd.gather.os, "replace", mock_replace)
+
+
+class TestParser:
+    """Unit tests for `atlantis gather` sub-command command-line parser."""
+
+    def test_get_parser(self, gather_cmd):
+        parser = gather_cmd.get_parser("atlantis gather")
+        assert parser.prog == "atlantis gather"
+
+    def test_results_dir_argument(self, gather_cmd):
+        parser = gather_cmd.get_parser("atlantis gather")
+        assert parser._actions[1].dest == "results_dir"
+        assert parser._actions[1].metavar == "RESULTS_DIR"
+        assert parser._actions[1].type == Path
+        assert parser._actions[1].help
+
+    def test_max_workers_option(self, gather_cmd):
+        parser = gather_cmd.get_parser("atlantis gather")
+        assert parser._actions[2].dest == "max_workers"
+        assert parser._actions[2].option_strings == ["--max-workers"]
+        assert parser._actions[2].type == int
+        assert parser._actions[2].default == 4
+        assert parser._actions[2].help
+
+    def test_repack_option(self, gather_cmd):
+        parser = gather_cmd.get_parser("atlantis gather")
+        assert parser._actions[3].dest == "repack_globs"
+        assert parser._actions[3].option_strings == ["--repack"]
+        assert parser._actions[3].metavar == "GLOB"
+        assert parser._actions[3].default == []
+        assert parser._actions[3].help
+
+    def test_compression_option(self, gather_cmd):
+        parser = gather_cmd.get_parser("atlantis gather")
+        assert parser._actions[4].dest == "compression"
+        assert parser._actions[4].option_strings == ["--compression"]
+        assert parser._actions[4].choices == ("zlib", "zstd")
+        assert parser._actions[4].default == "zlib"
+        assert parser._actions[4].help
+
+    def test_compression_level_option(self, gather_cmd):
+        parser = gather_cmd.get_parser("atlantis gather")
+        assert parser._actions[5].dest == "complevel"
+        assert parser._actions[5].option_strings == ["--compression-level"]
+        assert parser._actions[5].type == int
+        assert parser._actions[5].default == 4
+        assert parser._actions[5].help
+
+    def test_time_chunk_option(self, gather_cmd):
+        parser = gather_cmd.get_parser("atlantis gather")
+        assert parser._actions[6].dest == "time_chunk"
+        assert parser._actions[6].option_strings == ["--time-chunk"]
+        assert parser._actions[6].type == int
+        assert parser._actions[6].default == 256
+        assert parser._actions[6].help
+
+    def test_summarize_option(self, gather_cmd):
+        parser = gather_cmd.get_parser("atlantis gather")
+        assert parser._actions[7].dest == "summarize"
+        assert parser._actions[7].option_strings == ["--summarize"]
+        assert parser._actions[7].const is True
+        assert parser._actions[7].default is False
+        assert parser._actions[7].help
+
+    def test_parsed_args_defaults(self, gather_cmd):
+        parser = gather_cmd.get_parser("atlantis gather")
+        parsed_args = parser.parse_args(["results/foo/"])
+        assert parsed_args.results_dir == Path("results/foo/")
+        assert parsed_args.max_workers == 4
+        assert parsed_args.repack_globs == []
+        assert parsed_args.compression == "zlib"
+        assert parsed_args.complevel == 4
+        assert parsed_args.time_chunk == 256
+        assert parsed_args.summarize is False
+
+    def test_parsed_args_repack_options(self, gather_cmd):
+        parser = gather_cmd.get_parser("atlantis gather")
+        parsed_args = parser.parse_args(
+            ["results/foo/", "--repack", "output*.nc", "--repack", "other.nc"]
+        )
+        assert parsed_args.repack_globs == ["output*.nc", "other.nc"]
+
+
+class TestTakeAction:
+    """Unit test for `atlantis gather` sub-command take_action() method."""
+
+    def test_take_action(self, gather_cmd, monkeypatch):
+        gather_args = {}
+
+        def mock_gather(results_dir, **kwargs):
+            gather_args.update(results_dir=results_dir, **kwargs)
+
+        monkeypatch.setattr(atlantis_cmd.gather, "gather", mock_gather)
+        parsed_args = SimpleNamespace(
+            results_dir=Path("results dir"),
+            max_workers=2,
+            repack_globs=["outputSalishSea*.nc"],
+            compression="zstd",
+            complevel=3,
+            time_chunk=365,
+            summarize=True,
+        )
+
+        gather_cmd.take_action(parsed_args)
+
+        assert gather_args == {
+            "results_dir": Path("results dir"),
+            "max_workers": 2,
+            "repack_globs": ["outputSalishSea*.nc"],
+            "compression": "zstd",
+            "complevel": 3,
+            "time_chunk": 365,
+            "summarize": True,
+        }
+
+
+class TestGather:
+    """Unit tests for gather() function."""
+
+    def test_rename(self, run_dir, tmp_path):
+        results_dir = tmp_path / "results_dir"
+
+        methods = atlantis_cmd.gather.gather(results_dir, run_dir=run_dir)
+
+        assert methods == {"rename": 3, "copy": 0}
+        assert sorted(path.name for path in results_dir.iterdir()) == [
+            "atlantis.yaml",
+            "biology.prm",
+            "outputSalishSea.nc",
+        ]
+        assert not any(run_dir.iterdir())
+
+    def test_symlinks_deleted(self, run_dir, tmp_path):
+        atlantis_cmd.gather.gather(tmp_path / "results_dir", run_dir=run_dir)
+
+        assert not (tmp_path / "results_dir" / "SS_hydro.nc").exists()
+        assert (tmp_path / "SS_hydro.nc").exists()
+
+    def test_results_dir_created(self, run_dir, tmp_path):
+        results_dir = tmp_path / "results" / "SS-Atlantis"
+
+        atlantis_cmd.gather.gather(results_dir, run_dir=run_dir)
+
+        assert results_dir.is_dir()
+
+    def test_cwd_is_default_run_dir(self, run_dir, tmp_path, monkeypatch):
+        monkeypatch.chdir(run_dir)
+
+        atlantis_cmd.gather.gather(tmp_path / "results_dir")
+
+        assert (tmp_path / "results_dir" / "biology.prm").exists()
+
+    def test_cross_filesystem_copy(
+        self, run_dir, mock_cross_filesystem, tmp_path, caplog
+    ):
+        results_dir = tmp_path / "results_dir"
+        contents = (run_dir / "outputSalishSea.nc").read_bytes()
+        mtime = (run_dir / "outputSalishSea.nc").stat().st_mtime
+        caplog.set_level(logging.INFO)
+
+        methods = atlantis_cmd.gather.gather(results_dir, run_dir=run_dir)
+
+        assert methods == {"rename": 0, "copy": 3}
+        assert (results_dir / "outputSalishSea.nc").read_bytes() == contents
+        assert (results_dir / "outputSalishSea.nc").stat().st_mtime == mtime
+        assert not any(run_dir.iterdir())
+        assert not list(results_dir.glob(".*.gather-tmp"))
+        assert caplog.messages[-1].startswith("gathered 3 files (0.0 MiB) in ")
+        assert caplog.messages[-1].endswith("0 renamed, 3 copied")
+
+    def test_checksum_mismatch(
+        self, run_dir, mock_cross_filesystem, tmp_path, caplog, monkeypatch
+    ):
+        def mock_sha256(path):
+            return "0" * 64
+
+        monkeypatch.setattr(atlantis_cmd.gather, "_sha256", mock_sha256)
+        results_dir = tmp_path / "results_dir"
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit) as exc_info:
+            atlantis_cmd.gather.gather(results_dir, run_dir=run_dir)
+
+        assert exc_info.value.code == 2
+        assert caplog.messages[-1] == f"3 files were not moved and remain in {run_dir}"
+        assert (run_dir / "outputSalishSea.nc").exists()
+        assert not any(results_dir.iterdir())
+
+    def test_cross_filesystem_dir_copy(self, run_dir, mock_cross_filesystem, tmp_path):
+        (run_dir / "restart").mkdir()
+        (run_dir / "restart" / "restart.nc").write_bytes(b"restart")
+        results_dir = tmp_path / "results_dir"
+
+        methods = atlantis_cmd.gather.gather(results_dir, run_dir=run_dir)
+
+        assert methods == {"rename": 0, "copy": 4}
+        assert (results_dir / "restart" / "restart.nc").read_bytes() == b"restart"
+        assert not list((results_dir / "restart").glob(".*.gather-tmp"))
+        assert not any(run_dir.iterdir())
+
+    def test_dir_checksum_mismatch(
+        self, run_dir, mock_cross_filesystem, tmp_path, caplog, monkeypatch
+    ):
+        (run_dir / "restart").mkdir()
+        (run_dir / "restart" / "restart.nc").write_bytes(b"restart")
+        sha256 = atlantis_cmd.gather._sha256
+
+        def mock_sha256(path):
+            return "0" * 64 if path.parent.name == "restart" else sha256(path)
+
+        monkeypatch.setattr(atlantis_cmd.gather, "_sha256", mock_sha256)
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.gather.gather(tmp_path / "results_dir", run_dir=run_dir)
+
+        assert caplog.messages[-1] == f"1 files were not moved and remain in {run_dir}"
+        assert (run_dir / "restart" / "restart.nc").read_bytes() == b"restart"
+
+    def test_repack(self, run_dir, tmp_path, monkeypatch):
+        repack_args = {}
+
+        def mock_repack_files(paths, **kwargs):
+            repack_args.update(paths=paths, **kwargs)
+            return []
+
+        monkeypatch.setattr(
+            atlantis_cmd.gather.repack, "repack_files", mock_repack_files
+        )
+        results_dir = tmp_path / "results_dir"
+        results_dir.mkdir()
+        (results_dir / "outputSalishSeaCATCH.nc").write_bytes(b"")
+
+        atlantis_cmd.gather.gather(
+            results_dir,
+            run_dir=run_dir,
+            repack_globs=["outputSalishSea*.nc", "*.nc"],
+            compression="zstd",
+        )
+
+        assert repack_args["paths"] == [
+            results_dir / "outputSalishSea.nc",
+            results_dir / "outputSalishSeaCATCH.nc",
+        ]
+        assert repack_args["compression"] == "zstd"
+
+    def test_repack_failure(self, run_dir, tmp_path, caplog, monkeypatch):
+        def mock_repack_files(paths, **kwargs):
+            return paths
+
+        monkeypatch.setattr(
+            atlantis_cmd.gather.repack, "repack_files", mock_repack_files
+        )
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.gather.gather(
+                tmp_path / "results_dir", run_dir=run_dir, repack_globs=["*.nc"]
+            )
+
+        assert caplog.messages[-1] == "1 NetCDF files were not re-packed"
+
+    def test_summarize(self, run_dir, tmp_path, monkeypatch):
+        summarized = []
+
+        def mock_summarize_biomass(results_dir):
+            summarized.append(results_dir)
+
+        monkeypatch.setattr(
+            atlantis_cmd.gather, "summarize_biomass", mock_summarize_biomass
+        )
+        results_dir = tmp_path / "results_dir"
+
+        atlantis_cmd.gather.gather(results_dir, run_dir=run_dir, summarize=True)
+
+        assert summarized == [results_dir]
+
+    def test_summarize_failure(self, run_dir, tmp_path, caplog, monkeypatch):
+        def mock_summarize_biomass(results_dir):
+            raise SystemExit(2)
+
+        monkeypatch.setattr(
+            atlantis_cmd.gather, "summarize_biomass", mock_summarize_biomass
+        )
+        results_dir = tmp_path / "results_dir"
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.gather.gather(results_dir, run_dir=run_dir, summarize=True)
+
+        assert (results_dir / "outputSalishSea.nc").exists()
+        assert caplog.messages[-1] == f"biomass was not summarized in {results_dir}"
+
+    def test_bad_max_workers(self, run_dir, tmp_path, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.gather.gather(
+                tmp_path / "results_dir", max_workers=0, run_dir=run_dir
+            )
+
+        assert caplog.messages[0] == "--max-workers must be at least 1, not 0"
+
+
+class TestVerifiedCopy:
+    """Unit tests for _verified_copy() function."""
+
+    def test_large_file_chunks(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(atlantis_cmd.gather, "COPY_CHUNK_SIZE", 1000)
+        src = tmp_path / "outputSalishSea.nc"
+        src.write_bytes(os.urandom(10_500))
+        dest = tmp_path / "results" / "outputSalishSea.nc"
+        dest.parent.mkdir()
+
+        atlantis_cmd.gather._verified_copy(src, dest)
+
+        assert dest.read_bytes() == src.read_bytes()
@@ -0,0 +1,54 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Unit tests for deferred import function."""
+
+import subprocess
+import sys
+import textwrap
+
+from atlantis_cmd.lazy_import import lazy_import
+
+
+class TestLazyImport:
+    """Unit tests for lazy_import() function."""
+
+    def test_import_is_deferred(self):
+        code = textwrap.dedent("""\
+            import sys
+            from atlantis_cmd.lazy_import import lazy_import
+            xml = lazy_import("xml.dom.minidom")
+            print("xml.dom.minidom" in sys.modules)
+            xml.dom.minidom.parseString("<a/>")
+            print("xml.dom.minidom" in sys.modules)
+            """)
+        proc = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        assert proc.stdout.split() == ["False", "True"]
+
+    def test_top_level_module(self):
+        json = lazy_import("json")
+        assert json.dumps({"a": 1}) == '{"a": 1}'
+
+    def test_dotted_name(self):
+        os = lazy_import("os.path")
+        assert os.path.join("a", "b") == "a/b"
+
+    def test_repr(self):
+        assert repr(lazy_import("json")) == "<lazily imported module 'json'>"
@@ -0,0 +1,117 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""AtlantisCmd application unit tests and startup time budget test."""
+
+import subprocess
+import sys
+
+import pytest
+
+import atlantis_cmd.__about__
+import atlantis_cmd.main
+
+# Modules that are imported when the atlantis command starts;
+# i.e. the application module and all of the sub-command plug-in modules
+STARTUP_MODULES = (
+    "atlantis_cmd.compare",
+    "atlantis_cmd.ensemble_stats",
+    "atlantis_cmd.gather",
+    "atlantis_cmd.main",
+    "atlantis_cmd.monitor",
+    "atlantis_cmd.run",
+    "atlantis_cmd.run_queue",
+    "atlantis_cmd.summarize",
+    "atlantis_cmd.supervise",
+    "atlantis_cmd.sweep",
+)
+
+# Dependencies that are slow to import, and must only be imported when
+# a sub-command that needs them executes
+DEFERRED_MODULES = (
+    "arrow",
+    "cookiecutter",
+    "jinja2",
+    "nemo_cmd",
+    "netCDF4",
+    "numpy",
+    "pyarrow",
+    "yaml",
+)
+
+# Budget for the import time of the startup modules, in microseconds;
+# generous compared to the ~70 ms it takes on a development machine,
+# but much less than importing the deferred modules adds to it
+STARTUP_IMPORT_TIME_BUDGET = 300_000
+
+
+def _import_startup_modules(*python_opts):
+    return subprocess.run(
+        [
+            sys.executable,
+            *python_opts,
+            "-c",
+            f"import sys, {', '.join(STARTUP_MODULES)}; print(*sys.modules)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+class TestAtlantisCmdApp:
+    """Unit tests for AtlantisCmdApp class."""
+
+    def test_version(self):
+        app = atlantis_cmd.main.AtlantisCmdApp()
+        version_action = next(
+            action
+            for action in app.parser._actions
+            if "--version" in action.option_strings
+        )
+        assert version_action.version.endswith(atlantis_cmd.__about__.__version__)
+
+
+class TestStartup:
+    """Startup time tests for the atlantis command."""
+
+    def test_deferred_modules_not_imported(self):
+        proc = _import_startup_modules()
+
+        imported = {module.partition(".")[0] for module in proc.stdout.split()}
+        assert not imported & set(DEFERRED_MODULES)
+
+    def test_import_time_budget(self):
+        # Best of 3 to reduce the influence of cold disk caches and noisy neighbours
+        import_times = []
+        for _ in range(3):
+            proc = _import_startup_modules("-X", "importtime")
+            import_times.append(
+                sum(
+                    int(line.split("|")[1])
+                    for line in proc.stderr.splitlines()
+                    # Top-level imports of the startup modules only
+                    if line.startswith("import time:")
+                    and line.split("|")[2].rstrip()
+                    in {f" {module}" for module in STARTUP_MODULES}
+                )
+            )
+        assert min(import_times) < STARTUP_IMPORT_TIME_BUDGET, (
+            f"atlantis startup imports took {min(import_times) / 1e3:.0f} ms; "
+            f"budget is {STARTUP_IMPORT_TIME_BUDGET / 1e3:.0f} ms"
+        )
@@ -0,0 +1,201 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Unit tests for input file manifest."""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import pytest
+
+import atlantis_cmd.run
+from atlantis_cmd import manifest
+
+
+@pytest.fixture(name="inputs")
+def fixture_inputs(tmp_path):
+    model_config = tmp_path / "model_config"
+    model_config.mkdir()
+    inputs = {}
+    for name, contents in (
+        ("init_conditions.nc", b"initial conditions"),
+        ("biology.prm", b"biology parameters"),
+        ("SS_hydro.nc", b""),
+    ):
+        inputs[name] = model_config / name
+        inputs[name].write_bytes(contents)
+    return inputs
+
+
+@pytest.fixture(name="tmp_run_dir")
+def fixture_tmp_run_dir(tmp_path):
+    tmp_run_dir = tmp_path / "tmp_run_dir"
+    tmp_run_dir.mkdir()
+    return tmp_run_dir
+
+
+class TestStagedInputs:
+    """Unit test for staged_inputs() function."""
+
+    def test_staged_inputs(self, run_desc, tmp_path):
+        context = atlantis_cmd.run._calc_cookiecutter_context(
+            run_desc,
+            run_desc["run id"],
+            tmp_path / "atlantis.yaml",
+            tmp_path / "tmp_run_dir",
+            tmp_path / "results_dir",
+        )
+
+        inputs = manifest.staged_inputs(context)
+
+        assert inputs["atlantis.yaml"] == Path(context["run_desc_yaml"])
+        assert inputs["init_conditions.nc"] == Path(context["init_conditions"])
+        assert inputs["groups.csv"] == Path(context["groups"])
+        assert inputs["biology.prm"] == Path(context["parameters"]["biology"])
+        for link_name, target in context["forcing"].items():
+            assert inputs[link_name] == Path(target)
+
+
+class TestWriteManifest:
+    """Unit tests for write_manifest() function."""
+
+    def test_manifest(self, inputs, tmp_run_dir):
+        manifest_file = manifest.write_manifest(inputs, tmp_run_dir)
+
+        assert manifest_file == tmp_run_dir / manifest.MANIFEST_FILE
+        contents = json.loads(manifest_file.read_text())
+        assert contents["hash algorithm"] == "sha256"
+        files = {file["name"]: file for file in contents["files"]}
+        assert files.keys() == inputs.keys()
+        for name, path in inputs.items():
+            assert files[name]["path"] == os.fspath(path)
+            assert files[name]["bytes"] == path.stat().st_size
+            assert (
+                files[name]["sha256"] == hashlib.sha256(path.read_bytes()).hexdigest()
+            )
+
+    def test_cached_hashes_not_recalculated(
+        self, inputs, tmp_run_dir, tmp_path, monkeypatch
+    ):
+        cache_path = tmp_path / "hashes.sqlite"
+        manifest.write_manifest(inputs, tmp_run_dir, cache_path)
+        hashed = []
+
+        def mock_hash_file(path):
+            hashed.append(path)
+            return "hash"
+
+        monkeypatch.setattr(manifest, "hash_file", mock_hash_file)
+
+        manifest.write_manifest(inputs, tmp_run_dir, cache_path)
+
+        assert hashed == []
+
+    def test_changed_input_rehashed(self, inputs, tmp_run_dir, tmp_path):
+        cache_path = tmp_path / "hashes.sqlite"
+        manifest.write_manifest(inputs, tmp_run_dir, cache_path)
+        inputs["biology.prm"].write_bytes(b"tuned biology parameters")
+
+        manifest_file = manifest.write_manifest(inputs, tmp_run_dir, cache_path)
+
+        files = {
+            file["name"]: file
+            for file in json.loads(manifest_file.read_text())["files"]
+        }
+        assert (
+            files["biology.prm"]["sha256"]
+            == hashlib.sha256(b"tuned biology parameters").hexdigest()
+        )
+
+    def test_unusable_cache(self, inputs, tmp_run_dir, tmp_path, caplog):
+        not_a_dir = tmp_path / "not_a_dir"
+        not_a_dir.write_text("")
+        caplog.set_level(logging.WARNING)
+
+        manifest_file = manifest.write_manifest(
+            inputs, tmp_run_dir, not_a_dir / "hashes.sqlite"
+        )
+
+        assert manifest_file.exists()
+        assert caplog.records[0].levelname == "WARNING"
+        assert caplog.messages[0].startswith("failed to open input file hash cache: ")
+
+
+class TestUpdateManifest:
+    """Unit tests for update_manifest() function."""
+
+    def test_modified_staged_file(self, inputs, tmp_run_dir, tmp_path):
+        manifest.write_manifest(inputs, tmp_run_dir, tmp_path / "hashes.sqlite")
+        (tmp_run_dir / "biology.prm").write_bytes(b"swept biology parameters")
+
+        manifest_file = manifest.update_manifest(tmp_run_dir, ["biology.prm"])
+
+        files = {
+            file["name"]: file
+            for file in json.loads(manifest_file.read_text())["files"]
+        }
+        assert list(files) == list(inputs)
+        assert files["biology.prm"]["path"] == os.fspath(tmp_run_dir / "biology.prm")
+        assert files["biology.prm"]["bytes"] == len(b"swept biology parameters")
+        assert (
+            files["biology.prm"]["sha256"]
+            == hashlib.sha256(b"swept biology parameters").hexdigest()
+        )
+        assert files["init_conditions.nc"]["path"] == os.fspath(
+            inputs["init_conditions.nc"]
+        )
+
+
+class TestHashFile:
+    """Unit tests for hash_file() function."""
+
+    def test_chunks(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(manifest, "HASH_CHUNK_BYTES", 7)
+        path = tmp_path / "SS_init.nc"
+        path.write_bytes(b"initial conditions" * 10)
+
+        assert (
+            manifest.hash_file(path)
+            == hashlib.sha256(b"initial conditions" * 10).hexdigest()
+        )
+
+    def test_empty_file(self, tmp_path):
+        path = tmp_path / "SS_hydro.nc"
+        path.write_bytes(b"")
+
+        assert manifest.hash_file(path) == hashlib.sha256(b"").hexdigest()
+
+
+class TestHashCache:
+    """Unit tests for HashCache class."""
+
+    def test_least_recently_used_evicted(self, tmp_path):
+        cache_path = tmp_path / "hashes.sqlite"
+        with manifest.HashCache(cache_path, max_entries=2) as cache:
+            cache.put_many({"1:1:1:1": "a"})
+            cache.put_many({"1:2:1:1": "b"})
+            cache.get_many(["1:1:1:1"])
+            cache.put_many({"1:3:1:1": "c"})
+
+        with manifest.HashCache(cache_path) as cache:
+            cached = cache.get_many(["1:1:1:1", "1:2:1:1", "1:3:1:1"])
+
+        assert cached == {"1:1:1:1": "a", "1:3:1:1": "c"}
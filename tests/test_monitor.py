@@ -0,0 +1,399 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""AtlantisCmd monitor sub-command plug-in unit tests."""
+
+import json
+import logging
+import os
+import re
+import textwrap
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import atlantis_cmd.main
+import atlantis_cmd.monitor
+
+
+@pytest.fixture
+def monitor_cmd():
+    return atlantis_cmd.monitor.Monitor(atlantis_cmd.main.AtlantisCmdApp, [])
+
+
+@pytest.fixture
+def time_re():
+    return re.compile(atlantis_cmd.monitor.DEFAULT_TIME_PATTERN)
+
+
+def _write_resources(results_dir, *exit_codes):
+    """Write resource usage records of the steps of a run script."""
+    steps = [
+        {"step": step, "exit code": exit_code}
+        for step, exit_code in zip(("atlantis", "gather"), exit_codes)
+    ]
+    (results_dir / "resources.json").write_text(json.dumps({"steps": steps}))
+
+
+@pytest.fixture(name="results_dir")
+def fixture_results_dir(tmp_path):
+    """Results directory of a run that started 2 hours ago,
+    and has a 100 day stop time in run.prm in its working directory.
+    """
+    work_dir = tmp_path / "tmp_run_dir"
+    work_dir.mkdir()
+    (work_dir / "run.prm").write_text("dt 12 hour\ntstop 100 day\n")
+    results_dir = tmp_path / "results_dir"
+    results_dir.mkdir()
+    start = time.strftime(
+        "%a %b %d %H:%M:%S UTC %Y", time.localtime(time.time() - 7200)
+    )
+    (results_dir / "stdout").write_text(textwrap.dedent(f"""\
+        working dir: {work_dir}
+        Starting run at {start}
+        Time: 0.000000 days
+        Time: 10.000000 days
+        """))
+    return results_dir
+
+
+class TestParser:
+    """Unit tests for `atlantis monitor` sub-command command-line parser."""
+
+    def test_get_parser(self, monitor_cmd):
+        parser = monitor_cmd.get_parser("atlantis monitor")
+        assert parser.prog == "atlantis monitor"
+
+    def test_results_dirs_argument(self, monitor_cmd):
+        parser = monitor_cmd.get_parser("atlantis monitor")
+        assert parser._actions[1].dest == "results_dirs"
+        assert parser._actions[1].metavar == "RESULTS_DIR"
+        assert parser._actions[1].nargs == "+"
+        assert parser._actions[1].type == Path
+        assert parser._actions[1].help
+
+    def test_interval_option(self, monitor_cmd):
+        parser = monitor_cmd.get_parser("atlantis monitor")
+        assert parser._actions[2].dest == "interval"
+        assert parser._actions[2].option_strings == ["--interval"]
+        assert parser._actions[2].type == float
+        assert parser._actions[2].default == 60
+        assert parser._actions[2].help
+
+    def test_once_option(self, monitor_cmd):
+        parser = monitor_cmd.get_parser("atlantis monitor")
+        assert parser._actions[3].dest == "once"
+        assert parser._actions[3].option_strings == ["--once"]
+        assert parser._actions[3].const is True
+        assert parser._actions[3].default is False
+        assert parser._actions[3].help
+
+    def test_time_pattern_option(self, monitor_cmd):
+        parser = monitor_cmd.get_parser("atlantis monitor")
+        assert parser._actions[4].dest == "time_pattern"
+        assert parser._actions[4].option_strings == ["--time-pattern"]
+        assert parser._actions[4].default == atlantis_cmd.monitor.DEFAULT_TIME_PATTERN
+        assert parser._actions[4].help
+
+    def test_parsed_args(self, monitor_cmd):
+        parser = monitor_cmd.get_parser("atlantis monitor")
+        parsed_args = parser.parse_args(["results/a/", "results/b/", "--once"])
+        assert parsed_args.results_dirs == [Path("results/a/"), Path("results/b/")]
+        assert parsed_args.once is True
+
+
+class TestTakeAction:
+    """Unit test for `atlantis monitor` sub-command take_action() method."""
+
+    def test_take_action(self, monitor_cmd, monkeypatch):
+        monitor_args = {}
+
+        def mock_monitor(results_dirs, **kwargs):
+            monitor_args.update(results_dirs=results_dirs, **kwargs)
+
+        monkeypatch.setattr(atlantis_cmd.monitor, "monitor", mock_monitor)
+        parsed_args = SimpleNamespace(
+            results_dirs=[Path("results dir")],
+            interval=5,
+            once=True,
+            time_pattern="t=(?P<days>\\d+)",
+        )
+
+        monitor_cmd.take_action(parsed_args)
+
+        assert monitor_args == {
+            "results_dirs": [Path("results dir")],
+            "interval": 5,
+            "once": True,
+            "time_pattern": "t=(?P<days>\\d+)",
+        }
+
+
+class TestMonitor:
+    """Unit tests for monitor() function."""
+
+    def test_once(self, results_dir, caplog):
+        caplog.set_level(logging.INFO)
+
+        atlantis_cmd.monitor.monitor([results_dir], once=True)
+
+        assert caplog.messages[0].startswith(
+            f"{results_dir}: day 10.0 of 100 (10.0%), 5.00 sim days/hour, ETA 18h"
+        )
+
+    def test_stragglers_first(self, results_dir, tmp_path, caplog):
+        not_started = tmp_path / "not_started"
+        not_started.mkdir()
+        finished = tmp_path / "finished"
+        finished.mkdir()
+        (finished / "stdout").write_text(
+            "working dir: /tmp\nStarting run at x\nEnded run at y\n"
+        )
+        caplog.set_level(logging.INFO)
+
+        atlantis_cmd.monitor.monitor([finished, results_dir, not_started], once=True)
+
+        assert caplog.messages[0] == f"{not_started}: not started"
+        assert caplog.messages[1].startswith(f"{results_dir}: day 10.0")
+        assert caplog.messages[2] == f"{finished}: finished"
+
+    def test_returns_when_all_finished(self, results_dir, monkeypatch):
+        with (results_dir / "stdout").open("a") as f:
+            f.write("Ended run at Wed Aug 18 15:34:16 PDT 2021\n")
+
+        def mock_sleep(seconds):
+            raise AssertionError("should not sleep")
+
+        monkeypatch.setattr(atlantis_cmd.monitor.time, "sleep", mock_sleep)
+
+        atlantis_cmd.monitor.monitor([results_dir], interval=1)
+
+    def test_crashed_run(self, results_dir, caplog, monkeypatch):
+        # The run script stops at the failed step, so the log stops mid-run
+        _write_resources(results_dir, 139)
+
+        def mock_sleep(seconds):
+            raise AssertionError("should not sleep")
+
+        monkeypatch.setattr(atlantis_cmd.monitor.time, "sleep", mock_sleep)
+        caplog.set_level(logging.INFO)
+
+        with pytest.raises(SystemExit) as exc_info:
+            atlantis_cmd.monitor.monitor([results_dir], interval=1)
+
+        assert exc_info.value.code == 1
+        assert caplog.messages == [
+            f"{results_dir}: failed at day 10.0; atlantis step exited with code 139",
+            "1 of 1 runs failed",
+        ]
+
+    def test_waits_for_running_runs_when_one_failed(
+        self, results_dir, tmp_path, caplog, monkeypatch
+    ):
+        crashed = tmp_path / "crashed"
+        crashed.mkdir()
+        (crashed / "stdout").write_text("working dir: /tmp\nStarting run at x\n")
+        _write_resources(crashed, 1)
+        sleeps = []
+
+        def mock_sleep(seconds):
+            sleeps.append(seconds)
+            with (results_dir / "stdout").open("a") as f:
+                f.write("Ended run at Wed Aug 18 15:34:16 PDT 2021\n")
+
+        monkeypatch.setattr(atlantis_cmd.monitor.time, "sleep", mock_sleep)
+        caplog.set_level(logging.INFO)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.monitor.monitor([crashed, results_dir], interval=1)
+
+        assert sleeps == [1]
+        assert caplog.messages[0].startswith(f"{results_dir}: day 10.0")
+        assert caplog.messages[2:] == [
+            f"{crashed}: failed; atlantis step exited with code 1",
+            f"{results_dir}: finished",
+            "1 of 2 runs failed",
+        ]
+
+    def test_time_pattern_without_days_group(self, results_dir, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.monitor.monitor(
+                [results_dir], once=True, time_pattern="t=\\d+"
+            )
+
+        assert caplog.messages[0] == "--time-pattern must have a days group"
+
+
+class TestLogFollower:
+    """Unit tests for LogFollower class."""
+
+    def test_read_new_lines(self, tmp_path):
+        log = tmp_path / "stdout"
+        log.write_text("line 1\nline 2\npart")
+        follower = atlantis_cmd.monitor.LogFollower(log)
+
+        assert follower.read_new_lines() == ["line 1", "line 2"]
+        with log.open("a") as f:
+            f.write("ial line 3\nline 4\n")
+        assert follower.read_new_lines() == ["partial line 3", "line 4"]
+        assert follower.read_new_lines() == []
+        assert follower.offset == log.stat().st_size
+
+    def test_does_not_reread(self, tmp_path, monkeypatch):
+        log = tmp_path / "stdout"
+        log.write_text("line 1\n" * 1000)
+        follower = atlantis_cmd.monitor.LogFollower(log)
+        follower.read_new_lines()
+        with log.open("a") as f:
+            f.write("line 2\n")
+        reads = []
+        path_open = Path.open
+
+        def mock_open(self, *args, **kwargs):
+            f = path_open(self, *args, **kwargs)
+            f_read = f.read
+
+            def read(size=-1):
+                data = f_read(size)
+                reads.append(len(data))
+                return data
+
+            f.read = read
+            return f
+
+        monkeypatch.setattr(Path, "open", mock_open)
+
+        assert follower.read_new_lines() == ["line 2"]
+        assert sum(reads) == len("line 2\n")
+
+    def test_truncated(self, tmp_path):
+        log = tmp_path / "stdout"
+        log.write_text("line 1\nline 2\n")
+        follower = atlantis_cmd.monitor.LogFollower(log)
+        follower.read_new_lines()
+        log.write_text("new\n")
+
+        assert follower.read_new_lines() == ["new"]
+
+    def test_missing(self, tmp_path):
+        follower = atlantis_cmd.monitor.LogFollower(tmp_path / "stdout")
+        assert follower.read_new_lines() == []
+
+    def test_skip_to_end(self, tmp_path):
+        log = tmp_path / "stdout"
+        log.write_text("".join(f"line {i}\n" for i in range(100)))
+        follower = atlantis_cmd.monitor.LogFollower(log)
+
+        lines = follower.skip_to_end(20)
+
+        assert lines == ["line 98", "line 99"]
+        assert follower.offset == log.stat().st_size
+
+
+class TestRunProgress:
+    """Unit tests for RunProgress class."""
+
+    def test_work_dir_and_tstop(self, results_dir, time_re):
+        run = atlantis_cmd.monitor.RunProgress(results_dir, time_re)
+
+        run.update()
+
+        assert run.work_dir == results_dir.parent / "tmp_run_dir"
+        assert run.tstop_days == 100
+
+    def test_incremental_update(self, results_dir, time_re):
+        run = atlantis_cmd.monitor.RunProgress(results_dir, time_re)
+        run.update()
+        with (results_dir / "stdout").open("a") as f:
+            f.write("Time: 12.500000 days\n")
+
+        run.update()
+
+        assert run.sim_days == 12.5
+
+    def test_failed_step(self, results_dir, time_re):
+        run = atlantis_cmd.monitor.RunProgress(results_dir, time_re)
+        run.update()
+        assert not run.finished
+        _write_resources(results_dir, 0, 2)
+
+        run.update()
+
+        assert run.finished
+        assert run.failed
+        assert (run.failed_step, run.exit_code) == ("gather", 2)
+
+    def test_successful_steps(self, results_dir, time_re):
+        _write_resources(results_dir, 0)
+        run = atlantis_cmd.monitor.RunProgress(results_dir, time_re)
+
+        run.update()
+
+        assert not run.finished
+        assert not run.failed
+
+    def test_rate_without_start_time(self, results_dir, time_re):
+        stdout = results_dir / "stdout"
+        stdout.write_text("working dir: /no/such/dir\nTime: 10 days\n")
+        now = time.time()
+        os.utime(stdout, (now - 3600, now - 3600))
+        run = atlantis_cmd.monitor.RunProgress(results_dir, time_re)
+        run.update()
+        assert run.rate is None
+        with stdout.open("a") as f:
+            f.write("Time: 14 days\n")
+        os.utime(stdout, (now, now))
+
+        run.update()
+
+        assert run.rate == pytest.approx(4)
+        assert run.tstop_days is None
+        assert run.eta is None
+
+
+class TestParseTstop:
+    """Unit tests for parse_tstop() function."""
+
+    @pytest.mark.parametrize(
+        "text, expected",
+        (
+            ("tstop 36500 day\n", 36500),
+            ("# tstop 1 day\n  tstop 7.3e3 days\n", 7300),
+            ("tstop 48 hour\n", 2),
+            ("tstop 86400 s\n", 1),
+            ("tstop 10\n", 10),
+            ("tstart 0 day\n", None),
+        ),
+    )
+    def test_parse_tstop(self, text, expected):
+        assert atlantis_cmd.monitor.parse_tstop(text) == expected
+
+
+class TestParseDate:
+    """Unit tests for _parse_date() function."""
+
+    def test_date_format(self):
+        timestamp = atlantis_cmd.monitor._parse_date("Wed Aug 18 15:34:16 PDT 2021")
+        assert time.localtime(timestamp)[:6] == (2021, 8, 18, 15, 34, 16)
+
+    def test_unparsable(self):
+        assert atlantis_cmd.monitor._parse_date("yesterday") is None
@@ -138,6 +138,35 @@ class TestPostGenProject:
         )
         assert (tmp_run_dir / "init_conditions.nc").is_file()
 
+    def test_staging_methods(
+        self,
+        mock_load_run_desc_return,
+        mock_calc_tmp_run_dir_return,
+        mock_record_vcs_revisions,
+        run_desc,
+        tmp_path,
+        monkeypatch,
+    ):
+        monkeypatch.setitem(
+            run_desc,
+            "staging",
+            {"default": "copy", "initial conditions": "hardlink", "groups": "symlink"},
+        )
+        results_dir = tmp_path / "results_dir"
+        atlantis_cmd.run.run(
+            tmp_path / "atlantis.yaml",
+            results_dir,
+            no_submit=True,
+        )
+        tmp_run_dir = (
+            Path(run_desc["paths"]["runs directory"])
+            / "SS-Atlantis_2021-08-04T105443-0700"
+        )
+        init_conditions = tmp_run_dir / "init_conditions.nc"
+        assert init_conditions.samefile(run_desc["initial conditions"])
+        assert (tmp_run_dir / "groups.csv").is_symlink()
+        assert not (tmp_run_dir / "run.prm").samefile(run_desc["parameters"]["run"])
+
     def test_params_files(
         self,
         mock_load_run_desc_return,
@@ -199,3 +228,43 @@ class TestPostGenProject:
         )
         for key in run_desc["forcing"]:
             assert (tmp_run_dir / key).is_symlink()
+
+
+class TestCookiecutterPostGenProject:
+    """Functional test for symlinks and file copies created by cookiecutter
+    post_gen_project hook script when legacy cookiecutter rendering is used."""
+
+    def test_run_dir_contents(
+        self,
+        mock_load_run_desc_return,
+        mock_calc_tmp_run_dir_return,
+        mock_record_vcs_revisions,
+        run_desc,
+        tmp_path,
+    ):
+        results_dir = tmp_path / "results_dir"
+        atlantis_cmd.run.run(
+            tmp_path / "atlantis.yaml",
+            results_dir,
+            no_submit=True,
+            use_cookiecutter=True,
+        )
+        tmp_run_dir = (
+            Path(run_desc["paths"]["runs directory"])
+            / "SS-Atlantis_2021-08-04T105443-0700"
+        )
+        assert (tmp_run_dir / "Atlantis.sh").is_file()
+        assert (tmp_run_dir / "atlantis.yaml").is_file()
+        assert (tmp_run_dir / "atlantisMerged").is_symlink()
+        assert (tmp_run_dir / Path(run_desc["boxes"]).name).is_file()
+        for name in (
+            "init_conditions.nc",
+            "groups.csv",
+            "migrations.csv",
+            "fisheries.csv",
+        ):
+            assert (tmp_run_dir / name).is_file()
+        for key in run_desc["parameters"]:
+            assert (tmp_run_dir / f"{key}.prm").is_file()
+        for key in run_desc["forcing"]:
+            assert (tmp_run_dir / key).is_symlink()
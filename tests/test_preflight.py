@@ -0,0 +1,174 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Unit tests for preflight checks of NetCDF input files."""
+
+import logging
+import os
+
+import netCDF4
+import numpy
+import pytest
+
+from atlantis_cmd import preflight
+
+
+def _write_nc(path, boxes=5, layers=3, times=(0.0, 43200.0, 86400.0), **kwargs):
+    """Write a small NetCDF classic file with the structure of an Atlantis
+    initial conditions or forcing file.
+    """
+    with netCDF4.Dataset(path, "w", format="NETCDF3_CLASSIC") as ds:
+        ds.createDimension("t", None)
+        ds.createDimension("b", boxes)
+        ds.createDimension("z", layers)
+        t = ds.createVariable("t", "f8", ("t",))
+        t.units = kwargs.get("units", "seconds since 2007-01-01 00:00:00 -8")
+        t[:] = numpy.array(times)
+        temp = ds.createVariable("temperature", "f4", ("t", "b", "z"))
+        temp[:] = numpy.ones((len(times), boxes, layers), dtype="f4")
+    return path
+
+
+@pytest.fixture(name="init_nc")
+def fixture_init_nc(tmp_path):
+    return _write_nc(tmp_path / "SS_init.nc", times=(0.0,))
+
+
+@pytest.fixture(name="forcing")
+def fixture_forcing(tmp_path):
+    forcing_dir = tmp_path / "input"
+    forcing_dir.mkdir()
+    return {
+        name: _write_nc(forcing_dir / name) for name in ("SS_temp.nc", "SS_salt.nc")
+    }
+
+
+@pytest.fixture(autouse=True)
+def clear_headers(monkeypatch):
+    monkeypatch.setattr(preflight, "_headers", {})
+
+
+class TestCheckInputFiles:
+    """Unit tests for check_input_files() function."""
+
+    def test_good_files(self, init_nc, forcing):
+        assert preflight.check_input_files(init_nc, forcing) == 3
+
+    def test_non_netcdf_forcing_skipped(self, init_nc, forcing, tmp_path):
+        time_series = tmp_path / "input" / "SS_point_sources.ts"
+        time_series.write_text("## COLUMN1.name Time\n")
+        forcing[time_series.name] = time_series
+
+        assert preflight.check_input_files(init_nc, forcing) == 3
+
+    def test_empty_forcing_file(self, init_nc, forcing, caplog):
+        forcing["SS_temp.nc"].write_bytes(b"")
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            preflight.check_input_files(init_nc, forcing)
+
+        assert caplog.messages == [
+            f"can't read NetCDF header of {forcing['SS_temp.nc']}: not a NetCDF file",
+            "found 1 problem(s) in NetCDF input files; "
+            "no temporary run directory was created",
+        ]
+
+    def test_truncated_forcing_file(self, init_nc, forcing, caplog):
+        path = forcing["SS_salt.nc"]
+        os.truncate(path, path.stat().st_size - 20)
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            preflight.check_input_files(init_nc, forcing)
+
+        assert caplog.messages[0].startswith(f"{path} is truncated: ")
+
+    def test_boxes_mismatch(self, init_nc, forcing, caplog):
+        _write_nc(forcing["SS_temp.nc"], boxes=4)
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            preflight.check_input_files(init_nc, forcing)
+
+        assert caplog.messages[0] == (
+            f"b dimension of {forcing['SS_temp.nc']} is 4, "
+            f"but it is 5 in initial conditions file {init_nc}"
+        )
+
+    def test_no_time_records(self, init_nc, forcing, caplog):
+        _write_nc(forcing["SS_temp.nc"], times=())
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            preflight.check_input_files(init_nc, forcing)
+
+        assert caplog.messages[0] == f"{forcing['SS_temp.nc']} has no time records"
+
+    def test_time_not_increasing(self, init_nc, forcing, caplog):
+        _write_nc(forcing["SS_temp.nc"], times=(0.0, 86400.0, 43200.0))
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            preflight.check_input_files(init_nc, forcing)
+
+        assert caplog.messages[0] == (
+            f"{forcing['SS_temp.nc']} time coordinate values are not increasing"
+        )
+
+    def test_short_time_coverage_warning(self, init_nc, forcing, tmp_path, caplog):
+        run_params = tmp_path / "SS_run.prm"
+        run_params.write_text("tstop 365 day\n")
+        caplog.set_level(logging.WARNING)
+
+        assert preflight.check_input_files(init_nc, forcing, run_params) == 3
+
+        # 3 half-day records cover 1.5 days
+        assert caplog.records[0].levelname == "WARNING"
+        assert caplog.messages == [
+            f"{forcing[name]} covers 1.5 days, but the run is 365 days long"
+            for name in forcing
+        ]
+
+    def test_headers_memoized(self, init_nc, forcing, monkeypatch):
+        preflight.check_input_files(init_nc, forcing)
+
+        def mock_read_header(path):
+            raise AssertionError(f"{path} header read again")
+
+        monkeypatch.setattr(preflight, "read_header", mock_read_header)
+
+        assert preflight.check_input_files(init_nc, forcing) == 3
+
+
+class TestDaysPerTimeUnit:
+    """Unit tests for _days_per_time_unit() function."""
+
+    @pytest.mark.parametrize(
+        "units, expected",
+        (
+            ("seconds since 2007-01-01 00:00:00 -8", 1 / 86400),
+            ("hours since 2007-01-01", 1 / 24),
+            ("days since 2007-01-01", 1),
+            ("fortnights since 2007-01-01", None),
+            ("seconds", None),
+            (None, None),
+        ),
+    )
+    def test_days_per_time_unit(self, units, expected):
+        assert preflight._days_per_time_unit(units) == expected
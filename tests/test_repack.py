@@ -0,0 +1,141 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Unit tests for NetCDF output file re-packing."""
+
+import logging
+
+import netCDF4
+import numpy
+import pytest
+
+from atlantis_cmd import repack
+
+
+@pytest.fixture(name="output_nc")
+def fixture_output_nc(tmp_path):
+    """Small NetCDF classic file with the structure of an Atlantis output file."""
+    output_nc = tmp_path / "outputSalishSea.nc"
+    with netCDF4.Dataset(output_nc, "w", format="NETCDF3_CLASSIC") as ds:
+        ds.title = "Atlantis output"
+        ds.createDimension("t", None)
+        ds.createDimension("b", 5)
+        ds.createDimension("z", 3)
+        t = ds.createVariable("t", "f8", ("t",))
+        t.units = "seconds since 2007-01-01 00:00:00 -8"
+        t[:] = numpy.arange(20) * 43200.0
+        nums = ds.createVariable("Diatom_N", "f4", ("t", "b", "z"), fill_value=-1.0)
+        nums.units = "mg N m-3"
+        nums[:] = numpy.arange(20 * 5 * 3, dtype="f4").reshape(20, 5, 3)
+        area = ds.createVariable("area", "f8", ("b",))
+        area[:] = numpy.arange(5) * 1e6
+        ds.createVariable("nominal_dz", "f8", ())
+        ds["nominal_dz"].assignValue(10.0)
+    return output_nc
+
+
+class TestRepackFile:
+    """Unit tests for repack_file() function."""
+
+    def test_data_preserved(self, output_nc):
+        with netCDF4.Dataset(output_nc) as ds:
+            expected = {name: var[...] for name, var in ds.variables.items()}
+
+        repack.repack_file(output_nc, time_chunk=8)
+
+        with netCDF4.Dataset(output_nc) as ds:
+            assert ds.data_model == "NETCDF4_CLASSIC"
+            assert ds.title == "Atlantis output"
+            assert ds.dimensions["t"].isunlimited()
+            for name, values in expected.items():
+                numpy.testing.assert_array_equal(ds[name][...], values)
+            assert ds["Diatom_N"].units == "mg N m-3"
+            assert ds["Diatom_N"]._FillValue == -1.0
+
+    def test_compression_and_chunking(self, output_nc):
+        repack.repack_file(output_nc, complevel=5, time_chunk=8)
+
+        with netCDF4.Dataset(output_nc) as ds:
+            filters = ds["Diatom_N"].filters()
+            assert filters["zlib"] is True
+            assert filters["complevel"] == 5
+            assert filters["shuffle"] is True
+            assert ds["Diatom_N"].chunking() == [8, 5, 3]
+            assert ds["area"].chunking() == [5]
+
+    def test_time_chunk_larger_than_records(self, output_nc):
+        repack.repack_file(output_nc, time_chunk=256)
+
+        with netCDF4.Dataset(output_nc) as ds:
+            assert ds["Diatom_N"].chunking() == [20, 5, 3]
+
+    @pytest.mark.skipif(
+        not netCDF4.__has_zstandard_support__,
+        reason="netCDF4 library was built without zstd support",
+    )
+    def test_zstd(self, output_nc):
+        repack.repack_file(output_nc, compression="zstd")
+
+        with netCDF4.Dataset(output_nc) as ds:
+            assert ds["Diatom_N"].filters()["zstd"] is True
+
+    def test_small_blocks(self, output_nc, monkeypatch):
+        # Blocks of 1 time record to exercise the memory bound
+        monkeypatch.setattr(repack, "MAX_BLOCK_BYTES", 1)
+        with netCDF4.Dataset(output_nc) as ds:
+            expected = ds["Diatom_N"][...]
+
+        repack.repack_file(output_nc, time_chunk=8)
+
+        with netCDF4.Dataset(output_nc) as ds:
+            numpy.testing.assert_array_equal(ds["Diatom_N"][...], expected)
+
+    def test_unknown_compression(self, output_nc):
+        with pytest.raises(ValueError):
+            repack.repack_file(output_nc, compression="lzma")
+
+    def test_failure_leaves_file_unchanged(self, tmp_path):
+        not_nc = tmp_path / "outputSalishSea.nc"
+        not_nc.write_bytes(b"not a netcdf file")
+
+        with pytest.raises(OSError):
+            repack.repack_file(not_nc)
+
+        assert not_nc.read_bytes() == b"not a netcdf file"
+        assert [path.name for path in tmp_path.iterdir()] == ["outputSalishSea.nc"]
+
+
+class TestRepackFiles:
+    """Unit tests for repack_files() function."""
+
+    def test_repack_files(self, output_nc, tmp_path, caplog):
+        not_nc = tmp_path / "outputSalishSeaCATCH.nc"
+        not_nc.write_bytes(b"not a netcdf file")
+        caplog.set_level(logging.INFO)
+
+        failed = repack.repack_files([output_nc, not_nc], max_workers=2)
+
+        assert failed == [not_nc]
+        with netCDF4.Dataset(output_nc) as ds:
+            assert ds.data_model == "NETCDF4_CLASSIC"
+        assert caplog.messages[-1].startswith(
+            "re-packed 1 NetCDF files with zlib compression from "
+        )
+
+    def test_no_files(self):
+        assert repack.repack_files([]) == []
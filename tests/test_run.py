@@ -18,9 +18,12 @@
 
 """AtlantisCmd run sub-command plug-in unit and integration tests."""
 
+import concurrent.futures
+import json
 import logging
 import os
 import textwrap
+import threading
 from pathlib import Path
 from types import SimpleNamespace
 
@@ -78,6 +81,104 @@ class TestParser:
         assert parser._actions[4].default is False
         assert parser._actions[4].help
 
+    def test_ensemble_option(self, run_cmd):
+        parser = run_cmd.get_parser("atlantis run")
+        assert parser._actions[5].dest == "ensemble"
+        assert parser._actions[5].option_strings == ["--ensemble"]
+        assert parser._actions[5].const is True
+        assert parser._actions[5].default is False
+        assert parser._actions[5].help
+
+    def test_max_concurrent_option(self, run_cmd):
+        parser = run_cmd.get_parser("atlantis run")
+        assert parser._actions[6].dest == "max_concurrent"
+        assert parser._actions[6].option_strings == ["--max-concurrent"]
+        assert parser._actions[6].type == int
+        assert parser._actions[6].default == os.cpu_count()
+        assert parser._actions[6].help
+
+    def test_cookiecutter_option(self, run_cmd):
+        parser = run_cmd.get_parser("atlantis run")
+        assert parser._actions[7].dest == "use_cookiecutter"
+        assert parser._actions[7].option_strings == ["--cookiecutter"]
+        assert parser._actions[7].const is True
+        assert parser._actions[7].default is False
+        assert parser._actions[7].help
+
+    def test_timings_option(self, run_cmd):
+        parser = run_cmd.get_parser("atlantis run")
+        assert parser._actions[8].dest == "timings"
+        assert parser._actions[8].option_strings == ["--timings"]
+        assert parser._actions[8].const is True
+        assert parser._actions[8].default is False
+        assert parser._actions[8].help
+
+    def test_queue_option(self, run_cmd):
+        parser = run_cmd.get_parser("atlantis run")
+        assert parser._actions[9].dest == "queue"
+        assert parser._actions[9].option_strings == ["--queue"]
+        assert parser._actions[9].const is True
+        assert parser._actions[9].default is False
+        assert parser._actions[9].help
+
+    def test_priority_option(self, run_cmd):
+        parser = run_cmd.get_parser("atlantis run")
+        assert parser._actions[10].dest == "priority"
+        assert parser._actions[10].option_strings == ["--priority"]
+        assert parser._actions[10].type == int
+        assert parser._actions[10].default == 0
+        assert parser._actions[10].help
+
+    def test_memory_option(self, run_cmd):
+        parser = run_cmd.get_parser("atlantis run")
+        assert parser._actions[11].dest == "memory"
+        assert parser._actions[11].option_strings == ["--memory"]
+        assert parser._actions[11].type == atlantis_cmd.run.run_queue.parse_size
+        assert parser._actions[11].default == 0
+        assert parser._actions[11].help
+
+    def test_warm_start_from_option(self, run_cmd):
+        parser = run_cmd.get_parser("atlantis run")
+        assert parser._actions[12].dest == "warm_start_from"
+        assert parser._actions[12].option_strings == ["--warm-start-from"]
+        assert parser._actions[12].metavar == "PREVIOUS_RESULTS_DIR"
+        assert parser._actions[12].type == Path
+        assert parser._actions[12].default is None
+        assert parser._actions[12].help
+
+    def test_cache_run_desc_option(self, run_cmd):
+        parser = run_cmd.get_parser("atlantis run")
+        assert parser._actions[13].dest == "cache_run_desc"
+        assert parser._actions[13].option_strings == ["--cache-run-desc"]
+        assert parser._actions[13].const is True
+        assert parser._actions[13].default is False
+        assert parser._actions[13].help
+
+    def test_update_option(self, run_cmd):
+        parser = run_cmd.get_parser("atlantis run")
+        assert parser._actions[14].dest == "update_run_dir"
+        assert parser._actions[14].option_strings == ["--update"]
+        assert parser._actions[14].metavar == "RUN_DIR"
+        assert parser._actions[14].type == Path
+        assert parser._actions[14].default is None
+        assert parser._actions[14].help
+
+    def test_checksum_option(self, run_cmd):
+        parser = run_cmd.get_parser("atlantis run")
+        assert parser._actions[15].dest == "checksum"
+        assert parser._actions[15].option_strings == ["--checksum"]
+        assert parser._actions[15].const is True
+        assert parser._actions[15].default is False
+        assert parser._actions[15].help
+
+    def test_preflight_option(self, run_cmd):
+        parser = run_cmd.get_parser("atlantis run")
+        assert parser._actions[16].dest == "preflight"
+        assert parser._actions[16].option_strings == ["--preflight"]
+        assert parser._actions[16].const is True
+        assert parser._actions[16].default is False
+        assert parser._actions[16].help
+
     def test_parsed_args_defaults(self, run_cmd):
         parser = run_cmd.get_parser("atlantis run")
         parsed_args = parser.parse_args(["foo.yaml", "results/foo/"])
@@ -85,6 +186,35 @@ class TestParser:
         assert parsed_args.results_dir == Path("results/foo/")
         assert not parsed_args.no_submit
         assert not parsed_args.quiet
+        assert not parsed_args.ensemble
+        assert parsed_args.max_concurrent == os.cpu_count()
+        assert not parsed_args.use_cookiecutter
+        assert not parsed_args.timings
+        assert not parsed_args.queue
+        assert parsed_args.priority == 0
+        assert parsed_args.memory == 0
+        assert parsed_args.warm_start_from is None
+        assert not parsed_args.cache_run_desc
+        assert parsed_args.update_run_dir is None
+        assert not parsed_args.checksum
+        assert not parsed_args.preflight
+
+    def test_parsed_args_queue_options(self, run_cmd):
+        parser = run_cmd.get_parser("atlantis run")
+        parsed_args = parser.parse_args(
+            ["foo.yaml", "results/foo/", "--queue", "--priority", "5", "--memory", "8G"]
+        )
+        assert parsed_args.queue is True
+        assert parsed_args.priority == 5
+        assert parsed_args.memory == 8 * 2**30
+
+    def test_parsed_args_ensemble_options(self, run_cmd):
+        parser = run_cmd.get_parser("atlantis run")
+        parsed_args = parser.parse_args(
+            ["ensemble/", "results/", "--ensemble", "--max-concurrent", "8"]
+        )
+        assert parsed_args.ensemble is True
+        assert parsed_args.max_concurrent == 8
 
     @pytest.mark.parametrize("flag", ["-q", "--quiet"])
     def test_parsed_args_quiet_options(self, flag, run_cmd):
@@ -115,6 +245,18 @@ class TestTakeAction:
             results_dir=Path("results dir"),
             no_submit=False,
             quiet=False,
+            ensemble=False,
+            max_concurrent=4,
+            use_cookiecutter=False,
+            timings=False,
+            queue=False,
+            priority=0,
+            memory=0,
+            warm_start_from=None,
+            cache_run_desc=False,
+            update_run_dir=None,
+            checksum=False,
+            preflight=False,
         )
         caplog.set_level(logging.INFO)
 
@@ -122,12 +264,84 @@ class TestTakeAction:
 
         assert caplog.messages[0] == "launched job msg"
 
+    def test_take_action_cookiecutter(self, run_cmd, monkeypatch):
+        run_kwargs = {}
+
+        def mock_run_return(*args, **kwargs):
+            run_kwargs.update(kwargs)
+
+        parsed_args = SimpleNamespace(
+            desc_file=Path("desc file"),
+            results_dir=Path("results dir"),
+            no_submit=False,
+            quiet=False,
+            ensemble=False,
+            max_concurrent=4,
+            use_cookiecutter=True,
+            timings=False,
+            queue=False,
+            priority=0,
+            memory=0,
+            warm_start_from=None,
+            cache_run_desc=False,
+            update_run_dir=None,
+            checksum=False,
+            preflight=False,
+        )
+        monkeypatch.setattr(atlantis_cmd.run, "run", mock_run_return)
+
+        run_cmd.take_action(parsed_args)
+
+        assert run_kwargs["use_cookiecutter"] is True
+
+    def test_take_action_timings(self, run_cmd, monkeypatch):
+        run_kwargs = {}
+
+        def mock_run_return(*args, **kwargs):
+            run_kwargs.update(kwargs)
+
+        parsed_args = SimpleNamespace(
+            desc_file=Path("desc file"),
+            results_dir=Path("results dir"),
+            no_submit=False,
+            quiet=False,
+            ensemble=False,
+            max_concurrent=4,
+            use_cookiecutter=False,
+            timings=True,
+            queue=False,
+            priority=0,
+            memory=0,
+            warm_start_from=None,
+            cache_run_desc=False,
+            update_run_dir=None,
+            checksum=False,
+            preflight=False,
+        )
+        monkeypatch.setattr(atlantis_cmd.run, "run", mock_run_return)
+
+        run_cmd.take_action(parsed_args)
+
+        assert run_kwargs["timings"] is True
+
     def test_take_action_quiet(self, mock_run_submit_return, run_cmd, caplog):
         parsed_args = SimpleNamespace(
             desc_file=Path("desc file"),
             results_dir=Path("results dir"),
             no_submit=False,
             quiet=True,
+            ensemble=False,
+            max_concurrent=4,
+            use_cookiecutter=False,
+            timings=False,
+            queue=False,
+            priority=0,
+            memory=0,
+            warm_start_from=None,
+            cache_run_desc=False,
+            update_run_dir=None,
+            checksum=False,
+            preflight=False,
         )
         caplog.set_level(logging.INFO)
 
@@ -144,6 +358,18 @@ class TestTakeAction:
             results_dir=Path("results dir"),
             no_submit=True,
             quiet=False,
+            ensemble=False,
+            max_concurrent=4,
+            use_cookiecutter=False,
+            timings=False,
+            queue=False,
+            priority=0,
+            memory=0,
+            warm_start_from=None,
+            cache_run_desc=False,
+            update_run_dir=None,
+            checksum=False,
+            preflight=False,
         )
         monkeypatch.setattr(atlantis_cmd.run, "run", mock_run_no_submit_return)
         caplog.set_level(logging.INFO)
@@ -152,6 +378,60 @@ class TestTakeAction:
 
         assert not caplog.messages
 
+    def test_take_action_ensemble(self, run_cmd, caplog, monkeypatch):
+        def mock_run_ensemble_return(*args, **kwargs):
+            return f"ensemble msg max_concurrent={kwargs['max_concurrent']}"
+
+        parsed_args = SimpleNamespace(
+            desc_file=Path("ensemble/"),
+            results_dir=Path("results dir"),
+            no_submit=False,
+            quiet=False,
+            ensemble=True,
+            max_concurrent=2,
+            use_cookiecutter=False,
+            timings=False,
+            queue=False,
+            priority=0,
+            memory=0,
+            warm_start_from=None,
+            cache_run_desc=False,
+            update_run_dir=None,
+            checksum=False,
+            preflight=False,
+        )
+        monkeypatch.setattr(atlantis_cmd.run, "run_ensemble", mock_run_ensemble_return)
+        caplog.set_level(logging.INFO)
+
+        run_cmd.take_action(parsed_args)
+
+        assert caplog.messages[0] == "ensemble msg max_concurrent=2"
+
+    def test_take_action_update_ensemble(self, run_cmd, caplog):
+        parsed_args = SimpleNamespace(
+            desc_file=Path("ensemble/"),
+            results_dir=Path("results dir"),
+            no_submit=False,
+            quiet=False,
+            ensemble=True,
+            max_concurrent=2,
+            use_cookiecutter=False,
+            timings=False,
+            queue=False,
+            priority=0,
+            memory=0,
+            warm_start_from=None,
+            cache_run_desc=False,
+            update_run_dir=Path("runs/SS-Atlantis_2021-08-04T105443-0700"),
+            checksum=False,
+        )
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            run_cmd.take_action(parsed_args)
+
+        assert caplog.messages[0] == "--update can't be used with --ensemble"
+
 
 class TestRun:
     """Unit tests for `atlantis run` run() function."""
@@ -208,6 +488,629 @@ class TestRun:
         run_id = run_desc["run id"]
         assert launch_job_msg == f"launched {run_id} run via {tmp_run_dir}/Atlantis.sh"
 
+    def test_update(
+        self,
+        mock_load_run_desc_return,
+        mock_calc_tmp_run_dir_return,
+        mock_record_vcs_revisions,
+        run_desc,
+        tmp_path,
+        caplog,
+    ):
+        results_dir = tmp_path / "results_dir"
+        atlantis_cmd.run.run(tmp_path / "atlantis.yaml", results_dir, no_submit=True)
+        tmp_run_dir = (
+            Path(run_desc["paths"]["runs directory"])
+            / "SS-Atlantis_2021-08-04T105443-0700"
+        )
+        Path(run_desc["parameters"]["harvest"]).write_text("harvest changed\n")
+        caplog.set_level(logging.INFO)
+
+        atlantis_cmd.run.run(
+            tmp_path / "atlantis.yaml",
+            results_dir,
+            no_submit=True,
+            update_run_dir=tmp_run_dir,
+        )
+
+        assert f"re-staged 1 changed input file(s) in {tmp_run_dir}" in caplog.messages
+        assert (tmp_run_dir / "harvest.prm").read_text() == "harvest changed\n"
+
+    def test_update_not_run_dir(self, mock_load_run_desc_return, tmp_path, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run.run(
+                tmp_path / "atlantis.yaml",
+                tmp_path / "results_dir",
+                no_submit=True,
+                update_run_dir=tmp_path,
+            )
+
+        assert caplog.messages[0] == (
+            f"{tmp_path} is not a temporary run directory - "
+            f"please check your --update RUN_DIR"
+        )
+
+    def test_update_cookiecutter(self, tmp_path, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run.run(
+                tmp_path / "atlantis.yaml",
+                tmp_path / "results_dir",
+                use_cookiecutter=True,
+                update_run_dir=tmp_path,
+            )
+
+        assert caplog.messages[0] == "--update can't be used with --cookiecutter"
+
+    def test_update_problem_keeps_run_dir(
+        self,
+        mock_load_run_desc_return,
+        mock_calc_tmp_run_dir_return,
+        mock_record_vcs_revisions,
+        run_desc,
+        tmp_path,
+        monkeypatch,
+    ):
+        results_dir = tmp_path / "results_dir"
+        atlantis_cmd.run.run(tmp_path / "atlantis.yaml", results_dir, no_submit=True)
+        tmp_run_dir = (
+            Path(run_desc["paths"]["runs directory"])
+            / "SS-Atlantis_2021-08-04T105443-0700"
+        )
+        monkeypatch.setattr(
+            atlantis_cmd.run,
+            "_calc_tmp_run_dir",
+            lambda runs_dir, run_id: runs_dir / f"{run_id}_2021-08-05T105443-0700",
+        )
+        monkeypatch.setitem(run_desc, "staging", {"default": "teleport"})
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run.run(
+                tmp_path / "atlantis.yaml",
+                results_dir,
+                no_submit=True,
+                update_run_dir=tmp_run_dir,
+            )
+
+        assert (tmp_run_dir / "Atlantis.sh").is_file()
+
+    def test_warm_start(
+        self,
+        mock_load_run_desc_return,
+        mock_calc_tmp_run_dir_return,
+        mock_record_vcs_revisions,
+        run_desc,
+        tmp_path,
+        caplog,
+        monkeypatch,
+    ):
+        previous_results_dir = tmp_path / "previous_results"
+        previous_results_dir.mkdir()
+        (previous_results_dir / "outputSalishSea.nc").write_bytes(b"")
+        warm_starts = []
+
+        def mock_write_warm_start_init(init_conditions, previous_output, dest):
+            warm_starts.append((init_conditions, previous_output, dest))
+            return ["Diatom_N"]
+
+        monkeypatch.setattr(
+            atlantis_cmd.run.warm_start,
+            "write_warm_start_init",
+            mock_write_warm_start_init,
+        )
+        caplog.set_level(logging.INFO)
+
+        atlantis_cmd.run.run(
+            tmp_path / "atlantis.yaml",
+            tmp_path / "results_dir",
+            no_submit=True,
+            warm_start_from=previous_results_dir,
+        )
+
+        tmp_run_dir = (
+            Path(run_desc["paths"]["runs directory"])
+            / "SS-Atlantis_2021-08-04T105443-0700"
+        )
+        assert warm_starts == [
+            (
+                Path(run_desc["initial conditions"]),
+                previous_results_dir / "outputSalishSea.nc",
+                tmp_run_dir / "init_conditions.nc",
+            )
+        ]
+        assert caplog.messages[0] == (
+            f"warm started 1 initial conditions variables from the last time record "
+            f"of {previous_results_dir / 'outputSalishSea.nc'}"
+        )
+
+    def test_warm_start_output_not_found(
+        self,
+        mock_load_run_desc_return,
+        mock_calc_tmp_run_dir_return,
+        mock_record_vcs_revisions,
+        run_desc,
+        tmp_path,
+        caplog,
+    ):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run.run(
+                tmp_path / "atlantis.yaml",
+                tmp_path / "results_dir",
+                no_submit=True,
+                warm_start_from=tmp_path / "previous_results",
+            )
+
+        assert caplog.messages[0] == (
+            f"outputSalishSea.nc not found in {tmp_path / 'previous_results'} - "
+            f"please check your --warm-start-from results directory"
+        )
+        assert not list(Path(run_desc["paths"]["runs directory"]).iterdir())
+
+    def test_warm_start_failure_removes_tmp_run_dir(
+        self,
+        mock_load_run_desc_return,
+        mock_calc_tmp_run_dir_return,
+        mock_record_vcs_revisions,
+        run_desc,
+        tmp_path,
+        caplog,
+    ):
+        previous_results_dir = tmp_path / "previous_results"
+        previous_results_dir.mkdir()
+        # Not a NetCDF file
+        (previous_results_dir / "outputSalishSea.nc").write_bytes(b"")
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run.run(
+                tmp_path / "atlantis.yaml",
+                tmp_path / "results_dir",
+                no_submit=True,
+                warm_start_from=previous_results_dir,
+            )
+
+        assert caplog.messages[0].startswith(
+            f"failed to warm start from {previous_results_dir / 'outputSalishSea.nc'}: "
+        )
+        assert not list(Path(run_desc["paths"]["runs directory"]).iterdir())
+
+    def test_queue(
+        self,
+        mock_load_run_desc_return,
+        mock_calc_tmp_run_dir_return,
+        mock_record_vcs_revisions,
+        run_desc,
+        tmp_path,
+        monkeypatch,
+    ):
+        submitted = []
+
+        def mock_submit(run_script, run_id, priority, memory):
+            submitted.append((run_script, run_id, priority, memory))
+            return {"id": 7}
+
+        monkeypatch.setattr(atlantis_cmd.run.run_queue, "submit", mock_submit)
+
+        launch_job_msg = atlantis_cmd.run.run(
+            tmp_path / "atlantis.yaml",
+            tmp_path / "results_dir",
+            queue=True,
+            priority=1,
+            memory=4 * 2**30,
+        )
+
+        tmp_run_dir = (
+            Path(run_desc["paths"]["runs directory"])
+            / "SS-Atlantis_2021-08-04T105443-0700"
+        )
+        assert submitted == [(tmp_run_dir / "Atlantis.sh", "SS-Atlantis", 1, 4 * 2**30)]
+        assert launch_job_msg == (
+            f"queued SS-Atlantis run via {tmp_run_dir}/Atlantis.sh as job 7"
+        )
+
+    def test_timings(
+        self,
+        mock_load_run_desc_return,
+        mock_calc_tmp_run_dir_return,
+        mock_record_vcs_revisions,
+        run_desc,
+        tmp_path,
+        caplog,
+    ):
+        caplog.set_level(logging.INFO)
+
+        atlantis_cmd.run.run(
+            tmp_path / "atlantis.yaml",
+            tmp_path / "results_dir",
+            no_submit=True,
+            timings=True,
+        )
+
+        tmp_run_dir = (
+            Path(run_desc["paths"]["runs directory"])
+            / "SS-Atlantis_2021-08-04T105443-0700"
+        )
+        timings = json.loads((tmp_run_dir / "timings.json").read_text())
+        assert [phase["phase"] for phase in timings["phases"]] == [
+            "load run description",
+            "validate run description",
+            "calculate run directory context",
+            "render run script",
+            "stage input files",
+            "write input manifest",
+            "record VCS revisions",
+            "total",
+        ]
+        assert {file["dest"] for file in timings["files"]} >= {
+            os.fspath(tmp_run_dir / "init_conditions.nc"),
+            os.fspath(tmp_run_dir / "biology.prm"),
+        }
+        assert "total: " in "\n".join(caplog.messages)
+        assert caplog.messages[-2] == (
+            f"Wrote run preparation timings to {tmp_run_dir / 'timings.json'}"
+        )
+
+    def test_preflight_problem_no_tmp_run_dir(
+        self,
+        mock_load_run_desc_return,
+        mock_calc_tmp_run_dir_return,
+        run_desc,
+        tmp_path,
+        caplog,
+    ):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run.run(
+                tmp_path / "atlantis.yaml",
+                tmp_path / "results_dir",
+                no_submit=True,
+                preflight=True,
+            )
+
+        runs_dir = Path(run_desc["paths"]["runs directory"])
+        assert list(runs_dir.iterdir()) == []
+        # The empty initial conditions file and the 3 empty forcing files
+        assert caplog.messages[-1] == (
+            "found 4 problem(s) in NetCDF input files; "
+            "no temporary run directory was created"
+        )
+
+    def test_no_timings_file_by_default(
+        self,
+        mock_load_run_desc_return,
+        mock_calc_tmp_run_dir_return,
+        mock_record_vcs_revisions,
+        run_desc,
+        tmp_path,
+    ):
+        atlantis_cmd.run.run(
+            tmp_path / "atlantis.yaml", tmp_path / "results_dir", no_submit=True
+        )
+
+        tmp_run_dir = (
+            Path(run_desc["paths"]["runs directory"])
+            / "SS-Atlantis_2021-08-04T105443-0700"
+        )
+        assert not (tmp_run_dir / "timings.json").exists()
+
+
+class TestRunEnsemble:
+    """Unit tests for `atlantis run` run_ensemble() function."""
+
+    @staticmethod
+    @pytest.fixture
+    def ensemble_dir(run_desc, tmp_path):
+        ensemble_dir = tmp_path / "ensemble"
+        ensemble_dir.mkdir()
+        for member in ("member_a", "member_b"):
+            (ensemble_dir / f"{member}.yaml").write_text(
+                (tmp_path / "atlantis.yaml").read_text()
+            )
+        return ensemble_dir
+
+    def test_no_submit(
+        self,
+        mock_load_run_desc_return,
+        mock_record_vcs_revisions,
+        ensemble_dir,
+        run_desc,
+        tmp_path,
+    ):
+        results_dir = tmp_path / "results_dir"
+
+        msg = atlantis_cmd.run.run_ensemble(
+            ensemble_dir, results_dir, max_concurrent=2, no_submit=True, quiet=True
+        )
+
+        assert msg is None
+        tmp_run_dirs = list(Path(run_desc["paths"]["runs directory"]).iterdir())
+        assert len(tmp_run_dirs) == 2
+        for tmp_run_dir in tmp_run_dirs:
+            assert (tmp_run_dir / "Atlantis.sh").is_file()
+
+    def test_member_results_dirs(
+        self,
+        mock_load_run_desc_return,
+        mock_record_vcs_revisions,
+        ensemble_dir,
+        run_desc,
+        tmp_path,
+    ):
+        results_dir = tmp_path / "results_dir"
+
+        atlantis_cmd.run.run_ensemble(
+            ensemble_dir, results_dir, max_concurrent=2, no_submit=True, quiet=True
+        )
+
+        runs_dir = Path(run_desc["paths"]["runs directory"])
+        results_dirs = sorted(
+            line.split('"')[1]
+            for tmp_run_dir in runs_dir.iterdir()
+            for line in (tmp_run_dir / "Atlantis.sh").read_text().splitlines()
+            if line.startswith("RESULTS_DIR=")
+        )
+        assert results_dirs == [
+            os.fspath(results_dir / "member_a"),
+            os.fspath(results_dir / "member_b"),
+        ]
+
+    def test_submit(self, ensemble_dir, tmp_path, monkeypatch):
+        def mock_prepare_tmp_run_dir(
+            desc_file,
+            results_dir,
+            quiet,
+            use_cookiecutter=False,
+            timings=False,
+            stat_cache=None,
+            warm_start_from=None,
+            cache_run_desc=False,
+            preflight=False,
+        ):
+            return "SS-Atlantis", tmp_path / desc_file.stem
+
+        def mock_run_bounded(run_scripts, max_concurrent):
+            return {member: 0 for member in run_scripts}
+
+        monkeypatch.setattr(
+            atlantis_cmd.run, "_prepare_tmp_run_dir", mock_prepare_tmp_run_dir
+        )
+        monkeypatch.setattr(atlantis_cmd.run, "_run_bounded", mock_run_bounded)
+
+        msg = atlantis_cmd.run.run_ensemble(
+            ensemble_dir, tmp_path / "results_dir", max_concurrent=2
+        )
+
+        assert (
+            msg == "finished 2 ensemble member runs with at most 2 at a time; 0 failed"
+        )
+
+    def test_queue(self, ensemble_dir, tmp_path, monkeypatch):
+        def mock_prepare_tmp_run_dir(
+            desc_file,
+            results_dir,
+            quiet,
+            use_cookiecutter=False,
+            timings=False,
+            stat_cache=None,
+            warm_start_from=None,
+            cache_run_desc=False,
+            preflight=False,
+        ):
+            return "SS-Atlantis", tmp_path / desc_file.stem
+
+        submitted = []
+
+        def mock_submit(run_script, run_id, priority, memory):
+            submitted.append((run_script, run_id, priority, memory))
+            return {"id": len(submitted)}
+
+        monkeypatch.setattr(
+            atlantis_cmd.run, "_prepare_tmp_run_dir", mock_prepare_tmp_run_dir
+        )
+        monkeypatch.setattr(atlantis_cmd.run.run_queue, "submit", mock_submit)
+
+        msg = atlantis_cmd.run.run_ensemble(
+            ensemble_dir,
+            tmp_path / "results_dir",
+            max_concurrent=2,
+            queue=True,
+            priority=3,
+            memory=2**30,
+        )
+
+        assert msg == "queued 2 ensemble member runs"
+        assert submitted == [
+            (tmp_path / "member_a" / "Atlantis.sh", "member_a", 3, 2**30),
+            (tmp_path / "member_b" / "Atlantis.sh", "member_b", 3, 2**30),
+        ]
+
+    def test_failed_member(self, ensemble_dir, tmp_path, caplog, monkeypatch):
+        def mock_prepare_tmp_run_dir(
+            desc_file,
+            results_dir,
+            quiet,
+            use_cookiecutter=False,
+            timings=False,
+            stat_cache=None,
+            warm_start_from=None,
+            cache_run_desc=False,
+            preflight=False,
+        ):
+            return "SS-Atlantis", tmp_path / desc_file.stem
+
+        def mock_run_bounded(run_scripts, max_concurrent):
+            return {"member_a": 0, "member_b": 42}
+
+        monkeypatch.setattr(
+            atlantis_cmd.run, "_prepare_tmp_run_dir", mock_prepare_tmp_run_dir
+        )
+        monkeypatch.setattr(atlantis_cmd.run, "_run_bounded", mock_run_bounded)
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit) as exc_info:
+            atlantis_cmd.run.run_ensemble(
+                ensemble_dir, tmp_path / "results_dir", max_concurrent=1
+            )
+
+        assert exc_info.value.code == 1
+        assert caplog.messages == [
+            "ensemble member member_b run failed with exit code 42",
+            "finished 2 ensemble member runs with at most 1 at a time; 1 failed",
+        ]
+
+    def test_use_cookiecutter(self, ensemble_dir, tmp_path, monkeypatch):
+        use_cookiecutters = []
+
+        def mock_prepare_tmp_run_dir(
+            desc_file,
+            results_dir,
+            quiet,
+            use_cookiecutter=False,
+            timings=False,
+            stat_cache=None,
+            warm_start_from=None,
+            cache_run_desc=False,
+            preflight=False,
+        ):
+            use_cookiecutters.append(use_cookiecutter)
+            return "SS-Atlantis", tmp_path / desc_file.stem
+
+        monkeypatch.setattr(
+            atlantis_cmd.run, "_prepare_tmp_run_dir", mock_prepare_tmp_run_dir
+        )
+
+        atlantis_cmd.run.run_ensemble(
+            ensemble_dir,
+            tmp_path / "results_dir",
+            max_concurrent=2,
+            no_submit=True,
+            use_cookiecutter=True,
+        )
+
+        assert use_cookiecutters == [True, True]
+
+    def test_members_share_stat_cache(self, ensemble_dir, tmp_path, monkeypatch):
+        stat_caches = []
+
+        def mock_prepare_tmp_run_dir(
+            desc_file,
+            results_dir,
+            quiet,
+            use_cookiecutter=False,
+            timings=False,
+            stat_cache=None,
+            warm_start_from=None,
+            cache_run_desc=False,
+            preflight=False,
+        ):
+            stat_caches.append(stat_cache)
+            return "SS-Atlantis", tmp_path / desc_file.stem
+
+        monkeypatch.setattr(
+            atlantis_cmd.run, "_prepare_tmp_run_dir", mock_prepare_tmp_run_dir
+        )
+
+        atlantis_cmd.run.run_ensemble(
+            ensemble_dir, tmp_path / "results_dir", max_concurrent=2, no_submit=True
+        )
+
+        assert len(stat_caches) == 2
+        assert stat_caches[0] is stat_caches[1] is not None
+
+    def test_bad_max_concurrent(self, ensemble_dir, tmp_path, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run.run_ensemble(
+                ensemble_dir, tmp_path / "results_dir", max_concurrent=0
+            )
+
+        assert caplog.messages[0] == "--max-concurrent must be at least 1, not 0"
+
+
+class TestFindEnsembleDescFiles:
+    """Unit tests for `atlantis run` _find_ensemble_desc_files() function."""
+
+    def test_dir(self, tmp_path):
+        for name in ("b.yaml", "a.yml", "notes.txt"):
+            (tmp_path / name).write_text("")
+
+        desc_files = atlantis_cmd.run._find_ensemble_desc_files(tmp_path)
+
+        assert desc_files == [tmp_path / "a.yml", tmp_path / "b.yaml"]
+
+    def test_glob(self, tmp_path):
+        for name in ("ens_1.yaml", "ens_2.yaml", "other.yaml"):
+            (tmp_path / name).write_text("")
+
+        desc_files = atlantis_cmd.run._find_ensemble_desc_files(tmp_path / "ens_*.yaml")
+
+        assert desc_files == [tmp_path / "ens_1.yaml", tmp_path / "ens_2.yaml"]
+
+    def test_no_matches(self, tmp_path, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run._find_ensemble_desc_files(tmp_path / "*.yaml")
+
+        assert caplog.messages[0].startswith(
+            "no run description files found for ensemble:"
+        )
+
+    def test_duplicate_stems(self, tmp_path, caplog):
+        (tmp_path / "a.yaml").write_text("")
+        (tmp_path / "a.yml").write_text("")
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run._find_ensemble_desc_files(tmp_path)
+
+        assert caplog.messages[0].endswith(": a")
+
+
+class TestRunBounded:
+    """Unit tests for `atlantis run` _run_bounded() function."""
+
+    @staticmethod
+    def _write_run_script(path, body):
+        path.write_text(f"#!/bin/bash\n{body}\n")
+        path.chmod(0o755)
+        return path
+
+    def test_exit_codes(self, tmp_path):
+        run_scripts = {
+            "ok": self._write_run_script(tmp_path / "ok.sh", "exit 0"),
+            "fail": self._write_run_script(tmp_path / "fail.sh", "exit 3"),
+        }
+
+        exit_codes = atlantis_cmd.run._run_bounded(run_scripts, max_concurrent=2)
+
+        assert exit_codes == {"ok": 0, "fail": 3}
+
+    def test_max_concurrent(self, tmp_path):
+        # Each script records how many scripts are running when it starts
+        running = tmp_path / "running"
+        running.mkdir()
+        log = tmp_path / "log"
+        run_scripts = {
+            f"member_{i}": self._write_run_script(
+                tmp_path / f"member_{i}.sh",
+                f"touch {running}/{i}; ls {running} | wc -l >>{log}; "
+                f"sleep 0.2; rm {running}/{i}",
+            )
+            for i in range(6)
+        }
+
+        atlantis_cmd.run._run_bounded(run_scripts, max_concurrent=2)
+
+        assert max(int(line) for line in log.read_text().split()) <= 2
+
 
 class TestCalcCookiecutterContext:
     """Unit tests for `atlantis run` _calc_cookiecutter_context() function."""
@@ -229,7 +1132,7 @@ class TestCalcCookiecutterContext:
         context = atlantis_cmd.run._calc_cookiecutter_context(
             run_desc, args.run_id, args.desc_file, args.tmp_run_dir, args.results_dir
         )
-        assert len(context) == 15
+        assert len(context) == 18
 
     def test_run_id(self, run_desc, args):
         context = atlantis_cmd.run._calc_cookiecutter_context(
@@ -399,12 +1302,219 @@ class TestCalcCookiecutterContext:
             Path(run_desc["forcing"]["SS_salt.nc"]["link to"])
         )
 
+    def test_forcing_glob(self, run_desc, args, tmp_path, monkeypatch):
+        forcing_dir = tmp_path / "forcing"
+        forcing_dir.mkdir()
+        for year in (2020, 2021):
+            (forcing_dir / f"SS_hydro_{year}.nc").write_bytes(b"")
+        monkeypatch.setitem(
+            run_desc["forcing"], "hydro", {"glob": f"{forcing_dir}/SS_hydro_*.nc"}
+        )
+
+        context = atlantis_cmd.run._calc_cookiecutter_context(
+            run_desc, args.run_id, args.desc_file, args.tmp_run_dir, args.results_dir
+        )
+
+        assert list(context["forcing"])[-2:] == ["SS_hydro_2020.nc", "SS_hydro_2021.nc"]
+        assert context["forcing"]["SS_hydro_2021.nc"] == os.fspath(
+            forcing_dir / "SS_hydro_2021.nc"
+        )
+
+    def test_forcing_directory_resolved_paths(self, run_desc, args, tmp_path):
+        hydro = tmp_path / "forcing" / "SS_hydro_2020.nc"
+        run_desc["forcing"]["yearly"] = {"directory": "forcing"}
+        resolved_paths = {("forcing", "yearly", "directory"): (hydro,)}
+
+        context = atlantis_cmd.run._calc_cookiecutter_context(
+            run_desc,
+            args.run_id,
+            args.desc_file,
+            args.tmp_run_dir,
+            args.results_dir,
+            resolved_paths=resolved_paths,
+        )
+
+        assert context["forcing"]["SS_hydro_2020.nc"] == os.fspath(hydro)
+
     def test_output_filename_base(self, run_desc, args):
         context = atlantis_cmd.run._calc_cookiecutter_context(
             run_desc, args.run_id, args.desc_file, args.tmp_run_dir, args.results_dir
         )
         assert context["output_filename_base"] == run_desc["output filename base"]
 
+    def test_default_staging(self, run_desc, args):
+        context = atlantis_cmd.run._calc_cookiecutter_context(
+            run_desc, args.run_id, args.desc_file, args.tmp_run_dir, args.results_dir
+        )
+        assert context["staging"] == {
+            "boxes": "auto",
+            "init_conditions": "auto",
+            "groups": "auto",
+            "migrations": "auto",
+            "fisheries": "auto",
+            "parameters": "auto",
+        }
+
+
+class TestCalcScratchDir:
+    """Unit tests for `atlantis run` _calc_scratch_dir() function."""
+
+    def test_no_scratch_dir(self, run_desc, tmp_path):
+        scratch_dir = atlantis_cmd.run._calc_scratch_dir(run_desc, tmp_path)
+
+        assert scratch_dir == ""
+
+    @pytest.mark.parametrize(
+        "scratch_dir, expected",
+        [
+            ("/tmp/", "/tmp"),
+            ("$SLURM_TMPDIR", "$SLURM_TMPDIR"),
+            ("${TMPDIR}/atlantis", "${TMPDIR}/atlantis"),
+        ],
+    )
+    def test_scratch_dir(self, scratch_dir, expected, run_desc, tmp_path, monkeypatch):
+        monkeypatch.setitem(run_desc["paths"], "scratch directory", scratch_dir)
+
+        assert atlantis_cmd.run._calc_scratch_dir(run_desc, tmp_path) == expected
+
+    def test_home_expanded(self, run_desc, tmp_path, monkeypatch):
+        monkeypatch.setenv("HOME", "/home/dlatorne")
+        monkeypatch.setitem(run_desc["paths"], "scratch directory", "~/scratch")
+
+        scratch_dir = atlantis_cmd.run._calc_scratch_dir(run_desc, tmp_path)
+
+        assert scratch_dir == "/home/dlatorne/scratch"
+
+    def test_relative_scratch_dir(self, run_desc, tmp_path, caplog, monkeypatch):
+        monkeypatch.setitem(run_desc["paths"], "scratch directory", "scratch")
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run._calc_scratch_dir(run_desc, tmp_path)
+
+        assert caplog.messages[0] == (
+            "scratch directory must be an absolute path, "
+            "or start with an environment variable, not scratch"
+        )
+
+    def test_quote_in_scratch_dir(self, run_desc, tmp_path, caplog, monkeypatch):
+        monkeypatch.setitem(run_desc["paths"], "scratch directory", '/tmp/"x')
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run._calc_scratch_dir(run_desc, tmp_path)
+
+        assert (
+            caplog.messages[0] == 'scratch directory must not contain " or `: /tmp/"x'
+        )
+
+
+class TestCalcStagingMethods:
+    """Unit tests for `atlantis run` _calc_staging_methods() function."""
+
+    def test_no_staging_section(self, run_desc, tmp_path):
+        staging_methods = atlantis_cmd.run._calc_staging_methods(run_desc, tmp_path)
+        assert set(staging_methods.values()) == {"auto"}
+
+    def test_default(self, run_desc, tmp_path, monkeypatch):
+        monkeypatch.setitem(run_desc, "staging", {"default": "copy"})
+        staging_methods = atlantis_cmd.run._calc_staging_methods(run_desc, tmp_path)
+        assert set(staging_methods.values()) == {"copy"}
+
+    def test_per_input_method(self, run_desc, tmp_path, monkeypatch):
+        monkeypatch.setitem(
+            run_desc,
+            "staging",
+            {"default": "copy", "initial conditions": "hardlink"},
+        )
+        staging_methods = atlantis_cmd.run._calc_staging_methods(run_desc, tmp_path)
+        assert staging_methods["init_conditions"] == "hardlink"
+        assert staging_methods["parameters"] == "copy"
+
+    def test_unknown_key(self, run_desc, tmp_path, caplog, monkeypatch):
+        monkeypatch.setitem(run_desc, "staging", {"forcing": "copy"})
+        caplog.set_level(logging.ERROR)
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run._calc_staging_methods(run_desc, tmp_path)
+        assert caplog.messages[0].startswith("unknown staging key(s): forcing;")
+
+    def test_unknown_method(self, run_desc, tmp_path, caplog, monkeypatch):
+        monkeypatch.setitem(run_desc, "staging", {"boxes": "teleport"})
+        caplog.set_level(logging.ERROR)
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run._calc_staging_methods(run_desc, tmp_path)
+        assert caplog.messages[0].startswith(
+            "unknown staging method for boxes: teleport;"
+        )
+
+
+class TestCalcGatherOptions:
+    """Unit tests for `atlantis run` _calc_gather_options() function."""
+
+    def test_no_gather_section(self, run_desc, tmp_path):
+        gather_options = atlantis_cmd.run._calc_gather_options(run_desc, tmp_path)
+        assert gather_options == ""
+
+    def test_repack_outputs(self, run_desc, tmp_path, monkeypatch):
+        monkeypatch.setitem(run_desc, "gather", {"repack": True})
+        gather_options = atlantis_cmd.run._calc_gather_options(run_desc, tmp_path)
+        assert gather_options == " --repack 'outputSalishSea*.nc'"
+
+    def test_repack_globs(self, run_desc, tmp_path, monkeypatch):
+        monkeypatch.setitem(
+            run_desc,
+            "gather",
+            {
+                "repack": ["outputSalishSea.nc", "outputSalishSeaCATCH.nc"],
+                "compression": "zstd",
+                "compression level": 3,
+                "time chunk": 365,
+                "max workers": 2,
+            },
+        )
+        gather_options = atlantis_cmd.run._calc_gather_options(run_desc, tmp_path)
+        assert gather_options == (
+            " --repack outputSalishSea.nc --repack outputSalishSeaCATCH.nc"
+            " --compression zstd --compression-level 3 --time-chunk 365"
+            " --max-workers 2"
+        )
+
+    def test_summarize(self, run_desc, tmp_path, monkeypatch):
+        monkeypatch.setitem(run_desc, "gather", {"summarize": True})
+        gather_options = atlantis_cmd.run._calc_gather_options(run_desc, tmp_path)
+        assert gather_options == " --summarize"
+
+    def test_bad_summarize(self, run_desc, tmp_path, caplog, monkeypatch):
+        monkeypatch.setitem(run_desc, "gather", {"summarize": "yes"})
+        caplog.set_level(logging.ERROR)
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run._calc_gather_options(run_desc, tmp_path)
+        assert caplog.messages[0] == "gather summarize must be True or False, not yes"
+
+    def test_unknown_key(self, run_desc, tmp_path, caplog, monkeypatch):
+        monkeypatch.setitem(run_desc, "gather", {"compress": True})
+        caplog.set_level(logging.ERROR)
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run._calc_gather_options(run_desc, tmp_path)
+        assert caplog.messages[0].startswith("unknown gather key(s): compress;")
+
+    def test_unknown_compression(self, run_desc, tmp_path, caplog, monkeypatch):
+        monkeypatch.setitem(run_desc, "gather", {"compression": "lzma"})
+        caplog.set_level(logging.ERROR)
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run._calc_gather_options(run_desc, tmp_path)
+        assert caplog.messages[0].startswith("unknown gather compression: lzma;")
+
+    @pytest.mark.parametrize("value", [0, -1, "4", True])
+    def test_bad_time_chunk(self, value, run_desc, tmp_path, caplog, monkeypatch):
+        monkeypatch.setitem(run_desc, "gather", {"time chunk": value})
+        caplog.set_level(logging.ERROR)
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run._calc_gather_options(run_desc, tmp_path)
+        assert caplog.messages[0] == (
+            f"gather time chunk must be a positive integer, not {value}"
+        )
+
 
 @pytest.mark.skipif(
     os.environ.get("GITHUB_ACTIONS") == "true",
@@ -420,6 +1530,137 @@ class TestRecordVCSRevisions:
         assert (tmp_run_dir / "AtlantisCmd_rev.txt").exists()
 
 
+class TestMemoizedVCSRevision:
+    """Unit tests for `atlantis run` _memoized_vcs_revision() function."""
+
+    @staticmethod
+    @pytest.fixture
+    def git_repo(tmp_path, monkeypatch):
+        monkeypatch.setattr(atlantis_cmd.run, "_vcs_revisions", {})
+        git_repo = tmp_path / "salish-sea-atlantis-model"
+        (git_repo / ".git" / "refs" / "heads").mkdir(parents=True)
+        (git_repo / ".git" / "HEAD").write_text("ref: refs/heads/main\n")
+        (git_repo / ".git" / "refs" / "heads" / "main").write_text("abc123\n")
+        return git_repo
+
+    @staticmethod
+    @pytest.fixture
+    def vcs_func_calls():
+        calls = []
+
+        def mock_vcs_func(repo, run_dir):
+            calls.append((repo, run_dir))
+            return [f"changeset: {len(calls)}"]
+
+        return calls, mock_vcs_func
+
+    def test_memoized(self, git_repo, vcs_func_calls, tmp_path):
+        calls, mock_vcs_func = vcs_func_calls
+
+        for member in ("member_a", "member_b"):
+            lines = atlantis_cmd.run._memoized_vcs_revision(
+                "git", mock_vcs_func, git_repo, tmp_path / member
+            )
+
+        assert len(calls) == 1
+        assert lines == ["changeset: 1"]
+
+    def test_head_ref_change_invalidates(self, git_repo, vcs_func_calls, tmp_path):
+        calls, mock_vcs_func = vcs_func_calls
+        atlantis_cmd.run._memoized_vcs_revision(
+            "git", mock_vcs_func, git_repo, tmp_path / "member_a"
+        )
+        ref = git_repo / ".git" / "refs" / "heads" / "main"
+        mtime_ns = ref.stat().st_mtime_ns
+        os.utime(ref, ns=(mtime_ns + 1_000_000_000, mtime_ns + 1_000_000_000))
+
+        lines = atlantis_cmd.run._memoized_vcs_revision(
+            "git", mock_vcs_func, git_repo, tmp_path / "member_b"
+        )
+
+        assert len(calls) == 2
+        assert lines == ["changeset: 2"]
+
+    def test_concurrent_calls_query_once(self, git_repo, tmp_path):
+        calls = []
+        release = threading.Event()
+
+        def mock_vcs_func(repo, run_dir):
+            calls.append(repo)
+            release.wait(timeout=5)
+            return ["changeset: 1"]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [
+                executor.submit(
+                    atlantis_cmd.run._memoized_vcs_revision,
+                    "git",
+                    mock_vcs_func,
+                    git_repo,
+                    tmp_path / f"member_{i}",
+                )
+                for i in range(4)
+            ]
+            release.set()
+            results = [future.result() for future in futures]
+
+        assert len(calls) == 1
+        assert results == [["changeset: 1"]] * 4
+
+    def test_failure_not_memoized(self, git_repo, tmp_path):
+        calls = []
+
+        def mock_vcs_func(repo, run_dir):
+            calls.append(repo)
+            if len(calls) == 1:
+                raise SystemExit(2)
+            return ["changeset: 1"]
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run._memoized_vcs_revision(
+                "git", mock_vcs_func, git_repo, tmp_path / "member_a"
+            )
+        lines = atlantis_cmd.run._memoized_vcs_revision(
+            "git", mock_vcs_func, git_repo, tmp_path / "member_b"
+        )
+
+        assert lines == ["changeset: 1"]
+
+
+class TestRecordVCSRevisionsConcurrently:
+    """Unit tests for concurrent repository queries in `atlantis run`
+    _record_vcs_revisions() function.
+    """
+
+    def test_all_repos_recorded_once(self, run_desc, tmp_path, monkeypatch):
+        monkeypatch.setattr(atlantis_cmd.run, "_vcs_revisions", {})
+        repos = [tmp_path / f"repo_{i}" for i in range(5)]
+        for repo in repos:
+            (repo / ".git").mkdir(parents=True)
+            (repo / ".git" / "HEAD").write_text("abc123\n")
+        calls = []
+
+        def mock_get_git_revision(repo, run_dir):
+            calls.append(repo)
+            return [f"changeset: {repo.name}"]
+
+        monkeypatch.setattr(
+            atlantis_cmd.run.nemo_cmd.prepare, "get_git_revision", mock_get_git_revision
+        )
+        monkeypatch.setitem(
+            run_desc, "vcs revisions", {"git": [os.fspath(repo) for repo in repos]}
+        )
+        for member in ("member_a", "member_b"):
+            tmp_run_dir = tmp_path / member
+            tmp_run_dir.mkdir()
+            atlantis_cmd.run._record_vcs_revisions(run_desc, tmp_run_dir)
+
+            for repo in repos:
+                rev_file = tmp_run_dir / f"{repo.name}_rev.txt"
+                assert rev_file.read_text() == f"changeset: {repo.name}\n"
+        assert sorted(calls) == repos
+
+
 class TestAtlantisBashScript:
     """Unit test for contents of Atlantis.sh generated by cookiecutter."""
 
@@ -453,6 +1694,7 @@ class TestAtlantisBashScript:
             WORK_DIR="{tmp_run_dir}"
             RESULTS_DIR="{results_dir}"
             GATHER="{pixi_atlantis} gather"
+            SUPERVISE="{pixi_atlantis} supervise --resources-file ${{RESULTS_DIR}}/resources.json"
 
             mkdir -p ${{RESULTS_DIR}}
 
@@ -460,7 +1702,7 @@ class TestAtlantisBashScript:
             echo "working dir: $(pwd)" >${{RESULTS_DIR}}/stdout
 
             echo "Starting run at $(date)" >>${{RESULTS_DIR}}/stdout
-            ./atlantisMerged \\
+            ${{SUPERVISE}} --step atlantis -- ./atlantisMerged \\
               -i init_conditions.nc 0 -o {run_desc["output filename base"]}.nc \\
               -r run.prm -f forcing.prm -p physics.prm -b biology.prm -s groups.csv -m migrations.csv \\
               -h harvest.prm -q fisheries.csv \\
@@ -469,7 +1711,7 @@ class TestAtlantisBashScript:
             echo "Ended run at $(date)" >>${{RESULTS_DIR}}/stdout
 
             echo "Results gathering started at $(date)" >>${{RESULTS_DIR}}/stdout
-            ${{GATHER}} ${{RESULTS_DIR}} --debug &>>${{RESULTS_DIR}}/stdout
+            ${{SUPERVISE}} --step gather -- ${{GATHER}} ${{RESULTS_DIR}} --debug &>>${{RESULTS_DIR}}/stdout
             echo "Results gathering ended at $(date)" >>${{RESULTS_DIR}}/stdout
 
             chmod -v go+rx ${{RESULTS_DIR}} &>>${{RESULTS_DIR}}/stdout
@@ -487,6 +1729,62 @@ class TestAtlantisBashScript:
         ]
         assert tmp_run_dir_lines == [line.strip() for line in expected.splitlines()]
 
+    def test_cookiecutter_atlantis_sh_matches_native(
+        self,
+        mock_load_run_desc_return,
+        mock_record_vcs_revisions,
+        run_desc,
+        tmp_path,
+    ):
+        results_dir = tmp_path / "results_dir"
+        run_desc_yaml = tmp_path / "atlantis.yaml"
+
+        atlantis_cmd.run.run(run_desc_yaml, results_dir, no_submit=True)
+        atlantis_cmd.run.run(
+            run_desc_yaml, results_dir, no_submit=True, use_cookiecutter=True
+        )
+
+        native_run_dir, cookiecutter_run_dir = sorted(
+            Path(run_desc["paths"]["runs directory"]).iterdir()
+        )
+        native_lines = (native_run_dir / "Atlantis.sh").read_text().splitlines()
+        cookiecutter_lines = (
+            (cookiecutter_run_dir / "Atlantis.sh").read_text().splitlines()
+        )
+        assert native_lines == [
+            line.replace(os.fspath(cookiecutter_run_dir), os.fspath(native_run_dir))
+            for line in cookiecutter_lines
+        ]
+        assert os.access(native_run_dir / "Atlantis.sh", os.X_OK)
+
+    def test_gather_options(
+        self,
+        mock_load_run_desc_return,
+        mock_calc_tmp_run_dir_return,
+        mock_record_vcs_revisions,
+        run_desc,
+        tmp_path,
+        monkeypatch,
+    ):
+        monkeypatch.setitem(run_desc, "gather", {"repack": True, "compression": "zstd"})
+        results_dir = tmp_path / "results_dir"
+
+        atlantis_cmd.run.run(tmp_path / "atlantis.yaml", results_dir, no_submit=True)
+
+        tmp_run_dir = (
+            Path(run_desc["paths"]["runs directory"])
+            / "SS-Atlantis_2021-08-04T105443-0700"
+        )
+        gather_lines = [
+            line
+            for line in (tmp_run_dir / "Atlantis.sh").read_text().splitlines()
+            if line.startswith("${SUPERVISE} --step gather")
+        ]
+        assert gather_lines == [
+            "${SUPERVISE} --step gather -- ${GATHER} ${RESULTS_DIR} --repack 'outputSalishSea*.nc' "
+            "--compression zstd --debug &>>${RESULTS_DIR}/stdout"
+        ]
+
     def test_alt_atlantis_executable_name(
         self,
         mock_load_run_desc_return,
@@ -526,6 +1824,7 @@ class TestAtlantisBashScript:
             WORK_DIR="{tmp_run_dir}"
             RESULTS_DIR="{results_dir}"
             GATHER="{pixi_atlantis} gather"
+            SUPERVISE="{pixi_atlantis} supervise --resources-file ${{RESULTS_DIR}}/resources.json"
 
             mkdir -p ${{RESULTS_DIR}}
 
@@ -533,7 +1832,7 @@ class TestAtlantisBashScript:
             echo "working dir: $(pwd)" >${{RESULTS_DIR}}/stdout
 
             echo "Starting run at $(date)" >>${{RESULTS_DIR}}/stdout
-            ./foo \\
+            ${{SUPERVISE}} --step atlantis -- ./foo \\
               -i init_conditions.nc 0 -o {run_desc["output filename base"]}.nc \\
               -r run.prm -f forcing.prm -p physics.prm -b biology.prm -s groups.csv -m migrations.csv \\
               -h harvest.prm -q fisheries.csv \\
@@ -542,7 +1841,7 @@ class TestAtlantisBashScript:
             echo "Ended run at $(date)" >>${{RESULTS_DIR}}/stdout
 
             echo "Results gathering started at $(date)" >>${{RESULTS_DIR}}/stdout
-            ${{GATHER}} ${{RESULTS_DIR}} --debug &>>${{RESULTS_DIR}}/stdout
+            ${{SUPERVISE}} --step gather -- ${{GATHER}} ${{RESULTS_DIR}} --debug &>>${{RESULTS_DIR}}/stdout
             echo "Results gathering ended at $(date)" >>${{RESULTS_DIR}}/stdout
 
             chmod -v go+rx ${{RESULTS_DIR}} &>>${{RESULTS_DIR}}/stdout
@@ -559,3 +1858,37 @@ class TestAtlantisBashScript:
             for line in (tmp_run_dir / "Atlantis.sh").read_text().splitlines()
         ]
         assert tmp_run_dir_lines == [line.strip() for line in expected.splitlines()]
+
+    def test_atlantis_sh_scratch(
+        self,
+        mock_load_run_desc_return,
+        mock_calc_tmp_run_dir_return,
+        mock_record_vcs_revisions,
+        run_desc,
+        tmp_path,
+        monkeypatch,
+    ):
+        monkeypatch.setitem(run_desc["paths"], "scratch directory", "$SLURM_TMPDIR")
+        results_dir = tmp_path / "results_dir"
+
+        atlantis_cmd.run.run(tmp_path / "atlantis.yaml", results_dir, no_submit=True)
+
+        tmp_run_dir = (
+            Path(run_desc["paths"]["runs directory"])
+            / "SS-Atlantis_2021-08-04T105443-0700"
+        )
+        lines = (tmp_run_dir / "Atlantis.sh").read_text().splitlines()
+        assert 'SCRATCH_DIR=$(mktemp -d "$SLURM_TMPDIR/${RUN_ID}.XXXXXX")' in lines
+        assert "trap remove_scratch EXIT" in lines
+        assert (
+            "${SUPERVISE} --step stage-scratch -- cp -a ${WORK_DIR}/. ${SCRATCH_DIR}/ "
+            "&>>${RESULTS_DIR}/stdout"
+        ) in lines
+        assert "  -d ${OUTPUT_DIR} &>>${RESULTS_DIR}/stdout" in lines
+        copy_back = lines.index("copy_back")
+        assert lines[copy_back - 1] == ""
+        assert (
+            lines[copy_back - 2]
+            == 'echo "Ended run at $(date)" >>${RESULTS_DIR}/stdout'
+        )
+        assert lines[copy_back + 1] == "cd ${WORK_DIR}"
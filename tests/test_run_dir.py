@@ -0,0 +1,281 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Unit tests for native temporary run directory builder."""
+
+import logging
+import os
+from pathlib import Path
+
+import pytest
+
+import atlantis_cmd.run
+from atlantis_cmd import manifest, run_dir
+from atlantis_cmd.timings import Timings
+
+
+@pytest.fixture(name="context")
+def fixture_context(run_desc, tmp_path):
+    tmp_run_dir = (
+        Path(run_desc["paths"]["runs directory"]) / "SS-Atlantis_2021-08-04T105443-0700"
+    )
+    return atlantis_cmd.run._calc_cookiecutter_context(
+        run_desc,
+        run_desc["run id"],
+        tmp_path / "atlantis.yaml",
+        tmp_run_dir,
+        tmp_path / "results_dir",
+    )
+
+
+class TestBuildTmpRunDir:
+    """Unit tests for build_tmp_run_dir() function."""
+
+    def test_tmp_run_dir(self, context):
+        tmp_run_dir = run_dir.build_tmp_run_dir(context)
+
+        assert tmp_run_dir == Path(context["tmp_run_dir"])
+        assert (tmp_run_dir / "Atlantis.sh").is_file()
+        assert (tmp_run_dir / "init_conditions.nc").is_file()
+
+    def test_tmp_run_dir_exists(self, context):
+        Path(context["tmp_run_dir"]).mkdir()
+
+        with pytest.raises(FileExistsError):
+            run_dir.build_tmp_run_dir(context)
+
+    def test_remove_tmp_run_dir_on_failure(self, context, monkeypatch):
+        monkeypatch.setitem(context["parameters"], "biology", "/no/such/file.prm")
+
+        with pytest.raises(FileNotFoundError):
+            run_dir.build_tmp_run_dir(context)
+
+        assert not Path(context["tmp_run_dir"]).exists()
+
+    def test_timings(self, context):
+        timings = Timings()
+
+        run_dir.build_tmp_run_dir(context, timings)
+
+        assert [phase["phase"] for phase in timings.phases] == [
+            "render run script",
+            "stage input files",
+        ]
+
+
+class TestUpdateTmpRunDir:
+    """Unit tests for update_tmp_run_dir() function."""
+
+    def test_unchanged(self, context):
+        run_dir.build_tmp_run_dir(context)
+
+        assert run_dir.update_tmp_run_dir(context) == 0
+
+    def test_changed_params_file(self, context):
+        tmp_run_dir = run_dir.build_tmp_run_dir(context)
+        biology = Path(context["parameters"]["biology"])
+        biology.write_text("mum_FPS 0.2\n")
+        timings = Timings()
+
+        restaged = run_dir.update_tmp_run_dir(context, timings)
+
+        assert restaged == 1
+        assert [file["src"] for file in timings.files] == [os.fspath(biology)]
+        assert (tmp_run_dir / "biology.prm").read_text() == "mum_FPS 0.2\n"
+
+    def test_run_script_rerendered(self, context):
+        tmp_run_dir = run_dir.build_tmp_run_dir(context)
+        (tmp_run_dir / "Atlantis.sh").write_text("hacked")
+
+        run_dir.update_tmp_run_dir(context)
+
+        assert (tmp_run_dir / "Atlantis.sh").read_text() != "hacked"
+
+    def test_hardlinked_input_not_written_through(self, context, tmp_path):
+        context["staging"]["groups"] = "hardlink"
+        tmp_run_dir = run_dir.build_tmp_run_dir(context)
+        old_groups = Path(context["groups"])
+        new_groups = tmp_path / "SS_grps_new.csv"
+        new_groups.write_text("new groups")
+        context["groups"] = os.fspath(new_groups)
+
+        run_dir.update_tmp_run_dir(context)
+
+        assert (tmp_run_dir / "groups.csv").read_text() == "new groups"
+        assert old_groups.read_text() == ""
+
+    def test_changed_forcing_symlink(self, context, tmp_path):
+        tmp_run_dir = run_dir.build_tmp_run_dir(context)
+        new_hydro = tmp_path / "SS_hydro_2xflow.nc"
+        new_hydro.write_bytes(b"")
+        context["forcing"]["SS_hydro.nc"] = os.fspath(new_hydro)
+        context["forcing"]["SS_hydro_2021.nc"] = os.fspath(new_hydro)
+
+        run_dir.update_tmp_run_dir(context)
+
+        assert os.readlink(tmp_run_dir / "SS_hydro.nc") == os.fspath(new_hydro)
+        assert os.readlink(tmp_run_dir / "SS_hydro_2021.nc") == os.fspath(new_hydro)
+
+    def test_removed_forcing_symlink(self, context):
+        tmp_run_dir = run_dir.build_tmp_run_dir(context)
+        del context["forcing"]["SS_salt.nc"]
+
+        run_dir.update_tmp_run_dir(context)
+
+        assert not os.path.lexists(tmp_run_dir / "SS_salt.nc")
+        assert (tmp_run_dir / "SS_hydro.nc").is_symlink()
+        assert (tmp_run_dir / context["atlantis_executable_name"]).is_symlink()
+
+    def test_removed_params_file(self, context, tmp_path):
+        tmp_run_dir = run_dir.build_tmp_run_dir(context)
+        manifest.write_manifest(
+            manifest.staged_inputs(context),
+            tmp_run_dir,
+            cache_path=tmp_path / "hashes.sqlite",
+        )
+        del context["parameters"]["biology"]
+
+        run_dir.update_tmp_run_dir(context)
+
+        assert not (tmp_run_dir / "biology.prm").exists()
+        assert (tmp_run_dir / "groups.csv").is_file()
+        assert (tmp_run_dir / "Atlantis.sh").is_file()
+        assert (tmp_run_dir / manifest.MANIFEST_FILE).is_file()
+
+    def test_timings(self, context):
+        run_dir.build_tmp_run_dir(context)
+        timings = Timings()
+
+        run_dir.update_tmp_run_dir(context, timings)
+
+        assert [phase["phase"] for phase in timings.phases] == [
+            "render run script",
+            "update input files",
+        ]
+
+
+class TestWriteRunScript:
+    """Unit tests for write_run_script() function."""
+
+    def test_run_script(self, context, tmp_path):
+        run_script = run_dir.write_run_script(context, tmp_path)
+
+        assert run_script == tmp_path / "Atlantis.sh"
+        assert f'RUN_ID="{context["run_id"]}"' in run_script.read_text().splitlines()
+
+    def test_run_script_is_executable(self, context, tmp_path):
+        run_script = run_dir.write_run_script(context, tmp_path)
+
+        assert os.access(run_script, os.X_OK)
+
+    def test_template_compiled_once(self, context, tmp_path):
+        run_dir.write_run_script(context, tmp_path)
+        run_dir.write_run_script(context, tmp_path)
+
+        assert run_dir._run_script_template.cache_info().hits >= 1
+
+
+class TestPopulateTmpRunDir:
+    """Unit tests for populate_tmp_run_dir() function."""
+
+    def test_forcing_symlinks(self, context, tmp_path):
+        tmp_run_dir = tmp_path / "tmp_run_dir"
+        tmp_run_dir.mkdir()
+
+        run_dir.populate_tmp_run_dir(context, tmp_run_dir)
+
+        for link_name, target in context["forcing"].items():
+            assert (tmp_run_dir / link_name).is_symlink()
+            assert os.readlink(tmp_run_dir / link_name) == target
+
+    def test_forcing_symlinks_without_dir_fd(self, context, tmp_path, monkeypatch):
+        monkeypatch.setattr(os, "supports_dir_fd", set())
+        tmp_run_dir = tmp_path / "tmp_run_dir"
+        tmp_run_dir.mkdir()
+
+        run_dir.populate_tmp_run_dir(context, tmp_run_dir)
+
+        for link_name, target in context["forcing"].items():
+            assert os.readlink(tmp_run_dir / link_name) == target
+
+    def test_params_files(self, context, tmp_path):
+        tmp_run_dir = tmp_path / "tmp_run_dir"
+        tmp_run_dir.mkdir()
+
+        run_dir.populate_tmp_run_dir(context, tmp_run_dir)
+
+        for key in context["parameters"]:
+            assert (tmp_run_dir / f"{key}.prm").is_file()
+
+    def test_run_desc_yaml_is_copied(self, context, tmp_path):
+        tmp_run_dir = tmp_path / "tmp_run_dir"
+        tmp_run_dir.mkdir()
+        context["staging"] = dict.fromkeys(context["staging"], "hardlink")
+
+        run_dir.populate_tmp_run_dir(context, tmp_run_dir)
+
+        assert not (tmp_run_dir / "atlantis.yaml").samefile(context["run_desc_yaml"])
+
+    def test_staged_file_timings(self, context, tmp_path):
+        tmp_run_dir = tmp_path / "tmp_run_dir"
+        tmp_run_dir.mkdir()
+        context["staging"] = dict.fromkeys(context["staging"], "copy")
+        timings = Timings()
+
+        run_dir.populate_tmp_run_dir(context, tmp_run_dir, timings)
+
+        # boxes, initial conditions, groups, migrations, fisheries, and parameters
+        assert len(timings.files) == 5 + len(context["parameters"])
+        assert {file["method"] for file in timings.files} == {"copy"}
+
+    def test_forcing_symlink_batches(self, context, tmp_path, monkeypatch):
+        monkeypatch.setattr(run_dir, "FORCING_SYMLINKS_PER_TASK", 1)
+        tmp_run_dir = tmp_path / "tmp_run_dir"
+        tmp_run_dir.mkdir()
+
+        run_dir.populate_tmp_run_dir(context, tmp_run_dir)
+
+        for link_name, target in context["forcing"].items():
+            assert os.readlink(tmp_run_dir / link_name) == target
+
+    def test_one_worker(self, context, tmp_path):
+        tmp_run_dir = tmp_path / "tmp_run_dir"
+        tmp_run_dir.mkdir()
+
+        run_dir.populate_tmp_run_dir(context, tmp_run_dir, max_workers=1)
+
+        assert (tmp_run_dir / "init_conditions.nc").is_file()
+        for key in context["parameters"]:
+            assert (tmp_run_dir / f"{key}.prm").is_file()
+
+    def test_all_staging_failures_logged(self, context, tmp_path, caplog):
+        tmp_run_dir = tmp_path / "tmp_run_dir"
+        tmp_run_dir.mkdir()
+        context["parameters"]["biology"] = "/no/such/biology.prm"
+        context["parameters"]["physics"] = "/no/such/physics.prm"
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(FileNotFoundError):
+            run_dir.populate_tmp_run_dir(context, tmp_run_dir)
+
+        failures = [record.message for record in caplog.records]
+        assert len(failures) == 2
+        assert failures[0].startswith("failed to stage /no/such/physics.prm: ")
+        assert failures[1].startswith("failed to stage /no/such/biology.prm: ")
+        # The other input files are staged despite the failures
+        assert (tmp_run_dir / "init_conditions.nc").is_file()
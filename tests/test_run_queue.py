@@ -0,0 +1,491 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""AtlantisCmd queue sub-command plug-in unit tests."""
+
+import json
+import logging
+import os
+import pwd
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import atlantis_cmd.main
+import atlantis_cmd.run_queue
+
+
+@pytest.fixture
+def queue_cmd():
+    return atlantis_cmd.run_queue.Queue(atlantis_cmd.main.AtlantisCmdApp, [])
+
+
+@pytest.fixture
+def run_script(tmp_path):
+    def make_run_script(name, exit_code=0):
+        script = tmp_path / name
+        script.write_text(f"#!/bin/bash\nexit {exit_code}\n")
+        script.chmod(0o755)
+        return script
+
+    return make_run_script
+
+
+@pytest.fixture
+def no_launch(monkeypatch):
+    """Start jobs without executing their run scripts."""
+
+    def mock_start(self, job):
+        job.update(state="running", started=time.time())
+
+    monkeypatch.setattr(atlantis_cmd.run_queue.RunQueue, "_start", mock_start)
+
+
+def wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+class TestParser:
+    """Unit tests for `atlantis queue` sub-command command-line parser."""
+
+    def test_get_parser(self, queue_cmd):
+        parser = queue_cmd.get_parser("atlantis queue")
+        assert parser.prog == "atlantis queue"
+
+    def test_socket_option(self, queue_cmd, monkeypatch):
+        monkeypatch.delenv(atlantis_cmd.run_queue.SOCKET_ENV_VAR, raising=False)
+        parser = queue_cmd.get_parser("atlantis queue")
+        assert parser._actions[1].dest == "socket"
+        assert parser._actions[1].option_strings == ["--socket"]
+        assert parser._actions[1].type == Path
+        assert parser._actions[1].default == atlantis_cmd.run_queue.DEFAULT_SOCKET
+        assert parser._actions[1].help
+
+    def test_socket_env_var(self, queue_cmd, monkeypatch):
+        monkeypatch.setenv(atlantis_cmd.run_queue.SOCKET_ENV_VAR, "/run/atlantis.sock")
+        parser = queue_cmd.get_parser("atlantis queue")
+        assert parser._actions[1].default == Path("/run/atlantis.sock")
+
+    def test_state_file_option(self, queue_cmd):
+        parser = queue_cmd.get_parser("atlantis queue")
+        assert parser._actions[2].dest == "state_file"
+        assert parser._actions[2].option_strings == ["--state-file"]
+        assert parser._actions[2].type == Path
+        assert parser._actions[2].default is None
+        assert parser._actions[2].help
+
+    def test_max_concurrent_option(self, queue_cmd):
+        parser = queue_cmd.get_parser("atlantis queue")
+        assert parser._actions[3].dest == "max_concurrent"
+        assert parser._actions[3].option_strings == ["--max-concurrent"]
+        assert parser._actions[3].type == int
+        assert parser._actions[3].default == os.cpu_count()
+        assert parser._actions[3].help
+
+    def test_max_memory_option(self, queue_cmd):
+        parser = queue_cmd.get_parser("atlantis queue")
+        assert parser._actions[4].dest == "max_memory"
+        assert parser._actions[4].option_strings == ["--max-memory"]
+        assert parser._actions[4].type == atlantis_cmd.run_queue.parse_size
+        assert parser._actions[4].default is None
+        assert parser._actions[4].help
+
+    def test_status_option(self, queue_cmd):
+        parser = queue_cmd.get_parser("atlantis queue")
+        assert parser._actions[5].dest == "status"
+        assert parser._actions[5].option_strings == ["--status"]
+        assert parser._actions[5].const is True
+        assert parser._actions[5].default is False
+        assert parser._actions[5].help
+
+    def test_parsed_args(self, queue_cmd):
+        parser = queue_cmd.get_parser("atlantis queue")
+        parsed_args = parser.parse_args(
+            ["--max-concurrent", "4", "--max-memory", "64G"]
+        )
+        assert parsed_args.max_concurrent == 4
+        assert parsed_args.max_memory == 64 * 2**30
+
+
+class TestTakeAction:
+    """Unit tests for `atlantis queue` sub-command take_action() method."""
+
+    def test_serve(self, queue_cmd, monkeypatch):
+        serve_args = {}
+
+        def mock_serve(socket_path, **kwargs):
+            serve_args.update(socket_path=socket_path, **kwargs)
+
+        monkeypatch.setattr(atlantis_cmd.run_queue, "serve", mock_serve)
+        parsed_args = SimpleNamespace(
+            socket=Path("queue.sock"),
+            state_file=None,
+            max_concurrent=2,
+            max_memory=2**30,
+            status=False,
+        )
+
+        queue_cmd.take_action(parsed_args)
+
+        assert serve_args == {
+            "socket_path": Path("queue.sock"),
+            "state_file": None,
+            "max_concurrent": 2,
+            "max_memory": 2**30,
+        }
+
+    def test_status(self, queue_cmd, monkeypatch):
+        status_args = []
+        monkeypatch.setattr(atlantis_cmd.run_queue, "show_status", status_args.append)
+        parsed_args = SimpleNamespace(
+            socket=Path("queue.sock"),
+            state_file=None,
+            max_concurrent=2,
+            max_memory=None,
+            status=True,
+        )
+
+        queue_cmd.take_action(parsed_args)
+
+        assert status_args == [Path("queue.sock")]
+
+
+class TestParseSize:
+    """Unit tests for parse_size() function."""
+
+    @pytest.mark.parametrize(
+        "text, expected",
+        (
+            ("1024", 1024),
+            ("512M", 512 * 2**20),
+            ("8G", 8 * 2**30),
+            ("8GiB", 8 * 2**30),
+            ("1.5g", int(1.5 * 2**30)),
+            ("2T", 2 * 2**40),
+        ),
+    )
+    def test_parse_size(self, text, expected):
+        assert atlantis_cmd.run_queue.parse_size(text) == expected
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            atlantis_cmd.run_queue.parse_size("lots")
+
+
+class TestRunQueue:
+    """Unit tests for RunQueue class."""
+
+    def test_concurrency_limit(self, no_launch, tmp_path):
+        run_queue = atlantis_cmd.run_queue.RunQueue(tmp_path / "queue.json", 2)
+
+        for run_id in ("a", "b", "c"):
+            run_queue.submit(f"{run_id}/Atlantis.sh", run_id)
+
+        states = [job["state"] for job in run_queue.status()]
+        assert states == ["running", "running", "queued"]
+
+    def test_priority_order(self, no_launch, tmp_path):
+        run_queue = atlantis_cmd.run_queue.RunQueue(tmp_path / "queue.json", 1)
+        run_queue.submit("a/Atlantis.sh", "a")
+        run_queue.submit("b/Atlantis.sh", "b")
+        run_queue.submit("c/Atlantis.sh", "c", priority=5)
+
+        run_queue.jobs[1]["state"] = "finished"
+        run_queue._schedule()
+
+        states = {job["run id"]: job["state"] for job in run_queue.status()}
+        assert states == {"a": "finished", "b": "queued", "c": "running"}
+
+    def test_memory_limit_blocks_queue(self, no_launch, tmp_path):
+        run_queue = atlantis_cmd.run_queue.RunQueue(
+            tmp_path / "queue.json", 4, max_memory=8 * 2**30
+        )
+        run_queue.submit("a/Atlantis.sh", "a", memory=6 * 2**30)
+        run_queue.submit("b/Atlantis.sh", "b", memory=4 * 2**30)
+        run_queue.submit("c/Atlantis.sh", "c", memory=1 * 2**30)
+
+        states = [job["state"] for job in run_queue.status()]
+        assert states == ["running", "queued", "queued"]
+
+    def test_too_much_memory(self, no_launch, tmp_path):
+        run_queue = atlantis_cmd.run_queue.RunQueue(
+            tmp_path / "queue.json", 4, max_memory=8 * 2**30
+        )
+
+        with pytest.raises(atlantis_cmd.run_queue.QueueError):
+            run_queue.submit("a/Atlantis.sh", "a", memory=16 * 2**30)
+
+    def test_records_exit_code(self, run_script, tmp_path):
+        state_file = tmp_path / "queue.json"
+        run_queue = atlantis_cmd.run_queue.RunQueue(state_file, 1)
+        run_queue.submit(run_script("fail.sh", 3), "fail")
+        run_queue.submit(run_script("ok.sh"), "ok")
+
+        wait_for(lambda: all(job["state"] == "finished" for job in run_queue.status()))
+
+        jobs = json.loads(state_file.read_text())["jobs"]
+        assert [job["exit code"] for job in jobs] == [3, 0]
+        for job in jobs:
+            assert job["submitted"] <= job["started"] <= job["ended"]
+
+    def test_restore_state(self, no_launch, tmp_path):
+        state_file = tmp_path / "queue.json"
+        run_queue = atlantis_cmd.run_queue.RunQueue(state_file, 1)
+        run_queue.submit("a/Atlantis.sh", "a")
+        run_queue.submit("b/Atlantis.sh", "b")
+
+        restored = atlantis_cmd.run_queue.RunQueue(state_file, 1)
+        restored._schedule()
+
+        states = [job["state"] for job in restored.status()]
+        assert states == ["lost", "running"]
+        assert restored.submit("c/Atlantis.sh", "c")["id"] == 3
+
+    def test_lost_jobs_count_while_alive(self, no_launch, tmp_path, monkeypatch):
+        monkeypatch.setattr(atlantis_cmd.run_queue, "LOST_JOB_POLL_INTERVAL", 0.01)
+        state_file = tmp_path / "queue.json"
+        run_queue = atlantis_cmd.run_queue.RunQueue(state_file, 1)
+        run_queue.submit("a/Atlantis.sh", "a")
+        run_queue.jobs[1]["pid"] = os.getpid()
+        run_queue._save()
+        run_queue.submit("b/Atlantis.sh", "b")
+
+        restored = atlantis_cmd.run_queue.RunQueue(state_file, 1)
+        restored._schedule()
+
+        assert [job["state"] for job in restored.status()] == ["lost", "queued"]
+
+        # Lost job finishes
+        monkeypatch.setattr(atlantis_cmd.run_queue, "_pid_alive", lambda pid: False)
+        wait_for(lambda: restored.status()[1]["state"] == "running")
+
+    def test_lost_job_memory(self, no_launch, tmp_path):
+        state_file = tmp_path / "queue.json"
+        run_queue = atlantis_cmd.run_queue.RunQueue(state_file, 2, max_memory=8)
+        run_queue.submit("a/Atlantis.sh", "a", memory=6)
+        run_queue.jobs[1]["pid"] = os.getpid()
+        run_queue._save()
+        run_queue.submit("b/Atlantis.sh", "b", memory=4)
+
+        restored = atlantis_cmd.run_queue.RunQueue(state_file, 2, max_memory=8)
+        restored._schedule()
+
+        assert [job["state"] for job in restored.status()] == ["lost", "queued"]
+
+    def test_foreign_user_rejected(self, no_launch, tmp_path, monkeypatch):
+        monkeypatch.setattr(atlantis_cmd.run_queue.os, "geteuid", lambda: 1000)
+        run_queue = atlantis_cmd.run_queue.RunQueue(tmp_path / "queue.json", 1)
+
+        response = run_queue.handle_request(
+            {"op": "submit", "run script": "a/Atlantis.sh", "run id": "a"}, 1001, 1001
+        )
+
+        assert response["ok"] is False
+        assert "only accepts runs from that user" in response["error"]
+        assert not run_queue.jobs
+
+    def test_root_runs_as_submitter(self, no_launch, tmp_path, monkeypatch):
+        monkeypatch.setattr(atlantis_cmd.run_queue.os, "geteuid", lambda: 0)
+        run_queue = atlantis_cmd.run_queue.RunQueue(tmp_path / "queue.json", 1)
+
+        response = run_queue.handle_request(
+            {"op": "submit", "run script": "a/Atlantis.sh", "run id": "a"}, 1001, 100
+        )
+
+        assert response["ok"] is True
+        assert (response["job"]["uid"], response["job"]["gid"]) == (1001, 100)
+
+    def test_unknown_op(self, tmp_path):
+        run_queue = atlantis_cmd.run_queue.RunQueue(tmp_path / "queue.json", 1)
+
+        response = run_queue.handle_request({"op": "cancel"}, 1000, 1000)
+
+        assert response == {
+            "ok": False,
+            "error": "QueueError: unknown request op: cancel",
+        }
+
+
+class TestStart:
+    """Unit tests for RunQueue._start() method."""
+
+    @pytest.mark.parametrize(
+        "uid, gid, expected",
+        ((None, None, None), (0, 0, os.getgrouplist("root", 0))),
+    )
+    def test_extra_groups(self, uid, gid, expected, tmp_path, monkeypatch):
+        popen_kwargs = {}
+
+        def mock_popen(args, **kwargs):
+            popen_kwargs.update(kwargs)
+            raise OSError("not launched")
+
+        monkeypatch.setattr(atlantis_cmd.run_queue.subprocess, "Popen", mock_popen)
+        run_queue = atlantis_cmd.run_queue.RunQueue(tmp_path / "queue.json", 1)
+        job = run_queue.submit("a/Atlantis.sh", "a", uid=uid, gid=gid)
+
+        assert (popen_kwargs["user"], popen_kwargs["group"]) == (uid, gid)
+        assert popen_kwargs["extra_groups"] == expected
+        assert job["exit code"] == -1
+
+    @pytest.mark.parametrize("uid", (None, os.getuid()))
+    def test_env(self, uid, tmp_path, monkeypatch):
+        popen_kwargs = {}
+
+        def mock_popen(args, **kwargs):
+            popen_kwargs.update(kwargs)
+            raise OSError("not launched")
+
+        monkeypatch.setattr(atlantis_cmd.run_queue.subprocess, "Popen", mock_popen)
+        monkeypatch.setenv("HOME", "/daemon/home")
+        run_queue = atlantis_cmd.run_queue.RunQueue(tmp_path / "queue.json", 1)
+
+        run_queue.submit("a/Atlantis.sh", "a", uid=uid, gid=os.getgid())
+
+        if uid is None:
+            # The daemon's own runs inherit its environment
+            assert popen_kwargs["env"] is None
+        else:
+            user = pwd.getpwuid(uid)
+            assert popen_kwargs["env"] == {
+                "PATH": atlantis_cmd.run_queue.JOB_PATH,
+                "HOME": user.pw_dir,
+                "USER": user.pw_name,
+                "LOGNAME": user.pw_name,
+                "SHELL": user.pw_shell or "/bin/sh",
+            }
+
+    def test_env_of_child(self, run_script, tmp_path):
+        env_file = tmp_path / "env"
+        script = run_script("env.sh")
+        script.write_text(f"#!/bin/sh\nenv >{env_file}\n")
+        run_queue = atlantis_cmd.run_queue.RunQueue(tmp_path / "queue.json", 1)
+
+        run_queue.submit(script, "env", uid=os.getuid(), gid=os.getgid())
+
+        wait_for(lambda: run_queue.status()[0]["state"] == "finished")
+        env = dict(line.split("=", 1) for line in env_file.read_text().splitlines())
+        assert env["HOME"] == pwd.getpwuid(os.getuid()).pw_dir
+        assert env["PATH"] == atlantis_cmd.run_queue.JOB_PATH
+        assert "PYTEST_CURRENT_TEST" not in env
+
+    def test_unknown_user_env(self):
+        assert atlantis_cmd.run_queue._user_env(2**31 - 2) == {
+            "PATH": atlantis_cmd.run_queue.JOB_PATH
+        }
+
+    def test_unknown_user_has_no_extra_groups(self):
+        assert atlantis_cmd.run_queue._user_groups(2**31 - 2, 2**31 - 2) == []
+
+
+class TestServe:
+    """Integration tests for the queue daemon and its clients."""
+
+    @staticmethod
+    @pytest.fixture
+    def daemon(monkeypatch):
+        # Unix domain socket paths are limited to about 100 characters,
+        # so the daemon gets a short temporary directory
+        with tempfile.TemporaryDirectory(prefix="aq-") as tmp_dir:
+            socket_path = Path(tmp_dir) / "q.sock"
+            handlers = {}
+            monkeypatch.setattr(
+                atlantis_cmd.run_queue.signal,
+                "signal",
+                lambda signum, handler: handlers.update({signum: handler}),
+            )
+            thread = threading.Thread(
+                target=atlantis_cmd.run_queue.serve,
+                args=(socket_path,),
+                kwargs={"max_concurrent": 1},
+            )
+            thread.start()
+            wait_for(socket_path.exists)
+            yield socket_path
+            handlers[atlantis_cmd.run_queue.signal.SIGTERM](None, None)
+            thread.join()
+
+    def test_submit_and_status(self, daemon, run_script, caplog):
+        job = atlantis_cmd.run_queue.submit(
+            run_script("Atlantis.sh", 2), "SS-Atlantis", socket_path=daemon
+        )
+
+        assert job["run id"] == "SS-Atlantis"
+        wait_for(
+            lambda: atlantis_cmd.run_queue.request(daemon, {"op": "status"})["jobs"][0][
+                "state"
+            ]
+            == "finished"
+        )
+        caplog.set_level(logging.INFO)
+        atlantis_cmd.run_queue.show_status(daemon)
+        assert caplog.messages[-1].startswith(
+            f"job {job['id']}: SS-Atlantis finished at "
+        )
+        assert caplog.messages[-1].endswith("with exit code 2")
+
+    def test_socket_permissions(self, daemon):
+        expected = 0o666 if os.geteuid() == 0 else 0o600
+        assert daemon.stat().st_mode & 0o777 == expected
+
+    def test_insecure_socket_dir(self, tmp_path, monkeypatch, caplog):
+        monkeypatch.setattr(atlantis_cmd.run_queue.os, "geteuid", lambda: 0)
+        socket_dir = tmp_path / "queue"
+        socket_dir.mkdir()
+        socket_dir.chmod(0o777)
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run_queue.serve(socket_dir / "q.sock")
+
+        assert caplog.messages[0] == (
+            f"queue daemon socket directory {socket_dir} must be owned by "
+            f"root and writable only by root"
+        )
+
+    def test_already_running(self, daemon, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run_queue.serve(daemon)
+
+        assert caplog.messages[0] == f"queue daemon is already running on {daemon}"
+
+
+class TestSubmit:
+    """Unit tests for submit() function."""
+
+    def test_no_daemon(self, tmp_path, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run_queue.submit(
+                tmp_path / "Atlantis.sh", "SS-Atlantis", socket_path=tmp_path / "q.sock"
+            )
+
+        assert caplog.messages[0].startswith(
+            "failed to queue SS-Atlantis run: can't connect to queue daemon on "
+        )
@@ -0,0 +1,225 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Unit tests for input file staging functions."""
+
+import errno
+import os
+
+import pytest
+
+from atlantis_cmd import staging
+
+
+@pytest.fixture(name="src")
+def fixture_src(tmp_path):
+    src = tmp_path / "SS_init.nc"
+    src.write_bytes(b"initial conditions")
+    return src
+
+
+@pytest.fixture
+def mock_no_reflink(monkeypatch):
+    def mock_ioctl(fd, request, arg):
+        raise OSError(errno.EOPNOTSUPP, "Operation not supported")
+
+    monkeypatch.setattr(staging.fcntl, "ioctl", mock_ioctl)
+
+
+@pytest.fixture
+def mock_reflink(monkeypatch):
+    def mock_ioctl(fd, request, arg):
+        # Emulate the clone by copying the source file contents
+        os.write(fd, os.pread(arg, 1024, 0))
+
+    monkeypatch.setattr(staging.fcntl, "ioctl", mock_ioctl)
+
+
+@pytest.fixture
+def mock_no_hardlink(monkeypatch):
+    def mock_link(src, dest):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(staging.os, "link", mock_link)
+
+
+class TestStageFile:
+    """Unit tests for stage_file() function."""
+
+    def test_copy(self, src, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+
+        used = staging.stage_file(src, dest, "copy")
+
+        assert used == "copy"
+        assert dest.read_bytes() == b"initial conditions"
+        assert not dest.samefile(src)
+        assert dest.stat().st_mtime == src.stat().st_mtime
+
+    def test_hardlink(self, src, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+
+        used = staging.stage_file(src, dest, "hardlink")
+
+        assert used == "hardlink"
+        assert dest.samefile(src)
+
+    def test_hardlink_falls_back_to_copy(self, mock_no_hardlink, src, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+
+        used = staging.stage_file(src, dest, "hardlink")
+
+        assert used == "copy"
+        assert dest.read_bytes() == b"initial conditions"
+
+    def test_symlink(self, src, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+
+        used = staging.stage_file(src, dest, "symlink")
+
+        assert used == "symlink"
+        assert dest.is_symlink()
+        assert dest.resolve() == src
+
+    def test_reflink(self, mock_reflink, src, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+
+        used = staging.stage_file(src, dest, "reflink")
+
+        assert used == "reflink"
+        assert dest.read_bytes() == b"initial conditions"
+        assert dest.stat().st_mtime == src.stat().st_mtime
+
+    def test_reflink_falls_back_to_copy(self, mock_no_reflink, src, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+
+        used = staging.stage_file(src, dest, "reflink")
+
+        assert used == "copy"
+        assert dest.read_bytes() == b"initial conditions"
+        assert not dest.samefile(src)
+
+    def test_reflink_failure_removes_dest(self, src, tmp_path, monkeypatch):
+        def mock_ioctl(fd, request, arg):
+            raise OSError(errno.EIO, "Input/output error")
+
+        monkeypatch.setattr(staging.fcntl, "ioctl", mock_ioctl)
+        dest = tmp_path / "init_conditions.nc"
+
+        with pytest.raises(OSError):
+            staging.stage_file(src, dest, "reflink")
+
+        assert not dest.exists()
+
+    def test_auto_reflink(self, mock_reflink, src, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+
+        used = staging.stage_file(src, dest, "auto")
+
+        assert used == "reflink"
+
+    def test_auto_read_only_hardlink(self, mock_no_reflink, src, tmp_path):
+        src.chmod(0o444)
+        dest = tmp_path / "init_conditions.nc"
+
+        used = staging.stage_file(src, dest, "auto")
+
+        assert used == "hardlink"
+        assert dest.samefile(src)
+
+    def test_auto_writable_copy(self, mock_no_reflink, src, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+
+        used = staging.stage_file(src, dest, "auto")
+
+        assert used == "copy"
+        assert not dest.samefile(src)
+
+    def test_auto_read_only_other_filesystem(
+        self, mock_no_reflink, mock_no_hardlink, src, tmp_path
+    ):
+        src.chmod(0o444)
+        dest = tmp_path / "init_conditions.nc"
+
+        used = staging.stage_file(src, dest, "auto")
+
+        assert used == "copy"
+
+    def test_unknown_method(self, src, tmp_path):
+        with pytest.raises(ValueError):
+            staging.stage_file(src, tmp_path / "init_conditions.nc", "teleport")
+
+
+class TestIsCurrent:
+    """Unit tests for is_current() function."""
+
+    def test_missing(self, src, tmp_path):
+        assert not staging.is_current(src, tmp_path / "init_conditions.nc")
+
+    def test_symlink(self, src, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+        dest.symlink_to(src)
+
+        assert staging.is_current(src, dest, "symlink")
+
+    def test_symlink_to_other_file(self, src, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+        dest.symlink_to(tmp_path / "SS_init_old.nc")
+
+        assert not staging.is_current(src, dest, "symlink")
+
+    def test_symlink_not_current_for_other_methods(self, src, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+        dest.symlink_to(src)
+
+        assert not staging.is_current(src, dest, "copy")
+
+    def test_hardlink(self, src, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+        os.link(src, dest)
+
+        assert staging.is_current(src, dest, "hardlink")
+
+    def test_copy(self, src, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+        staging.stage_file(src, dest, "copy")
+
+        assert staging.is_current(src, dest, "copy")
+
+    def test_changed_size(self, src, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+        staging.stage_file(src, dest, "copy")
+        src.write_bytes(b"new initial conditions")
+
+        assert not staging.is_current(src, dest, "copy", checksum=True)
+
+    @pytest.mark.parametrize("checksum", [False, True])
+    def test_changed_mtime(self, checksum, src, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+        staging.stage_file(src, dest, "copy")
+        stat_result = src.stat()
+        os.utime(src, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + 10**9))
+
+        assert staging.is_current(src, dest, "copy", checksum=checksum) is checksum
+
+    def test_changed_contents(self, src, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+        staging.stage_file(src, dest, "copy")
+        src.write_bytes(b"INITIAL CONDITIONS")
+
+        assert not staging.is_current(src, dest, "copy", checksum=True)
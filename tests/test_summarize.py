@@ -0,0 +1,276 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Unit tests for summarize sub-command."""
+
+import csv
+import logging
+from pathlib import Path
+from types import SimpleNamespace
+
+import netCDF4
+import numpy
+import pytest
+
+import atlantis_cmd.main
+import atlantis_cmd.summarize
+
+TIMES = (0.0, 86400.0, 2 * 86400.0, 3 * 86400.0)
+BOXES, LAYERS = 3, 2
+
+
+@pytest.fixture
+def summarize_cmd():
+    return atlantis_cmd.summarize.Summarize(atlantis_cmd.main.AtlantisCmdApp, [])
+
+
+@pytest.fixture(name="results_dir")
+def fixture_results_dir(tmp_path):
+    """Results directory with a small Atlantis output file of a pelagic biomass pool
+    group, an epibenthic group, and an age structured group with 2 cohorts.
+    """
+    results_dir = tmp_path / "results_dir"
+    results_dir.mkdir()
+    (results_dir / "atlantis.yaml").write_text(
+        "run id: SS-Atlantis\noutput filename base: outputSalishSea\n"
+    )
+    (results_dir / "groups.csv").write_text(
+        "Code,Index,IsTurnedOn,Name,LongName\n"
+        "FHA,0,1,Hake,Pacific hake\n"
+        "PL,1,1,Diatom,Diatoms\n"
+        "BC,2,1,Benthic_Carniv,Benthic carnivores\n"
+        "DIN,3,0,Jellies,Jellyfish\n"
+    )
+    shape = (len(TIMES), BOXES, LAYERS)
+    with netCDF4.Dataset(results_dir / "outputSalishSea.nc", "w") as ds:
+        ds.createDimension("t", None)
+        ds.createDimension("b", BOXES)
+        ds.createDimension("z", LAYERS)
+        t = ds.createVariable("t", "f8", ("t",))
+        t.units = "seconds since 2007-01-01 00:00:00"
+        t[:] = TIMES
+        ds.createVariable("volume", "f8", ("t", "b", "z"))[:] = numpy.full(shape, 2.0)
+        ds.createVariable("dz", "f8", ("t", "b", "z"))[:] = numpy.full(shape, 0.5)
+        diatom = numpy.arange(numpy.prod(shape), dtype="f4").reshape(shape)
+        ds.createVariable("Diatom_N", "f4", ("t", "b", "z"))[:] = diatom
+        ds.createVariable("Benthic_Carniv_N", "f4", ("t", "b"))[:] = numpy.ones(
+            shape[:2]
+        )
+        for cohort in (1, 2):
+            for name, value in (("StructN", 3.0), ("ResN", 1.0), ("Nums", 10.0)):
+                ds.createVariable(f"Hake{cohort}_{name}", "f4", ("t", "b", "z"))[:] = (
+                    numpy.full(shape, value * cohort)
+                )
+    return results_dir
+
+
+def _expected_by_box():
+    """Expected biomass in tonnes, with dimensions group, time, box."""
+    shape = (len(TIMES), BOXES, LAYERS)
+    diatom = numpy.arange(numpy.prod(shape)).reshape(shape) * 2.0
+    hake = sum((3.0 * c + 1.0 * c) * 10.0 * c for c in (1, 2)) * numpy.ones(shape)
+    # Box area is sediment layer volume / dz = 2.0 / 0.5
+    benthic_carniv = numpy.full(shape[:2], 4.0)
+    return (
+        numpy.stack((hake.sum(axis=2), diatom.sum(axis=2), benthic_carniv))
+        * atlantis_cmd.summarize.MG_N_TO_TONNES
+    )
+
+
+def _read_csv(path):
+    with path.open(newline="") as f:
+        return list(csv.DictReader(f))
+
+
+class TestParser:
+    """Unit tests for `atlantis summarize` sub-command command-line parser."""
+
+    def test_get_parser(self, summarize_cmd):
+        parser = summarize_cmd.get_parser("atlantis summarize")
+        assert parser.prog == "atlantis summarize"
+
+    def test_parsed_args_defaults(self, summarize_cmd):
+        parser = summarize_cmd.get_parser("atlantis summarize")
+        parsed_args = parser.parse_args(["results/foo/"])
+        assert parsed_args.results_dir == Path("results/foo/")
+        assert parsed_args.file_format == "csv"
+
+    def test_format_option(self, summarize_cmd):
+        parser = summarize_cmd.get_parser("atlantis summarize")
+        parsed_args = parser.parse_args(["results/foo/", "--format", "parquet"])
+        assert parsed_args.file_format == "parquet"
+
+
+class TestTakeAction:
+    """Unit test for `atlantis summarize` sub-command take_action() method."""
+
+    def test_take_action(self, summarize_cmd, monkeypatch):
+        summarize_args = {}
+
+        def mock_summarize_biomass(results_dir, **kwargs):
+            summarize_args.update(results_dir=results_dir, **kwargs)
+
+        monkeypatch.setattr(
+            atlantis_cmd.summarize, "summarize_biomass", mock_summarize_biomass
+        )
+        parsed_args = SimpleNamespace(
+            results_dir=Path("results dir"), file_format="parquet"
+        )
+
+        summarize_cmd.take_action(parsed_args)
+
+        assert summarize_args == {
+            "results_dir": Path("results dir"),
+            "file_format": "parquet",
+        }
+
+
+class TestSummarizeBiomass:
+    """Unit tests for summarize_biomass() function."""
+
+    def test_total_biomass(self, results_dir):
+        total_path, _ = atlantis_cmd.summarize.summarize_biomass(results_dir)
+
+        assert total_path == results_dir / "outputSalishSea_biomass.csv"
+        rows = _read_csv(total_path)
+        expected = _expected_by_box().sum(axis=2)
+        assert [row["group"] for row in rows[:3]] == [
+            "Hake",
+            "Diatom",
+            "Benthic_Carniv",
+        ]
+        assert rows[3]["time"] == "2007-01-02T00:00:00"
+        numpy.testing.assert_allclose(
+            [float(row["biomass"]) for row in rows], expected.T.ravel()
+        )
+
+    def test_biomass_by_box(self, results_dir):
+        _, box_path = atlantis_cmd.summarize.summarize_biomass(results_dir)
+
+        assert box_path == results_dir / "outputSalishSea_biomass_by_box.csv"
+        rows = _read_csv(box_path)
+        assert len(rows) == len(TIMES) * 3 * BOXES
+        assert [(row["group"], row["box"]) for row in rows[:4]] == [
+            ("Hake", "0"),
+            ("Hake", "1"),
+            ("Hake", "2"),
+            ("Diatom", "0"),
+        ]
+        numpy.testing.assert_allclose(
+            [float(row["biomass"]) for row in rows],
+            _expected_by_box().transpose(1, 0, 2).ravel(),
+        )
+
+    def test_time_blocks(self, results_dir, monkeypatch):
+        # 8 bytes per value; 2 time records per block
+        monkeypatch.setattr(
+            atlantis_cmd.summarize, "MAX_BLOCK_BYTES", 2 * BOXES * LAYERS * 8
+        )
+
+        _, box_path = atlantis_cmd.summarize.summarize_biomass(results_dir)
+
+        numpy.testing.assert_allclose(
+            [float(row["biomass"]) for row in _read_csv(box_path)],
+            _expected_by_box().transpose(1, 0, 2).ravel(),
+        )
+
+    def test_masked_values_are_zero(self, results_dir):
+        with netCDF4.Dataset(results_dir / "outputSalishSea.nc", "a") as ds:
+            ds.variables["Benthic_Carniv_N"][:, 1] = numpy.ma.masked
+
+        total_path, _ = atlantis_cmd.summarize.summarize_biomass(results_dir)
+
+        rows = _read_csv(total_path)
+        numpy.testing.assert_allclose(
+            float(rows[2]["biomass"]),
+            2 * 4.0 * atlantis_cmd.summarize.MG_N_TO_TONNES,
+        )
+
+    def test_output_filename_base(self, results_dir):
+        (results_dir / "atlantis.yaml").unlink()
+        (results_dir / "outputSalishSea.nc").rename(results_dir / "SS_run.nc")
+
+        total_path, _ = atlantis_cmd.summarize.summarize_biomass(
+            results_dir, output_filename_base="SS_run"
+        )
+
+        assert total_path == results_dir / "SS_run_biomass.csv"
+
+    def test_no_run_desc(self, results_dir, caplog):
+        (results_dir / "atlantis.yaml").unlink()
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.summarize.summarize_biomass(results_dir)
+
+        assert caplog.messages[0] == (
+            f"can't find the output filename base in a run description YAML file "
+            f"in {results_dir}"
+        )
+
+    def test_no_groups_file(self, results_dir, caplog):
+        (results_dir / "groups.csv").unlink()
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.summarize.summarize_biomass(results_dir)
+
+        assert caplog.messages[0] == f"{results_dir / 'groups.csv'} not found"
+
+    def test_no_group_variables(self, results_dir, caplog):
+        (results_dir / "groups.csv").write_text("Code,IsTurnedOn,Name\nDIN,1,Jellies\n")
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.summarize.summarize_biomass(results_dir)
+
+        assert caplog.messages[0].startswith("no variables of the groups in ")
+
+    def test_not_an_atlantis_output_file(self, results_dir, caplog):
+        output_file = results_dir / "outputSalishSea.nc"
+        with netCDF4.Dataset(output_file, "w") as ds:
+            ds.createDimension("t", None)
+            ds.createDimension("b", BOXES)
+            ds.createVariable("t", "f8", ("t",))
+            ds.createVariable("Diatom_N", "f4", ("t", "b"))
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.summarize.summarize_biomass(results_dir)
+
+        assert caplog.messages[0] == (
+            f"z dimension, volume variable, dz variable not found in {output_file}"
+        )
+
+
+class TestFindOutputFilenameBase:
+    """Unit tests for find_output_filename_base() function."""
+
+    def test_output_filename_base(self, results_dir):
+        base = atlantis_cmd.summarize.find_output_filename_base(results_dir)
+
+        assert base == "outputSalishSea"
+
+    def test_conflicting_run_descs(self, results_dir, caplog):
+        (results_dir / "other.yaml").write_text("output filename base: other\n")
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.summarize.find_output_filename_base(results_dir)
+
+        assert caplog.messages[0].startswith("can't find the output filename base")
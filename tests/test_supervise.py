@@ -0,0 +1,169 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""AtlantisCmd supervise sub-command plug-in unit tests."""
+
+import json
+import logging
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import atlantis_cmd.main
+import atlantis_cmd.supervise
+
+
+@pytest.fixture
+def supervise_cmd():
+    return atlantis_cmd.supervise.Supervise(atlantis_cmd.main.AtlantisCmdApp, [])
+
+
+class TestParser:
+    """Unit tests for `atlantis supervise` sub-command command-line parser."""
+
+    def test_get_parser(self, supervise_cmd):
+        parser = supervise_cmd.get_parser("atlantis supervise")
+        assert parser.prog == "atlantis supervise"
+
+    def test_resources_file_option(self, supervise_cmd):
+        parser = supervise_cmd.get_parser("atlantis supervise")
+        assert parser._actions[1].dest == "resources_file"
+        assert parser._actions[1].option_strings == ["--resources-file"]
+        assert parser._actions[1].type == Path
+        assert parser._actions[1].default == Path("resources.json")
+        assert parser._actions[1].help
+
+    def test_step_option(self, supervise_cmd):
+        parser = supervise_cmd.get_parser("atlantis supervise")
+        assert parser._actions[2].dest == "step"
+        assert parser._actions[2].option_strings == ["--step"]
+        assert parser._actions[2].default is None
+        assert parser._actions[2].help
+
+    def test_command_argument(self, supervise_cmd):
+        parser = supervise_cmd.get_parser("atlantis supervise")
+        assert parser._actions[3].dest == "command"
+        assert parser._actions[3].metavar == "COMMAND"
+        assert parser._actions[3].help
+
+    def test_parsed_args(self, supervise_cmd):
+        parser = supervise_cmd.get_parser("atlantis supervise")
+        parsed_args = parser.parse_args(
+            ["--step", "atlantis", "--", "./atlantisMerged", "-q", "fisheries.csv"]
+        )
+        assert parsed_args.step == "atlantis"
+        assert parsed_args.command[-3:] == ["./atlantisMerged", "-q", "fisheries.csv"]
+
+
+class TestTakeAction:
+    """Unit test for `atlantis supervise` sub-command take_action() method."""
+
+    def test_take_action(self, supervise_cmd, monkeypatch):
+        supervise_args = []
+
+        def mock_supervise(command, resources_file, step=None):
+            supervise_args.append((command, resources_file, step))
+            return 3
+
+        monkeypatch.setattr(atlantis_cmd.supervise, "supervise", mock_supervise)
+        parsed_args = SimpleNamespace(
+            resources_file=Path("resources.json"),
+            step="gather",
+            command=["--", "atlantis", "gather", "results/"],
+        )
+
+        exit_code = supervise_cmd.take_action(parsed_args)
+
+        assert exit_code == 3
+        assert supervise_args == [
+            (["atlantis", "gather", "results/"], Path("resources.json"), "gather")
+        ]
+
+
+class TestSupervise:
+    """Unit tests for supervise() function."""
+
+    def test_resource_record(self, tmp_path, caplog):
+        resources_file = tmp_path / "resources.json"
+        command = [
+            sys.executable,
+            "-c",
+            "import sys; sys.stdout.write('x' * 100000); sys.exit(5)",
+        ]
+        caplog.set_level(logging.INFO)
+
+        exit_code = atlantis_cmd.supervise.supervise(
+            command, resources_file, step="atlantis"
+        )
+
+        assert exit_code == 5
+        (record,) = json.loads(resources_file.read_text())["steps"]
+        assert record["step"] == "atlantis"
+        assert record["command"] == command
+        assert record["exit code"] == 5
+        assert record["wall seconds"] > 0
+        assert record["user cpu seconds"] + record["system cpu seconds"] > 0
+        assert record["peak rss bytes"] > 0
+        if sys.platform.startswith("linux"):
+            assert record["bytes written"] >= 100000
+        assert caplog.messages[0].startswith("atlantis: ")
+        assert caplog.messages[0].endswith("exit code 5")
+
+    def test_records_appended(self, tmp_path):
+        resources_file = tmp_path / "resources.json"
+
+        atlantis_cmd.supervise.supervise(["true"], resources_file, step="atlantis")
+        atlantis_cmd.supervise.supervise(["true"], resources_file)
+
+        steps = json.loads(resources_file.read_text())["steps"]
+        assert [step["step"] for step in steps] == ["atlantis", "true"]
+
+    def test_killed_by_signal(self, tmp_path):
+        resources_file = tmp_path / "resources.json"
+
+        exit_code = atlantis_cmd.supervise.supervise(
+            [sys.executable, "-c", "import os, signal; os.kill(os.getpid(), 9)"],
+            resources_file,
+        )
+
+        assert exit_code == 137
+        (record,) = json.loads(resources_file.read_text())["steps"]
+        assert record["exit code"] == -9
+
+    def test_no_command(self, tmp_path, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.supervise.supervise([], tmp_path / "resources.json")
+
+        assert caplog.messages[0] == "no command to supervise"
+
+    def test_command_not_found(self, tmp_path, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.supervise.supervise(
+                [str(tmp_path / "atlantisMerged")], tmp_path / "resources.json"
+            )
+
+        assert caplog.messages[0].startswith(
+            f"failed to execute {tmp_path / 'atlantisMerged'}: "
+        )
+        assert not (tmp_path / "resources.json").exists()
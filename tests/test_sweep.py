@@ -0,0 +1,483 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""AtlantisCmd sweep sub-command plug-in unit and integration tests."""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import textwrap
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import yaml
+
+import atlantis_cmd.main
+import atlantis_cmd.sweep
+
+
+@pytest.fixture
+def sweep_cmd():
+    return atlantis_cmd.sweep.Sweep(atlantis_cmd.main.AtlantisCmdApp, [])
+
+
+@pytest.fixture(name="sweep_file")
+def fixture_sweep_file(run_desc, tmp_path):
+    hydro_forcing = Path(run_desc["forcing"]["SS_hydro.nc"]["link to"])
+    alt_hydro_forcing = hydro_forcing.with_name("SS_hydro_alt.nc")
+    alt_hydro_forcing.write_bytes(b"")
+    biology_prm = Path(run_desc["parameters"]["biology"])
+    biology_prm.write_text(textwrap.dedent("""\
+            # Biology parameters
+            flag_fish 1
+            mum_FPS    0.25
+            """))
+    sweep_file = tmp_path / "sweep.yaml"
+    sweep_file.write_text(textwrap.dedent(f"""\
+            design: factorial
+
+            variables:
+              hydro forcing:
+                run description key: [forcing, SS_hydro.nc, link to]
+                values:
+                  - {hydro_forcing}
+                  - {alt_hydro_forcing}
+              FPS growth:
+                parameters file: biology
+                parameter: mum_FPS
+                values: [0.1, 0.2, 0.3]
+            """))
+    return sweep_file
+
+
+@pytest.fixture
+def mock_load_descs(run_desc, tmp_path, monkeypatch):
+    def mock_load_run_desc(desc_file):
+        if Path(desc_file).name == "atlantis.yaml":
+            return run_desc
+        with Path(desc_file).open("rt") as f:
+            return yaml.safe_load(f)
+
+    monkeypatch.setattr(
+        atlantis_cmd.sweep.nemo_cmd.prepare, "load_run_desc", mock_load_run_desc
+    )
+
+
+class TestParser:
+    """Unit tests for `atlantis sweep` sub-command command-line parser."""
+
+    def test_get_parser(self, sweep_cmd):
+        parser = sweep_cmd.get_parser("atlantis sweep")
+        assert parser.prog == "atlantis sweep"
+
+    def test_cmd_description(self, sweep_cmd):
+        parser = sweep_cmd.get_parser("atlantis sweep")
+        assert parser.description.strip().startswith(
+            "Prepare a temporary run directory for each point of the parameter"
+        )
+
+    @pytest.mark.parametrize(
+        "index, dest, metavar",
+        [
+            (1, "desc_file", "DESC_FILE"),
+            (2, "sweep_file", "SWEEP_FILE"),
+            (3, "results_dir", "RESULTS_DIR"),
+        ],
+    )
+    def test_positional_arguments(self, index, dest, metavar, sweep_cmd):
+        parser = sweep_cmd.get_parser("atlantis sweep")
+        assert parser._actions[index].dest == dest
+        assert parser._actions[index].metavar == metavar
+        assert parser._actions[index].type == Path
+        assert parser._actions[index].help
+
+    def test_parsed_args_defaults(self, sweep_cmd):
+        parser = sweep_cmd.get_parser("atlantis sweep")
+        parsed_args = parser.parse_args(["foo.yaml", "sweep.yaml", "results/foo/"])
+        assert parsed_args.desc_file == Path("foo.yaml")
+        assert parsed_args.sweep_file == Path("sweep.yaml")
+        assert parsed_args.results_dir == Path("results/foo/")
+        assert not parsed_args.no_submit
+        assert parsed_args.max_workers == os.cpu_count()
+        assert parsed_args.max_concurrent == os.cpu_count()
+        assert not parsed_args.quiet
+
+    def test_parsed_args_options(self, sweep_cmd):
+        parser = sweep_cmd.get_parser("atlantis sweep")
+        parsed_args = parser.parse_args(
+            [
+                "foo.yaml",
+                "sweep.yaml",
+                "results/foo/",
+                "--no-submit",
+                "--max-workers",
+                "3",
+                "--max-concurrent",
+                "5",
+                "-q",
+            ]
+        )
+        assert parsed_args.no_submit is True
+        assert parsed_args.max_workers == 3
+        assert parsed_args.max_concurrent == 5
+        assert parsed_args.quiet is True
+
+
+class TestTakeAction:
+    """Unit test for `atlantis sweep` sub-command take_action() method."""
+
+    def test_take_action(self, sweep_cmd, caplog, monkeypatch):
+        def mock_sweep(*args, **kwargs):
+            return "sweep msg"
+
+        monkeypatch.setattr(atlantis_cmd.sweep, "sweep", mock_sweep)
+        parsed_args = SimpleNamespace(
+            desc_file=Path("desc file"),
+            sweep_file=Path("sweep file"),
+            results_dir=Path("results dir"),
+            no_submit=False,
+            max_workers=2,
+            max_concurrent=2,
+            quiet=False,
+        )
+        caplog.set_level(logging.INFO)
+
+        sweep_cmd.take_action(parsed_args)
+
+        assert caplog.messages[0] == "sweep msg"
+
+
+class TestSweep:
+    """Integration tests for `atlantis sweep` sweep() function."""
+
+    def test_tmp_run_dirs(
+        self, mock_load_descs, mock_record_vcs_revisions, run_desc, sweep_file, tmp_path
+    ):
+        results_dir = tmp_path / "results_dir"
+
+        msg = atlantis_cmd.sweep.sweep(
+            tmp_path / "atlantis.yaml",
+            sweep_file,
+            results_dir,
+            max_workers=1,
+            max_concurrent=1,
+            no_submit=True,
+            quiet=True,
+        )
+
+        assert msg is None
+        tmp_run_dirs = sorted(Path(run_desc["paths"]["runs directory"]).iterdir())
+        assert len(tmp_run_dirs) == 6
+        for tmp_run_dir in tmp_run_dirs:
+            assert tmp_run_dir.name.startswith("SS-Atlantis_0")
+            assert (tmp_run_dir / "Atlantis.sh").is_file()
+            assert (tmp_run_dir / "sweep_point.yaml").is_file()
+
+    def test_sweep_points_csv(
+        self, mock_load_descs, mock_record_vcs_revisions, run_desc, sweep_file, tmp_path
+    ):
+        results_dir = tmp_path / "results_dir"
+
+        atlantis_cmd.sweep.sweep(
+            tmp_path / "atlantis.yaml",
+            sweep_file,
+            results_dir,
+            max_workers=1,
+            max_concurrent=1,
+            no_submit=True,
+            quiet=True,
+        )
+
+        lines = (results_dir / "sweep_points.csv").read_text().splitlines()
+        assert lines[0] == "run id,hydro forcing,FPS growth"
+        assert len(lines) == 7
+        assert lines[1].startswith("SS-Atlantis_000,")
+
+    def test_point_variables(
+        self, mock_load_descs, mock_record_vcs_revisions, run_desc, sweep_file, tmp_path
+    ):
+        results_dir = tmp_path / "results_dir"
+
+        atlantis_cmd.sweep.sweep(
+            tmp_path / "atlantis.yaml",
+            sweep_file,
+            results_dir,
+            max_workers=1,
+            max_concurrent=1,
+            no_submit=True,
+            quiet=True,
+        )
+
+        runs_dir = Path(run_desc["paths"]["runs directory"])
+        (tmp_run_dir,) = runs_dir.glob("SS-Atlantis_005_*")
+        assert "mum_FPS    0.3" in (tmp_run_dir / "biology.prm").read_text()
+        assert (tmp_run_dir / "SS_hydro.nc").resolve().name == "SS_hydro_alt.nc"
+        with (tmp_run_dir / "atlantis.yaml").open("rt") as f:
+            point_run_desc = yaml.safe_load(f)
+        assert point_run_desc["run id"] == "SS-Atlantis_005"
+
+    def test_manifest(
+        self, mock_load_descs, mock_record_vcs_revisions, run_desc, sweep_file, tmp_path
+    ):
+        results_dir = tmp_path / "results_dir"
+
+        atlantis_cmd.sweep.sweep(
+            tmp_path / "atlantis.yaml",
+            sweep_file,
+            results_dir,
+            max_workers=1,
+            max_concurrent=1,
+            no_submit=True,
+            quiet=True,
+        )
+
+        runs_dir = Path(run_desc["paths"]["runs directory"])
+        (tmp_run_dir,) = runs_dir.glob("SS-Atlantis_005_*")
+        manifest = json.loads((tmp_run_dir / "input_manifest.json").read_text())
+        entries = {entry["name"]: entry for entry in manifest["files"]}
+        for name in ("biology.prm", "atlantis.yaml"):
+            assert entries[name]["path"] == os.fspath(tmp_run_dir / name)
+            assert entries[name]["sha256"] == (
+                hashlib.sha256((tmp_run_dir / name).read_bytes()).hexdigest()
+            )
+        assert entries["SS_hydro.nc"]["path"].endswith("SS_hydro_alt.nc")
+
+    def test_submit(self, mock_load_descs, sweep_file, tmp_path, monkeypatch):
+        def mock_prepare_sweep_points(
+            run_desc, desc_file, results_dir, variables, point_ids, points, max_workers
+        ):
+            return {point_id: tmp_path / point_id for point_id in point_ids}
+
+        def mock_run_bounded(run_scripts, max_concurrent):
+            return {point_id: 0 for point_id in run_scripts}
+
+        monkeypatch.setattr(
+            atlantis_cmd.sweep, "_prepare_sweep_points", mock_prepare_sweep_points
+        )
+        monkeypatch.setattr(
+            atlantis_cmd.sweep.atlantis_cmd.run, "_run_bounded", mock_run_bounded
+        )
+
+        msg = atlantis_cmd.sweep.sweep(
+            tmp_path / "atlantis.yaml",
+            sweep_file,
+            tmp_path / "results_dir",
+            max_workers=1,
+            max_concurrent=3,
+            quiet=True,
+        )
+
+        assert msg == "finished 6 sweep point runs with at most 3 at a time; 0 failed"
+
+    def test_failed_point(
+        self, mock_load_descs, sweep_file, tmp_path, caplog, monkeypatch
+    ):
+        def mock_prepare_sweep_points(
+            run_desc, desc_file, results_dir, variables, point_ids, points, max_workers
+        ):
+            return {point_id: tmp_path / point_id for point_id in point_ids}
+
+        def mock_run_bounded(run_scripts, max_concurrent):
+            return {
+                point_id: 3 if point_id == "SS-Atlantis_002" else 0
+                for point_id in run_scripts
+            }
+
+        monkeypatch.setattr(
+            atlantis_cmd.sweep, "_prepare_sweep_points", mock_prepare_sweep_points
+        )
+        monkeypatch.setattr(
+            atlantis_cmd.sweep.atlantis_cmd.run, "_run_bounded", mock_run_bounded
+        )
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit) as exc_info:
+            atlantis_cmd.sweep.sweep(
+                tmp_path / "atlantis.yaml",
+                sweep_file,
+                tmp_path / "results_dir",
+                max_workers=1,
+                max_concurrent=3,
+                quiet=True,
+            )
+
+        assert exc_info.value.code == 1
+        assert caplog.messages == [
+            "sweep point SS-Atlantis_002 run failed with exit code 3",
+            "finished 6 sweep point runs with at most 3 at a time; 1 failed",
+        ]
+
+
+class TestGetSweepVariables:
+    """Unit tests for `atlantis sweep` _get_sweep_variables() function."""
+
+    def test_variables(self):
+        sweep_desc = {
+            "variables": {
+                "a": {"run description key": ["forcing", "x", "link to"]},
+                "b": {"parameters file": "biology", "parameter": "mum_FPS"},
+            }
+        }
+
+        variables = atlantis_cmd.sweep._get_sweep_variables(sweep_desc)
+
+        assert variables == sweep_desc["variables"]
+
+    @pytest.mark.parametrize(
+        "variable",
+        [
+            {"values": [1, 2]},
+            {
+                "run description key": ["output filename base"],
+                "parameters file": "biology",
+                "parameter": "mum_FPS",
+            },
+            {"parameters file": "biology"},
+        ],
+    )
+    def test_bad_variable(self, variable, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.sweep._get_sweep_variables({"variables": {"a": variable}})
+
+        assert caplog.messages[0].startswith("sweep variable a must have either")
+
+
+class TestCalcSweepPoints:
+    """Unit tests for `atlantis sweep` _calc_sweep_points() function."""
+
+    def test_factorial(self):
+        variables = {"a": {"values": [1, 2]}, "b": {"values": ["x", "y", "z"]}}
+
+        points = atlantis_cmd.sweep._calc_sweep_points(
+            {"design": "factorial"}, variables
+        )
+
+        assert len(points) == 6
+        assert points[0] == {"a": 1, "b": "x"}
+        assert points[-1] == {"a": 2, "b": "z"}
+
+    def test_factorial_without_values(self, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.sweep._calc_sweep_points(
+                {"design": "factorial"}, {"a": {"range": [0, 1]}}
+            )
+
+        assert caplog.messages[0].startswith("sweep variable a must have a list")
+
+    def test_latin_hypercube(self):
+        variables = {"a": {"range": [0.0, 10.0]}, "b": {"values": ["x", "y"]}}
+
+        points = atlantis_cmd.sweep._calc_sweep_points(
+            {"design": "latin hypercube", "samples": 10, "seed": 42}, variables
+        )
+
+        assert len(points) == 10
+        # Exactly one sample in each of the 10 strata of the range
+        assert sorted(int(point["a"]) for point in points) == list(range(10))
+        assert sorted(point["b"] for point in points) == ["x"] * 5 + ["y"] * 5
+
+    def test_latin_hypercube_seed_is_reproducible(self):
+        variables = {"a": {"range": [0.0, 1.0]}}
+        sweep_desc = {"design": "latin hypercube", "samples": 5, "seed": 1}
+
+        points_1 = atlantis_cmd.sweep._calc_sweep_points(sweep_desc, variables)
+        points_2 = atlantis_cmd.sweep._calc_sweep_points(sweep_desc, variables)
+
+        assert points_1 == points_2
+
+    def test_list(self):
+        points = [{"a": 1}, {"a": 2, "b": "x"}]
+
+        result = atlantis_cmd.sweep._calc_sweep_points(
+            {"design": "list", "points": points}, {"a": {}, "b": {}}
+        )
+
+        assert result == points
+
+    def test_list_unknown_variable(self, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.sweep._calc_sweep_points(
+                {"design": "list", "points": [{"c": 1}]}, {"a": {}}
+            )
+
+        assert caplog.messages[0].startswith("unknown sweep variable(s)")
+
+    def test_unknown_design(self, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.sweep._calc_sweep_points({"design": "random"}, {})
+
+        assert caplog.messages[0].startswith("unknown sweep design: random")
+
+
+class TestLatinHypercube:
+    """Unit test for `atlantis sweep` _latin_hypercube() function."""
+
+    def test_missing_range_and_values(self, caplog):
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.sweep._latin_hypercube({"a": {}}, 3, random.Random(0))
+
+        assert caplog.messages[0].startswith("sweep variable a must have a range")
+
+
+class TestSetPrmValue:
+    """Unit tests for `atlantis sweep` _set_prm_value() function."""
+
+    def test_set_value(self, tmp_path):
+        prm_file = tmp_path / "biology.prm"
+        prm_file.write_text("mum_FPS 0.25\nmum_FPSS 0.5\n")
+
+        atlantis_cmd.sweep._set_prm_value(prm_file, "mum_FPS", 0.3, tmp_path)
+
+        assert prm_file.read_text() == "mum_FPS 0.3\nmum_FPSS 0.5\n"
+
+    def test_replaces_linked_file(self, tmp_path):
+        src_prm_file = tmp_path / "SS_biology.prm"
+        src_prm_file.write_text("mum_FPS 0.25\n")
+        prm_file = tmp_path / "biology.prm"
+        os.link(src_prm_file, prm_file)
+
+        atlantis_cmd.sweep._set_prm_value(prm_file, "mum_FPS", 0.3, tmp_path)
+
+        assert src_prm_file.read_text() == "mum_FPS 0.25\n"
+        assert prm_file.read_text() == "mum_FPS 0.3\n"
+
+    def test_parameter_not_found(self, tmp_path, caplog):
+        tmp_run_dir = tmp_path / "tmp_run_dir"
+        tmp_run_dir.mkdir()
+        prm_file = tmp_run_dir / "biology.prm"
+        prm_file.write_text("mum_FPS 0.25\n")
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.sweep._set_prm_value(prm_file, "mum_XYZ", 0.3, tmp_run_dir)
+
+        assert caplog.messages[0] == f"mum_XYZ not found in {prm_file}"
+        assert not tmp_run_dir.exists()
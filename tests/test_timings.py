@@ -0,0 +1,112 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Unit tests for run preparation timings."""
+
+import json
+import logging
+
+import pytest
+
+from atlantis_cmd.timings import Timings
+
+
+@pytest.fixture(name="src")
+def fixture_src(tmp_path):
+    src = tmp_path / "SS_init.nc"
+    src.write_bytes(b"x" * 2048)
+    return src
+
+
+class TestTimings:
+    """Unit tests for Timings class."""
+
+    def test_phase(self):
+        timings = Timings()
+
+        with timings.phase("load run description"):
+            pass
+
+        assert timings.phases[0]["phase"] == "load run description"
+        assert timings.phases[0]["seconds"] >= 0
+
+    def test_nested_phases_finish_first(self):
+        timings = Timings()
+
+        with timings.phase("total"):
+            with timings.phase("stage input files"):
+                pass
+
+        assert [phase["phase"] for phase in timings.phases] == [
+            "stage input files",
+            "total",
+        ]
+
+    def test_phase_recorded_on_exception(self):
+        timings = Timings()
+
+        with pytest.raises(FileNotFoundError):
+            with timings.phase("stage input files"):
+                raise FileNotFoundError
+
+        assert timings.phases[0]["phase"] == "stage input files"
+
+    @pytest.mark.parametrize(
+        "method, bytes_moved",
+        (
+            ("copy", 2048),
+            ("hardlink", 0),
+            ("reflink", 0),
+            ("symlink", 0),
+        ),
+    )
+    def test_record_file(self, method, bytes_moved, src, tmp_path):
+        timings = Timings()
+
+        timings.record_file(src, tmp_path / "init_conditions.nc", method, 0.5)
+
+        assert timings.files[0]["bytes"] == 2048
+        assert timings.files[0]["bytes moved"] == bytes_moved
+        assert timings.files[0]["method"] == method
+
+    def test_write(self, src, tmp_path):
+        timings = Timings()
+        with timings.phase("total"):
+            timings.record_file(src, tmp_path / "init_conditions.nc", "copy", 0.5)
+
+        timings_file = timings.write(tmp_path)
+
+        assert timings_file == tmp_path / "timings.json"
+        written = json.loads(timings_file.read_text())
+        assert written["phases"][0]["phase"] == "total"
+        assert written["files"][0]["src"] == str(src)
+        assert written["total bytes moved"] == 2048
+
+    def test_log(self, src, tmp_path, caplog):
+        timings = Timings()
+        timings.phases.append({"phase": "total", "seconds": 1.25})
+        timings.record_file(src, tmp_path / "init_conditions.nc", "copy", 0.5)
+        caplog.set_level(logging.INFO)
+
+        timings.log()
+
+        assert caplog.messages[0] == "total: 1.250 s"
+        assert caplog.messages[1] == (
+            f"staged 1 files in 0.500 s, moving 0.0 MiB; "
+            f"slowest was {src} by copy in 0.500 s"
+        )
@@ -0,0 +1,264 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Unit tests for run description validation."""
+
+import logging
+import os
+from pathlib import Path
+
+import pytest
+
+import atlantis_cmd.run
+from atlantis_cmd import validate
+
+
+class TestStatCache:
+    """Unit tests for StatCache class."""
+
+    def test_lookup(self, tmp_path):
+        path = tmp_path / "SS_init.nc"
+        path.write_bytes(b"initial conditions")
+        stat_cache = validate.StatCache()
+
+        resolved, stat_result = stat_cache.lookup(path)
+
+        assert resolved == path
+        assert stat_result.st_size == len(b"initial conditions")
+
+    def test_lookup_missing(self, tmp_path):
+        stat_cache = validate.StatCache()
+
+        resolved, stat_result = stat_cache.lookup(tmp_path / "SS_init.nc")
+
+        assert resolved == tmp_path / "SS_init.nc"
+        assert stat_result is None
+
+    def test_lookup_expands_envvars(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("MODEL_CONFIG", os.fspath(tmp_path))
+        stat_cache = validate.StatCache()
+
+        resolved, stat_result = stat_cache.lookup("$MODEL_CONFIG")
+
+        assert resolved == tmp_path
+        assert stat_result is not None
+
+    def test_lookup_cached(self, tmp_path):
+        path = tmp_path / "SS_init.nc"
+        stat_cache = validate.StatCache()
+        stat_cache.lookup(path)
+        path.write_bytes(b"")
+
+        resolved, stat_result = stat_cache.lookup(path)
+
+        # Cached lookups are not repeated for the lifetime of the cache
+        assert stat_result is None
+
+    def test_lookup_many(self, tmp_path):
+        paths = [tmp_path / f"SS_{i}.prm" for i in range(20)]
+        for path in paths[::2]:
+            path.write_text("")
+        stat_cache = validate.StatCache()
+
+        lookups = stat_cache.lookup_many(paths)
+
+        assert [resolved for resolved, _ in lookups] == paths
+        assert [stat_result is not None for _, stat_result in lookups] == [
+            i % 2 == 0 for i in range(20)
+        ]
+
+    def test_lookup_many_no_paths(self):
+        assert validate.StatCache().lookup_many([]) == []
+
+
+class TestValidateRunDesc:
+    """Unit tests for validate_run_desc() function."""
+
+    def test_resolved_paths(self, run_desc):
+        resolved_paths = validate.validate_run_desc(run_desc)
+
+        assert resolved_paths[("boxes",)] == Path(run_desc["boxes"])
+        assert resolved_paths[("parameters", "biology")] == Path(
+            run_desc["parameters"]["biology"]
+        )
+        assert resolved_paths[("forcing", "SS_hydro.nc", "link to")] == Path(
+            run_desc["forcing"]["SS_hydro.nc"]["link to"]
+        )
+        assert resolved_paths["atlantis executable"] == Path(
+            run_desc["paths"]["atlantis code"], "atlantis/atlantismain/atlantisMerged"
+        )
+
+    def test_shared_stat_cache(self, run_desc):
+        stat_cache = validate.StatCache()
+
+        validate.validate_run_desc(run_desc, stat_cache)
+        lookups = dict(stat_cache._lookups)
+        validate.validate_run_desc(run_desc, stat_cache)
+
+        assert stat_cache._lookups == lookups
+
+    def test_all_problems_reported(self, run_desc, caplog, monkeypatch):
+        monkeypatch.setitem(run_desc, "boxes", "/no/such/SS_xy.bgm")
+        monkeypatch.setitem(run_desc["parameters"], "biology", "/no/such/SS_bio.prm")
+        monkeypatch.setitem(
+            run_desc["forcing"], "SS_temp.nc", {"link to": "/no/such/SS_temp.nc"}
+        )
+        monkeypatch.delitem(run_desc, "groups")
+        monkeypatch.setitem(run_desc["paths"], "atlantis executable name", "atlantis")
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit) as exc_info:
+            validate.validate_run_desc(run_desc)
+
+        assert exc_info.value.code == 2
+        executable = Path(
+            run_desc["paths"]["atlantis code"], "atlantis/atlantismain/atlantis"
+        )
+        assert set(caplog.messages[:-1]) == {
+            '"groups" key not found - please check your run description YAML file',
+            "/no/such/SS_xy.bgm path from run description YAML file not found - "
+            "please check your run description YAML file",
+            "/no/such/SS_bio.prm path from run description YAML file not found - "
+            "please check your run description YAML file",
+            "/no/such/SS_temp.nc path from run description YAML file not found - "
+            "please check your run description YAML file",
+            f"{executable} not found - did you forget to build it?",
+        }
+        assert caplog.messages[-1] == (
+            "found 5 problem(s) in run description; "
+            "no temporary run directory was created"
+        )
+
+    def test_missing_forcing_link_to(self, run_desc, caplog, monkeypatch):
+        monkeypatch.setitem(run_desc["forcing"], "SS_temp.nc", {})
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            validate.validate_run_desc(run_desc)
+
+        assert caplog.messages[0] == (
+            '"forcing: SS_temp.nc: link to" key not found - '
+            "please check your run description YAML file"
+        )
+
+    def test_forcing_glob(self, run_desc, tmp_path, monkeypatch):
+        forcing_dir = tmp_path / "forcing"
+        forcing_dir.mkdir()
+        for year in (2021, 2020, 2022):
+            (forcing_dir / f"SS_hydro_{year}.nc").write_bytes(b"")
+        (forcing_dir / "SS_temp_2020.nc").write_bytes(b"")
+        (forcing_dir / ".SS_hydro_2019.nc").write_bytes(b"")
+        monkeypatch.setitem(
+            run_desc["forcing"], "hydro", {"glob": f"{forcing_dir}/SS_hydro_*.nc"}
+        )
+
+        resolved_paths = validate.validate_run_desc(run_desc)
+
+        assert resolved_paths[("forcing", "hydro", "glob")] == tuple(
+            forcing_dir / f"SS_hydro_{year}.nc" for year in (2020, 2021, 2022)
+        )
+
+    def test_forcing_directory(self, run_desc, tmp_path, monkeypatch):
+        forcing_dir = tmp_path / "forcing"
+        (forcing_dir / "subdir").mkdir(parents=True)
+        (forcing_dir / "SS_hydro_2020.nc").write_bytes(b"")
+        (forcing_dir / "SS_temp_2020.nc").write_bytes(b"")
+        (forcing_dir / ".hidden").write_bytes(b"")
+        monkeypatch.setitem(
+            run_desc["forcing"], "yearly", {"directory": os.fspath(forcing_dir)}
+        )
+
+        resolved_paths = validate.validate_run_desc(run_desc)
+
+        assert resolved_paths[("forcing", "yearly", "directory")] == (
+            forcing_dir / "SS_hydro_2020.nc",
+            forcing_dir / "SS_temp_2020.nc",
+        )
+
+    def test_forcing_glob_no_matches(self, run_desc, tmp_path, caplog, monkeypatch):
+        monkeypatch.setitem(
+            run_desc["forcing"], "hydro", {"glob": f"{tmp_path}/SS_hydro_*.nc"}
+        )
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            validate.validate_run_desc(run_desc)
+
+        assert caplog.messages[0] == (
+            f"no forcing files found for {tmp_path}/SS_hydro_*.nc - "
+            f"please check your run description YAML file"
+        )
+
+    def test_forcing_glob_wildcard_dir(self, run_desc, tmp_path, caplog, monkeypatch):
+        monkeypatch.setitem(
+            run_desc["forcing"], "hydro", {"glob": f"{tmp_path}/*/SS_hydro.nc"}
+        )
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            validate.validate_run_desc(run_desc)
+
+        assert caplog.messages[0] == (
+            f"{tmp_path}/*/SS_hydro.nc forcing glob may only have wildcards in its "
+            f"file name - please check your run description YAML file"
+        )
+
+    def test_forcing_directory_not_dir(self, run_desc, caplog, monkeypatch):
+        boxes = run_desc["boxes"]
+        monkeypatch.setitem(run_desc["forcing"], "yearly", {"directory": boxes})
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            validate.validate_run_desc(run_desc)
+
+        assert caplog.messages[0] == (
+            f"{boxes} forcing directory is not a directory - "
+            f"please check your run description YAML file"
+        )
+
+    def test_duplicate_forcing_link_names(
+        self, run_desc, tmp_path, caplog, monkeypatch
+    ):
+        forcing_dir = tmp_path / "forcing"
+        forcing_dir.mkdir()
+        (forcing_dir / "SS_hydro.nc").write_bytes(b"")
+        monkeypatch.setitem(
+            run_desc["forcing"], "yearly", {"directory": os.fspath(forcing_dir)}
+        )
+        caplog.set_level(logging.ERROR)
+
+        with pytest.raises(SystemExit):
+            validate.validate_run_desc(run_desc)
+
+        assert caplog.messages[0] == (
+            "forcing file SS_hydro.nc is declared by more than one of: "
+            "SS_hydro.nc, yearly - please check your run description YAML file"
+        )
+
+    def test_nothing_created_on_disk(
+        self, mock_calc_tmp_run_dir_return, run_desc, tmp_path, monkeypatch
+    ):
+        monkeypatch.setitem(run_desc, "boxes", "/no/such/SS_xy.bgm")
+        monkeypatch.setitem(run_desc, "fisheries", "/no/such/SalishFisheries.csv")
+
+        with pytest.raises(SystemExit):
+            atlantis_cmd.run._prepare_tmp_run_dir(
+                tmp_path / "atlantis.yaml", tmp_path / "results_dir", run_desc=run_desc
+            )
+
+        assert not any(Path(run_desc["paths"]["runs directory"]).iterdir())
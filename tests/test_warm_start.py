@@ -0,0 +1,147 @@
+#  Copyright 2021 – present by the Salish Sea Atlantis project contributors,
+#  The University of British Columbia, and CSIRO.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+# SPDX-License-Identifier: Apache-2.0
+
+
+"""Unit tests for warm start initial conditions."""
+
+import netCDF4
+import numpy
+import pytest
+
+from atlantis_cmd import warm_start
+
+
+@pytest.fixture(name="init_nc")
+def fixture_init_nc(tmp_path):
+    """Small NetCDF classic file with the structure of an Atlantis initial
+    conditions file.
+    """
+    init_nc = tmp_path / "SS_init.nc"
+    with netCDF4.Dataset(init_nc, "w", format="NETCDF3_CLASSIC") as ds:
+        ds.geometry = "SS_xy.bgm"
+        ds.createDimension("t", None)
+        ds.createDimension("b", 5)
+        ds.createDimension("z", 3)
+        t = ds.createVariable("t", "f8", ("t",))
+        t.units = "seconds since 2007-01-01 00:00:00 -8"
+        t[0] = 0.0
+        diatom = ds.createVariable("Diatom_N", "f4", ("t", "b", "z"), fill_value=-1.0)
+        diatom.units = "mg N m-3"
+        diatom[0] = numpy.ones((5, 3), dtype="f4")
+        volume = ds.createVariable("volume", "f8", ("t", "b", "z"))
+        volume[0] = numpy.full((5, 3), 7.0)
+        topk = ds.createVariable("topk", "i4", ("b",))
+        topk[:] = numpy.arange(5)
+    return init_nc
+
+
+@pytest.fixture(name="output_nc")
+def fixture_output_nc(tmp_path):
+    """Small NetCDF classic file with the structure of an Atlantis output file."""
+    results_dir = tmp_path / "previous_results"
+    results_dir.mkdir()
+    output_nc = results_dir / "outputSalishSea.nc"
+    with netCDF4.Dataset(output_nc, "w", format="NETCDF3_CLASSIC") as ds:
+        ds.createDimension("t", None)
+        ds.createDimension("b", 5)
+        ds.createDimension("z", 3)
+        t = ds.createVariable("t", "f8", ("t",))
+        t[:] = numpy.arange(4) * 43200.0
+        diatom = ds.createVariable("Diatom_N", "f4", ("t", "b", "z"))
+        diatom[:] = numpy.arange(4 * 5 * 3, dtype="f4").reshape(4, 5, 3)
+        # Same name, but a different shape than in the initial conditions
+        volume = ds.createVariable("volume", "f8", ("t", "b"))
+        volume[:] = numpy.zeros((4, 5))
+        ds.createVariable("Diatom_N_growth", "f4", ("t", "b", "z"))
+    return output_nc
+
+
+class TestFindPreviousOutput:
+    """Unit tests for find_previous_output() function."""
+
+    def test_found(self, output_nc):
+        previous_output = warm_start.find_previous_output(
+            output_nc.parent, "outputSalishSea"
+        )
+        assert previous_output == output_nc
+
+    def test_not_found(self, output_nc):
+        assert warm_start.find_previous_output(output_nc.parent, "outputFoo") is None
+
+
+class TestWriteWarmStartInit:
+    """Unit tests for write_warm_start_init() function."""
+
+    def test_last_record(self, init_nc, output_nc, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+
+        warm_started = warm_start.write_warm_start_init(init_nc, output_nc, dest)
+
+        assert warm_started == ["Diatom_N"]
+        with netCDF4.Dataset(dest) as ds:
+            assert ds.data_model == "NETCDF3_CLASSIC"
+            assert ds.dimensions["t"].isunlimited()
+            assert len(ds.dimensions["t"]) == 1
+            numpy.testing.assert_array_equal(
+                ds["Diatom_N"][0],
+                numpy.arange(45, 60, dtype="f4").reshape(5, 3),
+            )
+            assert ds["Diatom_N"].units == "mg N m-3"
+            assert ds["Diatom_N"]._FillValue == -1.0
+
+    def test_unmatched_variables_from_init(self, init_nc, output_nc, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+
+        warm_start.write_warm_start_init(init_nc, output_nc, dest)
+
+        with netCDF4.Dataset(dest) as ds:
+            assert set(ds.variables) == {"t", "Diatom_N", "volume", "topk"}
+            assert ds["t"][0] == 0.0
+            numpy.testing.assert_array_equal(ds["volume"][0], numpy.full((5, 3), 7.0))
+            numpy.testing.assert_array_equal(ds["topk"][:], numpy.arange(5))
+
+    def test_provenance(self, init_nc, output_nc, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+
+        warm_start.write_warm_start_init(init_nc, output_nc, dest)
+
+        with netCDF4.Dataset(dest) as ds:
+            assert ds.geometry == "SS_xy.bgm"
+            assert ds.warm_start_from == f"{output_nc} time record 3"
+
+    def test_replaces_staged_link(self, init_nc, output_nc, tmp_path):
+        dest = tmp_path / "init_conditions.nc"
+        dest.symlink_to(init_nc)
+
+        warm_start.write_warm_start_init(init_nc, output_nc, dest)
+
+        assert not dest.is_symlink()
+        with netCDF4.Dataset(init_nc) as ds:
+            assert ds["Diatom_N"][0, 0, 0] == 1.0
+
+    def test_no_time_records(self, init_nc, tmp_path):
+        output_nc = tmp_path / "outputSalishSea.nc"
+        with netCDF4.Dataset(output_nc, "w", format="NETCDF3_CLASSIC") as ds:
+            ds.createDimension("t", None)
+            ds.createVariable("t", "f8", ("t",))
+        dest = tmp_path / "init_conditions.nc"
+
+        with pytest.raises(ValueError):
+            warm_start.write_warm_start_init(init_nc, output_nc, dest)
+
+        assert not dest.exists()
+        assert not list(tmp_path.glob(".*warm-start-tmp"))